@@ -2,7 +2,8 @@ from app import create_app, socketio
 from flask import send_from_directory, render_template, make_response
 from flask_socketio import join_room
 from flask_jwt_extended import decode_token
-from app.models import Usuario
+from app.models import Usuario, Motorista
+from app.services import notificacoes
 import os
 
 application = create_app()
@@ -89,8 +90,15 @@ def handle_connect(auth):
         if usuario:
             if usuario.tipo == 'admin':
                 join_room('admins')
-            else:
-                join_room(f'user_{usuario_id}')
+            # Sala individual também para admins (ex.: resultado dos jobs do Gemini)
+            join_room(f'user_{usuario_id}')
+            # Sala do motorista: eventos das OS atribuídas a ele (app/services/tempo_real.py)
+            motorista = Motorista.query.filter_by(usuario_id=usuario.id).first()
+            if motorista:
+                join_room(f'motorista_{motorista.id}')
+            # Salas de grupo: uma emissão por notificação em massa (app/services/notificacoes.py)
+            for sala in notificacoes.salas_do_usuario(usuario.id):
+                join_room(sala)
             print(f'Usuário {usuario.nome} conectado via WebSocket e entrou na sala')
             return True
     except Exception as e:
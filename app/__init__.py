@@ -31,7 +31,23 @@ def create_app():
     db.init_app(app)
     CORS(app)
     jwt = JWTManager(app)
-    socketio.init_app(app, cors_allowed_origins="*")
+    # Com vários workers (WEB_CONCURRENCY > 1) as emissões passam pela fila de
+    # mensagens (Redis) para chegar aos clientes conectados em outro processo.
+    # Sem sticky session o long-polling cai num worker diferente a cada
+    # requisição, então nesse modo só WebSocket é aceito (DEPLOY_MULTIWORKER.md)
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    message_queue = os.getenv('SOCKETIO_MESSAGE_QUEUE') or os.getenv('REDIS_URL')
+    somente_websocket = os.getenv('SOCKETIO_SOMENTE_WEBSOCKET', 'auto').lower()
+    opcoes_socketio = {'cors_allowed_origins': "*"}
+    if message_queue:
+        opcoes_socketio['message_queue'] = message_queue
+        opcoes_socketio['channel'] = os.getenv('SOCKETIO_CANAL', 'mrx-socketio')
+    elif workers > 1:
+        print(f"⚠️  WEB_CONCURRENCY={workers} sem SOCKETIO_MESSAGE_QUEUE: eventos Socket.IO só chegam "
+              f"aos clientes conectados no mesmo worker")
+    if somente_websocket == 'true' or (somente_websocket == 'auto' and workers > 1):
+        opcoes_socketio['transports'] = ['websocket']
+    socketio.init_app(app, **opcoes_socketio)
 
     from flask import jsonify
 
@@ -111,35 +127,168 @@ def create_app():
         app.register_blueprint(rh.bp)
         app.register_blueprint(visitas.bp)
 
-        def run_hr_migration():
+        from app.services import dashboard_stats
+        dashboard_stats.init_app(app)
+
+        from app.services import gps_ingestao
+        gps_ingestao.init_app(app)
+
+        # registra o before_flush que grava lote_eventos em toda alteração de Lote
+        from app.services import lote_eventos  # noqa: F401
+
+        def add_missing_columns(table_name, columns_to_add):
+            adicionadas = []
             try:
                 from sqlalchemy import text
-                columns_to_add = [
-                    ("foto_path", "VARCHAR(255)"),
-                    ("foto_data", "BYTEA"),
-                    ("foto_mimetype", "VARCHAR(50)"),
-                    ("percentual_comissao", "NUMERIC(5,2) DEFAULT 0"),
-                    ("telefone", "VARCHAR(20)"),
-                    ("cpf", "VARCHAR(14)"),
-                    ("data_atualizacao", "TIMESTAMP")
-                ]
                 
                 with db.engine.connect() as conn:
                     for column_name, column_type in columns_to_add:
                         result = conn.execute(text(f"""
                             SELECT column_name 
                             FROM information_schema.columns 
-                            WHERE table_name = 'usuarios' AND column_name = '{column_name}'
+                            WHERE table_name = '{table_name}' AND column_name = '{column_name}'
                         """))
                         
                         if result.fetchone() is None:
-                            conn.execute(text(f"ALTER TABLE usuarios ADD COLUMN {column_name} {column_type}"))
+                            table_exists = conn.execute(text(f"""
+                                SELECT 1 FROM information_schema.tables WHERE table_name = '{table_name}'
+                            """)).fetchone()
+                            if table_exists is None:
+                                return adicionadas
+                            conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
                             conn.commit()
-                            print(f"✓ Added column usuarios.{column_name}")
+                            adicionadas.append(column_name)
+                            print(f"✓ Added column {table_name}.{column_name}")
+            except Exception as e:
+                print(f"Migration check: {e}")
+            return adicionadas
+
+        def run_hr_migration():
+            add_missing_columns('usuarios', [
+                ("foto_path", "VARCHAR(255)"),
+                ("foto_data", "BYTEA"),
+                ("foto_mimetype", "VARCHAR(50)"),
+                ("percentual_comissao", "NUMERIC(5,2) DEFAULT 0"),
+                ("telefone", "VARCHAR(20)"),
+                ("cpf", "VARCHAR(14)"),
+                ("data_atualizacao", "TIMESTAMP")
+            ])
+
+        def run_scanner_migration():
+            add_missing_columns('scanner_config', [
+                ("version", "INTEGER NOT NULL DEFAULT 1")
+            ])
+            add_missing_columns('scanner_analyses', [
+                ("image_key", "VARCHAR(64)"),
+                ("thumbnail_key", "VARCHAR(64)"),
+                ("image_size", "INTEGER"),
+                ("image_sha256", "VARCHAR(64)"),
+                ("image_phash", "VARCHAR(16)"),
+                ("config_version", "INTEGER"),
+                ("board_detected", "BOOLEAN")
+            ])
+            try:
+                from sqlalchemy import text
+                with db.engine.connect() as conn:
+                    for column in ('image_sha256', 'image_key', 'thumbnail_key'):
+                        conn.execute(text(
+                            f"CREATE INDEX IF NOT EXISTS ix_scanner_analyses_{column} ON scanner_analyses ({column})"
+                        ))
+                    conn.commit()
+            except Exception as e:
+                print(f"Migration check: {e}")
+
+        def run_dashboard_migration():
+            for table_name in ('lotes', 'solicitacoes', 'ordens_compra'):
+                add_missing_columns(table_name, [("data_atualizacao", "TIMESTAMP")])
+            try:
+                from sqlalchemy import text
+                with db.engine.connect() as conn:
+                    for index_name, table_name, column_name in [
+                        ('ix_lotes_data_criacao', 'lotes', 'data_criacao'),
+                        ('ix_lotes_data_atualizacao', 'lotes', 'data_atualizacao'),
+                        ('ix_solicitacoes_data_envio', 'solicitacoes', 'data_envio'),
+                        ('ix_solicitacoes_data_atualizacao', 'solicitacoes', 'data_atualizacao'),
+                        ('ix_ordens_compra_criado_em', 'ordens_compra', 'criado_em'),
+                        ('ix_ordens_compra_data_atualizacao', 'ordens_compra', 'data_atualizacao'),
+                        ('ix_ordens_servico_atualizado_em', 'ordens_servico', 'atualizado_em'),
+                    ]:
+                        conn.execute(text(
+                            f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({column_name})"
+                        ))
+                    conn.commit()
+            except Exception as e:
+                print(f"Migration check: {e}")
+
+        def run_gps_migration():
+            try:
+                from sqlalchemy import text
+                with db.engine.connect() as conn:
+                    conn.execute(text(
+                        "CREATE UNIQUE INDEX IF NOT EXISTS ux_gps_logs_posicao_device_timestamp "
+                        "ON gps_logs (device_id, \"timestamp\") WHERE evento = 'POSICAO'"
+                    ))
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_gps_logs_os_timestamp ON gps_logs (os_id, \"timestamp\")"
+                    ))
+                    conn.commit()
+            except Exception as e:
+                print(f"Migration check: {e}")
+            try:
+                from app.services.gps_armazenamento import criar_particoes
+                criar_particoes()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Migration check: {e}")
+
+        def run_notificacoes_migration():
+            try:
+                from sqlalchemy import text
+                with db.engine.connect() as conn:
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_notificacoes_usuario_data_id "
+                        "ON notificacoes (usuario_id, data_envio, id)"
+                    ))
+                    conn.commit()
+            except Exception as e:
+                print(f"Migration check: {e}")
+
+        def run_wms_migration():
+            adicionadas = add_missing_columns('lotes', [("total_divergencias", "INTEGER NOT NULL DEFAULT 0")])
+            try:
+                from sqlalchemy import text
+                with db.engine.connect() as conn:
+                    if 'total_divergencias' in adicionadas:
+                        resultado = conn.execute(text(
+                            "UPDATE lotes SET total_divergencias = json_array_length(divergencias) "
+                            "WHERE json_typeof(divergencias) = 'array'"
+                        ))
+                        print(f"✓ Preenchido lotes.total_divergencias ({resultado.rowcount} lotes)")
+                    for index_name, columns in [
+                        ('ix_lotes_data_criacao_id', 'data_criacao, id'),
+                        ('ix_lotes_status_data_id', 'status, data_criacao, id'),
+                        ('ix_lotes_localizacao_data_id', 'localizacao_atual, data_criacao, id'),
+                        ('ix_lotes_fornecedor_data_id', 'fornecedor_id, data_criacao, id'),
+                    ]:
+                        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON lotes ({columns})"))
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_lotes_divergentes_data_id ON lotes (data_criacao, id) "
+                        "WHERE total_divergencias > 0"
+                    ))
+                    conn.execute(text(
+                        "CREATE INDEX IF NOT EXISTS ix_lotes_inventario_motivo_id ON lotes (motivo_bloqueio, id) "
+                        "WHERE tipo_bloqueio = 'INVENTARIO'"
+                    ))
+                    conn.commit()
             except Exception as e:
                 print(f"Migration check: {e}")
 
         run_hr_migration()
+        run_scanner_migration()
+        run_dashboard_migration()
+        run_gps_migration()
+        run_notificacoes_migration()
+        run_wms_migration()
         db.create_all()
 
         # Inicializar tabelas de preço
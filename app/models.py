@@ -1,4 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from datetime import datetime
 import uuid
 from typing import Any
@@ -590,8 +591,9 @@ class Solicitacao(db.Model):  # type: ignore
     modalidade_frete = db.Column(db.String(10), default='FOB', nullable=True)
     status = db.Column(db.String(20), default='pendente', nullable=False)
     observacoes = db.Column(db.Text)
-    data_envio = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    data_envio = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     data_confirmacao = db.Column(db.DateTime, nullable=True)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     admin_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True)
 
     rua = db.Column(db.String(200))
@@ -711,6 +713,18 @@ class Lote(db.Model):  # type: ignore
         db.Index('idx_numero_lote', 'numero_lote'),
         db.Index('idx_fornecedor_tipo_status', 'fornecedor_id', 'tipo_lote_id', 'status'),
         db.UniqueConstraint('conferencia_id', name='uq_lote_conferencia_id'),
+        # listagem do WMS: mais recentes primeiro, paginada por (data_criacao, id), com ou sem filtro
+        db.Index('ix_lotes_data_criacao_id', 'data_criacao', 'id'),
+        db.Index('ix_lotes_status_data_id', 'status', 'data_criacao', 'id'),
+        db.Index('ix_lotes_localizacao_data_id', 'localizacao_atual', 'data_criacao', 'id'),
+        db.Index('ix_lotes_fornecedor_data_id', 'fornecedor_id', 'data_criacao', 'id'),
+        db.Index('ix_lotes_divergentes_data_id', 'data_criacao', 'id',
+                 postgresql_where=db.text('total_divergencias > 0'),
+                 sqlite_where=db.text('total_divergencias > 0')),
+        # lotes travados por um inventário, percorridos por id na finalização
+        db.Index('ix_lotes_inventario_motivo_id', 'motivo_bloqueio', 'id',
+                 postgresql_where=db.text("tipo_bloqueio = 'INVENTARIO'"),
+                 sqlite_where=db.text("tipo_bloqueio = 'INVENTARIO'")),
     )
 
     id = db.Column(db.Integer, primary_key=True)
@@ -749,14 +763,18 @@ class Lote(db.Model):  # type: ignore
     ip_inicio = db.Column(db.String(50), nullable=True)
     device_id = db.Column(db.String(255), nullable=True)
 
-    data_criacao = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    data_criacao = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     data_fechamento = db.Column(db.DateTime, nullable=True)
     data_aprovacao = db.Column(db.DateTime, nullable=True)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     conferente_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True)
     anexos = db.Column(db.JSON, default=lambda: [], nullable=True)
     divergencias = db.Column(db.JSON, default=lambda: [], nullable=True)
+    # len(divergencias), mantido pelos eventos abaixo: filtro indexável em vez de cast(divergencias) != '[]'
+    total_divergencias = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     observacoes = db.Column(db.Text)
+    # legado: o histórico novo vai para lote_eventos; executar_manutencao_lote_eventos.py migra e esvazia
     auditoria = db.Column(db.JSON, default=lambda: [], nullable=True)
 
     lote_pai_id = db.Column(db.Integer, db.ForeignKey('lotes.id'), nullable=True)
@@ -780,88 +798,16 @@ class Lote(db.Model):  # type: ignore
             ano = datetime.now().year
             self.numero_lote = f"{ano}-{str(uuid.uuid4().hex[:5]).upper()}"
 
-    def to_dict(self):
-        data = {
-            'id': self.id,
-            'numero_lote': self.numero_lote,
-            'tipo_lote_id': self.tipo_lote_id,
-            'fornecedor_id': self.fornecedor_id,
-            'peso_total_kg': self.peso_total_kg,
-            'valor_total': self.valor_total,
-            'data_criacao': self.data_criacao.isoformat() if self.data_criacao else None,
-            'status': self.status,
-            'localizacao_atual': self.localizacao_atual,
-            'observacoes': self.observacoes,
-            'oc_id': self.oc_id,
-            'os_id': self.os_id,
-            'conferencia_id': self.conferencia_id,
-            'quantidade_itens': self.quantidade_itens,
-            'estrelas_media': self.estrelas_media,
-            'classificacao_predominante': self.classificacao_predominante,
-            'qualidade_recebida': self.qualidade_recebida,
-            'tipo_retirada': self.tipo_retirada,
-            'reservado': self.reservado,
-            'reservado_para': self.reservado_para,
-            'reservado_por_id': self.reservado_por_id,
-            'reservado_por_nome': self.reservado_por.nome if self.reservado_por else None,
-            'reservado_em': self.reservado_em.isoformat() if self.reservado_em else None,
-            'bloqueado': self.bloqueado,
-            'tipo_bloqueio': self.tipo_bloqueio,
-            'bloqueado_por_id': self.bloqueado_por_id,
-            'bloqueado_por_nome': self.bloqueado_por.nome if self.bloqueado_por else None,
-            'bloqueado_em': self.bloqueado_em.isoformat() if self.bloqueado_em else None,
-            'motivo_bloqueio': self.motivo_bloqueio,
-            'data_fechamento': self.data_fechamento.isoformat() if self.data_fechamento else None,
-            'data_aprovacao': self.data_aprovacao.isoformat() if self.data_aprovacao else None,
-            'conferente_id': self.conferente_id,
-            'conferente_nome': self.conferente.nome if self.conferente else None,
-            'anexos': self.anexos,
-            'divergencias': self.divergencias,
-            'gps_inicio': self.gps_inicio,
-            'gps_fim': self.gps_fim,
-            'ip_inicio': self.ip_inicio,
-            'device_id': self.device_id,
-            'lote_pai_id': self.lote_pai_id,
-            'solicitacao_origem_id': self.solicitacao_origem_id
-        }
+    def to_dict(self, conjunto='completo'):
+        # campos e relacionamentos declarados em app/services/serializacao.py; para
+        # listas use LOTE.consultar(), que carrega tudo em número fixo de consultas
+        from app.services.serializacao import LOTE
+        return LOTE.serializar(self, conjunto)
 
-        # Adicionar informações dos relacionamentos
-        # Usar try/except para garantir que funciona mesmo se os relationships não estiverem carregados
-        try:
-            if self.tipo_lote:
-                data['tipo_lote'] = {
-                    'id': self.tipo_lote.id,
-                    'nome': self.tipo_lote.nome
-                }
-                data['tipo_lote_nome'] = self.tipo_lote.nome
-            else:
-                data['tipo_lote_nome'] = None
-        except Exception:
-            data['tipo_lote_nome'] = None
-
-        try:
-            if self.fornecedor:
-                data['fornecedor'] = {
-                    'id': self.fornecedor.id,
-                    'nome': self.fornecedor.nome,
-                    'cnpj': self.fornecedor.cnpj
-                }
-                data['fornecedor_nome'] = self.fornecedor.nome
-            else:
-                data['fornecedor_nome'] = None
-        except Exception:
-            data['fornecedor_nome'] = None
-
-        if hasattr(self, 'solicitacao_origem') and self.solicitacao_origem:
-            data['solicitacao_origem'] = {
-                'id': self.solicitacao_origem.id,
-                'funcionario_id': self.solicitacao_origem.funcionario_id,
-                'funcionario_nome': self.solicitacao_origem.funcionario.nome if self.solicitacao_origem.funcionario else None,
-                'fornecedor_id': self.solicitacao_origem.fornecedor_id,
-                'fornecedor_nome': self.solicitacao_origem.fornecedor.nome if self.solicitacao_origem.fornecedor else None
-            }
-
-        return data
+@event.listens_for(Lote, 'before_insert')
+@event.listens_for(Lote, 'before_update')
+def _contar_divergencias(mapper, connection, lote):
+    lote.total_divergencias = len(lote.divergencias) if isinstance(lote.divergencias, list) else 0
 
 class EntradaEstoque(db.Model):  # type: ignore
     __tablename__ = 'entradas_estoque'
@@ -895,6 +841,10 @@ class EntradaEstoque(db.Model):  # type: ignore
 
 class Notificacao(db.Model):  # type: ignore
     __tablename__ = 'notificacoes'
+    __table_args__ = (
+        # caixa de entrada paginada por (data_envio, id) decrescente de cada usuário
+        db.Index('ix_notificacoes_usuario_data_id', 'usuario_id', 'data_envio', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
@@ -918,6 +868,47 @@ class Notificacao(db.Model):  # type: ignore
             'data_envio': self.data_envio.isoformat() if self.data_envio else None
         }
 
+class NotificacaoContador(db.Model):  # type: ignore
+    """Total de notificações não lidas por usuário, mantido por app/services/notificacoes.py."""
+    __tablename__ = 'notificacoes_nao_lidas'
+
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id', ondelete='CASCADE'), primary_key=True)
+    total = db.Column(db.Integer, default=0, nullable=False)
+    recalculado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+
+class NotificacaoArquivada(db.Model):  # type: ignore
+    """Notificações lidas movidas pela retenção (executar_retencao); mesmo id da original."""
+    __tablename__ = 'notificacoes_arquivadas'
+    __table_args__ = (
+        db.Index('ix_notificacoes_arquivadas_usuario_data', 'usuario_id', 'data_envio'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id', ondelete='CASCADE'), nullable=False)
+    titulo = db.Column(db.String(200), nullable=False)
+    mensagem = db.Column(db.Text, nullable=False)
+    tipo = db.Column(db.String(50), nullable=True)
+    data_envio = db.Column(db.DateTime, nullable=False)
+    arquivada_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'usuario_id': self.usuario_id,
+            'titulo': self.titulo,
+            'mensagem': self.mensagem,
+            'tipo': self.tipo,
+            'lida': True,
+            'data_envio': self.data_envio.isoformat() if self.data_envio else None,
+            'arquivada_em': self.arquivada_em.isoformat() if self.arquivada_em else None
+        }
+
 class Configuracao(db.Model):  # type: ignore
     __tablename__ = 'configuracoes'
 
@@ -1072,8 +1063,9 @@ class OrdemCompra(db.Model):  # type: ignore
     ip_aprovacao = db.Column(db.String(50))
     gps_aprovacao = db.Column(db.String(100))
     device_info = db.Column(db.String(100))
-    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     criado_por = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
+    data_atualizacao = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     solicitacao = db.relationship('Solicitacao', back_populates='ordem_compra', foreign_keys=[solicitacao_id], uselist=False)
     fornecedor = db.relationship('Fornecedor', backref='ordens_compra', foreign_keys=[fornecedor_id])
@@ -1162,7 +1154,7 @@ class OrdemServico(db.Model):  # type: ignore
     created_by = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=False)
     auditoria = db.Column(db.JSON, default=lambda: [], nullable=True)
     criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    atualizado_em = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     ordem_compra = db.relationship('OrdemCompra', backref='ordens_servico', foreign_keys=[oc_id])
     motorista = db.relationship('Motorista', backref='ordens_servico', foreign_keys=[motorista_id])
@@ -1235,6 +1227,14 @@ class RotaOperacional(db.Model):  # type: ignore
 
 class GPSLog(db.Model):  # type: ignore
     __tablename__ = 'gps_logs'
+    __table_args__ = (
+        # Trajeto de uma OS: os_id + intervalo de tempo
+        db.Index('ix_gps_logs_os_timestamp', 'os_id', 'timestamp'),
+        # Deduplicação das posições contínuas enviadas em lote pelo app do motorista
+        db.Index('ux_gps_logs_posicao_device_timestamp', 'device_id', 'timestamp', unique=True,
+                 postgresql_where=db.text("evento = 'POSICAO'"),
+                 sqlite_where=db.text("evento = 'POSICAO'")),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     os_id = db.Column(db.Integer, db.ForeignKey('ordens_servico.id'), nullable=False)
@@ -1264,6 +1264,77 @@ class GPSLog(db.Model):  # type: ignore
             'dados_adicionais': self.dados_adicionais
         }
 
+class GPSRotaSimplificada(db.Model):  # type: ignore
+    """Trajeto antigo de uma OS, simplificado e codificado após a retenção dos pontos brutos."""
+    __tablename__ = 'gps_rotas_simplificadas'
+    __table_args__ = (
+        db.Index('ix_gps_rotas_simplificadas_os_inicio', 'os_id', 'inicio'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    os_id = db.Column(db.Integer, db.ForeignKey('ordens_servico.id'), nullable=False)
+    device_id = db.Column(db.String(255), nullable=True)
+    inicio = db.Column(db.DateTime, nullable=False)
+    fim = db.Column(db.DateTime, nullable=False)
+    pontos_originais = db.Column(db.Integer, nullable=False, default=0)
+    pontos = db.Column(db.Integer, nullable=False, default=0)
+    tolerancia_metros = db.Column(db.Float, nullable=False)
+    polyline = db.Column(db.Text, nullable=False)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'os_id': self.os_id,
+            'device_id': self.device_id,
+            'inicio': self.inicio.isoformat() if self.inicio else None,
+            'fim': self.fim.isoformat() if self.fim else None,
+            'pontos_originais': self.pontos_originais,
+            'pontos': self.pontos,
+            'tolerancia_metros': self.tolerancia_metros,
+            'polyline': self.polyline
+        }
+
+class MetricasRotaOS(db.Model):  # type: ignore
+    """Distância, tempos e paradas calculados da trilha de GPS de uma OS finalizada."""
+    __tablename__ = 'metricas_rotas_os'
+
+    id = db.Column(db.Integer, primary_key=True)
+    os_id = db.Column(db.Integer, db.ForeignKey('ordens_servico.id'), nullable=False, unique=True)
+    motorista_id = db.Column(db.Integer, db.ForeignKey('motoristas.id'), nullable=True, index=True)
+    km_percorrido = db.Column(db.Float, nullable=False, default=0.0)
+    duracao_minutos = db.Column(db.Float, nullable=False, default=0.0)
+    tempo_fornecedor_minutos = db.Column(db.Float, nullable=True)
+    paradas = db.Column(db.JSON, nullable=True)
+    pontos_originais = db.Column(db.Integer, nullable=False, default=0)
+    pontos_validos = db.Column(db.Integer, nullable=False, default=0)
+    polyline = db.Column(db.Text, nullable=True)
+    inicio = db.Column(db.DateTime, nullable=True)
+    fim = db.Column(db.DateTime, nullable=True)
+    calculado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+
+    def to_dict(self):
+        return {
+            'os_id': self.os_id,
+            'motorista_id': self.motorista_id,
+            'km_percorrido': self.km_percorrido,
+            'duracao_minutos': self.duracao_minutos,
+            'tempo_fornecedor_minutos': self.tempo_fornecedor_minutos,
+            'paradas': self.paradas or [],
+            'pontos_originais': self.pontos_originais,
+            'pontos_validos': self.pontos_validos,
+            'polyline': self.polyline,
+            'inicio': self.inicio.isoformat() if self.inicio else None,
+            'fim': self.fim.isoformat() if self.fim else None,
+            'calculado_em': self.calculado_em.isoformat() if self.calculado_em else None
+        }
+
 class ConferenciaRecebimento(db.Model):  # type: ignore
     __tablename__ = 'conferencias_recebimento'
 
@@ -1370,6 +1441,43 @@ class MovimentacaoEstoque(db.Model):  # type: ignore
             'auditoria': self.auditoria
         }
 
+class LoteEvento(db.Model):  # type: ignore
+    """Histórico do lote, uma linha por ação (app/services/lote_eventos.py); substitui o array Lote.auditoria."""
+    __tablename__ = 'lote_eventos'
+    __table_args__ = (
+        db.Index('ix_lote_eventos_lote_criado_id', 'lote_id', 'criado_em', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    lote_id = db.Column(db.Integer, db.ForeignKey('lotes.id', ondelete='CASCADE'), nullable=False)
+    acao = db.Column(db.String(50), nullable=False)
+    usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    ip = db.Column(db.String(50), nullable=True)
+    device_id = db.Column(db.String(255), nullable=True)
+    gps = db.Column(db.JSON, nullable=True)
+    # só os campos que mudaram: {campo: [antes, depois]}
+    alteracoes = db.Column(db.JSON, nullable=True)
+    detalhes = db.Column(db.JSON, nullable=True)
+
+    lote = db.relationship('Lote', backref=db.backref('eventos', lazy='dynamic', passive_deletes=True))
+    usuario = db.relationship('Usuario')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'lote_id': self.lote_id,
+            'acao': self.acao,
+            'usuario_id': self.usuario_id,
+            'usuario_nome': self.usuario.nome if self.usuario else None,
+            'criado_em': self.criado_em.isoformat() if self.criado_em else None,
+            'ip': self.ip,
+            'device_id': self.device_id,
+            'gps': self.gps,
+            'alteracoes': self.alteracoes or {},
+            'detalhes': self.detalhes or {}
+        }
+
 class LoteSeparacao(db.Model):  # type: ignore
     __tablename__ = 'lotes_separacao'
 
@@ -1894,6 +2002,7 @@ class ScannerConfig(db.Model):  # type: ignore
     price_high_min = db.Column(db.Float, default=60.0, nullable=False)
     price_high_max = db.Column(db.Float, default=150.0, nullable=False)
     prompt_rules = db.Column(db.Text, nullable=True)
+    version = db.Column(db.Integer, default=1, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     updated_by = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True)
@@ -1912,6 +2021,7 @@ class ScannerConfig(db.Model):  # type: ignore
             'price_high_min': self.price_high_min,
             'price_high_max': self.price_high_max,
             'prompt_rules': self.prompt_rules,
+            'version': self.version,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
             'updated_by': self.updated_by
@@ -1932,6 +2042,13 @@ class ScannerAnalysis(db.Model):  # type: ignore
     density_score = db.Column(db.Float, nullable=True)
     image_data = db.Column(db.LargeBinary, nullable=True)
     image_mimetype = db.Column(db.String(50), nullable=True)
+    image_key = db.Column(db.String(64), nullable=True, index=True)
+    thumbnail_key = db.Column(db.String(64), nullable=True, index=True)
+    image_size = db.Column(db.Integer, nullable=True)
+    image_sha256 = db.Column(db.String(64), nullable=True, index=True)
+    image_phash = db.Column(db.String(16), nullable=True)
+    config_version = db.Column(db.Integer, nullable=True)
+    board_detected = db.Column(db.Boolean, nullable=True)
     raw_response = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
@@ -1950,7 +2067,10 @@ class ScannerAnalysis(db.Model):  # type: ignore
             'confidence': self.confidence,
             'components_count': self.components_count,
             'density_score': self.density_score,
-            'has_image': self.image_data is not None,
+            'board_detected': self.board_detected is not False,
+            'has_image': self.image_key is not None or self.image_data is not None,
+            'image_url': f'/api/scanner/blobs/{self.image_key}' if self.image_key else None,
+            'thumbnail_url': f'/api/scanner/blobs/{self.thumbnail_key}' if self.thumbnail_key else None,
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
         if include_image and self.image_data:
@@ -2009,4 +2129,81 @@ class VisitaFornecedor(db.Model):  # type: ignore
             'usuario_nome': self.usuario.nome if self.usuario else None,
             'fornecedor_id': self.fornecedor_id,
             'fornecedor_nome': self.fornecedor.nome if self.fornecedor else None
-        }
\ No newline at end of file
+        }
+
+
+class RollupEstado(db.Model):  # type: ignore
+    """Marca d'água e horário da última atualização de cada tabela de rollup"""
+    __tablename__ = 'rollup_estado'
+
+    nome = db.Column(db.String(50), primary_key=True)
+    marca_dagua = db.Column(db.DateTime, nullable=True)
+    atualizado_em = db.Column(db.DateTime, nullable=True)
+
+
+class RollupLoteDiario(db.Model):  # type: ignore
+    """Lotes agregados por dia de criação, fornecedor, tipo de lote e status"""
+    __tablename__ = 'rollup_lotes_diario'
+    __table_args__ = (
+        db.UniqueConstraint('dia', 'fornecedor_id', 'tipo_lote_id', 'status', name='uq_rollup_lotes_diario'),
+        db.Index('idx_rollup_lotes_fornecedor_dia', 'fornecedor_id', 'dia'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False, index=True)
+    fornecedor_id = db.Column(db.Integer, nullable=False)
+    tipo_lote_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    peso_total_kg = db.Column(db.Float, nullable=False, default=0.0)
+    valor_total = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class RollupSolicitacaoDiario(db.Model):  # type: ignore
+    """Solicitações agregadas por dia de envio, fornecedor, comprador e status"""
+    __tablename__ = 'rollup_solicitacoes_diario'
+    __table_args__ = (
+        db.UniqueConstraint('dia', 'fornecedor_id', 'funcionario_id', 'status', name='uq_rollup_solicitacoes_diario'),
+        db.Index('idx_rollup_solicitacoes_fornecedor_dia', 'fornecedor_id', 'dia'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False, index=True)
+    fornecedor_id = db.Column(db.Integer, nullable=False)
+    funcionario_id = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    quantidade_confirmadas = db.Column(db.Integer, nullable=False, default=0)
+    horas_aprovacao_total = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class RollupOrdemCompraDiario(db.Model):  # type: ignore
+    """Ordens de compra agregadas por dia de criação, fornecedor, comprador e status"""
+    __tablename__ = 'rollup_ordens_compra_diario'
+    __table_args__ = (
+        db.UniqueConstraint('dia', 'fornecedor_id', 'criado_por', 'status', name='uq_rollup_ordens_compra_diario'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    dia = db.Column(db.Date, nullable=False, index=True)
+    fornecedor_id = db.Column(db.Integer, nullable=False)
+    criado_por = db.Column(db.Integer, nullable=False)
+    status = db.Column(db.String(50), nullable=False)
+    quantidade = db.Column(db.Integer, nullable=False, default=0)
+    valor_total = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class GeocodeCache(db.Model):  # type: ignore
+    """Resultado do geocoding reverso por coordenada arredondada (ver app/services/geocode_cache.py)"""
+    __tablename__ = 'geocode_cache'
+
+    id = db.Column(db.Integer, primary_key=True)
+    chave = db.Column(db.String(40), nullable=False, unique=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    resultado = db.Column(db.JSON, nullable=False)
+    fonte = db.Column(db.String(20), nullable=False, default='nominatim')
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expira_em = db.Column(db.DateTime, nullable=False, index=True)
+    ultimo_acesso = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    acessos = db.Column(db.Integer, nullable=False, default=0)
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import Solicitacao, ItemSolicitacao, Lote, Fornecedor, TipoLote, Usuario, db
+from app.services.serializacao import LOTE
 from datetime import datetime
 
 bp = Blueprint('compras', __name__, url_prefix='/api/compras')
@@ -207,11 +208,9 @@ def obter_compra(id):
         if usuario.tipo != 'admin' and solicitacao.funcionario_id != usuario_id:
             return jsonify({'erro': 'Sem permissão para acessar esta compra'}), 403
         
-        lotes = Lote.query.filter_by(solicitacao_origem_id=id).all()
-        
         return jsonify({
             'solicitacao': solicitacao.to_dict(),
-            'lotes': [lote.to_dict() for lote in lotes]
+            'lotes': LOTE.consultar(Lote.query.filter_by(solicitacao_origem_id=id), 'completo')
         }), 200
     
     except Exception as e:
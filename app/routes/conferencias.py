@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import db, ConferenciaRecebimento, OrdemServico, OrdemCompra, Usuario, Notificacao, EntradaEstoque, Lote
 from app.auth import admin_required
+from app.services import notificacoes, lote_eventos
 from datetime import datetime
 import uuid
 import os
@@ -101,25 +102,14 @@ def criar_lote_apos_conferencia(conferencia, usuario_id, decisao='ACEITAR', perc
             conferente_id=conferencia.conferente_id,
             anexos=conferencia.fotos_pesagem or [],
             divergencias=divergencias_registradas,
-            auditoria=[{
-                'acao': 'LOTE_CRIADO_APOS_CONFERENCIA',
-                'usuario_id': usuario_id,
-                'timestamp': datetime.utcnow().isoformat(),
-                'ip': request.remote_addr,
-                'device_id': conferencia.device_id_conferencia or device_id,
-                'gps': conferencia.gps_conferencia or gps,
-                'detalhes': {
-                    'conferencia_id': conferencia.id,
-                    'os_id': os.id,
-                    'oc_id': oc.id,
-                    'decisao': decisao,
-                    'divergencia': conferencia.divergencia,
-                    'tipo_divergencia': conferencia.tipo_divergencia
-                }
-            }],
             data_criacao=datetime.utcnow()
         )
         db.session.add(lote)
+        lote_eventos.registrar(lote, 'LOTE_CRIADO_APOS_CONFERENCIA', usuario_id, {
+            'decisao': decisao,
+            'divergencia': conferencia.divergencia,
+            'tipo_divergencia': conferencia.tipo_divergencia
+        }, gps=conferencia.gps_conferencia or gps, device_id=conferencia.device_id_conferencia or device_id)
         db.session.flush()
         
         if oc.solicitacao and oc.solicitacao.itens:
@@ -463,16 +453,13 @@ def enviar_para_adm(id):
             device_id=data.get('device_id')
         )
         
-        admins = Usuario.query.filter_by(tipo='admin').all()
-        for admin in admins:
-            notificacao = Notificacao(
-                usuario_id=admin.id,
-                titulo='Divergência em Conferência',
-                mensagem=f'Conferência #{conferencia.id} com divergência de {conferencia.percentual_diferenca:.2f}% precisa de análise',
-                tipo='divergencia_conferencia',
-                lida=False
-            )
-            db.session.add(notificacao)
+        notificacoes.notificar(
+            'admins',
+            titulo='Divergência em Conferência',
+            mensagem=f'Conferência #{conferencia.id} com divergência de {conferencia.percentual_diferenca:.2f}% precisa de análise',
+            tipo='divergencia_conferencia',
+            dados={'conferencia_id': conferencia.id}
+        )
         
         db.session.commit()
         
@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import db, Lote, MovimentacaoEstoque, Usuario
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import db, Lote, MovimentacaoEstoque, Usuario, ItemSolicitacao
 from app.auth import admin_required
+from app.services.serializacao import LOTE
 from datetime import datetime
 
 bp = Blueprint('estoque', __name__, url_prefix='/api/estoque')
@@ -33,8 +35,7 @@ def listar_lotes_estoque():
         com_divergencia = request.args.get('com_divergencia')
         if com_divergencia == 'true':
             print(f"  Filtro com_divergencia: true")
-            query = query.filter(Lote.divergencias != None)
-            query = query.filter(Lote.divergencias != [])
+            query = query.filter(Lote.total_divergencias > 0)
 
         data_inicio = request.args.get('data_inicio')
         data_fim = request.args.get('data_fim')
@@ -43,7 +44,16 @@ def listar_lotes_estoque():
         if data_fim:
             query = query.filter(Lote.data_criacao <= datetime.fromisoformat(data_fim))
 
-        lotes = query.order_by(Lote.data_criacao.desc()).all()
+        # tudo que o laço abaixo lê vem em consultas fixas, não por lote
+        itens = selectinload(Lote.itens)
+        lotes = query.options(
+            *LOTE.opcoes('detalhe'),
+            itens.joinedload(ItemSolicitacao.material),
+            itens.joinedload(ItemSolicitacao.tipo_lote),
+            selectinload(Lote.movimentacoes),
+            joinedload(Lote.entrada_estoque)
+        ).order_by(Lote.data_criacao.desc()).all()
+        contagens = LOTE.contar([lote.id for lote in lotes], 'detalhe')
         print(f"✅ Encontrados {len(lotes)} lotes no estoque")
 
         if len(lotes) > 0:
@@ -54,9 +64,7 @@ def listar_lotes_estoque():
         resultado = []
         for lote in lotes:
             try:
-                lote_dict = lote.to_dict()
-                lote_dict['itens_count'] = len(lote.itens)
-                lote_dict['sublotes_count'] = len(lote.sublotes)
+                lote_dict = LOTE.serializar(lote, 'detalhe', contagens)
 
                 # Incluir informações dos materiais/itens do lote
                 itens_info = []
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import db, FornecedorTabelaPrecos, AuditoriaFornecedorTabelaPrecos, Fornecedor, MaterialBase, Usuario, Notificacao, TabelaPrecoItem, TabelaPreco, FornecedorFuncionarioAtribuicao
 from app.auth import admin_required
+from app.services import notificacoes
 import pandas as pd
 from io import BytesIO
 from datetime import datetime
@@ -49,19 +50,14 @@ def verificar_acesso_fornecedor(fornecedor_id, usuario_id):
 
 def notificar_admins_nova_tabela(fornecedor, usuario_criador):
     """Cria notificação para todos os admins sobre nova tabela de preços"""
-    admins = Usuario.query.filter_by(tipo='admin', ativo=True).all()
-    
-    for admin in admins:
-        if admin.id == usuario_criador.id:
-            continue
-            
-        notificacao = Notificacao(
-            usuario_id=admin.id,
-            titulo='Nova Tabela de Preços',
-            mensagem=f'Tabela de preços adicionada para o fornecedor {fornecedor.nome} por {usuario_criador.nome}',
-            tipo='tabela_precos'
-        )
-        db.session.add(notificacao)
+    notificacoes.notificar(
+        'admins',
+        titulo='Nova Tabela de Preços',
+        mensagem=f'Tabela de preços adicionada para o fornecedor {fornecedor.nome} por {usuario_criador.nome}',
+        tipo='tabela_precos',
+        excluir=[usuario_criador.id],
+        dados={'fornecedor_id': fornecedor.id}
+    )
 
 @bp.route('/fornecedor/<int:fornecedor_id>', methods=['GET'])
 @jwt_required()
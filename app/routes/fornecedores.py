@@ -5,6 +5,7 @@ from app.auth import admin_required
 import requests
 import re
 import logging
+from app.services import fornecedores_proximos
 
 logger = logging.getLogger(__name__)
 
@@ -284,6 +285,138 @@ def listar_fornecedores():
     except Exception as e:
         return jsonify({'erro': f'Erro ao listar fornecedores: {str(e)}'}), 500
 
+RAIO_PADRAO_KM = 15
+RAIO_MAXIMO_KM = 500
+LIMITE_PADRAO_PROXIMOS = 50
+LIMITE_MAXIMO_PROXIMOS = 500
+K_MAXIMO = 100
+
+
+def _ler_coordenadas():
+    """Lê lat/lng da query string; devolve (lat, lng, None) ou (None, None, resposta de erro)."""
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    if lat is None or lng is None:
+        return None, None, (jsonify({'erro': 'Parâmetros lat e lng são obrigatórios'}), 400)
+    if not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        return None, None, (jsonify({'erro': 'Coordenadas inválidas'}), 400)
+    return lat, lng, None
+
+
+def _filtro_comprador(usuario):
+    """Comprador só enxerga os fornecedores dos quais é responsável (mesma regra da listagem)."""
+    if usuario.tipo == 'funcionario' and usuario.perfil and usuario.perfil.nome != 'Auditoria / BI':
+        return usuario.id
+    return None
+
+
+def _fornecedores_com_distancia(resultados, pendentes=None):
+    por_id = {f.id: f for f in Fornecedor.query.filter(Fornecedor.id.in_([i for i, _ in resultados])).all()} \
+        if resultados else {}
+    itens = []
+    for fornecedor_id, metros in resultados:
+        fornecedor = por_id.get(fornecedor_id)
+        if not fornecedor:
+            continue
+        item = {
+            'id': fornecedor.id,
+            'nome': fornecedor.nome,
+            'rua': fornecedor.rua,
+            'numero': fornecedor.numero,
+            'bairro': fornecedor.bairro,
+            'cidade': fornecedor.cidade,
+            'estado': fornecedor.estado,
+            'telefone': fornecedor.telefone,
+            'latitude': fornecedor.latitude,
+            'longitude': fornecedor.longitude,
+            'distancia_km': round(metros / 1000, 3)
+        }
+        if pendentes is not None:
+            item['os_pendentes'] = pendentes.get(fornecedor_id, [])
+        itens.append(item)
+    return itens
+
+
+@bp.route('/proximos', methods=['GET'])
+@jwt_required()
+def listar_fornecedores_proximos():
+    """Fornecedores a até `raio` km de (lat, lng), do mais próximo ao mais distante"""
+    try:
+        usuario = Usuario.query.get(get_jwt_identity())
+        if not usuario:
+            return jsonify({'erro': 'Usuário não encontrado'}), 404
+
+        lat, lng, erro = _ler_coordenadas()
+        if erro:
+            return erro
+        raio = request.args.get('raio', RAIO_PADRAO_KM, type=float)
+        limite = request.args.get('limite', LIMITE_PADRAO_PROXIMOS, type=int)
+        if raio is None or not 0 < raio <= RAIO_MAXIMO_KM:
+            return jsonify({'erro': f'raio deve estar entre 0 e {RAIO_MAXIMO_KM} km'}), 400
+        if limite is None or not 1 <= limite <= LIMITE_MAXIMO_PROXIMOS:
+            return jsonify({'erro': f'limite deve estar entre 1 e {LIMITE_MAXIMO_PROXIMOS}'}), 400
+
+        resultados, total = fornecedores_proximos.buscar_no_raio(
+            lat, lng, raio * 1000, limite=limite, comprador_id=_filtro_comprador(usuario)
+        )
+        return jsonify({
+            'fornecedores': _fornecedores_com_distancia(resultados),
+            'total': total,
+            'raio_km': raio,
+            'limite': limite
+        }), 200
+
+    except Exception as e:
+        return jsonify({'erro': f'Erro ao buscar fornecedores próximos: {str(e)}'}), 500
+
+
+@bp.route('/mais-proximos', methods=['GET'])
+@jwt_required()
+def listar_fornecedores_mais_proximos():
+    """
+    Os `k` fornecedores mais próximos de (lat, lng), opcionalmente dentro de `raio` km.
+    Com ?coleta_pendente=true considera só fornecedores com OS PENDENTE/AGENDADA.
+    """
+    try:
+        usuario = Usuario.query.get(get_jwt_identity())
+        if not usuario:
+            return jsonify({'erro': 'Usuário não encontrado'}), 404
+
+        lat, lng, erro = _ler_coordenadas()
+        if erro:
+            return erro
+        k = request.args.get('k', 5, type=int)
+        raio = request.args.get('raio', type=float)
+        if k is None or not 1 <= k <= K_MAXIMO:
+            return jsonify({'erro': f'k deve estar entre 1 e {K_MAXIMO}'}), 400
+        if raio is not None and not 0 < raio <= RAIO_MAXIMO_KM:
+            return jsonify({'erro': f'raio deve estar entre 0 e {RAIO_MAXIMO_KM} km'}), 400
+
+        pendentes = None
+        if request.args.get('coleta_pendente', 'false').lower() == 'true':
+            pendentes = fornecedores_proximos.coletas_pendentes()
+
+        resultados = fornecedores_proximos.buscar_mais_proximos(
+            lat, lng, k,
+            raio_metros=raio * 1000 if raio is not None else None,
+            comprador_id=_filtro_comprador(usuario),
+            ids_permitidos=pendentes.keys() if pendentes is not None else None
+        )
+        return jsonify({
+            'fornecedores': _fornecedores_com_distancia(resultados, pendentes),
+            'k': k,
+            'raio_km': raio
+        }), 200
+
+    except Exception as e:
+        return jsonify({'erro': f'Erro ao buscar fornecedores mais próximos: {str(e)}'}), 500
+
+
+@bp.route('/indice-espacial', methods=['GET'])
+@admin_required
+def obter_status_indice_espacial():
+    return jsonify(fornecedores_proximos.get_indice_stats()), 200
+
 @bp.route('/<int:id>', methods=['GET'])
 @jwt_required()
 def obter_fornecedor(id):
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import Lote, ItemSolicitacao, Solicitacao, EntradaEstoque, Usuario, db
 from app.auth import admin_required
+from app.services.serializacao import LOTE
 from datetime import datetime
 import uuid
 
@@ -26,15 +27,7 @@ def listar_lotes():
         if tipo_lote_id:
             query = query.filter_by(tipo_lote_id=tipo_lote_id)
         
-        lotes = query.order_by(Lote.data_criacao.desc()).all()
-        
-        resultado = []
-        for lote in lotes:
-            lote_dict = lote.to_dict()
-            lote_dict['itens_count'] = len(lote.itens)
-            resultado.append(lote_dict)
-        
-        return jsonify(resultado), 200
+        return jsonify(LOTE.consultar(query.order_by(Lote.data_criacao.desc()), 'lista')), 200
     
     except Exception as e:
         return jsonify({'erro': f'Erro ao listar lotes: {str(e)}'}), 500
@@ -3,6 +3,7 @@ import requests
 import os
 from datetime import datetime, timedelta
 from functools import lru_cache
+from app.services import estado_compartilhado
 import time
 import json
 import urllib3
@@ -10,12 +11,14 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 bp = Blueprint('metais', __name__, url_prefix='/api/metais')
 
-METALS_CACHE = {
-    'data': None,
-    'timestamp': 0,
-    'history': {}
-}
+# Cotação, histórico do dia e alertas ficam em estado_compartilhado (Redis com
+# vários workers): com um dicionário no módulo cada worker tinha seu próprio
+# histórico e os alertas criados num worker não apareciam nos outros
+CHAVE_COTACAO = 'metais:cotacao'
+CHAVE_HISTORICO = 'metais:historico:{}'
+CHAVE_ALERTAS = 'metais:alertas'
 CACHE_DURATION = 60
+HISTORICO_TTL = 31 * 24 * 3600
 
 METAL_SYMBOLS = {
     'XAU': {
@@ -195,8 +198,9 @@ def get_simulated_metals_data():
 def fetch_metals_data():
     current_time = time.time()
     
-    if METALS_CACHE['data'] and (current_time - METALS_CACHE['timestamp']) < CACHE_DURATION:
-        return METALS_CACHE['data']
+    cotacao = estado_compartilhado.obter(CHAVE_COTACAO) or {}
+    if cotacao.get('data') and (current_time - cotacao.get('timestamp', 0)) < CACHE_DURATION:
+        return cotacao['data']
     
     metals_data = get_metals_live_api()
     
@@ -211,7 +215,7 @@ def fetch_metals_data():
     
     usd_brl = get_awesome_api_currencies()
     
-    previous_cache = METALS_CACHE.get('previous') or {}
+    previous_cache = cotacao.get('previous') or {}
     
     for symbol, data in metals_data.items():
         metal_info = METAL_SYMBOLS.get(symbol, {})
@@ -237,24 +241,29 @@ def fetch_metals_data():
         'source': list(metals_data.values())[0]['source'] if metals_data else 'none'
     }
     
-    cached_data = METALS_CACHE.get('data') or {}
-    METALS_CACHE['previous'] = cached_data.get('metals', {}) if isinstance(cached_data, dict) else {}
-    METALS_CACHE['data'] = result
-    METALS_CACHE['timestamp'] = current_time
+    cached_data = cotacao.get('data') or {}
+    estado_compartilhado.definir(CHAVE_COTACAO, {
+        'data': result,
+        'timestamp': current_time,
+        'previous': cached_data.get('metals', {}) if isinstance(cached_data, dict) else {}
+    })
     
     today = datetime.now().strftime('%Y-%m-%d')
-    if today not in METALS_CACHE['history']:
-        METALS_CACHE['history'][today] = []
-    METALS_CACHE['history'][today].append({
+    estado_compartilhado.anexar(CHAVE_HISTORICO.format(today), {
         'time': datetime.now().strftime('%H:%M:%S'),
         'metals': {k: v['price_usd'] for k, v in metals_data.items()}
-    })
-    
-    if len(METALS_CACHE['history'][today]) > 1440:
-        METALS_CACHE['history'][today] = METALS_CACHE['history'][today][-1440:]
+    }, maximo=1440, ttl=HISTORICO_TTL)
     
     return result
 
+def aplicar_historico_real(history):
+    """Substitui os dias simulados pelas cotações reais registradas em fetch_metals_data."""
+    for date in list(history.keys()):
+        entries = estado_compartilhado.ler_lista(CHAVE_HISTORICO.format(date))
+        if entries:
+            history[date] = entries
+    return history
+
 def generate_historical_data(days=30):
     import random
     history = {}
@@ -312,12 +321,7 @@ def get_historico():
         days = request.args.get('days', 7, type=int)
         days = min(days, 30)
         
-        history = generate_historical_data(days)
-        
-        real_history = METALS_CACHE.get('history') or {}
-        for date, entries in real_history.items():
-            if date in history and entries:
-                history[date] = entries
+        history = aplicar_historico_real(generate_historical_data(days))
         
         return jsonify({
             'history': history,
@@ -451,11 +455,7 @@ def exportar_csv():
             csv_content += f"TOTAL,,,{round(total_usd, 2)},{round(total_brl, 2)}\n"
         elif export_type == 'historico':
             days = data.get('days', 7)
-            history = generate_historical_data(days)
-            real_history = METALS_CACHE.get('history') or {}
-            for date, entries in real_history.items():
-                if date in history and entries:
-                    history[date] = entries
+            history = aplicar_historico_real(generate_historical_data(days))
             metals_list = list(METAL_SYMBOLS.keys())
             csv_content = "Data,Hora," + ",".join(metals_list) + "\n"
             for date, entries in sorted(history.items()):
@@ -480,16 +480,14 @@ def exportar_csv():
 
 @bp.route('/alertas', methods=['GET', 'POST', 'DELETE'])
 def manage_alertas():
-    if not hasattr(bp, 'alertas'):
-        bp.alertas = []
-    
     if request.method == 'GET':
-        return jsonify(bp.alertas)
+        alertas = estado_compartilhado.ler_campos(CHAVE_ALERTAS).values()
+        return jsonify(sorted(alertas, key=lambda a: a['id']))
     
     elif request.method == 'POST':
         data = request.get_json()
         alerta = {
-            'id': len(bp.alertas) + 1,
+            'id': estado_compartilhado.incrementar(f'{CHAVE_ALERTAS}:seq'),
             'metal': data.get('metal'),
             'condition': data.get('condition'),
             'price': float(data.get('price', 0)),
@@ -497,12 +495,12 @@ def manage_alertas():
             'created_at': datetime.now().isoformat(),
             'active': True
         }
-        bp.alertas.append(alerta)
+        estado_compartilhado.definir_campo(CHAVE_ALERTAS, alerta['id'], alerta)
         return jsonify(alerta), 201
     
     elif request.method == 'DELETE':
         alerta_id = request.args.get('id', type=int)
-        bp.alertas = [a for a in bp.alertas if a['id'] != alerta_id]
+        estado_compartilhado.remover_campo(CHAVE_ALERTAS, alerta_id)
         return jsonify({'success': True})
 
 @bp.route('/estatisticas', methods=['GET'])
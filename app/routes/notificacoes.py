@@ -1,36 +1,47 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import db, Notificacao
+from app.auth import admin_required
+from app.services import notificacoes as servico_notificacoes
 
 bp = Blueprint('notificacoes', __name__, url_prefix='/api/notificacoes')
 
 @bp.route('', methods=['GET'])
 @jwt_required()
 def listar_notificacoes():
-    usuario_id = get_jwt_identity()
+    """
+    Caixa de entrada paginada, mais recentes primeiro.
+
+    ?limite=50 (máx. 200) e ?cursor=<X-Proximo-Cursor da página anterior>;
+    sem o cabeçalho X-Proximo-Cursor não há mais páginas.
+    """
+    usuario_id = int(get_jwt_identity())
     
-    notificacoes = Notificacao.query.filter_by(
-        usuario_id=usuario_id
-    ).order_by(Notificacao.data_envio.desc()).all()
+    try:
+        notificacoes, proximo_cursor = servico_notificacoes.listar(
+            usuario_id, limite=request.args.get('limite', type=int), cursor=request.args.get('cursor')
+        )
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
     
-    return jsonify([notificacao.to_dict() for notificacao in notificacoes]), 200
+    resposta = jsonify([notificacao.to_dict() for notificacao in notificacoes])
+    if proximo_cursor:
+        resposta.headers['X-Proximo-Cursor'] = proximo_cursor
+    return resposta, 200
 
 @bp.route('/nao-lidas', methods=['GET'])
 @jwt_required()
 def contar_nao_lidas():
-    usuario_id = get_jwt_identity()
+    usuario_id = int(get_jwt_identity())
     
-    count = Notificacao.query.filter_by(
-        usuario_id=usuario_id,
-        lida=False
-    ).count()
+    count = servico_notificacoes.contar_nao_lidas(usuario_id)
     
     return jsonify({'count': count}), 200
 
 @bp.route('/<int:id>/marcar-lida', methods=['PUT'])
 @jwt_required()
 def marcar_como_lida(id):
-    usuario_id = get_jwt_identity()
+    usuario_id = int(get_jwt_identity())
     
     notificacao = Notificacao.query.get(id)
     
@@ -40,6 +51,7 @@ def marcar_como_lida(id):
     if notificacao.usuario_id != usuario_id:
         return jsonify({'erro': 'Acesso negado'}), 403
     
+    # o contador de não lidas é atualizado no flush (app/services/notificacoes.py)
     notificacao.lida = True
     db.session.commit()
     
@@ -48,13 +60,16 @@ def marcar_como_lida(id):
 @bp.route('/marcar-todas-lidas', methods=['PUT'])
 @jwt_required()
 def marcar_todas_como_lidas():
-    usuario_id = get_jwt_identity()
-    
-    Notificacao.query.filter_by(
-        usuario_id=usuario_id,
-        lida=False
-    ).update({'lida': True})
+    usuario_id = int(get_jwt_identity())
     
-    db.session.commit()
+    marcadas = servico_notificacoes.marcar_todas_lidas(usuario_id)
     
-    return jsonify({'mensagem': 'Todas as notificações foram marcadas como lidas'}), 200
+    return jsonify({
+        'mensagem': 'Todas as notificações foram marcadas como lidas',
+        'marcadas': marcadas
+    }), 200
+
+@bp.route('/envio/stats', methods=['GET'])
+@admin_required
+def obter_stats_envio():
+    return jsonify(servico_notificacoes.get_notificacoes_stats()), 200
@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import db, OrdemServico, OrdemCompra, Fornecedor, Motorista, Veiculo, Usuario, Notificacao, GPSLog, ConferenciaRecebimento
 from app.auth import admin_required
+from app.services import gps_ingestao, gps_armazenamento, rotas_metricas, roteirizacao, tempo_real, notificacoes
 from datetime import datetime
 
 bp = Blueprint('ordens_servico', __name__)
@@ -71,16 +72,46 @@ def listar_os():
         
         perfil_nome = usuario.perfil.nome if usuario.perfil else None
         
+        since = request.args.get('since')
+        desde = None
+        if since:
+            try:
+                desde = tempo_real.ler_cursor(since)
+            except ValueError as e:
+                return jsonify({'erro': str(e)}), 400
+        cursor = tempo_real.cursor_atual()
+        
+        visiveis = db.session.query(OrdemServico.id)
         if perfil_nome == 'Motorista' or usuario.tipo == 'motorista':
             motorista = Motorista.query.filter_by(usuario_id=usuario_id).first()
             if motorista:
                 query = query.filter_by(motorista_id=motorista.id)
+                visiveis = visiveis.filter_by(motorista_id=motorista.id)
+            elif desde:
+                return jsonify({'alterados': [], 'removidos': [], 'cursor': cursor}), 200
             else:
-                return jsonify([]), 200
+                return jsonify([]), 200, {'X-Cursor': cursor}
+        
+        if desde:
+            # Delta: só as OS alteradas desde o cursor; as que mudaram mas saíram
+            # dos filtros da consulta (outro status, outro motorista_id) voltam em
+            # removidos, limitados às OS que o usuário pode ver
+            os_list = query.filter(OrdemServico.atualizado_em >= desde).order_by(OrdemServico.criado_em.desc()).all()
+            alteradas = {os.id for os in os_list}
+            removidos = [os_id for (os_id,) in visiveis.filter(
+                OrdemServico.atualizado_em >= desde
+            ) if os_id not in alteradas]
+            tempo_real.registrar_consulta(True, len(os_list))
+            return jsonify({
+                'alterados': [os.to_dict() for os in os_list],
+                'removidos': removidos,
+                'cursor': cursor
+            }), 200
         
         os_list = query.order_by(OrdemServico.criado_em.desc()).all()
+        tempo_real.registrar_consulta(False, len(os_list))
         
-        return jsonify([os.to_dict() for os in os_list]), 200
+        return jsonify([os.to_dict() for os in os_list]), 200, {'X-Cursor': cursor}
     
     except Exception as e:
         return jsonify({'erro': f'Erro ao listar OS: {str(e)}'}), 500
@@ -106,7 +137,11 @@ def obter_os(id):
         os_dict = os.to_dict()
         
         os_dict['ordem_compra'] = os.ordem_compra.to_dict() if os.ordem_compra else None
-        os_dict['gps_eventos'] = [gps.to_dict() for gps in os.eventos_gps]
+        # Só os eventos discretos; o trajeto contínuo fica em /<id>/rota-gps
+        os_dict['gps_eventos'] = [gps.to_dict() for gps in GPSLog.query.filter(
+            GPSLog.os_id == os.id,
+            GPSLog.evento != gps_ingestao.EVENTO_POSICAO
+        ).order_by(GPSLog.timestamp)]
         os_dict['rotas'] = [rota.to_dict() for rota in os.rotas_operacionais]
         
         return jsonify(os_dict), 200
@@ -223,6 +258,59 @@ def atribuir_motorista(id):
         db.session.rollback()
         return jsonify({'erro': f'Erro ao atribuir motorista: {str(e)}'}), 500
 
+@bp.route('/roteirizar', methods=['POST'])
+@admin_required
+def roteirizar_pendentes():
+    """
+    Planeja rotas com várias coletas para as OS PENDENTE sem motorista.
+
+    Body (opcional): os_ids, motorista_ids, origem {latitude, longitude},
+    max_paradas, max_viagens e aplicar. Sem aplicar=true só devolve o plano;
+    com aplicar=true atribui as OS e grava as RotaOperacional. OS atribuídas
+    por outra requisição durante o planejamento voltam em os_ignoradas, e as
+    rotas e totais do plano devolvido já vêm recalculados sem elas.
+    """
+    try:
+        usuario_id = get_jwt_identity()
+        data = request.get_json(silent=True) or {}
+
+        deposito = None
+        if data.get('origem'):
+            try:
+                deposito = (float(data['origem']['latitude']), float(data['origem']['longitude']))
+            except (KeyError, TypeError, ValueError):
+                return jsonify({'erro': 'origem deve ter latitude e longitude'}), 400
+
+        max_paradas = data.get('max_paradas', roteirizacao.ROTEIRIZACAO_MAX_PARADAS)
+        max_viagens = data.get('max_viagens', roteirizacao.ROTEIRIZACAO_MAX_VIAGENS)
+        if not isinstance(max_paradas, int) or not 1 <= max_paradas <= 100:
+            return jsonify({'erro': 'max_paradas deve estar entre 1 e 100'}), 400
+        if not isinstance(max_viagens, int) or not 1 <= max_viagens <= 10:
+            return jsonify({'erro': 'max_viagens deve estar entre 1 e 10'}), 400
+
+        plano = roteirizacao.planejar_pendentes(
+            os_ids=data.get('os_ids'),
+            motorista_ids=data.get('motorista_ids'),
+            deposito=deposito,
+            max_paradas=max_paradas,
+            max_viagens=max_viagens
+        )
+
+        if data.get('aplicar'):
+            plano['os_ignoradas'] = roteirizacao.aplicar_plano(plano, usuario_id, registrar_auditoria_os)
+            db.session.commit()
+            plano['aplicado'] = True
+        else:
+            plano['aplicado'] = False
+
+        return jsonify(plano), 200
+
+    except roteirizacao.RoteirizacaoErro as e:
+        return jsonify({'erro': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'erro': f'Erro ao roteirizar OS: {str(e)}'}), 500
+
 @bp.route('/<int:id>/reagendar', methods=['POST'])
 @admin_required
 def reagendar_os(id):
@@ -375,38 +463,22 @@ def registrar_evento(id):
             os.status = 'ENTREGUE'
         elif evento == 'FORNECEDOR_FECHADO':
             os.status = 'IMPEDIDO'
-            admins = Usuario.query.filter(
-                db.or_(
-                    Usuario.tipo == 'admin',
-                    Usuario.perfil.has(nome='Administrador')
-                )
-            ).all()
-            for admin in admins:
-                notificacao = Notificacao(
-                    usuario_id=admin.id,
-                    titulo='Fornecedor Fechado',
-                    mensagem=f'OS {os.numero_os}: Motorista registrou que o fornecedor está fechado. Motivo: {data.get("motivo", "Não informado")}',
-                    tipo='alerta_motorista',
-                    lida=False
-                )
-                db.session.add(notificacao)
+            notificacoes.notificar(
+                'admins',
+                titulo='Fornecedor Fechado',
+                mensagem=f'OS {os.numero_os}: Motorista registrou que o fornecedor está fechado. Motivo: {data.get("motivo", "Não informado")}',
+                tipo='alerta_motorista',
+                dados={'os_id': os.id}
+            )
         elif evento == 'FORNECEDOR_NAO_ENCONTRADO':
             os.status = 'IMPEDIDO'
-            admins = Usuario.query.filter(
-                db.or_(
-                    Usuario.tipo == 'admin',
-                    Usuario.perfil.has(nome='Administrador')
-                )
-            ).all()
-            for admin in admins:
-                notificacao = Notificacao(
-                    usuario_id=admin.id,
-                    titulo='Fornecedor Não Encontrado',
-                    mensagem=f'OS {os.numero_os}: Motorista não conseguiu localizar o fornecedor. Motivo: {data.get("motivo", "Não informado")}',
-                    tipo='alerta_motorista',
-                    lida=False
-                )
-                db.session.add(notificacao)
+            notificacoes.notificar(
+                'admins',
+                titulo='Fornecedor Não Encontrado',
+                mensagem=f'OS {os.numero_os}: Motorista não conseguiu localizar o fornecedor. Motivo: {data.get("motivo", "Não informado")}',
+                tipo='alerta_motorista',
+                dados={'os_id': os.id}
+            )
         elif evento == 'FINALIZEI':
             os.status = 'FINALIZADA'
             
@@ -438,23 +510,15 @@ def registrar_evento(id):
                         }]
                     )
                     db.session.add(conferencia)
+                    db.session.flush()
                     
-                    conferentes = Usuario.query.join(Usuario.perfil).filter(
-                        db.or_(
-                            db.text("perfis.nome = 'Conferente / Estoque'"),
-                            db.text("perfis.nome = 'Administrador'")
-                        )
-                    ).all()
-                    
-                    for conferente in conferentes:
-                        notificacao = Notificacao(
-                            usuario_id=conferente.id,
-                            titulo='Nova Conferência Pendente',
-                            mensagem=f'OS {os.numero_os} foi finalizada. Conferência #{conferencia.id if conferencia.id else "nova"} criada e aguardando processamento.',
-                            tipo='nova_conferencia',
-                            lida=False
-                        )
-                        db.session.add(notificacao)
+                    notificacoes.notificar(
+                        'conferentes',
+                        titulo='Nova Conferência Pendente',
+                        mensagem=f'OS {os.numero_os} foi finalizada. Conferência #{conferencia.id} criada e aguardando processamento.',
+                        tipo='nova_conferencia',
+                        dados={'os_id': os.id, 'conferencia_id': conferencia.id}
+                    )
         
         registrar_auditoria_os(os, f'EVENTO_{evento}', usuario_id, {
             'gps': data['gps'],
@@ -463,6 +527,9 @@ def registrar_evento(id):
         
         db.session.commit()
         
+        if evento == 'FINALIZEI':
+            rotas_metricas.agendar_calculo(current_app._get_current_object(), os.id)
+        
         return jsonify({
             'mensagem': f'Evento {evento} registrado com sucesso',
             'os': os.to_dict()
@@ -472,6 +539,136 @@ def registrar_evento(id):
         db.session.rollback()
         return jsonify({'erro': f'Erro ao registrar evento: {str(e)}'}), 500
 
+@bp.route('/<int:id>/gps', methods=['POST'])
+@jwt_required()
+def registrar_posicoes_gps(id):
+    """
+    Recebe um lote de posições contínuas do app do motorista:
+    {"device_id": "...", "pontos": [{"latitude", "longitude", "precisao", "timestamp", ...}]}
+
+    Os pontos são validados e enfileirados para gravação em massa
+    (app/services/gps_ingestao.py); reenvios do mesmo (device_id, timestamp)
+    são ignorados.
+    """
+    try:
+        usuario_id = get_jwt_identity()
+        data = request.get_json(silent=True) or {}
+
+        device_id = data.get('device_id')
+        pontos = data.get('pontos')
+        if not device_id or not isinstance(pontos, list) or not pontos:
+            return jsonify({'erro': 'device_id e pontos são obrigatórios'}), 400
+        if len(pontos) > gps_ingestao.GPS_LOTE_MAX:
+            return jsonify({'erro': f'Máximo de {gps_ingestao.GPS_LOTE_MAX} pontos por lote'}), 413
+
+        os_atribuida = db.session.query(OrdemServico.id).join(
+            Motorista, OrdemServico.motorista_id == Motorista.id
+        ).filter(
+            OrdemServico.id == id,
+            Motorista.usuario_id == usuario_id
+        ).first()
+        if not os_atribuida:
+            return jsonify({'erro': 'Ordem de Serviço não encontrada ou não atribuída ao motorista'}), 404
+
+        linhas, rejeitados, duplicados = gps_ingestao.validar_pontos(
+            id, str(device_id), pontos, ip=request.remote_addr
+        )
+        if linhas:
+            gps_ingestao.enfileirar_pontos(linhas)
+
+        return jsonify({
+            'aceitos': len(linhas),
+            'duplicados': duplicados,
+            'rejeitados': rejeitados
+        }), 202
+
+    except gps_ingestao.GPSBufferCheio as e:
+        resposta = jsonify({'erro': 'Servidor ocupado, reenvie os pontos em instantes', 'retry_after': e.retry_after})
+        resposta.headers['Retry-After'] = str(e.retry_after)
+        return resposta, 503
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'erro': f'Erro ao registrar posições: {str(e)}'}), 500
+
+@bp.route('/<int:id>/rota-gps', methods=['GET'])
+@jwt_required()
+def obter_rota_gps(id):
+    """
+    Trajeto da OS, lido dos pontos brutos e dos trajetos já simplificados pela
+    retenção. Pontos em [latitude, longitude, timestamp]; filtros opcionais
+    inicio e fim (ISO 8601). Com simplificar=true aplica Douglas-Peucker
+    (tolerancia em metros, padrão 5) para desenhar no mapa.
+    """
+    try:
+        usuario_id = get_jwt_identity()
+        usuario = Usuario.query.get(usuario_id)
+
+        os = OrdemServico.query.get(id)
+        if not os:
+            return jsonify({'erro': 'Ordem de Serviço não encontrada'}), 404
+
+        perfil_nome = usuario.perfil.nome if usuario.perfil else None
+        if perfil_nome == 'Motorista' or usuario.tipo == 'motorista':
+            motorista = Motorista.query.filter_by(usuario_id=usuario_id).first()
+            if not motorista or os.motorista_id != motorista.id:
+                return jsonify({'erro': 'Acesso negado'}), 403
+
+        try:
+            inicio = datetime.fromisoformat(request.args['inicio']) if request.args.get('inicio') else None
+            fim = datetime.fromisoformat(request.args['fim']) if request.args.get('fim') else None
+        except ValueError:
+            return jsonify({'erro': 'inicio e fim devem estar no formato ISO 8601'}), 400
+
+        rota = gps_armazenamento.obter_rota(os.id, inicio=inicio, fim=fim)
+        pontos = rota['pontos']
+        if request.args.get('simplificar', 'false').lower() == 'true':
+            tolerancia = request.args.get('tolerancia', rotas_metricas.TOLERANCIA_MAPA_METROS, type=float)
+            pontos = gps_armazenamento.simplificar(pontos, max(tolerancia, 0.5))
+
+        return jsonify({
+            'os_id': os.id,
+            'pontos': [[lat, lng, instante.isoformat()] for lat, lng, instante in pontos],
+            'eventos': [evento.to_dict() for evento in rota['eventos']],
+            'fontes': rota['fontes']
+        }), 200
+
+    except Exception as e:
+        return jsonify({'erro': f'Erro ao obter rota: {str(e)}'}), 500
+
+@bp.route('/<int:id>/metricas-rota', methods=['GET'])
+@jwt_required()
+def obter_metricas_rota(id):
+    """Km percorrido, duração, tempo no fornecedor, paradas e polyline da OS"""
+    try:
+        usuario_id = get_jwt_identity()
+        usuario = Usuario.query.get(usuario_id)
+
+        os = OrdemServico.query.get(id)
+        if not os:
+            return jsonify({'erro': 'Ordem de Serviço não encontrada'}), 404
+
+        perfil_nome = usuario.perfil.nome if usuario.perfil else None
+        if perfil_nome == 'Motorista' or usuario.tipo == 'motorista':
+            motorista = Motorista.query.filter_by(usuario_id=usuario_id).first()
+            if not motorista or os.motorista_id != motorista.id:
+                return jsonify({'erro': 'Acesso negado'}), 403
+
+        return jsonify(rotas_metricas.obter_metricas(os)), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'erro': f'Erro ao calcular métricas da rota: {str(e)}'}), 500
+
+@bp.route('/gps/buffer', methods=['GET'])
+@admin_required
+def obter_status_buffer_gps():
+    return jsonify(gps_ingestao.get_buffer_stats()), 200
+
+@bp.route('/tempo-real/stats', methods=['GET'])
+@admin_required
+def obter_stats_tempo_real():
+    return jsonify(tempo_real.get_tempo_real_stats()), 200
+
 @bp.route('/<int:id>/cancelar-impedido', methods=['PUT'])
 @admin_required
 def cancelar_os_impedido(id):
@@ -4,9 +4,9 @@ from app.models import Fornecedor, Usuario, Vendedor, Placa, db
 from werkzeug.utils import secure_filename
 import os
 from datetime import datetime
-from google import genai
-from google.genai import types
+from app.services.gemini_queue import submit_job, wait_job, get_job, GeminiQueueFull
 import io
+import re
 
 placas_bp = Blueprint('placas', __name__)
 
@@ -16,81 +16,52 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def interpretar_resposta_placa(resultado_texto):
+    if not resultado_texto:
+        return {'erro': 'Gemini não retornou resposta'}
+    
+    print(f"[GEMINI] Resposta completa: {resultado_texto}")
+    
+    # Detectar classificação
+    classificacao = "media"
+    resultado_upper = resultado_texto.upper()
+    if "LEVE" in resultado_upper:
+        classificacao = "leve"
+    elif "PESADA" in resultado_upper:
+        classificacao = "pesada"
+    
+    # Extrair justificativa
+    justificativa_match = re.search(r'Classificação:\s*(LEVE|MÉDIA|MEDIA|PESADA)\s*[—\-–]\s*(.+)', resultado_texto, re.IGNORECASE)
+    if justificativa_match:
+        justificativa = justificativa_match.group(2).strip()
+    else:
+        # Tentar pegar a primeira linha que não seja vazia
+        linhas = [l.strip() for l in resultado_texto.split('\n') if l.strip()]
+        justificativa = linhas[0] if linhas else "Placa analisada"
+    
+    mensagem_final = f" Classificação IA: {classificacao.upper()} — {justificativa}"
+    
+    return {
+        'classificacao': classificacao,
+        'mensagem': mensagem_final,
+        'justificativa': justificativa,
+        'analise_completa': resultado_texto
+    }
+
+def enviar_analise_placa(imagem_bytes, usuario_id=None):
+    """Coloca a imagem na fila de classificação do Gemini e devolve o job"""
+    return submit_job(imagem_bytes, 'placa', interpretar_resposta_placa, usuario_id)
+
 def analisar_placa_automatica(imagem_bytes):
     try:
         # Integração com Gemini AI blueprint
-        api_key = os.environ.get("GEMINI_API_KEY")
-        if not api_key:
+        if not os.environ.get("GEMINI_API_KEY"):
             return {'erro': 'Chave da API do Gemini não configurada'}
-            
-        client = genai.Client(api_key=api_key)
-        
-        prompt = """Você é um especialista em classificação de placas eletrônicas (PCBs). 
-Analise esta imagem de placa eletrônica e classifique como LEVE, MÉDIA ou PESADA.
-
-REGRAS DE CLASSIFICAÇÃO IMPORTANTES:
-- LEVE: Alta presença de verde visível (áreas grandes da placa sem muitos componentes soldados). 
-  Quanto mais verde aparecer na placa, mais "LEVE" ela é.
-- MÉDIA: Quantidade moderada de componentes, com áreas verdes ainda visíveis.
-- PESADA: Muitos componentes, conectores, chips, resistores, capacitores e grande densidade visual.
-  Pouco verde visível devido à alta quantidade de componentes soldados.
-
-A regra é simples: quanto MAIS VERDE VISÍVEL = mais LEVE a placa.
-Quanto MENOS VERDE VISÍVEL (mais componentes) = mais PESADA a placa.
-
-Responda APENAS com:
-1. A classificação (LEVE / MÉDIA / PESADA)
-2. Uma breve justificativa (1 frase curta)
-
-Formato EXATO da resposta:
-Classificação: [LEVE/MÉDIA/PESADA] — [justificativa em 1 frase]
-
-Não adicione informações extras, apenas a classificação e justificativa."""
-        
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=[
-                types.Part.from_bytes(
-                    data=imagem_bytes,
-                    mime_type="image/jpeg",
-                ),
-                prompt
-            ],
-        )
-        
-        if not response.text:
-            return {'erro': 'Gemini não retornou resposta'}
         
-        resultado_texto = response.text.strip()
-        print(f"[GEMINI] Resposta completa: {resultado_texto}")
-        
-        # Detectar classificação
-        classificacao = "media"
-        resultado_upper = resultado_texto.upper()
-        if "LEVE" in resultado_upper:
-            classificacao = "leve"
-        elif "PESADA" in resultado_upper:
-            classificacao = "pesada"
-        
-        # Extrair justificativa
-        import re
-        justificativa_match = re.search(r'Classificação:\s*(LEVE|MÉDIA|MEDIA|PESADA)\s*[—\-–]\s*(.+)', resultado_texto, re.IGNORECASE)
-        if justificativa_match:
-            justificativa = justificativa_match.group(2).strip()
-        else:
-            # Tentar pegar a primeira linha que não seja vazia
-            linhas = [l.strip() for l in resultado_texto.split('\n') if l.strip()]
-            justificativa = linhas[0] if linhas else "Placa analisada"
-        
-        mensagem_final = f" Classificação IA: {classificacao.upper()} — {justificativa}"
-        
-        return {
-            'classificacao': classificacao,
-            'mensagem': mensagem_final,
-            'justificativa': justificativa,
-            'analise_completa': resultado_texto
-        }
+        return wait_job(enviar_analise_placa(imagem_bytes))
         
+    except GeminiQueueFull:
+        return {'erro': 'Fila de análise cheia, tente novamente em instantes'}
     except Exception as e:
         return {'erro': f'Erro ao processar imagem: {str(e)}'}
 
@@ -111,6 +82,17 @@ def analisar_placa_endpoint():
     try:
         imagem_bytes = file.read()
         
+        if request.args.get('async', 'false').lower() == 'true':
+            if not os.environ.get("GEMINI_API_KEY"):
+                return jsonify({'erro': 'Chave da API do Gemini não configurada'}), 400
+            try:
+                job = enviar_analise_placa(imagem_bytes, int(get_jwt_identity()))
+            except GeminiQueueFull as e:
+                response = jsonify({'erro': 'Fila de análise cheia, tente novamente', 'retry_after': e.retry_after})
+                response.headers['Retry-After'] = str(e.retry_after)
+                return response, 503
+            return jsonify(job.to_dict()), 202
+        
         resultado = analisar_placa_automatica(imagem_bytes)
         
         if 'erro' in resultado:
@@ -121,6 +103,15 @@ def analisar_placa_endpoint():
     except Exception as e:
         return jsonify({'erro': f'Erro ao processar imagem: {str(e)}'}), 500
 
+@placas_bp.route('/api/placas/analisar/<job_id>', methods=['GET'])
+@jwt_required()
+def status_analise_placa(job_id):
+    job = get_job(job_id)
+    if not job or job.usuario_id != int(get_jwt_identity()):
+        return jsonify({'erro': 'Análise não encontrada'}), 404
+    
+    return jsonify(job.to_dict()), 200
+
 @placas_bp.route('/api/placas/consulta', methods=['GET'])
 @jwt_required()
 def consultar_placas():
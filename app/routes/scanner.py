@@ -1,8 +1,9 @@
-from flask import Blueprint, request, jsonify, render_template
+from flask import Blueprint, request, jsonify, render_template, send_file, Response
+from sqlalchemy import or_
+from sqlalchemy.orm import defer
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import db, Usuario, ScannerConfig, ScannerAnalysis
 from app.services.pcb_analyzer import (
-    analyze_pcb_image as opencv_analyze_pcb,
     get_type_guess_from_analysis,
     generate_local_explanation
 )
@@ -10,13 +11,46 @@ from app.services.perplexity_formatter import (
     build_explanation_with_perplexity,
     is_perplexity_configured
 )
+from app.services.scanner_pool import (
+    submit_analysis,
+    submit_batch,
+    ScannerPoolFull,
+    get_pool_status,
+    run_in_thread
+)
+from app.services.scanner_cache import (
+    compute_image_hashes,
+    find_cached_analysis,
+    remember_analysis,
+    invalidate_cache,
+    get_cache_stats
+)
+from app.services.blob_store import (
+    store_scanner_image,
+    make_thumbnail,
+    get_blob_store,
+    LocalBlobStore,
+    sniff_mimetype
+)
+from app.services.pcb_scanner import calculate_price_suggestion
 from app.auth import admin_required
 from datetime import datetime
 import base64
+import io
+import json
+import mimetypes
 import os
+import re
+import zipfile
 
 bp = Blueprint('scanner', __name__)
 
+MAX_BATCH_IMAGES = 60
+MAX_ZIP_ENTRY_SIZE = 25 * 1024 * 1024
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+GRADE_SCORES = {'LOW': 1, 'MEDIUM': 2, 'HIGH': 3}
+BLOB_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
 def get_scanner_config():
     config = ScannerConfig.query.first()
     if not config:
@@ -34,6 +68,64 @@ def get_scanner_config():
         db.session.commit()
     return config
 
+def calculate_confidence(density_score, components_count):
+    return min(0.95, 0.5 + (min(density_score * 10000, 0.3)) + (min(components_count, 50) / 100))
+
+def pool_full_response(e):
+    response = jsonify({
+        'erro': 'Scanner ocupado. Tente novamente em alguns segundos.',
+        'retry_after': e.retry_after
+    })
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response, 503
+
+def image_fields(image_bytes, image_mimetype, image_sha256):
+    """
+    Grava a imagem e a miniatura no blob store e retorna as colunas de
+    ScannerAnalysis. Se o blob store falhar, mantém a imagem na própria linha.
+    A miniatura é gerada numa thread do sistema, fora do loop do eventlet.
+    """
+    try:
+        thumbnail = run_in_thread(make_thumbnail, image_bytes)
+        return store_scanner_image(image_bytes, image_mimetype, image_sha256,
+                                   thumbnail=thumbnail, generate_thumbnail=False)
+    except Exception as e:
+        print(f'Erro ao gravar imagem no blob store: {e}')
+        return {'image_data': image_bytes, 'image_mimetype': image_mimetype}
+
+def analysis_for_user(cached, usuario_id, image_bytes, image_mimetype, image_sha256, image_phash):
+    """
+    Reaproveita uma análise do cache. Se ela pertence a outro usuário (o que só
+    acontece quando os bytes são idênticos), cria uma cópia para o usuário
+    atual apontando para os mesmos blobs, sem refazer OpenCV nem Perplexity.
+    """
+    if cached.usuario_id == usuario_id:
+        return cached
+    if cached.image_key and cached.image_sha256 == image_sha256:
+        blob_fields = {
+            'image_key': cached.image_key,
+            'thumbnail_key': cached.thumbnail_key,
+            'image_size': cached.image_size,
+            'image_mimetype': cached.image_mimetype
+        }
+    else:
+        blob_fields = image_fields(image_bytes, image_mimetype, image_sha256)
+    return ScannerAnalysis(
+        usuario_id=usuario_id,
+        grade=cached.grade,
+        type_guess=cached.type_guess,
+        explanation=cached.explanation,
+        confidence=cached.confidence,
+        components_count=cached.components_count,
+        density_score=cached.density_score,
+        **blob_fields,
+        image_sha256=image_sha256,
+        image_phash=image_phash,
+        config_version=cached.config_version,
+        board_detected=cached.board_detected,
+        raw_response=cached.raw_response
+    )
+
 @bp.route('/api/scanner/analyze', methods=['POST'])
 @jwt_required()
 def analyze_pcb():
@@ -72,7 +164,42 @@ def analyze_pcb():
         if not image_data:
             return jsonify({'erro': 'Imagem nao fornecida. Por favor, envie uma imagem da placa para analise.'}), 400
         
-        analysis_result = opencv_analyze_pcb(image_data)
+        image_sha256, image_phash = run_in_thread(compute_image_hashes, image_bytes)
+        cached, cache_match = find_cached_analysis(image_sha256, image_phash, config.version, int(usuario_id))
+        
+        if cached:
+            analysis = analysis_for_user(cached, int(usuario_id), image_bytes, image_mimetype, image_sha256, image_phash)
+            if analysis is not cached:
+                try:
+                    db.session.add(analysis)
+                    db.session.commit()
+                    remember_analysis(analysis)
+                except Exception as e:
+                    print(f'Erro ao salvar analise: {e}')
+                    db.session.rollback()
+            
+            return jsonify({
+                'id': analysis.id,
+                'grade': analysis.grade,
+                'components_count': analysis.components_count,
+                'density_score': analysis.density_score,
+                'board_detected': analysis.board_detected is not False,
+                'type_guess': analysis.type_guess,
+                'explanation': analysis.explanation,
+                'confidence': round(analysis.confidence or 0, 2),
+                'timestamp': datetime.now().isoformat(),
+                'analysis_method': 'opencv',
+                'perplexity_used': is_perplexity_configured(),
+                'cached': True,
+                'cache_match': cache_match
+            }), 200
+        
+        try:
+            analysis_result = submit_analysis(image_data)
+        except ScannerPoolFull as e:
+            return pool_full_response(e)
+        except TimeoutError as e:
+            return jsonify({'erro': str(e)}), 504
         
         if 'error' in analysis_result:
             return jsonify({'erro': analysis_result['error']}), 400
@@ -104,7 +231,7 @@ def analyze_pcb():
         if not explanation:
             explanation = generate_local_explanation(grade, components_count, density_score, board_detected)
         
-        confidence = min(0.95, 0.5 + (min(density_score * 10000, 0.3)) + (min(components_count, 50) / 100))
+        confidence = calculate_confidence(density_score, components_count)
         
         analysis_id = None
         try:
@@ -116,13 +243,17 @@ def analyze_pcb():
                 confidence=confidence,
                 components_count=components_count,
                 density_score=density_score,
-                image_data=image_bytes,
-                image_mimetype=image_mimetype,
+                **image_fields(image_bytes, image_mimetype, image_sha256),
+                image_sha256=image_sha256,
+                image_phash=image_phash,
+                config_version=config.version,
+                board_detected=True,
                 raw_response=str(analysis_result)
             )
             db.session.add(analysis)
             db.session.commit()
             analysis_id = analysis.id
+            remember_analysis(analysis)
         except Exception as e:
             print(f'Erro ao salvar analise: {e}')
             db.session.rollback()
@@ -138,7 +269,8 @@ def analyze_pcb():
             'confidence': round(confidence, 2),
             'timestamp': datetime.now().isoformat(),
             'analysis_method': 'opencv',
-            'perplexity_used': is_perplexity_configured()
+            'perplexity_used': is_perplexity_configured(),
+            'cached': False
         }
         
         return jsonify(response), 200
@@ -147,6 +279,268 @@ def analyze_pcb():
         print(f'Erro no scanner: {e}')
         return jsonify({'erro': str(e)}), 500
 
+def read_batch_images():
+    """
+    Lê as imagens do lote: vários arquivos em 'images' (multipart) e/ou um
+    arquivo .zip em 'zip'. Retorna uma lista de (nome, bytes, mimetype).
+    """
+    images = []
+
+    for image_file in request.files.getlist('images'):
+        if image_file.filename and image_file.filename.lower().endswith('.zip'):
+            images.extend(read_zip_images(image_file.read()))
+        else:
+            images.append((
+                image_file.filename or f'imagem_{len(images) + 1}',
+                image_file.read(),
+                image_file.mimetype or 'image/jpeg'
+            ))
+
+    if 'zip' in request.files:
+        images.extend(read_zip_images(request.files['zip'].read()))
+
+    return images
+
+def read_zip_images(zip_bytes):
+    images = []
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+        for info in zf.infolist():
+            nome = os.path.basename(info.filename)
+            if info.is_dir() or not nome or nome.startswith('.'):
+                continue
+            if not nome.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if info.file_size > MAX_ZIP_ENTRY_SIZE:
+                raise ValueError(f'Imagem {nome} excede o tamanho máximo permitido')
+            images.append((nome, zf.read(info), mimetypes.guess_type(nome)[0] or 'image/jpeg'))
+            if len(images) > MAX_BATCH_IMAGES:
+                break
+    return images
+
+def read_batch_weights(nomes):
+    """
+    Pesos opcionais em kg no campo 'weights' (JSON): lista na ordem das imagens
+    ou objeto {nome_do_arquivo: peso}.
+    """
+    raw = request.form.get('weights')
+    if not raw:
+        return [None] * len(nomes)
+
+    weights = json.loads(raw)
+    if isinstance(weights, dict):
+        valores = [weights.get(nome) for nome in nomes]
+    else:
+        valores = list(weights) + [None] * max(0, len(nomes) - len(weights))
+
+    return [float(v) if v not in (None, '') else None for v in valores[:len(nomes)]]
+
+def aggregate_batch(items, config_dict):
+    """
+    Grade agregada (média das grades ponderada pelo peso) e sugestão de preço
+    somando calculate_price_suggestion de cada placa com peso informado.
+    """
+    detected = [item for item in items if item['board_detected']]
+    if not detected:
+        return {'grade': None, 'boards_detected': 0, 'price_suggestion': None}
+
+    has_weights = any(item['weight_kg'] for item in detected)
+    total_weight = 0.0
+    score_sum = 0.0
+    for item in detected:
+        peso = item['weight_kg'] if has_weights else 1.0
+        if not peso:
+            continue
+        total_weight += peso
+        score_sum += GRADE_SCORES[item['grade']] * peso
+
+    average_score = score_sum / total_weight if total_weight else 0
+    grade = min(GRADE_SCORES, key=lambda g: abs(GRADE_SCORES[g] - average_score)) if total_weight else None
+
+    price_suggestion = None
+    suggestions = [s for s in (item.get('price_suggestion') for item in detected) if s]
+    if suggestions:
+        weight = sum(s['weight_kg'] for s in suggestions)
+        totals = {
+            'total_min': round(sum(s['total_min'] for s in suggestions), 2),
+            'total_max': round(sum(s['total_max'] for s in suggestions), 2),
+            'total_avg': round(sum(s['total_avg'] for s in suggestions), 2)
+        }
+        price_suggestion = {
+            'price_per_kg_min': round(totals['total_min'] / weight, 2),
+            'price_per_kg_max': round(totals['total_max'] / weight, 2),
+            'price_per_kg_avg': round(totals['total_avg'] / weight, 2),
+            **totals,
+            'weight_kg': weight,
+            'grade': grade
+        }
+    elif grade and has_weights:
+        price_suggestion = calculate_price_suggestion(grade, total_weight, config_dict)
+
+    return {
+        'grade': grade,
+        'grade_score': round(average_score, 2),
+        'boards_detected': len(detected),
+        'total_weight_kg': total_weight if has_weights else None,
+        'grades_count': {g: sum(1 for item in detected if item['grade'] == g) for g in GRADE_SCORES},
+        'price_suggestion': price_suggestion
+    }
+
+@bp.route('/api/scanner/analyze-batch', methods=['POST'])
+@jwt_required()
+def analyze_pcb_batch():
+    try:
+        usuario_id = int(get_jwt_identity())
+        config = get_scanner_config()
+        
+        if not config.enabled:
+            return jsonify({'erro': 'Scanner desativado pelo administrador'}), 403
+        
+        try:
+            images = read_batch_images()
+            weights = read_batch_weights([nome for nome, _, _ in images])
+        except zipfile.BadZipFile:
+            return jsonify({'erro': 'Arquivo zip inválido'}), 400
+        except (ValueError, TypeError) as e:
+            return jsonify({'erro': str(e)}), 400
+        
+        if not images:
+            return jsonify({'erro': 'Nenhuma imagem fornecida. Envie as fotos em "images" ou um arquivo .zip em "zip".'}), 400
+        if len(images) > MAX_BATCH_IMAGES:
+            return jsonify({'erro': f'Máximo de {MAX_BATCH_IMAGES} imagens por lote'}), 400
+        
+        hashes = [run_in_thread(compute_image_hashes, image_bytes) for _, image_bytes, _ in images]
+        lookups = [find_cached_analysis(sha, phash, config.version, usuario_id) for sha, phash in hashes]
+        misses = [i for i, (cached, _) in enumerate(lookups) if cached is None]
+        
+        results = [None] * len(images)
+        if misses:
+            try:
+                analyzed = submit_batch([images[i][1] for i in misses])
+            except ScannerPoolFull as e:
+                return pool_full_response(e)
+            except TimeoutError as e:
+                return jsonify({'erro': str(e)}), 504
+            for i, analysis_result in zip(misses, analyzed):
+                results[i] = analysis_result
+        
+        config_dict = config.to_dict()
+        items = []
+        analyses = []
+        for (nome, image_bytes, image_mimetype), weight_kg, analysis_result, (image_sha256, image_phash), (cached, cache_match) in zip(
+                images, weights, results, hashes, lookups):
+            if cached:
+                analysis = analysis_for_user(cached, usuario_id, image_bytes, image_mimetype, image_sha256, image_phash)
+                if analysis is not cached:
+                    analyses.append(analysis)
+                items.append({
+                    'filename': nome,
+                    'weight_kg': weight_kg,
+                    'board_detected': analysis.board_detected is not False,
+                    'grade': analysis.grade,
+                    'components_count': analysis.components_count,
+                    'density_score': analysis.density_score,
+                    'type_guess': analysis.type_guess,
+                    'explanation': analysis.explanation,
+                    'confidence': round(analysis.confidence or 0, 2),
+                    'price_suggestion': calculate_price_suggestion(analysis.grade, weight_kg, config_dict),
+                    'cached': True,
+                    'cache_match': cache_match,
+                    '_analysis': analysis
+                })
+                continue
+            
+            item = {
+                'filename': nome,
+                'weight_kg': weight_kg,
+                'board_detected': bool(analysis_result.get('board_detected')),
+                'grade': analysis_result.get('grade'),
+                'components_count': analysis_result.get('components_count', 0),
+                'density_score': analysis_result.get('density_score', 0.0),
+                'cached': False
+            }
+            
+            if 'error' in analysis_result:
+                item['erro'] = analysis_result['error']
+                item['board_detected'] = False
+                items.append(item)
+                continue
+            
+            if not item['board_detected']:
+                item['type_guess'] = 'Placa nao detectada'
+                item['confidence'] = 0
+                items.append(item)
+                continue
+            
+            item['type_guess'] = get_type_guess_from_analysis(analysis_result)
+            item['explanation'] = generate_local_explanation(
+                item['grade'], item['components_count'], item['density_score'], True
+            )
+            item['confidence'] = round(calculate_confidence(item['density_score'], item['components_count']), 2)
+            item['price_suggestion'] = calculate_price_suggestion(item['grade'], weight_kg, config_dict)
+            
+            analysis = ScannerAnalysis(
+                usuario_id=usuario_id,
+                grade=item['grade'],
+                type_guess=item['type_guess'],
+                explanation=item['explanation'],
+                confidence=item['confidence'],
+                components_count=item['components_count'],
+                density_score=item['density_score'],
+                **image_fields(image_bytes, image_mimetype, image_sha256),
+                image_sha256=image_sha256,
+                image_phash=image_phash,
+                config_version=config.version,
+                board_detected=True,
+                raw_response=str(analysis_result)
+            )
+            analyses.append(analysis)
+            item['_analysis'] = analysis
+            items.append(item)
+        
+        aggregate = aggregate_batch(items, config_dict)
+        
+        # Uma única chamada ao Perplexity para o lote inteiro
+        if aggregate['grade']:
+            detected = [item for item in items if item['board_detected']]
+            avg_components = round(sum(item['components_count'] for item in detected) / len(detected))
+            avg_density = sum(item['density_score'] for item in detected) / len(detected)
+            aggregate['explanation'] = (
+                build_explanation_with_perplexity(aggregate['grade'], avg_components, avg_density)
+                or generate_local_explanation(aggregate['grade'], avg_components, avg_density)
+            )
+        
+        saved = False
+        if analyses:
+            try:
+                db.session.add_all(analyses)
+                db.session.commit()
+                saved = True
+                for analysis in analyses:
+                    remember_analysis(analysis)
+            except Exception as e:
+                print(f'Erro ao salvar analises do lote: {e}')
+                db.session.rollback()
+        
+        for item in items:
+            analysis = item.pop('_analysis', None)
+            if analysis is None or (analysis in analyses and not saved):
+                item['id'] = None
+            else:
+                item['id'] = analysis.id
+        
+        return jsonify({
+            'total_images': len(items),
+            'results': items,
+            'aggregate': aggregate,
+            'timestamp': datetime.now().isoformat(),
+            'analysis_method': 'opencv',
+            'perplexity_used': is_perplexity_configured()
+        }), 200
+        
+    except Exception as e:
+        print(f'Erro no scanner (lote): {e}')
+        return jsonify({'erro': str(e)}), 500
+
 @bp.route('/api/scanner/config', methods=['GET'])
 @jwt_required()
 def get_config():
@@ -179,6 +573,21 @@ def get_admin_config():
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
+@bp.route('/api/admin/scanner-cache', methods=['GET'])
+@jwt_required()
+def get_admin_cache_stats():
+    try:
+        usuario_id = get_jwt_identity()
+        usuario = Usuario.query.get(usuario_id)
+        
+        if not usuario or usuario.tipo != 'admin':
+            return jsonify({'erro': 'Acesso negado'}), 403
+        
+        return jsonify(get_cache_stats()), 200
+        
+    except Exception as e:
+        return jsonify({'erro': str(e)}), 500
+
 @bp.route('/api/admin/scanner-config', methods=['POST'])
 @jwt_required()
 def update_admin_config():
@@ -197,9 +606,11 @@ def update_admin_config():
         if 'prompt_rules' in data:
             config.prompt_rules = str(data['prompt_rules'])
         
+        config.version = (config.version or 1) + 1
         config.updated_at = datetime.utcnow()
         config.updated_by = int(usuario_id)
         db.session.commit()
+        invalidate_cache()
         
         return jsonify({
             'mensagem': 'Configuracoes atualizadas com sucesso',
@@ -220,7 +631,9 @@ def scanner_status():
             'api_configured': True,
             'ready': config.enabled,
             'model': 'opencv+perplexity',
-            'perplexity_configured': perplexity_configured
+            'perplexity_configured': perplexity_configured,
+            'pool': get_pool_status(),
+            'cache': get_cache_stats()
         }), 200
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
@@ -233,13 +646,19 @@ def scanner_history():
         limit = request.args.get('limit', 20, type=int)
         include_images = request.args.get('include_images', 'false').lower() == 'true'
         
-        analyses = ScannerAnalysis.query.filter_by(
+        # As imagens são servidas por URL (thumbnail_url/image_url); o blob
+        # só é carregado para análises antigas ainda não migradas.
+        analyses = ScannerAnalysis.query.options(
+            defer(ScannerAnalysis.image_data)
+        ).filter_by(
             usuario_id=int(usuario_id)
         ).order_by(
             ScannerAnalysis.created_at.desc()
         ).limit(limit).all()
         
-        return jsonify([a.to_dict(include_image=include_images) for a in analyses]), 200
+        return jsonify([
+            a.to_dict(include_image=include_images and a.image_key is None) for a in analyses
+        ]), 200
         
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
@@ -275,10 +694,12 @@ def get_analysis_image(analysis_id):
             usuario_id=int(usuario_id)
         ).first()
         
+        if analysis and analysis.image_key:
+            return serve_blob(analysis.image_key)
+        
         if not analysis or not analysis.image_data:
             return jsonify({'erro': 'Imagem nao encontrada'}), 404
         
-        from flask import Response
         return Response(
             analysis.image_data,
             mimetype=analysis.image_mimetype or 'image/jpeg'
@@ -287,6 +708,62 @@ def get_analysis_image(analysis_id):
     except Exception as e:
         return jsonify({'erro': str(e)}), 500
 
+def serve_blob(key):
+    """
+    Serve um blob com ETag forte (a própria chave) e suporte a Range.
+    O conteúdo nunca muda para uma chave, então o cache pode ser imutável,
+    mas só no navegador: as fotos são do usuário e não podem ficar em caches
+    compartilhados.
+    """
+    store = get_blob_store()
+    
+    if isinstance(store, LocalBlobStore):
+        path = store.path(key)
+        if not os.path.exists(path):
+            return jsonify({'erro': 'Imagem nao encontrada'}), 404
+        with open(path, 'rb') as f:
+            mimetype = sniff_mimetype(f.read(12))
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=key, max_age=31536000)
+    else:
+        data = store.get(key)
+        if data is None:
+            return jsonify({'erro': 'Imagem nao encontrada'}), 404
+        response = Response(data, mimetype=sniff_mimetype(data[:12]))
+        response.set_etag(key)
+        response.cache_control.max_age = 31536000
+        response = response.make_conditional(request, accept_ranges=True, complete_length=len(data))
+    
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+@bp.route('/api/scanner/blobs/<key>', methods=['GET'])
+@jwt_required()
+def get_blob(key):
+    if not BLOB_KEY_PATTERN.match(key):
+        return jsonify({'erro': 'Chave invalida'}), 400
+    try:
+        usuario_id = get_jwt_identity()
+        usuario = Usuario.query.get(usuario_id)
+        if not usuario:
+            return jsonify({'erro': 'Acesso negado'}), 403
+        
+        # A chave só é servida se for a imagem ou a miniatura de uma análise
+        # do próprio usuário (admins veem todas). Para os demais a resposta é
+        # 404, sem revelar se a chave existe.
+        if usuario.tipo != 'admin':
+            owned = db.session.query(ScannerAnalysis.id).filter(
+                or_(ScannerAnalysis.image_key == key, ScannerAnalysis.thumbnail_key == key),
+                ScannerAnalysis.usuario_id == usuario.id
+            ).first()
+            if not owned:
+                return jsonify({'erro': 'Imagem nao encontrada'}), 404
+        
+        return serve_blob(key)
+    except Exception as e:
+        return jsonify({'erro': str(e)}), 500
+
 @bp.route('/scanner')
 def scanner_page():
     return render_template('scanner.html')
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import db, Lote, LoteSeparacao, Residuo, Usuario, Notificacao, MovimentacaoEstoque
 from app.auth import admin_required
+from app.services import notificacoes, lote_eventos
 from datetime import datetime
 
 bp = Blueprint('separacao', __name__, url_prefix='/api/separacao')
@@ -216,22 +217,15 @@ def criar_sublote(id):
             quantidade_itens=data.get('quantidade', 1),
             observacoes=data.get('observacoes', ''),
             anexos=data.get('fotos', []),
-            auditoria=[{
-                'acao': 'SUBLOTE_CRIADO_NA_SEPARACAO',
-                'usuario_id': usuario_id,
-                'timestamp': datetime.utcnow().isoformat(),
-                'ip': request.remote_addr,
-                'user_agent': request.headers.get('User-Agent'),
-                'gps': data.get('gps'),
-                'device_id': data.get('device_id') or separacao.device_id,
-                'separacao_id': separacao.id,
-                'lote_pai_id': lote_pai.id,
-                'lote_pai_numero': lote_pai.numero_lote
-            }],
             data_criacao=datetime.utcnow()
         )
 
         db.session.add(sublote)
+        lote_eventos.registrar(sublote, 'SUBLOTE_CRIADO_NA_SEPARACAO', usuario_id, {
+            'separacao_id': separacao.id,
+            'lote_pai_numero': lote_pai.numero_lote,
+            'user_agent': request.headers.get('User-Agent')
+        }, gps=data.get('gps'), device_id=data.get('device_id') or separacao.device_id)
         db.session.flush()  # Garantir que o sublote seja criado antes de continuar
         
         print(f'\n✅ Sublote criado: {sublote.numero_lote} (ID: {sublote.id})')
@@ -334,16 +328,12 @@ def criar_residuo(id):
             device_id=data.get('device_id') or separacao.device_id
         )
 
-        admins = Usuario.query.filter_by(tipo='admin').all()
-        for admin in admins:
-            notificacao = Notificacao(
-                usuario_id=admin.id,
-                titulo='Novo Resíduo Aguardando Aprovação',
-                mensagem=f'Resíduo de {data["peso"]}kg ({data["material"]}) precisa de aprovação para descarte',
-                tipo='residuo_aprovacao',
-                lida=False
-            )
-            db.session.add(notificacao)
+        notificacoes.notificar(
+            'admins',
+            titulo='Novo Resíduo Aguardando Aprovação',
+            mensagem=f'Resíduo de {data["peso"]}kg ({data["material"]}) precisa de aprovação para descarte',
+            tipo='residuo_aprovacao'
+        )
 
         db.session.commit()
 
@@ -5,6 +5,7 @@ from app.models import (
     FornecedorTipoLoteClassificacao, TipoLotePreco, Usuario, Configuracao, Lote, EntradaEstoque
 )
 from app.auth import admin_required
+from app.services import tempo_real
 from datetime import datetime
 import os
 import base64
@@ -37,12 +38,25 @@ def geocode_reverso():
     except Exception as e:
         return jsonify({'erro': f'Erro ao buscar endereço: {str(e)}'}), 500
 
+@bp.route('/geocode/stats', methods=['GET'])
+@admin_required
+def geocode_stats():
+    """Taxa de acerto do cache de geocoding e latência do Nominatim/ViaCEP"""
+    from app.services.geocode_cache import get_geocode_stats
+    return jsonify(get_geocode_stats()), 200
+
 @bp.route('/analisar-imagem', methods=['POST'])
 @jwt_required()
 def analisar_imagem():
-    """Endpoint para análise de imagem com Gemini AI"""
+    """
+    Endpoint para análise de imagem com Gemini AI
+    
+    Com ?async=true responde 202 com o job_id; o resultado chega pelo evento
+    Socket.IO 'gemini_job_concluido' ou por GET /analisar-imagem/<job_id>.
+    """
     try:
-        from app.services.gemini_analyzer import analyze_images
+        from app.services.gemini_analyzer import parse_classification
+        from app.services.gemini_queue import submit_job, wait_job, GeminiQueueFull
         
         if 'imagem' not in request.files:
             return jsonify({'erro': 'Nenhuma imagem foi enviada'}), 400
@@ -52,22 +66,46 @@ def analisar_imagem():
         if file.filename == '':
             return jsonify({'erro': 'Arquivo sem nome'}), 400
         
+        if not os.getenv('GEMINI_API_KEY'):
+            return jsonify({'erro': 'Chave da API do Gemini não configurada. Configure GEMINI_API_KEY.'}), 400
+        
         # Ler bytes da imagem
         imagem_bytes = file.read()
+        usuario_id = int(get_jwt_identity())
         
         # Analisar usando Gemini (para solicitações de lote)
-        resultados = analyze_images([imagem_bytes], use_case='solicitacao')
+        try:
+            job = submit_job(imagem_bytes, 'solicitacao', parse_classification, usuario_id)
+        except GeminiQueueFull as e:
+            response = jsonify({'erro': 'Fila de análise cheia, tente novamente', 'retry_after': e.retry_after})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
         
-        if not resultados or len(resultados) == 0:
-            return jsonify({'erro': 'Erro ao analisar imagem'}), 500
+        if request.args.get('async', 'false').lower() == 'true':
+            return jsonify(job.to_dict()), 202
         
-        resultado = resultados[0]
+        resultado = wait_job(job)
+        
+        if not resultado:
+            return jsonify({'erro': 'Erro ao analisar imagem'}), 500
         
         return jsonify(resultado), 200
     
     except Exception as e:
         return jsonify({'erro': f'Erro ao analisar imagem: {str(e)}'}), 500
 
+@bp.route('/analisar-imagem/<job_id>', methods=['GET'])
+@jwt_required()
+def status_analise_imagem(job_id):
+    """Consulta o status/resultado de uma análise enviada com ?async=true"""
+    from app.services.gemini_queue import get_job
+    
+    job = get_job(job_id)
+    if not job or job.usuario_id != int(get_jwt_identity()):
+        return jsonify({'erro': 'Análise não encontrada'}), 404
+    
+    return jsonify(job.to_dict()), 200
+
 @bp.route('/upload-imagem', methods=['POST'])
 @jwt_required()
 def upload_imagem():
@@ -403,21 +441,46 @@ def criar_solicitacao():
         'item': item.to_dict()
     }), 201
 
+def _listar_por_status(status, ordem, serializar):
+    """
+    Lista as solicitações com o status informado. Com ?since=<cursor> devolve só
+    o delta: as alteradas que continuam no status em alterados e as que saíram
+    dele (aprovadas, rejeitadas, recebidas) em removidos.
+    """
+    since = request.args.get('since')
+    cursor = tempo_real.cursor_atual()
+    
+    if not since:
+        solicitacoes = Solicitacao.query.filter_by(status=status).order_by(ordem.desc()).all()
+        tempo_real.registrar_consulta(False, len(solicitacoes))
+        return jsonify([serializar(sol) for sol in solicitacoes]), 200, {'X-Cursor': cursor}
+    
+    try:
+        desde = tempo_real.ler_cursor(since)
+    except ValueError as e:
+        return jsonify({'erro': str(e)}), 400
+    
+    alteradas = Solicitacao.query.filter(
+        Solicitacao.data_atualizacao >= desde
+    ).order_by(ordem.desc()).all()
+    tempo_real.registrar_consulta(True, len(alteradas))
+    
+    return jsonify({
+        'alterados': [serializar(sol) for sol in alteradas if sol.status == status],
+        'removidos': [sol.id for sol in alteradas if sol.status != status],
+        'cursor': cursor
+    }), 200
+
 @bp.route('/aguardando-aprovacao', methods=['GET'])
 @jwt_required()
 def listar_aguardando_aprovacao():
     """Lista todas as solicitações aguardando aprovação"""
-    solicitacoes = Solicitacao.query.filter_by(
-        status='aguardando_aprovacao'
-    ).order_by(Solicitacao.data_envio.desc()).all()
-    
-    resultado = []
-    for sol in solicitacoes:
+    def serializar(sol):
         sol_dict = sol.to_dict()
         sol_dict['itens'] = [item.to_dict() for item in sol.itens]
-        resultado.append(sol_dict)
+        return sol_dict
     
-    return jsonify(resultado), 200
+    return _listar_por_status('aguardando_aprovacao', Solicitacao.data_envio, serializar)
 
 @bp.route('/<int:id>/aprovar', methods=['PUT'])
 @admin_required
@@ -474,12 +537,7 @@ def rejeitar_solicitacao(id):
 @jwt_required()
 def listar_aprovadas():
     """Lista todas as solicitações aprovadas aguardando entrada"""
-    solicitacoes = Solicitacao.query.filter_by(
-        status='aprovado'
-    ).order_by(Solicitacao.data_confirmacao.desc()).all()
-    
-    resultado = []
-    for sol in solicitacoes:
+    def serializar(sol):
         sol_dict = sol.to_dict()
         sol_dict['itens'] = [item.to_dict() for item in sol.itens]
         
@@ -487,10 +545,9 @@ def listar_aprovadas():
             Lote.solicitacao_origem_id == sol.id
         ).first()
         sol_dict['tem_entrada'] = entrada_existente is not None
-        
-        resultado.append(sol_dict)
+        return sol_dict
     
-    return jsonify(resultado), 200
+    return _listar_por_status('aprovado', Solicitacao.data_confirmacao, serializar)
 
 @bp.route('/<int:id>/registrar-entrada', methods=['POST'])
 @admin_required
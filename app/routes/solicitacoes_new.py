@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.models import Solicitacao, ItemSolicitacao, Fornecedor, TipoLote, FornecedorTipoLotePreco, FornecedorTipoLoteClassificacao, db, Usuario, Lote, OrdemCompra, Notificacao, Perfil, MaterialBase, TabelaPreco, TabelaPrecoItem
 from app.auth import admin_required
 from app.utils.auditoria import registrar_auditoria_oc
+from app.services import notificacoes
 from app import socketio
 from datetime import datetime
 import os
@@ -695,60 +696,30 @@ def aprovar_solicitacao(id):
         oc, lotes_criados = _criar_oc_e_lotes(solicitacao, usuario_id, data)
         
         print(f"\n ETAPA 2: Criando notificações...")
-        notificacao_funcionario = Notificacao(
-            usuario_id=solicitacao.funcionario_id,
+        notificacoes.notificar(
+            [solicitacao.funcionario_id],
             titulo='Solicitação Aprovada',
-            mensagem=f'Sua solicitação #{solicitacao.id} foi aprovada! OC #{oc.id} criada (R$ {oc.valor_total:.2f}) e {len(lotes_criados)} lote(s) gerado(s).'
+            mensagem=f'Sua solicitação #{solicitacao.id} foi aprovada! OC #{oc.id} criada (R$ {oc.valor_total:.2f}) e {len(lotes_criados)} lote(s) gerado(s).',
+            dados={'tipo': 'solicitacao_aprovada', 'solicitacao_id': id, 'oc_id': oc.id,
+                   'valor_total': float(oc.valor_total)}
         )
-        db.session.add(notificacao_funcionario)
         print(f"    Notificação para funcionário criada")
         
-        usuarios_financeiro = Usuario.query.filter(
-            db.and_(
-                Usuario.ativo == True,
-                db.or_(
-                    Usuario.tipo == 'admin',
-                    Usuario.perfil.has(Perfil.nome.in_(['Administrador', 'Financeiro']))
-                )
-            )
-        ).all()
-        
-        usuarios_ids_notificados = set()
-        for usuario_fin in usuarios_financeiro:
-            if usuario_fin.id not in usuarios_ids_notificados and usuario_fin.id != solicitacao.funcionario_id:
-                notificacao_financeiro = Notificacao(
-                    usuario_id=usuario_fin.id,
-                    titulo='Nova Ordem de Compra - Aprovação Pendente',
-                    mensagem=f'OC #{oc.id} gerada (R$ {oc.valor_total:.2f}) da Solicitação #{solicitacao.id} - Fornecedor: {solicitacao.fornecedor.nome}. Aguardando sua aprovação!'
-                )
-                db.session.add(notificacao_financeiro)
-                usuarios_ids_notificados.add(usuario_fin.id)
+        total_financeiro = notificacoes.notificar(
+            'financeiro',
+            titulo='Nova Ordem de Compra - Aprovação Pendente',
+            mensagem=f'OC #{oc.id} gerada (R$ {oc.valor_total:.2f}) da Solicitação #{solicitacao.id} - Fornecedor: {solicitacao.fornecedor.nome}. Aguardando sua aprovação!',
+            excluir=[solicitacao.funcionario_id],
+            dados={'tipo': 'nova_oc', 'oc_id': oc.id, 'solicitacao_id': id,
+                   'valor_total': float(oc.valor_total), 'fornecedor': solicitacao.fornecedor.nome}
+        )
         
-        print(f"    {len(usuarios_ids_notificados)} notificações para financeiro/admin criadas")
+        print(f"    {total_financeiro} notificações para financeiro/admin criadas")
         
         db.session.commit()
         print(f"\n Transação commitada com sucesso!")
         
-        print(f"\n FASE 3: Enviando notificações WebSocket...")
-        try:
-            socketio.emit('nova_notificacao', {
-                'tipo': 'solicitacao_aprovada',
-                'solicitacao_id': id,
-                'oc_id': oc.id,
-                'valor_total': float(oc.valor_total)
-            }, room='funcionarios')
-            
-            socketio.emit('nova_notificacao', {
-                'tipo': 'nova_oc',
-                'oc_id': oc.id,
-                'solicitacao_id': id,
-                'valor_total': float(oc.valor_total),
-                'fornecedor': solicitacao.fornecedor.nome
-            }, room='admins')
-            
-            print(f" Notificações WebSocket enviadas")
-        except Exception as ws_error:
-            print(f" Erro ao enviar WebSocket (não crítico): {str(ws_error)}")
+        # eventos WebSocket saem no commit (app/services/notificacoes.py)
         
         print(f"\n{'='*60}")
         print(f" APROVAÇÃO CONCLUÍDA COM SUCESSO!")
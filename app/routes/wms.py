@@ -1,63 +1,140 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import db, Lote, ItemSolicitacao, Fornecedor, TipoLote, MovimentacaoEstoque, MaterialBase
+from sqlalchemy.orm import joinedload, selectinload
+from app.models import db, Lote, LoteEvento, ItemSolicitacao, Fornecedor, TipoLote, MovimentacaoEstoque, MaterialBase, Inventario, InventarioContagem, Usuario
 from app.auth import admin_required
-from datetime import datetime
+from app.services.serializacao import LOTE
+from app.services import inventario as inventario_service
+from app.services import lote_eventos
+from app.services import movimentacao_massa
+from datetime import datetime, timezone
 import json
+import csv
+import io
+import os
 
 bp = Blueprint('wms', __name__, url_prefix='/api/wms')
 
+WMS_LOTES_PAGINA = int(os.getenv('WMS_LOTES_PAGINA', '100'))
+WMS_LOTES_PAGINA_MAXIMA = int(os.getenv('WMS_LOTES_PAGINA_MAXIMA', '500'))
+# até aqui o total é exato (count limitado); acima, estimativa do planejador do PostgreSQL
+WMS_LOTES_CONTAGEM_EXATA = int(os.getenv('WMS_LOTES_CONTAGEM_EXATA', '10000'))
+
 # ==================== LOTES WMS ====================
 
+def _filtrar_lotes(query):
+    busca = request.args.get('busca', '').strip()
+    status = request.args.get('status')
+    fornecedor_id = request.args.get('fornecedor_id', type=int)
+    tipo_lote_id = request.args.get('tipo_lote_id', type=int)
+    localizacao = request.args.get('localizacao')
+    bloqueado = request.args.get('bloqueado')
+    reservado = request.args.get('reservado')
+    divergente = request.args.get('divergente')
+
+    if busca:
+        query = query.filter(Lote.numero_lote.ilike(f'%{busca}%'))
+    if status:
+        query = query.filter_by(status=status)
+    if fornecedor_id:
+        query = query.filter_by(fornecedor_id=fornecedor_id)
+    if tipo_lote_id:
+        query = query.filter_by(tipo_lote_id=tipo_lote_id)
+    if localizacao:
+        query = query.filter_by(localizacao_atual=localizacao)
+    if bloqueado is not None:
+        query = query.filter_by(bloqueado=bloqueado.lower() == 'true')
+    if reservado is not None:
+        query = query.filter_by(reservado=reservado.lower() == 'true')
+    if divergente is not None:
+        if divergente.lower() == 'true':
+            query = query.filter(Lote.total_divergencias > 0)
+    return query.order_by(Lote.data_criacao.desc(), Lote.id.desc())
+
+def _ler_cursor(valor):
+    """Converte ?cursor=<data_criacao>_<id> em (data_criacao, id); ValueError se inválido."""
+    try:
+        data_criacao, lote_id = valor.rsplit('_', 1)
+        return datetime.fromisoformat(data_criacao), int(lote_id)
+    except (AttributeError, ValueError):
+        raise ValueError('Parâmetro cursor inválido, use o cursor devolvido pela página anterior')
+
+def _estimar_total(query):
+    """(total, exato): count() limitado a WMS_LOTES_CONTAGEM_EXATA; acima disso, linhas estimadas pelo EXPLAIN."""
+    limitada = query.order_by(None).with_entities(Lote.id).limit(WMS_LOTES_CONTAGEM_EXATA + 1).subquery()
+    total = db.session.query(db.func.count()).select_from(limitada).scalar()
+    if total <= WMS_LOTES_CONTAGEM_EXATA:
+        return total, True
+    if db.engine.dialect.name == 'postgresql':
+        try:
+            instrucao = query.order_by(None).with_entities(Lote.id).statement.compile(dialect=db.engine.dialect)
+            plano = db.session.connection().exec_driver_sql(
+                f'EXPLAIN (FORMAT JSON) {instrucao}', instrucao.params
+            ).scalar()
+            return max(int(plano[0]['Plan']['Plan Rows']), total), False
+        except Exception as e:
+            print(f'Estimativa de lotes indisponível: {e}')
+    return total, False
+
 @bp.route('/lotes', methods=['GET'])
 @jwt_required()
 def listar_lotes_wms():
+    """
+    Uma página de lotes, mais recentes primeiro, por cursor (data_criacao, id):
+    ?limite= (padrão WMS_LOTES_PAGINA) e ?cursor= do cabeçalho X-Proximo-Cursor
+    da página anterior. Na primeira página, X-Total-Estimado e X-Total-Exato.
+    ?busca= filtra por parte do numero_lote (seletores de lote das telas).
+    """
     try:
-        status = request.args.get('status')
-        fornecedor_id = request.args.get('fornecedor_id', type=int)
-        tipo_lote_id = request.args.get('tipo_lote_id', type=int)
-        localizacao = request.args.get('localizacao')
-        bloqueado = request.args.get('bloqueado')
-        reservado = request.args.get('reservado')
-        divergente = request.args.get('divergente')
+        limite = min(max(request.args.get('limite', WMS_LOTES_PAGINA, type=int), 1), WMS_LOTES_PAGINA_MAXIMA)
+        cursor = request.args.get('cursor')
+
+        query = _filtrar_lotes(Lote.query)
+        if cursor:
+            try:
+                data_criacao, ultimo_id = _ler_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'erro': str(e)}), 400
+            query = query.filter(db.tuple_(Lote.data_criacao, Lote.id) < (data_criacao, ultimo_id))
+
+        # relacionamentos com JOIN e itens_count/sublotes_count agrupados: consultas fixas por página
+        lotes = LOTE.consultar(query.limit(limite + 1), 'lista')
+        resposta = jsonify(lotes[:limite])
+        if len(lotes) > limite:
+            ultimo = lotes[limite - 1]
+            resposta.headers['X-Proximo-Cursor'] = f"{ultimo['data_criacao']}_{ultimo['id']}"
+        if not cursor:
+            total, exato = _estimar_total(_filtrar_lotes(Lote.query))
+            resposta.headers['X-Total-Estimado'] = str(total)
+            resposta.headers['X-Total-Exato'] = 'true' if exato else 'false'
+        return resposta, 200
 
-        query = Lote.query
+    except Exception as e:
+        return jsonify({'erro': f'Erro ao listar lotes: {str(e)}'}), 500
 
-        if status:
-            query = query.filter_by(status=status)
-        if fornecedor_id:
-            query = query.filter_by(fornecedor_id=fornecedor_id)
-        if tipo_lote_id:
-            query = query.filter_by(tipo_lote_id=tipo_lote_id)
-        if localizacao:
-            query = query.filter_by(localizacao_atual=localizacao)
-        if bloqueado is not None:
-            query = query.filter_by(bloqueado=bloqueado.lower() == 'true')
-        if reservado is not None:
-            query = query.filter_by(reservado=reservado.lower() == 'true')
-        if divergente is not None:
-            if divergente.lower() == 'true':
-                query = query.filter(
-                    Lote.divergencias.isnot(None),
-                    db.cast(Lote.divergencias, db.String) != '[]'
-                )
-
-        lotes = query.order_by(Lote.data_criacao.desc()).all()
+@bp.route('/lotes/exportar', methods=['GET'])
+@jwt_required()
+def exportar_lotes_csv():
+    """Exporta os lotes (mesmos filtros da listagem) em CSV"""
+    try:
+        lotes = LOTE.consultar(_filtrar_lotes(Lote.query), 'exportacao')
 
-        resultado = []
+        output = io.StringIO()
+        writer = csv.writer(output)
+        colunas = LOTE.conjuntos['exportacao']
+        writer.writerow(colunas)
         for lote in lotes:
-            lote_dict = lote.to_dict()
-            lote_dict['tipo_lote_nome'] = lote.tipo_lote.nome if lote.tipo_lote else None
-            lote_dict['fornecedor_nome'] = lote.fornecedor.nome if lote.fornecedor else None
-            lote_dict['itens_count'] = len(lote.itens) if lote.itens else 0
-            lote_dict['sublotes_count'] = len(lote.sublotes)
-            lote_dict['lote_pai_id'] = lote.lote_pai_id  # Garantir que o campo seja retornado
-            resultado.append(lote_dict)
+            writer.writerow(['' if lote[coluna] is None else lote[coluna] for coluna in colunas])
 
-        return jsonify(resultado), 200
+        output.seek(0)
+        return Response(
+            output.getvalue(),
+            mimetype='text/csv',
+            headers={'Content-Disposition': 'attachment; filename=lotes.csv'}
+        )
 
     except Exception as e:
-        return jsonify({'erro': f'Erro ao listar lotes: {str(e)}'}), 500
+        return jsonify({'erro': f'Erro ao exportar lotes: {str(e)}'}), 500
 
 @bp.route('/lotes/<int:lote_id>', methods=['GET'])
 @jwt_required()
@@ -67,17 +144,13 @@ def obter_lote_detalhado(lote_id):
         # Nota: .get() ignora options, então usamos .filter_by().first()
         lote = Lote.query.options(
             selectinload(Lote.itens),
-            selectinload(Lote.sublotes),
             selectinload(Lote.movimentacoes),
             joinedload(Lote.solicitacao_origem),
             joinedload(Lote.ordem_compra),
             joinedload(Lote.ordem_servico),
             joinedload(Lote.conferencia),
             joinedload(Lote.separacao),
-            joinedload(Lote.fornecedor),
-            joinedload(Lote.tipo_lote),
-            joinedload(Lote.reservado_por),
-            joinedload(Lote.bloqueado_por)
+            *LOTE.opcoes('completo')
         ).filter_by(id=lote_id).first()
 
         if not lote:
@@ -85,15 +158,12 @@ def obter_lote_detalhado(lote_id):
 
         print(f'\n🔍 API /lotes/{lote_id}')
         print(f'   Lote: {lote.numero_lote}')
-        print(f'   Sublotes carregados: {lote.sublotes}')
-        print(f'   Quantidade de sublotes: {len(lote.sublotes) if lote.sublotes else 0}')
-
         lote_dict = lote.to_dict()
         lote_dict['itens'] = [item.to_dict() for item in lote.itens] if lote.itens else []
-        lote_dict['sublotes'] = [sublote.to_dict() for sublote in lote.sublotes] if lote.sublotes else []
+        lote_dict['sublotes'] = LOTE.consultar(Lote.query.filter_by(lote_pai_id=lote.id), 'completo')
         lote_dict['movimentacoes'] = [mov.to_dict() for mov in lote.movimentacoes] if lote.movimentacoes else []
 
-        print(f'   Sublotes no dict: {len(lote_dict["sublotes"])} sublotes')
+        print(f'   Quantidade de sublotes: {len(lote_dict["sublotes"])}')
         if lote_dict['sublotes']:
             print(f'   Primeiro sublote: {lote_dict["sublotes"][0]["numero_lote"]}')
 
@@ -125,22 +195,15 @@ def obter_sublotes_lote(lote_id):
 
         # Buscar os sublotes que foram criados A PARTIR deste lote
         # Os sublotes têm lote_pai_id apontando para este lote
-        sublotes = Lote.query.filter_by(lote_pai_id=lote_id).all()
+        sublotes = LOTE.consultar(Lote.query.filter_by(lote_pai_id=lote_id), 'completo')
 
         print(f'\n🔍 API /lotes/{lote_id}/sublotes')
         print(f'   Lote pai: {lote.numero_lote} (ID: {lote_id})')
         print(f'   Total de sublotes encontrados: {len(sublotes)}')
         if sublotes:
-            print(f'   Sublotes: {[s.numero_lote for s in sublotes]}')
+            print(f'   Sublotes: {[s["numero_lote"] for s in sublotes]}')
 
-        resultado = []
-        for sublote in sublotes:
-            sublote_dict = sublote.to_dict()
-            sublote_dict['tipo_lote_nome'] = sublote.tipo_lote.nome if sublote.tipo_lote else None
-            sublote_dict['fornecedor_nome'] = sublote.fornecedor.nome if sublote.fornecedor else None
-            resultado.append(sublote_dict)
-
-        return jsonify(resultado), 200
+        return jsonify(sublotes), 200
 
     except Exception as e:
         return jsonify({'erro': f'Erro ao obter sublotes: {str(e)}'}), 500
@@ -156,17 +219,13 @@ def obter_lote_por_numero(numero_lote):
         # Buscar por número de lote (indexado) com eager loading
         lote = Lote.query.options(
             selectinload(Lote.itens),
-            selectinload(Lote.sublotes),
             selectinload(Lote.movimentacoes),
             joinedload(Lote.solicitacao_origem),
             joinedload(Lote.ordem_compra),
             joinedload(Lote.ordem_servico),
             joinedload(Lote.conferencia),
             joinedload(Lote.separacao),
-            joinedload(Lote.fornecedor),
-            joinedload(Lote.tipo_lote),
-            joinedload(Lote.reservado_por),
-            joinedload(Lote.bloqueado_por)
+            *LOTE.opcoes('completo')
         ).filter(Lote.numero_lote.ilike(numero_lote.strip())).first()
 
         if not lote:
@@ -174,7 +233,7 @@ def obter_lote_por_numero(numero_lote):
 
         lote_dict = lote.to_dict()
         lote_dict['itens'] = [item.to_dict() for item in lote.itens] if lote.itens else []
-        lote_dict['sublotes'] = [sublote.to_dict() for sublote in lote.sublotes] if lote.sublotes else []
+        lote_dict['sublotes'] = LOTE.consultar(Lote.query.filter_by(lote_pai_id=lote.id), 'completo')
         lote_dict['movimentacoes'] = [mov.to_dict() for mov in lote.movimentacoes] if lote.movimentacoes else []
 
         if lote.solicitacao_origem:
@@ -209,32 +268,19 @@ def bloquear_lote(lote_id):
         tipo_bloqueio = data.get('tipo_bloqueio', 'QC')
         motivo = data.get('motivo', '')
 
-        usuario_id = get_jwt_identity()
+        usuario_id = int(get_jwt_identity())
         usuario = Usuario.query.get(usuario_id)
 
         if not usuario:
             return jsonify({'erro': 'Usuário não encontrado'}), 404
 
-        dados_before = lote.to_dict()
-
         lote.bloqueado = True
         lote.tipo_bloqueio = tipo_bloqueio
         lote.motivo_bloqueio = motivo
         lote.bloqueado_por_id = usuario_id
         lote.bloqueado_em = datetime.utcnow()
 
-        auditoria = lote.auditoria or []
-        auditoria.append({
-            'acao': 'BLOQUEAR_LOTE',
-            'usuario_id': usuario_id,
-            'usuario_nome': usuario.nome if usuario else 'Desconhecido',
-            'tipo_bloqueio': tipo_bloqueio,
-            'motivo': motivo,
-            'timestamp': datetime.utcnow().isoformat(),
-            'ip': request.remote_addr,
-            'dados_before': dados_before
-        })
-        lote.auditoria = auditoria
+        lote_eventos.registrar(lote, 'BLOQUEAR_LOTE', usuario_id)
 
         db.session.commit()
 
@@ -258,30 +304,17 @@ def desbloquear_lote(lote_id):
         if not lote.bloqueado:
             return jsonify({'erro': 'Lote não está bloqueado'}), 400
 
-        usuario_id = get_jwt_identity()
+        usuario_id = int(get_jwt_identity())
         usuario = Usuario.query.get(usuario_id)
 
         if not usuario:
             return jsonify({'erro': 'Usuário não encontrado'}), 404
 
-        dados_before = lote.to_dict()
-        tipo_bloqueio_anterior = lote.tipo_bloqueio
-
         lote.bloqueado = False
         lote.tipo_bloqueio = None
         lote.motivo_bloqueio = None
 
-        auditoria = lote.auditoria or []
-        auditoria.append({
-            'acao': 'DESBLOQUEAR_LOTE',
-            'usuario_id': usuario_id,
-            'usuario_nome': usuario.nome if usuario else 'Desconhecido',
-            'tipo_bloqueio_anterior': tipo_bloqueio_anterior,
-            'timestamp': datetime.utcnow().isoformat(),
-            'ip': request.remote_addr,
-            'dados_before': dados_before
-        })
-        lote.auditoria = auditoria
+        lote_eventos.registrar(lote, 'DESBLOQUEAR_LOTE', usuario_id)
 
         db.session.commit()
 
@@ -311,30 +344,18 @@ def reservar_lote(lote_id):
         data = request.get_json()
         reservado_para = data.get('reservado_para', '')
 
-        usuario_id = get_jwt_identity()
+        usuario_id = int(get_jwt_identity())
         usuario = Usuario.query.get(usuario_id)
 
         if not usuario:
             return jsonify({'erro': 'Usuário não encontrado'}), 404
 
-        dados_before = lote.to_dict()
-
         lote.reservado = True
         lote.reservado_para = reservado_para
         lote.reservado_por_id = usuario_id
         lote.reservado_em = datetime.utcnow()
 
-        auditoria = lote.auditoria or []
-        auditoria.append({
-            'acao': 'RESERVAR_LOTE',
-            'usuario_id': usuario_id,
-            'usuario_nome': usuario.nome if usuario else 'Desconhecido',
-            'reservado_para': reservado_para,
-            'timestamp': datetime.utcnow().isoformat(),
-            'ip': request.remote_addr,
-            'dados_before': dados_before
-        })
-        lote.auditoria = auditoria
+        lote_eventos.registrar(lote, 'RESERVAR_LOTE', usuario_id)
 
         db.session.commit()
 
@@ -358,31 +379,18 @@ def liberar_reserva_lote(lote_id):
         if not lote.reservado:
             return jsonify({'erro': 'Lote não está reservado'}), 400
 
-        usuario_id = get_jwt_identity()
+        usuario_id = int(get_jwt_identity())
         usuario = Usuario.query.get(usuario_id)
 
         if not usuario:
             return jsonify({'erro': 'Usuário não encontrado'}), 404
 
-        dados_before = lote.to_dict()
-        reservado_para_anterior = lote.reservado_para
-
         lote.reservado = False
         lote.reservado_para = None
         lote.reservado_por_id = None
         lote.reservado_em = None
 
-        auditoria = lote.auditoria or []
-        auditoria.append({
-            'acao': 'LIBERAR_RESERVA',
-            'usuario_id': usuario_id,
-            'usuario_nome': usuario.nome if usuario else 'Desconhecido',
-            'reservado_para_anterior': reservado_para_anterior,
-            'timestamp': datetime.utcnow().isoformat(),
-            'ip': request.remote_addr,
-            'dados_before': dados_before
-        })
-        lote.auditoria = auditoria
+        lote_eventos.registrar(lote, 'LIBERAR_RESERVA', usuario_id)
 
         db.session.commit()
 
@@ -419,14 +427,13 @@ def movimentar_lote(lote_id):
         if not localizacao_destino:
             return jsonify({'erro': 'Localização destino é obrigatória'}), 400
 
-        usuario_id = get_jwt_identity()
+        usuario_id = int(get_jwt_identity())
         usuario = Usuario.query.get(usuario_id)
 
         if not usuario:
             return jsonify({'erro': 'Usuário não encontrado'}), 404
 
-        dados_before = lote.to_dict()
-
+        # só o que a movimentação muda; o lote inteiro em cada momento sai de /lotes/<id>/estado
         movimentacao = MovimentacaoEstoque(
             lote_id=lote_id,
             tipo=tipo,
@@ -436,13 +443,12 @@ def movimentar_lote(lote_id):
             peso=peso,
             usuario_id=usuario_id,
             observacoes=observacoes,
-            dados_before=dados_before
+            dados_before={'localizacao_atual': lote.localizacao_atual},
+            dados_after={'localizacao_atual': localizacao_destino}
         )
 
         lote.localizacao_atual = localizacao_destino
 
-        movimentacao.dados_after = lote.to_dict()
-
         auditoria_mov = [{
             'usuario_id': usuario_id,
             'usuario_nome': usuario.nome if usuario else 'Desconhecido',
@@ -453,19 +459,8 @@ def movimentar_lote(lote_id):
         }]
         movimentacao.auditoria = auditoria_mov
 
-        auditoria_lote = lote.auditoria or []
-        auditoria_lote.append({
-            'acao': 'MOVIMENTACAO',
-            'usuario_id': usuario_id,
-            'usuario_nome': usuario.nome if usuario else 'Desconhecido',
-            'tipo': tipo,
-            'localizacao_origem': movimentacao.localizacao_origem,
-            'localizacao_destino': localizacao_destino,
-            'timestamp': datetime.utcnow().isoformat(),
-            'ip': request.remote_addr,
-            'gps': gps
-        })
-        lote.auditoria = auditoria_lote
+        lote_eventos.registrar(lote, 'MOVIMENTACAO', usuario_id, {'tipo': tipo}, gps=gps,
+                               device_id=data.get('device_id'))
 
         db.session.add(movimentacao)
         db.session.commit()
@@ -480,6 +475,47 @@ def movimentar_lote(lote_id):
         db.session.rollback()
         return jsonify({'erro': f'Erro ao movimentar lote: {str(e)}'}), 500
 
+@bp.route('/movimentacoes/lote-em-massa', methods=['POST'])
+@jwt_required()
+def movimentar_lotes_em_massa():
+    """Move os lotes lidos por QR code (numeros_lote) para localizacao_destino numa transação só."""
+    try:
+        data = request.get_json() or {}
+        numeros = data.get('numeros_lote')
+        localizacao_destino = data.get('localizacao_destino')
+
+        if not localizacao_destino:
+            return jsonify({'erro': 'Localização destino é obrigatória'}), 400
+        if not isinstance(numeros, list) or not numeros:
+            return jsonify({'erro': 'Informe a lista numeros_lote'}), 400
+        if len(numeros) > movimentacao_massa.MOVIMENTACAO_MASSA_MAXIMO:
+            return jsonify({'erro': f'Máximo de {movimentacao_massa.MOVIMENTACAO_MASSA_MAXIMO} lotes por movimentação'}), 400
+
+        usuario_id = int(get_jwt_identity())
+        usuario = Usuario.query.get(usuario_id)
+
+        if not usuario:
+            return jsonify({'erro': 'Usuário não encontrado'}), 404
+
+        resultados, movidos = movimentacao_massa.movimentar(
+            numeros, localizacao_destino, usuario_id, usuario.nome,
+            tipo=data.get('tipo', 'transferencia'),
+            observacoes=data.get('observacoes', ''),
+            gps=data.get('gps'),
+            device_id=data.get('device_id')
+        )
+
+        return jsonify({
+            'mensagem': f'{movidos} de {len(resultados)} lotes movimentados para {localizacao_destino}',
+            'total': len(resultados),
+            'movidos': movidos,
+            'resultados': resultados
+        }), 200
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'erro': f'Erro ao movimentar lotes: {str(e)}'}), 500
+
 @bp.route('/movimentacoes', methods=['GET'])
 @jwt_required()
 def listar_movimentacoes():
@@ -520,7 +556,7 @@ def reverter_movimentacao(mov_id):
         data = request.get_json()
         motivo = data.get('motivo', '')
 
-        usuario_id = get_jwt_identity()
+        usuario_id = int(get_jwt_identity())
         usuario = Usuario.query.get(usuario_id)
 
         if not usuario:
@@ -535,12 +571,13 @@ def reverter_movimentacao(mov_id):
             peso=movimentacao.peso,
             usuario_id=usuario_id,
             observacoes=f'Reversão da movimentação #{mov_id}. Motivo: {motivo}',
-            dados_before={'movimentacao_revertida_id': mov_id}
+            dados_before={'movimentacao_revertida_id': mov_id, 'localizacao_atual': lote.localizacao_atual}
         )
 
+        nova_movimentacao.dados_after = {'localizacao_atual': movimentacao.localizacao_origem}
         lote.localizacao_atual = movimentacao.localizacao_origem
-
-        nova_movimentacao.dados_after = lote.to_dict()
+        lote_eventos.registrar(lote, 'REVERSAO_MOVIMENTACAO', usuario_id,
+                               {'movimentacao_revertida_id': mov_id, 'motivo': motivo})
 
         auditoria_mov = [{
             'usuario_id': usuario_id,
@@ -576,7 +613,7 @@ def iniciar_inventario():
         localizacao = data.get('localizacao')
         observacoes = data.get('observacoes', '')
 
-        usuario_id = get_jwt_identity()
+        usuario_id = int(get_jwt_identity())
 
         inventario = Inventario(
             tipo=tipo,
@@ -595,25 +632,16 @@ def iniciar_inventario():
         }]
         inventario.auditoria = auditoria
 
-        if localizacao:
-            lotes = Lote.query.filter_by(localizacao_atual=localizacao).all()
-        else:
-            lotes = Lote.query.filter(Lote.status.in_(['EM_ESTOQUE', 'BLOQUEADO_QC', 'BLOQUEADO_INVENTARIO'])).all()
-
-        for lote in lotes:
-            lote.bloqueado = True
-            lote.tipo_bloqueio = 'INVENTARIO'
-            lote.motivo_bloqueio = f'Inventário {inventario.numero_inventario}'
-            lote.bloqueado_por_id = usuario_id
-            lote.bloqueado_em = datetime.utcnow()
-
         db.session.add(inventario)
         db.session.commit()
 
+        # UPDATE em faixas, um commit por faixa, com progresso por Socket.IO
+        lotes_bloqueados = inventario_service.bloquear_lotes(inventario, usuario_id)
+
         return jsonify({
-            'mensagem': f'Inventário iniciado. {len(lotes)} lotes bloqueados.',
+            'mensagem': f'Inventário iniciado. {lotes_bloqueados} lotes bloqueados.',
             'inventario': inventario.to_dict(),
-            'lotes_bloqueados': len(lotes)
+            'lotes_bloqueados': lotes_bloqueados
         }), 201
 
     except Exception as e:
@@ -652,7 +680,7 @@ def registrar_contagem(inv_id):
         if not lote:
             return jsonify({'erro': 'Lote não encontrado'}), 404
 
-        usuario_id = get_jwt_identity()
+        usuario_id = int(get_jwt_identity())
 
         contagem_existente = InventarioContagem.query.filter_by(
             inventario_id=inv_id,
@@ -700,44 +728,30 @@ def finalizar_inventario(inv_id):
         if inventario.status != 'EM_ANDAMENTO':
             return jsonify({'erro': 'Inventário não está em andamento'}), 400
 
-        usuario_id = get_jwt_identity()
+        usuario_id = int(get_jwt_identity())
+
+        # libera os lotes antes de marcar FINALIZADO: se cair no meio, basta finalizar de novo
+        lotes_desbloqueados = inventario_service.desbloquear_lotes(inventario, usuario_id)
 
         inventario.status = 'FINALIZADO'
         inventario.data_finalizacao = datetime.utcnow()
         inventario.finalizado_por_id = usuario_id
 
-        if inventario.localizacao:
-            lotes = Lote.query.filter_by(
-                localizacao_atual=inventario.localizacao,
-                bloqueado=True,
-                tipo_bloqueio='INVENTARIO'
-            ).all()
-        else:
-            lotes = Lote.query.filter_by(
-                bloqueado=True,
-                tipo_bloqueio='INVENTARIO'
-            ).all()
-
-        for lote in lotes:
-            if lote.motivo_bloqueio and inventario.numero_inventario in lote.motivo_bloqueio:
-                lote.bloqueado = False
-                lote.tipo_bloqueio = None
-                lote.motivo_bloqueio = None
-
-        auditoria = inventario.auditoria or []
+        # cópia: a mesma lista reatribuída não marca a coluna JSON como alterada
+        auditoria = list(inventario.auditoria or [])
         auditoria.append({
             'acao': 'FINALIZAR_INVENTARIO',
             'usuario_id': usuario_id,
             'timestamp': datetime.utcnow().isoformat(),
             'ip': request.remote_addr,
-            'lotes_desbloqueados': len(lotes)
+            'lotes_desbloqueados': lotes_desbloqueados
         })
         inventario.auditoria = auditoria
 
         db.session.commit()
 
         return jsonify({
-            'mensagem': f'Inventário finalizado. {len(lotes)} lotes desbloqueados.',
+            'mensagem': f'Inventário finalizado. {lotes_desbloqueados} lotes desbloqueados.',
             'inventario': inventario.to_dict()
         }), 200
 
@@ -753,49 +767,11 @@ def consolidar_inventario(inv_id):
         if not inventario:
             return jsonify({'erro': 'Inventário não encontrado'}), 404
 
-        contagens = InventarioContagem.query.filter_by(inventario_id=inv_id).all()
-
-        lotes_contados = {}
-        for contagem in contagens:
-            if contagem.lote_id not in lotes_contados:
-                lotes_contados[contagem.lote_id] = {
-                    'lote_numero': contagem.lote.numero_lote,
-                    'contagens': {}
-                }
-
-            lotes_contados[contagem.lote_id]['contagens'][contagem.numero_contagem] = {
-                'quantidade': contagem.quantidade_contada,
-                'peso': contagem.peso_contado,
-                'localizacao': contagem.localizacao_encontrada,
-                'contador': contagem.contador.nome
-            }
-
-        divergencias = []
-        for lote_id, dados in lotes_contados.items():
-            contagens_dict = dados['contagens']
-
-            if len(contagens_dict) >= 2:
-                contagem_1 = contagens_dict.get(1, {}).get('peso')
-                contagem_2 = contagens_dict.get(2, {}).get('peso')
-                contagem_3 = contagens_dict.get(3, {}).get('peso')
-
-                lote = Lote.query.get(lote_id)
-                peso_sistema = lote.peso_total_kg if lote else 0
-
-                if contagem_1 != contagem_2:
-                    divergencias.append({
-                        'lote_id': lote_id,
-                        'lote_numero': dados['lote_numero'],
-                        'peso_sistema': peso_sistema,
-                        'contagem_1': contagem_1,
-                        'contagem_2': contagem_2,
-                        'contagem_3': contagem_3,
-                        'status': 'DIVERGENTE'
-                    })
+        total_lotes, divergencias = inventario_service.consolidar(inventario)
 
         inventario.divergencias_consolidadas = divergencias
 
-        auditoria = inventario.auditoria or []
+        auditoria = list(inventario.auditoria or [])
         auditoria.append({
             'acao': 'CONSOLIDAR_INVENTARIO',
             'usuario_id': get_jwt_identity(),
@@ -809,7 +785,7 @@ def consolidar_inventario(inv_id):
 
         return jsonify({
             'mensagem': 'Inventário consolidado',
-            'total_lotes': len(lotes_contados),
+            'total_lotes': total_lotes,
             'divergencias': divergencias
         }), 200
 
@@ -859,6 +835,10 @@ def obter_inventario(inv_id):
 
 # ==================== AUDITORIA ====================
 
+def _eventos_do_lote(lote_id):
+    return LoteEvento.query.filter(LoteEvento.lote_id == lote_id).options(joinedload(LoteEvento.usuario))
+
+
 @bp.route('/auditoria/lotes/<int:lote_id>', methods=['GET'])
 @jwt_required()
 def obter_auditoria_lote(lote_id):
@@ -867,15 +847,87 @@ def obter_auditoria_lote(lote_id):
         if not lote:
             return jsonify({'erro': 'Lote não encontrado'}), 404
 
+        eventos = _eventos_do_lote(lote_id).order_by(LoteEvento.criado_em, LoteEvento.id).all()
+        # entradas antigas ainda não migradas (executar_manutencao_lote_eventos.py) vêm antes
         return jsonify({
             'lote_id': lote_id,
             'numero_lote': lote.numero_lote,
-            'auditoria': lote.auditoria or []
+            'auditoria': (lote.auditoria or []) + [evento.to_dict() for evento in eventos]
         }), 200
 
     except Exception as e:
         return jsonify({'erro': f'Erro ao obter auditoria: {str(e)}'}), 500
 
+@bp.route('/lotes/<int:lote_id>/eventos', methods=['GET'])
+@jwt_required()
+def listar_eventos_lote(lote_id):
+    """Eventos do lote, mais recentes primeiro, paginados pelo cursor de X-Proximo-Cursor."""
+    try:
+        if not db.session.query(Lote.id).filter(Lote.id == lote_id).first():
+            return jsonify({'erro': 'Lote não encontrado'}), 404
+
+        limite = min(max(request.args.get('limite', WMS_LOTES_PAGINA, type=int), 1), WMS_LOTES_PAGINA_MAXIMA)
+        query = _eventos_do_lote(lote_id)
+        acao = request.args.get('acao')
+        if acao:
+            query = query.filter(LoteEvento.acao == acao)
+
+        cursor = request.args.get('cursor')
+        if cursor:
+            try:
+                criado_em, ultimo_id = _ler_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'erro': str(e)}), 400
+            query = query.filter(db.tuple_(LoteEvento.criado_em, LoteEvento.id) < (criado_em, ultimo_id))
+
+        eventos = query.order_by(LoteEvento.criado_em.desc(), LoteEvento.id.desc()).limit(limite + 1).all()
+        resposta = jsonify([evento.to_dict() for evento in eventos[:limite]])
+        if len(eventos) > limite:
+            ultimo = eventos[limite - 1]
+            resposta.headers['X-Proximo-Cursor'] = f'{ultimo.criado_em.isoformat()}_{ultimo.id}'
+        return resposta, 200
+
+    except Exception as e:
+        return jsonify({'erro': f'Erro ao listar eventos do lote: {str(e)}'}), 500
+
+@bp.route('/lotes/<int:lote_id>/estado', methods=['GET'])
+@jwt_required()
+def obter_estado_lote(lote_id):
+    """
+    Colunas do lote como estavam em ?em=<data ISO>, desfazendo os eventos
+    posteriores. Sem fuso a data é tomada como UTC; com Z ou offset é
+    convertida para UTC sem fuso, como criado_em.
+    """
+    try:
+        lote = Lote.query.get(lote_id)
+        if not lote:
+            return jsonify({'erro': 'Lote não encontrado'}), 404
+
+        em = request.args.get('em')
+        if not em:
+            return jsonify({'erro': 'Parâmetro em é obrigatório'}), 400
+        try:
+            momento = datetime.fromisoformat(em.replace('Z', '+00:00'))
+        except ValueError:
+            return jsonify({'erro': 'Data inválida em em'}), 400
+        if momento.tzinfo is not None:
+            momento = momento.astimezone(timezone.utc).replace(tzinfo=None)
+
+        estado, desfeitos = lote_eventos.estado_em(lote, momento)
+        if estado is None:
+            return jsonify({'erro': 'Lote ainda não existia nessa data'}), 404
+
+        return jsonify({
+            'lote_id': lote_id,
+            'numero_lote': lote.numero_lote,
+            'em': momento.isoformat(),
+            'eventos_desfeitos': desfeitos,
+            'estado': estado
+        }), 200
+
+    except Exception as e:
+        return jsonify({'erro': f'Erro ao reconstruir estado do lote: {str(e)}'}), 500
+
 # ==================== ESTATÍSTICAS ====================
 
 @bp.route('/estatisticas', methods=['GET'])
@@ -885,10 +937,7 @@ def obter_estatisticas():
         total_lotes = Lote.query.count()
         lotes_bloqueados = Lote.query.filter_by(bloqueado=True).count()
         lotes_reservados = Lote.query.filter_by(reservado=True).count()
-        lotes_divergentes = Lote.query.filter(
-            Lote.divergencias.isnot(None),
-            db.cast(Lote.divergencias, db.String) != '[]'
-        ).count()
+        lotes_divergentes = Lote.query.filter(Lote.total_divergencias > 0).count()
 
         peso_total = db.session.query(db.func.sum(Lote.peso_total_kg)).scalar() or 0
 
@@ -957,9 +1006,7 @@ def listar_lotes_ativos():
         if localizacao and localizacao != 'todos':
             query = query.filter(Lote.localizacao_atual == localizacao)
 
-        lotes = query.all()
-
-        return jsonify([lote.to_dict() for lote in lotes]), 200
+        return jsonify(LOTE.consultar(query, 'completo')), 200
 
     except Exception as e:
         print(f'Erro ao listar lotes ativos: {e}')
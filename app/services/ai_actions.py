@@ -2,6 +2,7 @@ from app.models import (
     db, Usuario, Fornecedor, Solicitacao, Lote, TipoLote,
     Notificacao, EntradaEstoque, OrdemCompra, ItemSolicitacao
 )
+from app.services import notificacoes
 from datetime import datetime
 import json
 import re
@@ -132,27 +133,14 @@ def criar_notificacao_por_texto(mensagem, usuario_id):
     titulo = titulo_match.group(1).strip() if titulo_match else 'Notificação do Assistente'
     conteudo = msg_match.group(1).strip() if msg_match else mensagem[:200]
     
-    destinatarios = []
-    
     if admin_destinatario:
-        admins = Usuario.query.filter_by(tipo='admin', ativo=True).all()
-        destinatarios = [u.id for u in admins]
+        destino = 'admins'
     elif todos_destinatario:
-        usuarios = Usuario.query.filter_by(ativo=True).limit(50).all()
-        destinatarios = [u.id for u in usuarios]
+        destino = 'todos'
     else:
-        destinatarios = [usuario_id]
-    
-    count = 0
-    for dest_id in destinatarios:
-        notif = Notificacao(
-            usuario_id=dest_id,
-            titulo=titulo,
-            mensagem=conteudo,
-            tipo='assistente'
-        )
-        db.session.add(notif)
-        count += 1
+        destino = [usuario_id]
+    
+    count = notificacoes.notificar(destino, titulo=titulo, mensagem=conteudo, tipo='assistente')
     
     db.session.commit()
     
@@ -0,0 +1,218 @@
+"""
+Armazenamento de imagens (blobs) endereçado pelo conteúdo.
+
+Cada blob é gravado sob o SHA-256 do seu conteúdo, então o mesmo arquivo
+enviado várias vezes ocupa espaço uma única vez e a chave serve como ETag
+forte e imutável.
+
+Backends (variável SCANNER_BLOB_BACKEND):
+  - local  (padrão): diretório SCANNER_BLOB_DIR, em subpastas ab/cd/<sha256>
+  - s3:     bucket S3 ou compatível (MinIO), configurado por SCANNER_S3_BUCKET,
+            SCANNER_S3_ENDPOINT_URL, SCANNER_S3_PREFIX e as credenciais AWS_*
+            padrão. Requer o pacote boto3 (requirements.txt).
+  - tiered: S3 como armazenamento principal e o diretório local como cache
+            quente de leitura (miniaturas e imagens recentes).
+"""
+import os
+import hashlib
+
+import cv2
+import numpy as np
+
+SCANNER_BLOB_BACKEND = os.getenv('SCANNER_BLOB_BACKEND', 'local')
+SCANNER_BLOB_DIR = os.getenv('SCANNER_BLOB_DIR', os.path.join('uploads', 'scanner_blobs'))
+SCANNER_S3_BUCKET = os.getenv('SCANNER_S3_BUCKET')
+SCANNER_S3_ENDPOINT_URL = os.getenv('SCANNER_S3_ENDPOINT_URL')
+SCANNER_S3_PREFIX = os.getenv('SCANNER_S3_PREFIX', 'scanner/')
+
+THUMBNAIL_MAX_SIDE = 320
+THUMBNAIL_QUALITY = 80
+
+
+def content_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def sniff_mimetype(data):
+    if data[:2] == b'\xff\xd8':
+        return 'image/jpeg'
+    if data[:4] == b'\x89PNG':
+        return 'image/png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data[:4] == b'GIF8':
+        return 'image/gif'
+    return 'application/octet-stream'
+
+
+def make_thumbnail(image_bytes):
+    """Miniatura JPEG com lado maior de até THUMBNAIL_MAX_SIDE pixels, ou None."""
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_REDUCED_COLOR_4)
+    if img is None or max(img.shape[:2]) < THUMBNAIL_MAX_SIDE:
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+
+    height, width = img.shape[:2]
+    factor = THUMBNAIL_MAX_SIDE / float(max(height, width))
+    if factor < 1:
+        img = cv2.resize(img, (max(1, int(width * factor)), max(1, int(height * factor))),
+                         interpolation=cv2.INTER_AREA)
+
+    ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+    return buffer.tobytes() if ok else None
+
+
+class LocalBlobStore:
+    def __init__(self, root=SCANNER_BLOB_DIR):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, data, key=None):
+        key = key or content_key(data)
+        path = self.path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return key
+
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore:
+    def __init__(self, bucket=SCANNER_S3_BUCKET, endpoint_url=SCANNER_S3_ENDPOINT_URL, prefix=SCANNER_S3_PREFIX):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError('Backend S3 requer o pacote boto3 (pip install boto3)')
+        if not bucket:
+            raise RuntimeError('SCANNER_S3_BUCKET não configurado')
+
+        self.bucket = bucket
+        self.prefix = prefix or ''
+        self.client = boto3.client('s3', endpoint_url=endpoint_url or None)
+
+    def _object_key(self, key):
+        return f'{self.prefix}{key[:2]}/{key}'
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except ClientError:
+            return False
+
+    def put(self, data, key=None):
+        key = key or content_key(data)
+        if not self.exists(key):
+            self.client.put_object(
+                Bucket=self.bucket,
+                Key=self._object_key(key),
+                Body=data,
+                ContentType=sniff_mimetype(data),
+                CacheControl='private, max-age=31536000, immutable'
+            )
+        return key
+
+    def get(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError:
+            return None
+        return response['Body'].read()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+
+class TieredBlobStore:
+    """Grava no armazenamento principal e usa o diretório local como cache de leitura."""
+
+    def __init__(self, primary, cache):
+        self.primary = primary
+        self.cache = cache
+
+    def exists(self, key):
+        return self.cache.exists(key) or self.primary.exists(key)
+
+    def put(self, data, key=None):
+        key = self.primary.put(data, key)
+        self.cache.put(data, key)
+        return key
+
+    def get(self, key):
+        data = self.cache.get(key)
+        if data is None:
+            data = self.primary.get(key)
+            if data is not None:
+                self.cache.put(data, key)
+        return data
+
+    def delete(self, key):
+        self.cache.delete(key)
+        self.primary.delete(key)
+
+
+_store = None
+
+
+def get_blob_store():
+    global _store
+    if _store is None:
+        if SCANNER_BLOB_BACKEND == 's3':
+            _store = S3BlobStore()
+        elif SCANNER_BLOB_BACKEND == 'tiered':
+            _store = TieredBlobStore(S3BlobStore(), LocalBlobStore())
+        else:
+            _store = LocalBlobStore()
+    return _store
+
+
+def store_scanner_image(image_bytes, image_mimetype=None, image_key=None, thumbnail=None, generate_thumbnail=True):
+    """
+    Grava a imagem original e a miniatura gerada na ingestão.
+    Retorna os campos de ScannerAnalysis correspondentes.
+
+    As rotas geram a miniatura fora do loop do eventlet e a passam em
+    `thumbnail` com generate_thumbnail=False; os scripts de migração deixam
+    que ela seja gerada aqui.
+    """
+    store = get_blob_store()
+    image_key = store.put(image_bytes, image_key)
+
+    thumbnail_key = None
+    if thumbnail is None and generate_thumbnail:
+        thumbnail = make_thumbnail(image_bytes)
+    if thumbnail:
+        thumbnail_key = store.put(thumbnail)
+
+    return {
+        'image_key': image_key,
+        'thumbnail_key': thumbnail_key,
+        'image_size': len(image_bytes),
+        'image_mimetype': image_mimetype or sniff_mimetype(image_bytes)
+    }
@@ -0,0 +1,273 @@
+"""
+Tabelas de rollup diário que alimentam o dashboard.
+
+Cada fato (lotes, solicitações, ordens de compra) é agregado por dia e pelas
+dimensões fornecedor, comprador, tipo de lote e status nas tabelas
+rollup_*_diario, com um INSERT ... SELECT ... GROUP BY por atualização.
+
+Atualização incremental (atualizar_rollups):
+  - a marca d'água é a maior data_criacao/data_envio/criado_em já agregada;
+    os dias a partir de (marca d'água - ROLLUP_JANELA_DIAS) são recalculados
+  - linhas antigas alteradas depois da última atualização (data_atualizacao,
+    preenchida pelo onupdate) também têm seus dias recalculados, o que cobre
+    aprovações e mudanças de status de lotes antigos
+
+Exclusões de linhas antigas só são refletidas pela reconstrução completa
+(reconstruir_rollups / executar_rollups_dashboard.py --rebuild).
+verificar_rollups compara os rollups com as tabelas de origem.
+
+Concorrência: a atualização apaga e reinsere dias inteiros em tabelas com
+restrição de unicidade, então duas atualizações simultâneas (workers do
+gunicorn, CLI) não podem se intercalar. No PostgreSQL ela roda sob um
+advisory lock da transação (ROLLUP_LOCK_ID). A atualização disparada por uma
+leitura (garantir_atualizados) não espera: se outro processo já está
+atualizando, ou se a atualização colidir com outra (IntegrityError, em bancos
+sem advisory lock), a leitura usa os rollups como estão.
+"""
+import os
+import time
+import threading
+from datetime import datetime, date, timedelta
+
+from sqlalchemy import func, case, insert, select, text, and_, or_
+from sqlalchemy.exc import IntegrityError
+
+from app.models import (
+    db, Lote, Solicitacao, OrdemCompra, RollupEstado,
+    RollupLoteDiario, RollupSolicitacaoDiario, RollupOrdemCompraDiario
+)
+
+ROLLUP_JANELA_DIAS = int(os.getenv('ROLLUP_JANELA_DIAS', 3))
+ROLLUP_INTERVALO = float(os.getenv('ROLLUP_INTERVALO', 300))
+ROLLUP_LOCK_ID = int(os.getenv('ROLLUP_LOCK_ID', 73100901))
+
+DIAS_POR_LOTE = 200
+
+_lock = threading.Lock()
+_desatualizado = True
+_ultima_atualizacao = 0.0
+
+
+def _horas_entre(fim, inicio):
+    if db.engine.dialect.name == 'sqlite':
+        return (func.julianday(fim) - func.julianday(inicio)) * 24
+    return func.extract('epoch', fim - inicio) / 3600
+
+
+class Fato:
+    def __init__(self, nome, rollup, origem, coluna_data, dimensoes, medidas):
+        self.nome = nome
+        self.rollup = rollup
+        self.origem = origem
+        self.coluna_data = coluna_data
+        self.dimensoes = dimensoes
+        self.medidas = medidas
+
+    def colunas(self):
+        return ['dia'] + [nome for nome, _ in self.dimensoes] + [nome for nome, _ in self.medidas]
+
+    def consulta_agregada(self, *filtros):
+        dia = func.date(self.coluna_data)
+        dimensoes = [expr for _, expr in self.dimensoes]
+        return select(
+            dia, *dimensoes, *[medida() for _, medida in self.medidas]
+        ).where(*filtros).group_by(dia, *dimensoes)
+
+
+def _fatos():
+    horas = _horas_entre(Solicitacao.data_confirmacao, Solicitacao.data_envio)
+    return [
+        Fato('lotes', RollupLoteDiario, Lote, Lote.data_criacao, [
+            ('fornecedor_id', Lote.fornecedor_id),
+            ('tipo_lote_id', Lote.tipo_lote_id),
+            ('status', Lote.status),
+        ], [
+            ('quantidade', lambda: func.count(Lote.id)),
+            ('peso_total_kg', lambda: func.coalesce(func.sum(Lote.peso_total_kg), 0)),
+            ('valor_total', lambda: func.coalesce(func.sum(Lote.valor_total), 0)),
+        ]),
+        Fato('solicitacoes', RollupSolicitacaoDiario, Solicitacao, Solicitacao.data_envio, [
+            ('fornecedor_id', Solicitacao.fornecedor_id),
+            ('funcionario_id', Solicitacao.funcionario_id),
+            ('status', Solicitacao.status),
+        ], [
+            ('quantidade', lambda: func.count(Solicitacao.id)),
+            ('quantidade_confirmadas', lambda: func.count(Solicitacao.data_confirmacao)),
+            ('horas_aprovacao_total', lambda: func.coalesce(func.sum(
+                case((Solicitacao.data_confirmacao.isnot(None), horas), else_=0)
+            ), 0)),
+        ]),
+        Fato('ordens_compra', RollupOrdemCompraDiario, OrdemCompra, OrdemCompra.criado_em, [
+            ('fornecedor_id', OrdemCompra.fornecedor_id),
+            ('criado_por', OrdemCompra.criado_por),
+            ('status', OrdemCompra.status),
+        ], [
+            ('quantidade', lambda: func.count(OrdemCompra.id)),
+            ('valor_total', lambda: func.coalesce(func.sum(OrdemCompra.valor_total), 0)),
+        ]),
+    ]
+
+
+def _para_data(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor)[:10])
+
+
+def _inicio(dia):
+    return datetime(dia.year, dia.month, dia.day)
+
+
+def _reagregar(fato, desde=None, dias=None):
+    """Apaga e recalcula os rollups a partir de `desde` ou apenas dos `dias` informados."""
+    if desde is None and dias is None:
+        db.session.query(fato.rollup).delete(synchronize_session=False)
+        filtros = []
+    elif desde is not None:
+        db.session.query(fato.rollup).filter(fato.rollup.dia >= desde).delete(synchronize_session=False)
+        filtros = [fato.coluna_data >= _inicio(desde)]
+    else:
+        db.session.query(fato.rollup).filter(fato.rollup.dia.in_(dias)).delete(synchronize_session=False)
+        filtros = [or_(*[
+            and_(fato.coluna_data >= _inicio(dia), fato.coluna_data < _inicio(dia) + timedelta(days=1))
+            for dia in dias
+        ])]
+
+    db.session.execute(insert(fato.rollup).from_select(fato.colunas(), fato.consulta_agregada(*filtros)))
+
+
+def _atualizar_fato(fato, completo):
+    inicio = datetime.utcnow()
+    estado = db.session.get(RollupEstado, fato.nome)
+    marca_dagua = db.session.query(func.max(fato.coluna_data)).scalar()
+    dias_recalculados = 0
+    reconstruido = completo or estado is None or estado.marca_dagua is None
+
+    if reconstruido:
+        _reagregar(fato)
+        estado = estado or RollupEstado(nome=fato.nome)
+        db.session.add(estado)
+    else:
+        desde = estado.marca_dagua.date() - timedelta(days=ROLLUP_JANELA_DIAS)
+        _reagregar(fato, desde=desde)
+        dias_recalculados = (date.today() - desde).days + 1
+
+        # Filtra só por data_atualizacao para o índice dessa coluna ser usado;
+        # os dias que a janela já recalculou são descartados aqui.
+        alterados = sorted(dia for dia in {_para_data(dia) for (dia,) in db.session.query(
+            func.date(fato.coluna_data)
+        ).filter(
+            fato.origem.data_atualizacao >= estado.atualizado_em
+        ).distinct()} if dia < desde)
+        for i in range(0, len(alterados), DIAS_POR_LOTE):
+            _reagregar(fato, dias=alterados[i:i + DIAS_POR_LOTE])
+        dias_recalculados += len(alterados)
+
+    estado.marca_dagua = marca_dagua
+    estado.atualizado_em = inicio
+    return {'completo': reconstruido, 'dias_recalculados': dias_recalculados}
+
+
+def _lock_entre_processos(esperar):
+    """Advisory lock da transação corrente no PostgreSQL; nos outros bancos sempre True."""
+    if db.engine.dialect.name != 'postgresql':
+        return True
+    if esperar:
+        db.session.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': ROLLUP_LOCK_ID})
+        return True
+    return bool(db.session.execute(
+        text('SELECT pg_try_advisory_xact_lock(:id)'), {'id': ROLLUP_LOCK_ID}
+    ).scalar())
+
+
+def atualizar_rollups(completo=False, esperar=True):
+    """
+    Atualiza todos os rollups numa única transação e devolve um resumo por fato.
+    Com completo=True reconstrói tudo a partir das tabelas de origem.
+    Com esperar=False devolve None sem atualizar se outra atualização, neste ou
+    em outro processo, estiver em andamento.
+    """
+    global _desatualizado, _ultima_atualizacao
+
+    if not _lock.acquire(blocking=esperar):
+        return None
+    try:
+        resumo = {}
+        try:
+            if not _lock_entre_processos(esperar):
+                return None
+            for fato in _fatos():
+                inicio = time.perf_counter()
+                resumo[fato.nome] = _atualizar_fato(fato, completo)
+                resumo[fato.nome]['ms'] = round((time.perf_counter() - inicio) * 1000, 1)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        _desatualizado = False
+        _ultima_atualizacao = time.monotonic()
+        return resumo
+    finally:
+        _lock.release()
+
+
+def reconstruir_rollups():
+    return atualizar_rollups(completo=True)
+
+
+def marcar_desatualizado():
+    global _desatualizado
+    _desatualizado = True
+
+
+def garantir_atualizados():
+    """
+    Atualização incremental antes de uma leitura, se houve escrita ou o intervalo
+    expirou. Se outra atualização está em andamento a leitura não espera por ela
+    e usa os rollups atuais; o processo que a executa os deixa em dia.
+    """
+    global _desatualizado, _ultima_atualizacao
+
+    if _desatualizado or time.monotonic() - _ultima_atualizacao > ROLLUP_INTERVALO:
+        try:
+            resumo = atualizar_rollups(esperar=False)
+        except IntegrityError:
+            # outro processo reagregou os mesmos dias ao mesmo tempo
+            resumo = None
+        if resumo is None:
+            _desatualizado = False
+            _ultima_atualizacao = time.monotonic()
+
+
+def verificar_rollups(tolerancia=1e-6):
+    """
+    Compara cada rollup com a agregação direta da tabela de origem.
+    Devolve {fato: {'linhas': n, 'divergencias': [...]}}.
+    """
+    relatorio = {}
+    for fato in _fatos():
+        n_dimensoes = 1 + len(fato.dimensoes)
+        esperado = {}
+        for row in db.session.execute(fato.consulta_agregada()):
+            chave = (_para_data(row[0]),) + tuple(row[1:n_dimensoes])
+            esperado[chave] = tuple(row[n_dimensoes:])
+
+        atual = {}
+        colunas = [getattr(fato.rollup, nome) for nome in fato.colunas()]
+        for row in db.session.query(*colunas):
+            chave = (_para_data(row[0]),) + tuple(row[1:n_dimensoes])
+            atual[chave] = tuple(row[n_dimensoes:])
+
+        divergencias = []
+        for chave in sorted(set(esperado) | set(atual), key=str):
+            a, b = esperado.get(chave), atual.get(chave)
+            if a is None or b is None or any(
+                abs(float(x or 0) - float(y or 0)) > tolerancia * max(1.0, abs(float(x or 0)))
+                for x, y in zip(a, b)
+            ):
+                divergencias.append({'chave': chave, 'origem': a, 'rollup': b})
+
+        relatorio[fato.nome] = {'linhas': len(esperado), 'divergencias': divergencias}
+    return relatorio
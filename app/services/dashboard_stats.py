@@ -0,0 +1,550 @@
+"""
+Agregações do dashboard com cache de curta duração.
+
+Os números do dashboard são lidos dos rollups diários
+(app/services/dashboard_rollups.py) com agregação condicional (SUM(CASE ...))
+em poucas consultas, em vez de um COUNT/SUM por indicador e por mês,
+e guardados em memória por DASHBOARD_CACHE_TTL segundos para cada papel
+(admin / perfil do usuário).
+
+Requisições de escrita bem-sucedidas nos blueprints de solicitações, lotes,
+validação e ordens de serviço (BLUEPRINTS_INVALIDAM) invalidam o cache e
+marcam os rollups para atualização incremental na próxima leitura (ver
+init_app), então os números não ficam defasados depois de uma
+aprovação ou entrada. Com vários workers a invalidação também incrementa a
+versão 'dashboard' em estado_compartilhado, e os outros workers descartam o
+cache na leitura seguinte.
+"""
+import os
+import time
+import threading
+from datetime import datetime, date, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from flask import request
+from sqlalchemy import func, case, and_
+
+from app.models import (
+    db, Fornecedor, Solicitacao, Lote, TipoLote, Usuario, EntradaEstoque,
+    RollupLoteDiario, RollupSolicitacaoDiario, Motorista, OrdemServico, MetricasRotaOS
+)
+from app.services import dashboard_rollups, estado_compartilhado
+
+DASHBOARD_CACHE_TTL = float(os.getenv('DASHBOARD_CACHE_TTL', 30))
+
+# Blueprints cujas escritas alteram os números do dashboard (validacao aprova
+# e reprova solicitações; ordens_servico e motoristas alimentam o ranking de
+# motoristas)
+BLUEPRINTS_INVALIDAM = {
+    'solicitacoes', 'solicitacao_lotes', 'lotes', 'entradas', 'tipos_lote', 'validacao',
+    'conferencias', 'separacao', 'estoque', 'wms', 'compras', 'fornecedores', 'ordens_compra',
+    'ordens_servico', 'motoristas'
+}
+
+METODOS_ESCRITA = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+NOMES_MESES = ['', 'Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun',
+               'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+
+
+class DashboardCache:
+    def __init__(self, ttl=DASHBOARD_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._dados = {}
+        self._versao = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _conferir_versao(self):
+        versao = estado_compartilhado.versao('dashboard')
+        if versao != self._versao:
+            # invalidado por outro worker: os rollups também podem estar defasados
+            with self._lock:
+                self._dados.clear()
+                self._versao = versao
+            dashboard_rollups.marcar_desatualizado()
+
+    def get_or_compute(self, chave, calcular):
+        self._conferir_versao()
+        agora = time.monotonic()
+        with self._lock:
+            item = self._dados.get(chave)
+            if item and item[0] > agora:
+                self.hits += 1
+                return item[1]
+            self.misses += 1
+
+        valor = calcular()
+        with self._lock:
+            self._dados[chave] = (time.monotonic() + self.ttl, valor)
+        return valor
+
+    def invalidate(self):
+        with self._lock:
+            self._dados.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'ttl_s': self.ttl,
+                'entradas': len(self._dados),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+dashboard_cache = DashboardCache()
+
+
+def papel_usuario(usuario):
+    if usuario.tipo == 'admin':
+        return 'admin'
+    return usuario.perfil.nome if usuario.perfil else usuario.tipo
+
+
+def _ultimos_meses(hoje, quantidade=6):
+    """[(inicio, fim)] dos últimos `quantidade` meses, do mais antigo ao atual."""
+    mes_atual = date(hoje.year, hoje.month, 1)
+    meses = []
+    for i in range(quantidade - 1, -1, -1):
+        inicio = mes_atual - relativedelta(months=i)
+        meses.append((inicio, inicio + relativedelta(months=1)))
+    return meses
+
+
+def _soma_por_mes(coluna_dia, valor, meses):
+    return [
+        func.sum(case(((coluna_dia >= inicio) & (coluna_dia < fim), valor), else_=0))
+        for inicio, fim in meses
+    ]
+
+
+def calcular_estatisticas():
+    """Indicadores gerais do dashboard a partir dos rollups diários."""
+    dashboard_rollups.garantir_atualizados()
+    RS, RL = RollupSolicitacaoDiario, RollupLoteDiario
+
+    relatorios = db.session.query(
+        func.sum(case((RS.status == 'pendente', RS.quantidade), else_=0)),
+        func.sum(case((RS.status == 'aprovada', RS.quantidade), else_=0)),
+        func.sum(case((RS.status == 'rejeitada', RS.quantidade), else_=0))
+    ).one()
+
+    lotes = db.session.query(
+        func.sum(case((RL.status == 'aprovado', RL.valor_total), else_=0)),
+        func.sum(case((TipoLote.classificacao == 'leve', RL.peso_total_kg), else_=0)),
+        func.sum(case((TipoLote.classificacao == 'media', RL.peso_total_kg), else_=0)),
+        func.sum(case((TipoLote.classificacao == 'pesada', RL.peso_total_kg), else_=0))
+    ).outerjoin(
+        TipoLote, RL.tipo_lote_id == TipoLote.id
+    ).one()
+
+    # Ranking de fornecedores (top 10)
+    total = func.sum(RS.quantidade)
+    ranking = db.session.query(
+        Fornecedor.id,
+        Fornecedor.nome,
+        total.label('total')
+    ).join(
+        RS, RS.fornecedor_id == Fornecedor.id
+    ).filter(
+        RS.status == 'aprovada'
+    ).group_by(
+        Fornecedor.id, Fornecedor.nome
+    ).order_by(
+        total.desc()
+    ).limit(10).all()
+
+    return {
+        'relatorios': {
+            'pendentes': int(relatorios[0] or 0),
+            'aprovados': int(relatorios[1] or 0),
+            'reprovados': int(relatorios[2] or 0)
+        },
+        'valor_total': float(lotes[0] or 0),
+        'quilos_por_tipo': {
+            'leve': float(lotes[1] or 0),
+            'media': float(lotes[2] or 0),
+            'pesada': float(lotes[3] or 0)
+        },
+        'ranking_empresas': [
+            {
+                'id': r.id,
+                'nome': r.nome,
+                'total': int(r.total)
+            } for r in ranking
+        ]
+    }
+
+
+def calcular_grafico_mensal(hoje=None):
+    """Solicitações aprovadas por mês nos últimos 6 meses."""
+    dashboard_rollups.garantir_atualizados()
+    RS = RollupSolicitacaoDiario
+    meses = _ultimos_meses(hoje or datetime.now())
+
+    valores = db.session.query(*_soma_por_mes(RS.dia, RS.quantidade, meses)).filter(
+        RS.dia >= meses[0][0],
+        RS.dia < meses[-1][1],
+        RS.status == 'aprovada'
+    ).one()
+
+    return {
+        'labels': [NOMES_MESES[inicio.month] for inicio, _ in meses],
+        'data': [int(v or 0) for v in valores]
+    }
+
+
+def calcular_metricas_financeiras(hoje=None):
+    """
+    Métricas financeiras dos compradores em três consultas aos rollups,
+    independente do número de compradores: a lista de compradores, uma
+    agregação agrupada por comprador (responsável pelo fornecedor) e uma
+    agregação condicional dos últimos 6 meses.
+    """
+    dashboard_rollups.garantir_atualizados()
+    RL = RollupLoteDiario
+    hoje = hoje or datetime.now()
+    mes_atual = date(hoje.year, hoje.month, 1)
+    inicio_semana = hoje.date() - timedelta(days=hoje.weekday())
+
+    compradores = Usuario.query.with_entities(Usuario.id, Usuario.nome).filter(
+        Usuario.tipo.in_(['admin', 'funcionario']),
+        Usuario.ativo == True
+    ).all()
+
+    no_mes = RL.dia >= mes_atual
+    na_semana = RL.dia >= inicio_semana
+    por_comprador = {
+        row.comprador_id: row for row in db.session.query(
+            Fornecedor.comprador_responsavel_id.label('comprador_id'),
+            func.sum(case((no_mes, RL.valor_total), else_=0)).label('valor_mes'),
+            func.sum(case((na_semana, RL.valor_total), else_=0)).label('valor_semana'),
+            func.sum(case((no_mes, RL.quantidade), else_=0)).label('qtd_compras')
+        ).join(
+            Fornecedor, RL.fornecedor_id == Fornecedor.id
+        ).filter(
+            RL.dia >= min(mes_atual, inicio_semana),
+            RL.status == 'aprovado'
+        ).group_by(
+            Fornecedor.comprador_responsavel_id
+        )
+    }
+
+    gastos_por_comprador = []
+    for comprador in compradores:
+        row = por_comprador.get(comprador.id)
+        valor_mes = float(row.valor_mes or 0) if row else 0.0
+        qtd_compras = int(row.qtd_compras or 0) if row else 0
+        gastos_por_comprador.append({
+            'nome': comprador.nome,
+            'valor_mes': valor_mes,
+            'valor_semana': float(row.valor_semana or 0) if row else 0.0,
+            'qtd_compras': qtd_compras,
+            'ticket_medio': (valor_mes / qtd_compras) if qtd_compras > 0 else 0
+        })
+
+    meses = _ultimos_meses(hoje)
+    valores_mensais = db.session.query(*_soma_por_mes(RL.dia, RL.valor_total, meses)).filter(
+        RL.dia >= meses[0][0],
+        RL.dia < meses[-1][1],
+        RL.status == 'aprovado'
+    ).one()
+
+    gastos_mensais = [
+        {'mes': NOMES_MESES[inicio.month], 'valor': float(valor or 0)}
+        for (inicio, _), valor in zip(meses, valores_mensais)
+    ]
+
+    total_gasto_mes = sum(c['valor_mes'] for c in gastos_por_comprador)
+    total_compras_mes = sum(c['qtd_compras'] for c in gastos_por_comprador)
+
+    return {
+        'gastos_por_comprador': gastos_por_comprador,
+        'gastos_mensais': gastos_mensais,
+        'total_gasto_mes': float(total_gasto_mes),
+        'total_compras_mes': total_compras_mes,
+        'ticket_medio_geral': (total_gasto_mes / total_compras_mes) if total_compras_mes > 0 else 0
+    }
+
+
+METRICAS_FORNECEDOR = {
+    'nome', 'total_solicitacoes', 'solicitacoes_aprovadas', 'taxa_aprovacao',
+    'tempo_medio_aprovacao_horas', 'peso_total_kg', 'valor_total', 'preco_medio_kg'
+}
+
+METRICAS_SOLICITACOES = {'total_solicitacoes', 'solicitacoes_aprovadas', 'taxa_aprovacao',
+                         'tempo_medio_aprovacao_horas'}
+METRICAS_LOTES = {'peso_total_kg', 'valor_total', 'preco_medio_kg'}
+
+MAX_POR_PAGINA_FORNECEDORES = 200
+
+
+def _subconsultas_fornecedor(mes_atual, fornecedor_ids=None):
+    """Agregados do mês por fornecedor: solicitações e lotes aprovados."""
+    RS, RL = RollupSolicitacaoDiario, RollupLoteDiario
+    aprovada = RS.status == 'aprovada'
+
+    solicitacoes = db.session.query(
+        RS.fornecedor_id.label('fornecedor_id'),
+        func.sum(RS.quantidade).label('total'),
+        func.sum(case((aprovada, RS.quantidade), else_=0)).label('aprovadas'),
+        func.sum(case((aprovada, RS.quantidade_confirmadas), else_=0)).label('confirmadas'),
+        func.sum(case((aprovada, RS.horas_aprovacao_total), else_=0)).label('horas')
+    ).filter(RS.dia >= mes_atual)
+
+    lotes = db.session.query(
+        RL.fornecedor_id.label('fornecedor_id'),
+        func.sum(RL.peso_total_kg).label('peso'),
+        func.sum(RL.valor_total).label('valor')
+    ).filter(RL.dia >= mes_atual, RL.status == 'aprovado')
+
+    if fornecedor_ids is not None:
+        solicitacoes = solicitacoes.filter(RS.fornecedor_id.in_(fornecedor_ids))
+        lotes = lotes.filter(RL.fornecedor_id.in_(fornecedor_ids))
+
+    return solicitacoes.group_by(RS.fornecedor_id), lotes.group_by(RL.fornecedor_id)
+
+
+def _expressao_metrica(metrica, s, l):
+    """Expressão SQL da métrica sobre as subconsultas (NULL vira 0, como no payload)."""
+    if metrica == 'nome':
+        return Fornecedor.nome
+    expressoes = {
+        'total_solicitacoes': lambda: s.c.total,
+        'solicitacoes_aprovadas': lambda: s.c.aprovadas,
+        'taxa_aprovacao': lambda: s.c.aprovadas * 100.0 / func.nullif(s.c.total, 0),
+        'tempo_medio_aprovacao_horas': lambda: s.c.horas / func.nullif(s.c.confirmadas, 0),
+        'peso_total_kg': lambda: l.c.peso,
+        'valor_total': lambda: l.c.valor,
+        'preco_medio_kg': lambda: l.c.valor / func.nullif(l.c.peso, 0),
+    }
+    return func.coalesce(expressoes[metrica](), 0)
+
+
+def calcular_analise_fornecedores(hoje=None, ordenar_por='valor_total', ordem='desc', pagina=1, por_pagina=10):
+    """
+    Análise dos fornecedores ativos no mês, paginada e ordenada por qualquer métrica.
+
+    A ordenação e a paginação rodam no banco, juntando aos fornecedores só a
+    subconsulta necessária para a métrica escolhida; as demais métricas são
+    calculadas apenas para os fornecedores da página. São quatro consultas,
+    independente do número de fornecedores. Sem parâmetros devolve o top 10
+    por valor_total, como antes.
+    """
+    dashboard_rollups.garantir_atualizados()
+    hoje = hoje or datetime.now()
+    mes_atual = date(hoje.year, hoje.month, 1)
+
+    ativos = Fornecedor.ativo == True
+    total_fornecedores = db.session.query(func.count(Fornecedor.id)).filter(ativos).scalar() or 0
+
+    solicitacoes, lotes = _subconsultas_fornecedor(mes_atual)
+    s, l = solicitacoes.subquery(), lotes.subquery()
+    pagina_query = db.session.query(Fornecedor.id, Fornecedor.nome).filter(ativos)
+    if ordenar_por in METRICAS_SOLICITACOES:
+        pagina_query = pagina_query.outerjoin(s, s.c.fornecedor_id == Fornecedor.id)
+    elif ordenar_por in METRICAS_LOTES:
+        pagina_query = pagina_query.outerjoin(l, l.c.fornecedor_id == Fornecedor.id)
+
+    chave = _expressao_metrica(ordenar_por, s, l)
+    pagina_fornecedores = pagina_query.order_by(
+        chave.asc() if ordem == 'asc' else chave.desc(),
+        Fornecedor.id
+    ).offset((pagina - 1) * por_pagina).limit(por_pagina).all()
+
+    ids = [f.id for f in pagina_fornecedores]
+    if ids:
+        solicitacoes, lotes = _subconsultas_fornecedor(mes_atual, ids)
+        por_solicitacao = {row.fornecedor_id: row for row in solicitacoes}
+        por_lote = {row.fornecedor_id: row for row in lotes}
+    else:
+        por_solicitacao, por_lote = {}, {}
+
+    analise_fornecedores = []
+    for fornecedor in pagina_fornecedores:
+        s_row = por_solicitacao.get(fornecedor.id)
+        l_row = por_lote.get(fornecedor.id)
+        total_solicitacoes = int(s_row.total or 0) if s_row else 0
+        solicitacoes_aprovadas = int(s_row.aprovadas or 0) if s_row else 0
+        confirmadas = int(s_row.confirmadas or 0) if s_row else 0
+        tempo_medio_aprovacao = (float(s_row.horas or 0) / confirmadas) if confirmadas else 0
+        peso_total = float(l_row.peso or 0) if l_row else 0.0
+        valor_total = float(l_row.valor or 0) if l_row else 0.0
+
+        taxa_aprovacao = (solicitacoes_aprovadas / total_solicitacoes * 100) if total_solicitacoes > 0 else 0
+        preco_medio_kg = (valor_total / peso_total) if peso_total > 0 else 0
+
+        analise_fornecedores.append({
+            'nome': fornecedor.nome,
+            'total_solicitacoes': total_solicitacoes,
+            'solicitacoes_aprovadas': solicitacoes_aprovadas,
+            'taxa_aprovacao': round(taxa_aprovacao, 2),
+            'tempo_medio_aprovacao_horas': round(tempo_medio_aprovacao, 2),
+            'peso_total_kg': peso_total,
+            'valor_total': valor_total,
+            'preco_medio_kg': round(preco_medio_kg, 2)
+        })
+
+    return {
+        'top_fornecedores': analise_fornecedores,
+        'total_fornecedores': total_fornecedores,
+        'total': total_fornecedores,
+        'pages': (total_fornecedores + por_pagina - 1) // por_pagina,
+        'current_page': pagina,
+        'per_page': por_pagina,
+        'sort_by': ordenar_por,
+        'order': ordem
+    }
+
+
+def calcular_metricas_operacionais(hoje=None):
+    """Métricas de eficiência operacional; só o tempo de ciclo consulta as tabelas de origem."""
+    dashboard_rollups.garantir_atualizados()
+    RS = RollupSolicitacaoDiario
+    hoje = hoje or datetime.now()
+    mes_atual = date(hoje.year, hoje.month, 1)
+
+    no_mes = RS.dia >= mes_atual
+    totais = db.session.query(
+        func.sum(case((no_mes, RS.quantidade), else_=0)),
+        func.sum(case((no_mes & (RS.status == 'aprovada'), RS.quantidade), else_=0)),
+        func.sum(case((no_mes & (RS.status == 'rejeitada'), RS.quantidade), else_=0)),
+        func.sum(case((RS.status == 'pendente', RS.quantidade), else_=0)),
+        func.sum(case((no_mes & (RS.status == 'aprovada'), RS.quantidade_confirmadas), else_=0)),
+        func.sum(case((no_mes & (RS.status == 'aprovada'), RS.horas_aprovacao_total), else_=0))
+    ).one()
+    total_solicitacoes, aprovadas, rejeitadas, pendentes, confirmadas = [int(v or 0) for v in totais[:5]]
+    horas_aprovacao = float(totais[5] or 0)
+
+    # O ciclo completo cruza entradas de estoque com solicitações do mesmo
+    # fornecedor, o que não se decompõe por dia; continua na tabela de origem.
+    tempo_medio_ciclo_completo = db.session.query(
+        func.avg(
+            func.extract('epoch', EntradaEstoque.data_entrada - Solicitacao.data_envio) / (3600 * 24)
+        )
+    ).join(
+        Lote, EntradaEstoque.lote_id == Lote.id
+    ).join(
+        Solicitacao, Lote.fornecedor_id == Solicitacao.fornecedor_id
+    ).filter(
+        Solicitacao.data_envio >= datetime(mes_atual.year, mes_atual.month, 1),
+        EntradaEstoque.data_entrada.isnot(None)
+    ).scalar() or 0
+
+    meses = _ultimos_meses(hoje)
+    por_mes = db.session.query(
+        *_soma_por_mes(RS.dia, RS.quantidade, meses),
+        *_soma_por_mes(RS.dia, case((RS.status == 'aprovada', RS.quantidade), else_=0), meses)
+    ).filter(
+        RS.dia >= meses[0][0],
+        RS.dia < meses[-1][1]
+    ).one()
+
+    return {
+        'total_solicitacoes_mes': total_solicitacoes,
+        'solicitacoes_aprovadas': aprovadas,
+        'solicitacoes_rejeitadas': rejeitadas,
+        'solicitacoes_pendentes': pendentes,
+        'taxa_aprovacao': round((aprovadas / total_solicitacoes * 100) if total_solicitacoes > 0 else 0, 2),
+        'tempo_medio_aprovacao_horas': round((horas_aprovacao / confirmadas) if confirmadas else 0, 2),
+        'tempo_medio_ciclo_dias': round(float(tempo_medio_ciclo_completo), 2),
+        'solicitacoes_por_mes': [
+            {
+                'mes': NOMES_MESES[inicio.month],
+                'total': int(por_mes[i] or 0),
+                'aprovadas': int(por_mes[len(meses) + i] or 0)
+            } for i, (inicio, _) in enumerate(meses)
+        ]
+    }
+
+
+def calcular_metricas_logistica(hoje=None):
+    """
+    Métricas dos motoristas no mês numa consulta agrupada. Km e duração vêm de
+    metricas_rotas_os, calculadas quando a OS é finalizada (rotas_metricas).
+    """
+    hoje = hoje or datetime.now()
+    mes_atual = datetime(hoje.year, hoje.month, 1)
+    finalizada = OrdemServico.status == 'FINALIZADA'
+
+    linhas = db.session.query(
+        Motorista.nome,
+        func.count(OrdemServico.id),
+        func.sum(case((finalizada, 1), else_=0)),
+        func.sum(MetricasRotaOS.km_percorrido),
+        func.avg(case((finalizada, MetricasRotaOS.duracao_minutos), else_=None))
+    ).outerjoin(
+        OrdemServico, and_(OrdemServico.motorista_id == Motorista.id, OrdemServico.criado_em >= mes_atual)
+    ).outerjoin(
+        MetricasRotaOS, MetricasRotaOS.os_id == OrdemServico.id
+    ).filter(
+        Motorista.ativo == True
+    ).group_by(Motorista.id, Motorista.nome).order_by(Motorista.id).all()
+
+    metricas_motoristas = []
+    for nome, total_os, os_concluidas, km_total, duracao_media in linhas:
+        total_os = int(total_os or 0)
+        os_concluidas = int(os_concluidas or 0)
+        metricas_motoristas.append({
+            'nome': nome,
+            'total_os': total_os,
+            'os_concluidas': os_concluidas,
+            'km_total': round(float(km_total or 0), 3),
+            'tempo_medio_horas': round(float(duracao_media or 0) / 60, 2),
+            'taxa_conclusao': round((os_concluidas / total_os * 100) if total_os > 0 else 0, 2)
+        })
+
+    total_km_mes = sum(m['km_total'] for m in metricas_motoristas)
+    total_os_mes = sum(m['total_os'] for m in metricas_motoristas)
+    return {
+        'metricas_motoristas': metricas_motoristas,
+        'total_km_mes': float(total_km_mes),
+        'total_os_mes': total_os_mes,
+        'media_km_por_os': float((total_km_mes / total_os_mes) if total_os_mes > 0 else 0)
+    }
+
+
+def obter_estatisticas(papel):
+    return dashboard_cache.get_or_compute(('stats', papel), calcular_estatisticas)
+
+
+def obter_grafico_mensal(papel):
+    return dashboard_cache.get_or_compute(('grafico_mensal', papel), calcular_grafico_mensal)
+
+
+def obter_metricas_financeiras(papel):
+    return dashboard_cache.get_or_compute(('financeiro', papel), calcular_metricas_financeiras)
+
+
+def obter_analise_fornecedores(papel, ordenar_por='valor_total', ordem='desc', pagina=1, por_pagina=10):
+    return dashboard_cache.get_or_compute(
+        ('analise_fornecedores', papel, ordenar_por, ordem, pagina, por_pagina),
+        lambda: calcular_analise_fornecedores(ordenar_por=ordenar_por, ordem=ordem, pagina=pagina, por_pagina=por_pagina)
+    )
+
+
+def obter_metricas_logistica(papel):
+    return dashboard_cache.get_or_compute(('logistica', papel), calcular_metricas_logistica)
+
+
+def obter_metricas_operacionais(papel):
+    return dashboard_cache.get_or_compute(('operacional', papel), calcular_metricas_operacionais)
+
+
+def invalidar_dashboard():
+    dashboard_cache.invalidate()
+    dashboard_rollups.marcar_desatualizado()
+    estado_compartilhado.nova_versao('dashboard')
+
+
+def init_app(app):
+    @app.after_request
+    def invalidar_apos_escrita(response):
+        if (request.method in METODOS_ESCRITA
+                and request.blueprint in BLUEPRINTS_INVALIDAM
+                and response.status_code < 400):
+            invalidar_dashboard()
+        return response
@@ -0,0 +1,256 @@
+"""
+Estado compartilhado entre os workers do gunicorn.
+
+Com um worker só, dicionários no módulo bastam; com WEB_CONCURRENCY > 1 cada
+processo tem a sua cópia e o que um worker grava os outros não veem (alertas
+de metais, jobs do Gemini consultados por polling, invalidação de caches).
+Este módulo guarda esse estado no Redis quando ESTADO_REDIS_URL (ou REDIS_URL,
+ou um SOCKETIO_MESSAGE_QUEUE redis://) está configurado, e em memória do
+processo caso contrário:
+
+  - obter / definir / remover: valores JSON com TTL opcional
+  - definir_campo / remover_campo / ler_campos: hash de valores JSON
+  - anexar / ler_lista: lista com tamanho máximo
+  - incrementar: contador atômico (ids)
+  - versao / nova_versao: contador de versão para invalidar caches locais;
+    cada worker guarda a versão com que montou o cache e recarrega quando a
+    versão compartilhada muda
+
+Se o Redis ficar indisponível as operações caem para a memória do processo
+(cada worker com seu estado, como antes) e o erro é contado em
+get_estado_stats().
+"""
+import os
+import json
+import time
+import threading
+
+ESTADO_PREFIXO = os.getenv('ESTADO_PREFIXO', 'mrx:')
+ESTADO_REDIS_TIMEOUT = float(os.getenv('ESTADO_REDIS_TIMEOUT', 2.0))
+
+
+def _url_redis():
+    url = os.getenv('ESTADO_REDIS_URL') or os.getenv('REDIS_URL')
+    if not url:
+        fila = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+        if fila.startswith(('redis://', 'rediss://')):
+            url = fila
+    return url
+
+
+class EstadoMemoria:
+    nome = 'memoria'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._valores = {}
+        self._expira = {}
+        self._escritas = 0
+
+    def _limpar_expirados(self):
+        # chaves com TTL que nunca mais são lidas não ficam para sempre na memória
+        self._escritas += 1
+        if self._escritas % 1000:
+            return
+        agora = time.monotonic()
+        for chave in [c for c, expira in self._expira.items() if expira < agora]:
+            self._valores.pop(chave, None)
+            self._expira.pop(chave, None)
+
+    def _vivo(self, chave):
+        expira = self._expira.get(chave)
+        if expira is not None and expira < time.monotonic():
+            self._valores.pop(chave, None)
+            self._expira.pop(chave, None)
+        return chave in self._valores
+
+    def obter(self, chave):
+        with self._lock:
+            return self._valores.get(chave) if self._vivo(chave) else None
+
+    def definir(self, chave, valor, ttl=None):
+        with self._lock:
+            self._limpar_expirados()
+            self._valores[chave] = valor
+            if ttl:
+                self._expira[chave] = time.monotonic() + ttl
+            else:
+                self._expira.pop(chave, None)
+
+    def remover(self, chave):
+        with self._lock:
+            self._valores.pop(chave, None)
+            self._expira.pop(chave, None)
+
+    def incrementar(self, chave):
+        with self._lock:
+            valor = (self._valores.get(chave) if self._vivo(chave) else 0) + 1
+            self._valores[chave] = valor
+            return valor
+
+    def definir_campo(self, chave, campo, valor):
+        with self._lock:
+            if not self._vivo(chave):
+                self._valores[chave] = {}
+            self._valores[chave][str(campo)] = valor
+
+    def remover_campo(self, chave, campo):
+        with self._lock:
+            if self._vivo(chave):
+                return self._valores[chave].pop(str(campo), None) is not None
+            return False
+
+    def ler_campos(self, chave):
+        with self._lock:
+            return dict(self._valores[chave]) if self._vivo(chave) else {}
+
+    def anexar(self, chave, valor, maximo=None, ttl=None):
+        with self._lock:
+            if not self._vivo(chave):
+                self._valores[chave] = []
+            lista = self._valores[chave]
+            lista.append(valor)
+            if maximo and len(lista) > maximo:
+                del lista[:len(lista) - maximo]
+            if ttl:
+                self._expira[chave] = time.monotonic() + ttl
+
+    def ler_lista(self, chave):
+        with self._lock:
+            return list(self._valores[chave]) if self._vivo(chave) else []
+
+
+class EstadoRedis:
+    nome = 'redis'
+
+    def __init__(self, url):
+        import redis
+        self.url = url
+        self._redis = redis.Redis.from_url(url, socket_timeout=ESTADO_REDIS_TIMEOUT,
+                                           socket_connect_timeout=ESTADO_REDIS_TIMEOUT)
+
+    def obter(self, chave):
+        valor = self._redis.get(chave)
+        return json.loads(valor) if valor is not None else None
+
+    def definir(self, chave, valor, ttl=None):
+        self._redis.set(chave, json.dumps(valor), ex=int(ttl) if ttl else None)
+
+    def remover(self, chave):
+        self._redis.delete(chave)
+
+    def incrementar(self, chave):
+        return int(self._redis.incr(chave))
+
+    def definir_campo(self, chave, campo, valor):
+        self._redis.hset(chave, str(campo), json.dumps(valor))
+
+    def remover_campo(self, chave, campo):
+        return bool(self._redis.hdel(chave, str(campo)))
+
+    def ler_campos(self, chave):
+        return {c.decode(): json.loads(v) for c, v in self._redis.hgetall(chave).items()}
+
+    def anexar(self, chave, valor, maximo=None, ttl=None):
+        pipe = self._redis.pipeline()
+        pipe.rpush(chave, json.dumps(valor))
+        if maximo:
+            pipe.ltrim(chave, -maximo, -1)
+        if ttl:
+            pipe.expire(chave, int(ttl))
+        pipe.execute()
+
+    def ler_lista(self, chave):
+        return [json.loads(v) for v in self._redis.lrange(chave, 0, -1)]
+
+
+class EstadoCompartilhado:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend = None
+        self._memoria = EstadoMemoria()
+        self.erros = 0
+        self.ultimo_erro = None
+
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    url = _url_redis()
+                    self._backend = EstadoRedis(url) if url else self._memoria
+        return self._backend
+
+    def executar(self, operacao, chave, *args, **kwargs):
+        chave = ESTADO_PREFIXO + chave
+        backend = self.backend()
+        try:
+            return getattr(backend, operacao)(chave, *args, **kwargs)
+        except Exception as e:
+            if backend is self._memoria:
+                raise
+            self.erros += 1
+            self.ultimo_erro = str(e)
+            print(f"[ESTADO] Redis indisponível em {operacao} {chave}, usando memória local: {e}")
+            return getattr(self._memoria, operacao)(chave, *args, **kwargs)
+
+    def stats(self):
+        backend = self.backend()
+        return {
+            'backend': backend.nome,
+            'prefixo': ESTADO_PREFIXO,
+            'erros': self.erros,
+            'ultimo_erro': self.ultimo_erro
+        }
+
+
+estado = EstadoCompartilhado()
+
+
+def obter(chave):
+    return estado.executar('obter', chave)
+
+
+def definir(chave, valor, ttl=None):
+    estado.executar('definir', chave, valor, ttl)
+
+
+def remover(chave):
+    estado.executar('remover', chave)
+
+
+def incrementar(chave):
+    return estado.executar('incrementar', chave)
+
+
+def definir_campo(chave, campo, valor):
+    estado.executar('definir_campo', chave, campo, valor)
+
+
+def remover_campo(chave, campo):
+    return estado.executar('remover_campo', chave, campo)
+
+
+def ler_campos(chave):
+    return estado.executar('ler_campos', chave)
+
+
+def anexar(chave, valor, maximo=None, ttl=None):
+    estado.executar('anexar', chave, valor, maximo, ttl)
+
+
+def ler_lista(chave):
+    return estado.executar('ler_lista', chave)
+
+
+def versao(nome):
+    """Versão atual de um cache local; 0 se nunca foi invalidado."""
+    return obter(f'versao:{nome}') or 0
+
+
+def nova_versao(nome):
+    """Invalida o cache `nome` em todos os workers."""
+    return incrementar(f'versao:{nome}')
+
+
+def get_estado_stats():
+    return estado.stats()
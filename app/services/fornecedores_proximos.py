@@ -0,0 +1,203 @@
+"""
+Índice espacial dos fornecedores para busca por raio e vizinhos mais próximos.
+
+As coordenadas dos fornecedores ativos ficam num geo.IndiceEspacial (KD-tree
+em memória) junto com o id e o comprador responsável de cada um. Qualquer
+insert/update/delete de Fornecedor marca o índice como desatualizado e ele é
+reconstruído na próxima consulta (100k fornecedores em ~0,3 s). Depois do
+commit a versão 'fornecedores' em estado_compartilhado é incrementada, então os
+outros workers também reconstroem; alterações feitas fora da aplicação
+(scripts, SQL direto) aparecem depois de no máximo FORNECEDORES_INDICE_TTL
+segundos.
+
+As buscas devolvem listas de (fornecedor_id, distancia_metros) em ordem de
+distância; os filtros (comprador responsável, lista de ids permitidos) são
+aplicados sobre os candidatos da árvore, sem voltar ao banco.
+"""
+import os
+import time
+import threading
+
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from app.models import db, Fornecedor, OrdemServico, OrdemCompra
+from app.services import geo, estado_compartilhado
+
+FORNECEDORES_INDICE_TTL = int(os.getenv('FORNECEDORES_INDICE_TTL', 300))
+# listas de ids permitidos até este tamanho são comparadas direto, sem percorrer a árvore
+MAX_IDS_COMPARACAO_DIRETA = 5000
+
+STATUS_COLETA_PENDENTE = ('PENDENTE', 'AGENDADA')
+
+
+class IndiceFornecedores:
+    def __init__(self, ttl=FORNECEDORES_INDICE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._indice = None
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._compradores = np.zeros(0, dtype=np.int64)
+        self._lat = np.zeros(0)
+        self._lng = np.zeros(0)
+        self._construido_em = 0.0
+        self._desatualizado = True
+        self._versao = 0
+        self.reconstrucoes = 0
+        self.ultima_reconstrucao_ms = 0.0
+        self.consultas = 0
+
+    def marcar_desatualizado(self):
+        self._desatualizado = True
+
+    def _atualizado(self, versao):
+        return (not self._desatualizado and versao == self._versao
+                and time.monotonic() - self._construido_em < self.ttl)
+
+    def _garantir(self):
+        versao = estado_compartilhado.versao('fornecedores')
+        if self._atualizado(versao):
+            return
+        with self._lock:
+            if self._atualizado(versao):
+                return
+            inicio = time.perf_counter()
+            # marca antes de ler: uma alteração durante a leitura força nova reconstrução
+            self._desatualizado = False
+            self._versao = versao
+            linhas = db.session.query(
+                Fornecedor.id, Fornecedor.latitude, Fornecedor.longitude, Fornecedor.comprador_responsavel_id
+            ).filter(
+                Fornecedor.ativo == True,
+                Fornecedor.latitude.isnot(None),
+                Fornecedor.longitude.isnot(None)
+            ).all()
+            self._ids = np.fromiter((l[0] for l in linhas), dtype=np.int64, count=len(linhas))
+            self._compradores = np.fromiter((l[3] if l[3] is not None else -1 for l in linhas),
+                                            dtype=np.int64, count=len(linhas))
+            self._lat = np.fromiter((l[1] for l in linhas), dtype=np.float64, count=len(linhas))
+            self._lng = np.fromiter((l[2] for l in linhas), dtype=np.float64, count=len(linhas))
+            self._indice = geo.IndiceEspacial(self._lat, self._lng)
+            self._construido_em = time.monotonic()
+            self.reconstrucoes += 1
+            self.ultima_reconstrucao_ms = (time.perf_counter() - inicio) * 1000
+
+    def _filtrar(self, posicoes, comprador_id, ids_permitidos):
+        mascara = np.ones(posicoes.size, dtype=bool)
+        if comprador_id is not None:
+            mascara &= self._compradores[posicoes] == int(comprador_id)
+        if ids_permitidos is not None:
+            mascara &= np.isin(self._ids[posicoes], ids_permitidos)
+        return mascara
+
+    def no_raio(self, lat, lng, raio_metros, limite=None, comprador_id=None, ids_permitidos=None):
+        """Fornecedores a até raio_metros; devolve (lista [(id, metros)], total dentro do raio)."""
+        self._garantir()
+        self.consultas += 1
+        indice, ids = self._indice, self._ids
+        if ids_permitidos is not None:
+            ids_permitidos = np.fromiter(ids_permitidos, dtype=np.int64)
+        posicoes, distancias = indice.no_raio(lat, lng, raio_metros)
+        mascara = self._filtrar(posicoes, comprador_id, ids_permitidos)
+        posicoes, distancias = posicoes[mascara], distancias[mascara]
+        total = int(posicoes.size)
+        if limite:
+            posicoes, distancias = posicoes[:limite], distancias[:limite]
+        return [(int(ids[p]), float(d)) for p, d in zip(posicoes, distancias)], total
+
+    def mais_proximos(self, lat, lng, k, raio_metros=None, comprador_id=None, ids_permitidos=None):
+        """Os k fornecedores mais próximos que passam nos filtros, opcionalmente dentro de raio_metros."""
+        self._garantir()
+        self.consultas += 1
+        indice, ids = self._indice, self._ids
+        if ids_permitidos is not None:
+            ids_permitidos = np.fromiter(ids_permitidos, dtype=np.int64)
+            if ids_permitidos.size <= MAX_IDS_COMPARACAO_DIRETA:
+                return self._mais_proximos_entre(lat, lng, k, raio_metros, comprador_id, ids_permitidos)
+        filtrado = comprador_id is not None or ids_permitidos is not None
+        # com filtro, amplia a busca até achar k candidatos válidos ou esgotar o índice
+        busca = k if not filtrado else max(k * 4, 32)
+        while True:
+            posicoes, distancias = indice.k_proximos(lat, lng, min(busca, max(len(indice), 1)), raio_metros)
+            mascara = self._filtrar(posicoes, comprador_id, ids_permitidos)
+            if mascara.sum() >= k or posicoes.size < busca or busca >= len(indice):
+                break
+            busca *= 4
+        posicoes, distancias = posicoes[mascara][:k], distancias[mascara][:k]
+        return [(int(ids[p]), float(d)) for p, d in zip(posicoes, distancias)]
+
+    def _mais_proximos_entre(self, lat, lng, k, raio_metros, comprador_id, ids_permitidos):
+        """Poucos candidatos (ex.: só os fornecedores com coleta pendente): distância direta a cada um."""
+        posicoes = np.flatnonzero(np.isin(self._ids, ids_permitidos))
+        if comprador_id is not None:
+            posicoes = posicoes[self._compradores[posicoes] == int(comprador_id)]
+        distancias = geo.haversine_metros(self._lat[posicoes], self._lng[posicoes], lat, lng)
+        if raio_metros is not None:
+            dentro = distancias <= raio_metros
+            posicoes, distancias = posicoes[dentro], distancias[dentro]
+        ordem = np.argsort(distancias, kind='stable')[:k]
+        return [(int(self._ids[p]), float(d)) for p, d in zip(posicoes[ordem], distancias[ordem])]
+
+    def stats(self):
+        return {
+            'fornecedores': int(self._ids.size),
+            'desatualizado': self._desatualizado,
+            'versao': self._versao,
+            'idade_segundos': round(time.monotonic() - self._construido_em, 1) if self._construido_em else None,
+            'ttl_segundos': self.ttl,
+            'reconstrucoes': self.reconstrucoes,
+            'ultima_reconstrucao_ms': round(self.ultima_reconstrucao_ms, 1),
+            'consultas': self.consultas
+        }
+
+
+indice_fornecedores = IndiceFornecedores()
+
+
+def _marcar_desatualizado(mapper, connection, target):
+    indice_fornecedores.marcar_desatualizado()
+    sessao = object_session(target)
+    if sessao is not None:
+        sessao.info['fornecedores_alterados'] = True
+
+
+def _publicar_versao(session):
+    # só depois do commit: outro worker que reconstruísse antes leria os dados antigos
+    if session.info.pop('fornecedores_alterados', False):
+        estado_compartilhado.nova_versao('fornecedores')
+
+
+def _descartar_alteracao(session):
+    session.info.pop('fornecedores_alterados', None)
+
+
+for _evento in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Fornecedor, _evento, _marcar_desatualizado)
+event.listen(Session, 'after_commit', _publicar_versao)
+event.listen(Session, 'after_rollback', _descartar_alteracao)
+
+
+def coletas_pendentes():
+    """fornecedor_id -> ids das OS de coleta ainda não iniciadas (PENDENTE/AGENDADA)."""
+    linhas = db.session.query(OrdemCompra.fornecedor_id, OrdemServico.id).join(
+        OrdemCompra, OrdemCompra.id == OrdemServico.oc_id
+    ).filter(
+        OrdemServico.status.in_(STATUS_COLETA_PENDENTE)
+    ).all()
+    pendentes = {}
+    for fornecedor_id, os_id in linhas:
+        pendentes.setdefault(fornecedor_id, []).append(os_id)
+    return pendentes
+
+
+def buscar_no_raio(lat, lng, raio_metros, limite=None, comprador_id=None, ids_permitidos=None):
+    return indice_fornecedores.no_raio(lat, lng, raio_metros, limite, comprador_id, ids_permitidos)
+
+
+def buscar_mais_proximos(lat, lng, k, raio_metros=None, comprador_id=None, ids_permitidos=None):
+    return indice_fornecedores.mais_proximos(lat, lng, k, raio_metros, comprador_id, ids_permitidos)
+
+
+def get_indice_stats():
+    return indice_fornecedores.stats()
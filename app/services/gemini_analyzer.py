@@ -4,31 +4,87 @@ Reutilizável para placas eletrônicas e itens de solicitação
 """
 
 import os
+import threading
 from typing import List, Dict, Literal
 from google import genai
 from google.genai import types
 import re
 
+DEFAULT_MODEL = "gemini-2.0-flash-exp"
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL')
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gemini_client():
+    """Cliente Gemini compartilhado (o genai.Client mantém o pool de conexões HTTP)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                api_key = os.environ.get("GEMINI_API_KEY")
+                if not api_key:
+                    raise RuntimeError('Chave da API do Gemini não configurada. Configure GEMINI_API_KEY.')
+                http_options = types.HttpOptions(base_url=GEMINI_BASE_URL) if GEMINI_BASE_URL else None
+                _client = genai.Client(api_key=api_key, http_options=http_options)
+    return _client
+
+
+def generate_classification(imagem_bytes: bytes, use_case: str = 'placa', model: str = None) -> str:
+    """
+    Faz uma única chamada ao Gemini e devolve o texto da resposta.
+    Erros da API (incluindo 429) são propagados para a fila tratar.
+    """
+    response = get_gemini_client().models.generate_content(
+        model=model or DEFAULT_MODEL,
+        contents=[
+            types.Part.from_bytes(
+                data=imagem_bytes,
+                mime_type="image/jpeg",
+            ),
+            _get_prompt(use_case)
+        ],
+    )
+    return (response.text or '').strip()
+
+
+def parse_classification(texto: str) -> Dict[str, str]:
+    if not texto:
+        return {
+            'classificacao': 'medio',
+            'justificativa': 'Gemini não retornou resposta para esta imagem',
+            'raw_text': '',
+            'erro': 'Resposta vazia'
+        }
+    print(f"[GEMINI] Resposta completa: {texto}")
+    return _parse_gemini_response(texto)
+
 
 def analyze_images(
     images: List[bytes],
     use_case: Literal['placa', 'solicitacao'] = 'placa',
-    model: str = "gemini-2.0-flash-exp"
+    model: str = DEFAULT_MODEL,
+    usuario_id: int = None
 ) -> List[Dict[str, str]]:
     """
     Analisa múltiplas imagens usando Gemini AI
     
+    As imagens são enviadas juntas para a fila de classificação
+    (gemini_queue), que as processa em paralelo respeitando o limite de taxa.
+    
     Args:
         images: Lista de imagens em bytes
         use_case: Tipo de análise ('placa' ou 'solicitacao')
         model: Modelo do Gemini a usar
+        usuario_id: Usuário notificado via Socket.IO ao fim de cada job
     
     Returns:
         Lista de dicionários com classificacao, justificativa e raw_text
     """
+    from app.services.gemini_queue import submit_job, wait_job
     
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
+    if not os.environ.get("GEMINI_API_KEY"):
         return [{
             'classificacao': 'medio',
             'justificativa': 'Chave da API do Gemini não configurada. Configure GEMINI_API_KEY.',
@@ -36,55 +92,20 @@ def analyze_images(
             'erro': 'API key não configurada'
         }] * len(images)
     
-    try:
-        client = genai.Client(api_key=api_key)
-    except Exception as e:
-        return [{
-            'classificacao': 'medio',
-            'justificativa': f'Erro ao conectar com Gemini: {str(e)}',
-            'raw_text': '',
-            'erro': str(e)
-        }] * len(images)
+    jobs = [submit_job(imagem_bytes, use_case, parse_classification, usuario_id, model)
+            for imagem_bytes in images]
     
-    prompt = _get_prompt(use_case)
     resultados = []
-    
-    for imagem_bytes in images:
-        try:
-            response = client.models.generate_content(
-                model=model,
-                contents=[
-                    types.Part.from_bytes(
-                        data=imagem_bytes,
-                        mime_type="image/jpeg",
-                    ),
-                    prompt
-                ],
-            )
-            
-            if not response.text:
-                resultados.append({
-                    'classificacao': 'medio',
-                    'justificativa': 'Gemini não retornou resposta para esta imagem',
-                    'raw_text': '',
-                    'erro': 'Resposta vazia'
-                })
-                continue
-            
-            resultado_texto = response.text.strip()
-            print(f"[GEMINI] Resposta completa: {resultado_texto}")
-            
-            # Parsear a resposta
-            parsed = _parse_gemini_response(resultado_texto)
-            resultados.append(parsed)
-        
-        except Exception as e:
-            resultados.append({
+    for job in jobs:
+        resultado = wait_job(job)
+        if job.status == 'erro' and 'classificacao' not in resultado:
+            resultado = {
                 'classificacao': 'medio',
-                'justificativa': f'Erro ao analisar imagem: {str(e)}',
+                'justificativa': f"Erro ao analisar imagem: {resultado.get('erro')}",
                 'raw_text': '',
-                'erro': str(e)
-            })
+                'erro': resultado.get('erro')
+            }
+        resultados.append(resultado)
     
     return resultados
 
@@ -0,0 +1,288 @@
+"""
+Fila de classificação de imagens com Gemini AI.
+
+As chamadas ao Gemini levam segundos e antes eram feitas uma a uma, dentro da
+requisição, criando um genai.Client novo a cada chamada. Aqui um conjunto fixo
+de workers (GEMINI_QUEUE_CONCURRENCY) consome uma fila de jobs usando um único
+cliente compartilhado:
+
+  - token bucket limita a taxa de chamadas (GEMINI_RATE_PER_MINUTE)
+  - respostas 429/503 são repetidas com backoff exponencial e jitter, e
+    esvaziam o bucket para que os outros workers também recuem
+  - cada job tem um id; o resultado pode ser consultado por polling ou
+    recebido pelo evento Socket.IO 'gemini_job_concluido' na sala do usuário
+
+Sob eventlet as threads dos workers são green threads e a espera pela rede
+e pelo backoff é cooperativa.
+
+Com vários workers do gunicorn (WEB_CONCURRENCY) cada processo tem sua fila:
+GEMINI_RATE_PER_MINUTE é dividido entre eles, e o status de cada job é
+espelhado em estado_compartilhado para que o polling funcione mesmo quando
+cai em outro worker.
+"""
+import os
+import time
+import uuid
+import queue
+import random
+import threading
+from datetime import datetime
+
+GEMINI_QUEUE_CONCURRENCY = int(os.getenv('GEMINI_QUEUE_CONCURRENCY', 4))
+GEMINI_QUEUE_MAX_SIZE = int(os.getenv('GEMINI_QUEUE_MAX_SIZE', 200))
+GEMINI_RATE_PER_MINUTE = float(os.getenv('GEMINI_RATE_PER_MINUTE', 60))
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', 5))
+GEMINI_BACKOFF_BASE = float(os.getenv('GEMINI_BACKOFF_BASE', 1.0))
+GEMINI_BACKOFF_MAX = float(os.getenv('GEMINI_BACKOFF_MAX', 30.0))
+GEMINI_JOB_TIMEOUT = float(os.getenv('GEMINI_JOB_TIMEOUT', 120))
+GEMINI_JOB_TTL = int(os.getenv('GEMINI_JOB_TTL', 3600))
+WEB_CONCURRENCY = max(1, int(os.getenv('WEB_CONCURRENCY', 1)))
+
+RETRYABLE_STATUS = {429, 500, 503}
+
+
+class GeminiQueueFull(Exception):
+    """Fila de classificação cheia; retry_after indica em quantos segundos tentar novamente."""
+
+    def __init__(self, retry_after):
+        super().__init__('Fila de classificação do Gemini cheia')
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, min(rate_per_minute / 6.0, 10.0))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self, seconds):
+        """Zera o bucket e adia o próximo token em `seconds` (usado após um 429)."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class GeminiJob:
+    def __init__(self, imagem_bytes, use_case, parser, usuario_id=None, model=None):
+        self.id = uuid.uuid4().hex
+        self.imagem_bytes = imagem_bytes
+        self.use_case = use_case
+        self.parser = parser
+        self.usuario_id = usuario_id
+        self.model = model
+        self.status = 'pendente'
+        self.resultado = None
+        self.tentativas = 0
+        self.criado_em = datetime.now()
+        self.concluido_em = None
+        self.event = threading.Event()
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'use_case': self.use_case,
+            'tentativas': self.tentativas,
+            'resultado': self.resultado,
+            'criado_em': self.criado_em.isoformat(),
+            'concluido_em': self.concluido_em.isoformat() if self.concluido_em else None
+        }
+
+
+class GeminiJobCompartilhado:
+    """Job submetido em outro worker, lido do estado compartilhado."""
+
+    def __init__(self, dados):
+        self.usuario_id = dados['usuario_id']
+        self._dados = dados['job']
+        self.id = self._dados['job_id']
+        self.status = self._dados['status']
+
+    def to_dict(self):
+        return self._dados
+
+
+def _chave_job(job_id):
+    return f'gemini:job:{job_id}'
+
+
+def _compartilhar(job):
+    if WEB_CONCURRENCY == 1:
+        return
+    try:
+        from app.services import estado_compartilhado
+        estado_compartilhado.definir(_chave_job(job.id), {'usuario_id': job.usuario_id, 'job': job.to_dict()},
+                                     ttl=GEMINI_JOB_TTL)
+    except Exception as e:
+        print(f"[GEMINI] Erro ao compartilhar status do job {job.id}: {e}")
+
+
+class GeminiQueue:
+    def __init__(self, concurrency=GEMINI_QUEUE_CONCURRENCY, max_size=GEMINI_QUEUE_MAX_SIZE,
+                 rate_per_minute=GEMINI_RATE_PER_MINUTE / WEB_CONCURRENCY):
+        self.concurrency = concurrency
+        self.max_size = max_size
+        self.bucket = TokenBucket(rate_per_minute)
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._workers = []
+        self._avg_duration = 3.0
+        self.concluidos = 0
+        self.erros = 0
+        self.retries = 0
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.concurrency):
+                worker = threading.Thread(target=self._worker, name=f'gemini-worker-{i}', daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _prune(self):
+        limite = time.time() - GEMINI_JOB_TTL
+        for job_id in [j.id for j in self._jobs.values()
+                       if j.concluido_em and j.concluido_em.timestamp() < limite]:
+            del self._jobs[job_id]
+
+    def submit(self, imagem_bytes, use_case, parser, usuario_id=None, model=None):
+        self._ensure_workers()
+        with self._lock:
+            self._prune()
+            if self._queue.qsize() >= self.max_size:
+                waves = self._queue.qsize() / float(self.concurrency)
+                raise GeminiQueueFull(max(1, int(waves * self._avg_duration)))
+            job = GeminiJob(imagem_bytes, use_case, parser, usuario_id, model)
+            self._jobs[job.id] = job
+        _compartilhar(job)
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and WEB_CONCURRENCY > 1:
+            from app.services import estado_compartilhado
+            dados = estado_compartilhado.obter(_chave_job(job_id))
+            if dados:
+                return GeminiJobCompartilhado(dados)
+        return job
+
+    def wait(self, job, timeout=GEMINI_JOB_TIMEOUT):
+        if not job.event.wait(timeout):
+            return {
+                'classificacao': 'medio',
+                'justificativa': 'Tempo limite da classificação excedido',
+                'raw_text': '',
+                'erro': 'timeout'
+            }
+        return job.resultado
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            inicio = time.monotonic()
+            job.status = 'processando'
+            _compartilhar(job)
+            try:
+                texto = self._generate_with_retry(job)
+                job.resultado = job.parser(texto)
+                job.status = 'erro' if 'erro' in job.resultado else 'concluido'
+            except Exception as e:
+                job.resultado = {'erro': str(e)}
+                job.status = 'erro'
+            finally:
+                job.imagem_bytes = None
+                job.concluido_em = datetime.now()
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.monotonic() - inicio)
+                if job.status == 'erro':
+                    self.erros += 1
+                else:
+                    self.concluidos += 1
+                job.event.set()
+                self._queue.task_done()
+            _compartilhar(job)
+            _notify(job)
+
+    def _generate_with_retry(self, job):
+        from google.genai import errors
+        from app.services.gemini_analyzer import generate_classification
+
+        while True:
+            self.bucket.acquire()
+            job.tentativas += 1
+            try:
+                return generate_classification(job.imagem_bytes, job.use_case, job.model)
+            except errors.APIError as e:
+                if e.code not in RETRYABLE_STATUS or job.tentativas > GEMINI_MAX_RETRIES:
+                    raise
+                delay = min(GEMINI_BACKOFF_MAX, GEMINI_BACKOFF_BASE * 2 ** (job.tentativas - 1))
+                delay += random.uniform(0, delay / 2)
+                self.retries += 1
+                if e.code == 429:
+                    self.bucket.drain(delay)
+                print(f"[GEMINI] {e.code} no job {job.id}, nova tentativa em {delay:.1f}s")
+                time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            pendentes = sum(1 for j in self._jobs.values() if j.status in ('pendente', 'processando'))
+        return {
+            'workers': self.concurrency,
+            'rate_per_minute': GEMINI_RATE_PER_MINUTE,
+            'rate_per_minute_processo': round(self.bucket.rate * 60, 2),
+            'fila': self._queue.qsize(),
+            'pendentes': pendentes,
+            'concluidos': self.concluidos,
+            'erros': self.erros,
+            'retries': self.retries,
+            'avg_duration_s': round(self._avg_duration, 3)
+        }
+
+
+def _notify(job):
+    if job.usuario_id is None:
+        return
+    try:
+        from app import socketio
+        socketio.emit('gemini_job_concluido', job.to_dict(), room=f'user_{job.usuario_id}')
+    except Exception as e:
+        print(f"[GEMINI] Erro ao notificar job {job.id}: {e}")
+
+
+gemini_queue = GeminiQueue()
+
+
+def submit_job(imagem_bytes, use_case, parser, usuario_id=None, model=None):
+    return gemini_queue.submit(imagem_bytes, use_case, parser, usuario_id, model)
+
+
+def get_job(job_id):
+    return gemini_queue.get(job_id)
+
+
+def wait_job(job, timeout=GEMINI_JOB_TIMEOUT):
+    return gemini_queue.wait(job, timeout)
+
+
+def get_queue_stats():
+    return gemini_queue.stats()
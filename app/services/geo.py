@@ -0,0 +1,314 @@
+"""
+Cálculos geodésicos vetorizados (NumPy) sobre trilhas de GPS.
+
+Todas as funções recebem arrays (ou listas) de latitude/longitude em graus e,
+quando necessário, timestamps em segundos (epoch ou relativos), e operam sobre
+a trilha inteira de uma vez, sem laço Python por ponto:
+
+  - haversine_metros / distancias_segmentos / distancia_total_metros /
+    matriz_distancias
+  - filtrar_ruido: descarta pontos imprecisos e saltos impossíveis
+  - detectar_paradas: sequências de pontos parados acima de um tempo mínimo
+  - tempo_no_raio: tempo passado dentro de um raio (ex.: no fornecedor)
+  - simplificar_indices: Douglas-Peucker processando todos os segmentos
+    abertos em cada passada
+  - IndiceEspacial: KD-tree para vizinho mais próximo e busca por raio
+"""
+import numpy as np
+
+RAIO_TERRA_METROS = 6371008.8
+
+PRECISAO_MAXIMA_METROS = 50.0
+VELOCIDADE_MAXIMA_MS = 55.0
+VELOCIDADE_PARADA_MS = 0.8
+RAIO_PARADA_METROS = 50.0
+PARADA_MINIMA_SEGUNDOS = 120.0
+JANELA_PARADA_SEGUNDOS = 60.0
+
+
+def _arrays(*valores):
+    return [np.asarray(v, dtype=np.float64) for v in valores]
+
+
+def haversine_metros(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(v) for v in _arrays(lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * RAIO_TERRA_METROS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distancias_segmentos(lat, lng):
+    """Distância, em metros, entre cada ponto e o seguinte (n - 1 valores)."""
+    lat, lng = _arrays(lat, lng)
+    if lat.size < 2:
+        return np.zeros(0)
+    return haversine_metros(lat[:-1], lng[:-1], lat[1:], lng[1:])
+
+
+def distancia_total_metros(lat, lng):
+    return float(distancias_segmentos(lat, lng).sum())
+
+
+def matriz_distancias(lat, lng):
+    """Matriz n x n das distâncias, em metros, entre todos os pares de pontos."""
+    lat, lng = _arrays(lat, lng)
+    return haversine_metros(lat[:, None], lng[:, None], lat[None, :], lng[None, :])
+
+
+def filtrar_ruido(lat, lng, ts, precisao=None, precisao_maxima=PRECISAO_MAXIMA_METROS,
+                  velocidade_maxima=VELOCIDADE_MAXIMA_MS):
+    """
+    Máscara dos pontos aproveitáveis: precisão informada até precisao_maxima e
+    sem salto acima de velocidade_maxima em relação ao último ponto aceito.
+    O filtro de velocidade é repetido até estabilizar (normalmente 1-2 passadas),
+    já que remover um salto muda o vizinho do ponto seguinte.
+    """
+    lat, lng, ts = _arrays(lat, lng, ts)
+    mascara = np.ones(lat.size, dtype=bool)
+    if precisao is not None:
+        precisao = np.asarray([np.nan if p is None else p for p in precisao], dtype=np.float64)
+        mascara &= ~(precisao > precisao_maxima)
+
+    while True:
+        indices = np.flatnonzero(mascara)
+        if indices.size < 2:
+            return mascara
+        d = haversine_metros(lat[indices[:-1]], lng[indices[:-1]], lat[indices[1:]], lng[indices[1:]])
+        dt = np.maximum(np.diff(ts[indices]), 1.0)
+        saltos = indices[1:][d / dt > velocidade_maxima]
+        if saltos.size == 0:
+            return mascara
+        mascara[saltos] = False
+
+
+def _sequencias(booleano):
+    """Pares (inicio, fim) inclusivos das sequências de True."""
+    if booleano.size == 0:
+        return np.zeros((0, 2), dtype=np.int64)
+    borda = np.diff(np.concatenate(([0], booleano.astype(np.int8), [0])))
+    return np.column_stack((np.flatnonzero(borda == 1), np.flatnonzero(borda == -1) - 1))
+
+
+def detectar_paradas(lat, lng, ts, velocidade_parada=VELOCIDADE_PARADA_MS, raio_metros=RAIO_PARADA_METROS,
+                     minimo_segundos=PARADA_MINIMA_SEGUNDOS, janela_segundos=JANELA_PARADA_SEGUNDOS):
+    """
+    Paradas da trilha. Um ponto está parado quando o deslocamento até o ponto
+    janela_segundos depois fica abaixo de velocidade_parada (a janela absorve
+    o ruído do GPS parado); sequências de pontos parados que duram ao menos
+    minimo_segundos e ficam a até raio_metros do centro são paradas.
+    Devolve [{'inicio', 'fim', 'latitude', 'longitude', 'duracao_segundos'}]
+    com inicio/fim no mesmo formato de `ts`.
+    """
+    lat, lng, ts = _arrays(lat, lng, ts)
+    if lat.size < 2:
+        return []
+
+    fim_janela = np.minimum(np.searchsorted(ts, ts + janela_segundos), lat.size - 1)
+    intervalo = ts[fim_janela] - ts
+    deslocamento = haversine_metros(lat, lng, lat[fim_janela], lng[fim_janela])
+    parado = (intervalo > 0) & (deslocamento < velocidade_parada * np.maximum(intervalo, 1e-9))
+
+    paradas = []
+    for inicio, ultimo in _sequencias(parado):
+        fim = fim_janela[ultimo]
+        duracao = ts[fim] - ts[inicio]
+        if duracao < minimo_segundos:
+            continue
+        centro_lat = lat[inicio:fim + 1].mean()
+        centro_lng = lng[inicio:fim + 1].mean()
+        if haversine_metros(lat[inicio:fim + 1], lng[inicio:fim + 1], centro_lat, centro_lng).max() > raio_metros:
+            continue
+        paradas.append({
+            'inicio': float(ts[inicio]),
+            'fim': float(ts[fim]),
+            'latitude': float(centro_lat),
+            'longitude': float(centro_lng),
+            'duracao_segundos': float(duracao)
+        })
+    return paradas
+
+
+def tempo_no_raio(lat, lng, ts, centro_lat, centro_lng, raio_metros):
+    """Segundos entre pontos consecutivos que estão ambos a até raio_metros do centro."""
+    lat, lng, ts = _arrays(lat, lng, ts)
+    if lat.size < 2:
+        return 0.0
+    dentro = haversine_metros(lat, lng, centro_lat, centro_lng) <= raio_metros
+    return float(np.diff(ts)[dentro[:-1] & dentro[1:]].sum())
+
+
+def simplificar_indices(lat, lng, tolerancia_metros):
+    """
+    Índices mantidos pelo Douglas-Peucker com tolerância em metros, numa
+    projeção equiretangular local. Primeiro e último ponto sempre mantidos.
+
+    Em vez de recursão por segmento, cada passada processa todos os segmentos
+    abertos de uma vez: calcula a distância de todos os pontos candidatos ao
+    seu segmento, acha o mais distante de cada um e divide os que passam da
+    tolerância. O número de passadas é a profundidade da recursão.
+    """
+    lat, lng = _arrays(lat, lng)
+    n = lat.size
+    if n <= 2:
+        return np.arange(n)
+
+    escala = np.radians(1.0) * RAIO_TERRA_METROS
+    x = lng * escala * np.cos(np.radians(lat.mean()))
+    y = lat * escala
+    tolerancia2 = tolerancia_metros * tolerancia_metros
+
+    manter = np.zeros(n, dtype=bool)
+    manter[0] = manter[-1] = True
+    candidatos = np.arange(1, n - 1)
+    while candidatos.size:
+        mantidos = np.flatnonzero(manter)
+        segmento = np.searchsorted(mantidos, candidatos) - 1
+        a, b = mantidos[segmento], mantidos[segmento + 1]
+
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        px, py = x[candidatos] - x[a], y[candidatos] - y[a]
+        comprimento2 = dx * dx + dy * dy
+        t = np.clip(np.divide(px * dx + py * dy, comprimento2, out=np.zeros_like(px), where=comprimento2 > 0),
+                    0.0, 1.0)
+        d2 = (px - t * dx) ** 2 + (py - t * dy) ** 2
+
+        # candidatos estão ordenados, então cada segmento é um trecho contíguo
+        inicios = np.flatnonzero(np.concatenate(([True], segmento[1:] != segmento[:-1])))
+        maior = np.maximum.reduceat(d2, inicios)
+        grupo = np.repeat(np.arange(inicios.size), np.diff(np.append(inicios, d2.size)))
+        dividir = maior > tolerancia2
+
+        no_maximo = np.flatnonzero((d2 == maior[grupo]) & dividir[grupo])
+        _, primeiros = np.unique(grupo[no_maximo], return_index=True)
+        manter[candidatos[no_maximo[primeiros]]] = True
+
+        continuam = dividir[grupo] & ~manter[candidatos]
+        candidatos = candidatos[continuam]
+
+    return np.flatnonzero(manter)
+
+
+def _vetores_unitarios(lat, lng):
+    lat, lng = np.radians(lat), np.radians(lng)
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)))
+
+
+def _corda_para_metros(corda):
+    return 2 * RAIO_TERRA_METROS * np.arcsin(np.clip(corda / 2, 0.0, 1.0))
+
+
+def _metros_para_corda(metros):
+    return 2 * np.sin(min(metros / (2 * RAIO_TERRA_METROS), np.pi / 2))
+
+
+class IndiceEspacial:
+    """
+    KD-tree de pontos geográficos para vizinho mais próximo e busca por raio.
+
+    Os pontos são convertidos em vetores unitários 3D, então a distância
+    euclidiana (corda) cresce junto com a distância sobre a esfera e não há
+    problema com o antimeridiano nem com a distorção da longitude perto dos
+    polos. A árvore divide pela mediana do eixo de maior amplitude até folhas
+    de `tamanho_folha` pontos, que são comparados de uma vez com NumPy.
+
+    As consultas devolvem (indices, distancias_metros) em ordem crescente de
+    distância, com os índices na ordem dos arrays recebidos.
+    """
+
+    TAMANHO_FOLHA = 32
+
+    def __init__(self, lat, lng, tamanho_folha=TAMANHO_FOLHA):
+        lat, lng = _arrays(lat, lng)
+        pontos = _vetores_unitarios(lat, lng)
+        ordem = np.arange(lat.size)
+
+        # nó i: eixo (-1 nas folhas), corte, filho à esquerda/direita, trecho [inicio, fim) de `ordem`
+        self._eixo, self._corte, self._esquerda, self._direita = [], [], [], []
+        self._inicio, self._fim = [], []
+
+        def novo_no(inicio, fim):
+            for lista, valor in ((self._eixo, -1), (self._corte, 0.0), (self._esquerda, -1),
+                                 (self._direita, -1), (self._inicio, inicio), (self._fim, fim)):
+                lista.append(valor)
+            return len(self._eixo) - 1
+
+        pilha = [novo_no(0, lat.size)] if lat.size else []
+        while pilha:
+            no = pilha.pop()
+            inicio, fim = self._inicio[no], self._fim[no]
+            if fim - inicio <= tamanho_folha:
+                continue
+            trecho = pontos[ordem[inicio:fim]]
+            eixo = int(np.argmax(trecho.max(axis=0) - trecho.min(axis=0)))
+            meio = (fim - inicio) // 2
+            ordem[inicio:fim] = ordem[inicio:fim][np.argpartition(trecho[:, eixo], meio)]
+            self._eixo[no] = eixo
+            self._corte[no] = float(pontos[ordem[inicio + meio], eixo])
+            self._esquerda[no] = novo_no(inicio, inicio + meio)
+            self._direita[no] = novo_no(inicio + meio, fim)
+            pilha.extend((self._esquerda[no], self._direita[no]))
+
+        self._ordem = ordem
+        self._pontos = pontos[ordem]
+
+    def __len__(self):
+        return self._ordem.size
+
+    def _folhas(self, q, limite):
+        """Percorre as folhas cuja região pode ter pontos a até sqrt(limite()) de q, da mais próxima à mais distante."""
+        pilha = [(0, 0.0)] if len(self) else []
+        while pilha:
+            no, minimo = pilha.pop()
+            if minimo > limite():
+                continue
+            eixo = self._eixo[no]
+            if eixo < 0:
+                yield self._inicio[no], self._fim[no]
+                continue
+            diferenca = q[eixo] - self._corte[no]
+            perto, longe = (self._esquerda[no], self._direita[no]) if diferenca <= 0 else \
+                (self._direita[no], self._esquerda[no])
+            pilha.append((longe, max(minimo, diferenca * diferenca)))
+            pilha.append((perto, minimo))
+
+    def k_proximos(self, lat, lng, k=1, raio_metros=None):
+        """Os k pontos mais próximos, opcionalmente limitados a raio_metros."""
+        q = _vetores_unitarios(np.float64(lat), np.float64(lng))[0]
+        maximo = np.inf if raio_metros is None else _metros_para_corda(raio_metros) ** 2
+        melhores_d2 = np.zeros(0)
+        melhores = np.zeros(0, dtype=np.int64)
+
+        def limite():
+            return melhores_d2.max() if melhores_d2.size >= k else maximo
+
+        for inicio, fim in self._folhas(q, limite):
+            d2 = ((self._pontos[inicio:fim] - q) ** 2).sum(axis=1)
+            dentro = d2 <= limite()
+            if not dentro.any():
+                continue
+            melhores_d2 = np.concatenate((melhores_d2, d2[dentro]))
+            melhores = np.concatenate((melhores, np.arange(inicio, fim)[dentro]))
+            if melhores_d2.size > k:
+                manter = np.argpartition(melhores_d2, k - 1)[:k]
+                melhores_d2, melhores = melhores_d2[manter], melhores[manter]
+
+        ordem = np.argsort(melhores_d2, kind='stable')
+        return self._ordem[melhores[ordem]], _corda_para_metros(np.sqrt(melhores_d2[ordem]))
+
+    def no_raio(self, lat, lng, raio_metros):
+        """Todos os pontos a até raio_metros, do mais próximo ao mais distante."""
+        q = _vetores_unitarios(np.float64(lat), np.float64(lng))[0]
+        maximo = _metros_para_corda(raio_metros) ** 2
+        encontrados_d2, encontrados = [], []
+        for inicio, fim in self._folhas(q, lambda: maximo):
+            d2 = ((self._pontos[inicio:fim] - q) ** 2).sum(axis=1)
+            dentro = d2 <= maximo
+            if dentro.any():
+                encontrados_d2.append(d2[dentro])
+                encontrados.append(np.arange(inicio, fim)[dentro])
+        if not encontrados:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        d2 = np.concatenate(encontrados_d2)
+        indices = np.concatenate(encontrados)
+        ordem = np.argsort(d2, kind='stable')
+        return self._ordem[indices[ordem]], _corda_para_metros(np.sqrt(d2[ordem]))
@@ -0,0 +1,362 @@
+"""
+Cache do geocoding reverso e geocodificador offline.
+
+O Nominatim é lento (centenas de ms, com backoff em caso de 429) e as mesmas
+coordenadas de fornecedores são resolvidas repetidamente. As coordenadas são
+arredondadas em GEOCODE_PRECISAO casas decimais (4 casas ~ 11 m) e o
+resultado fica em duas camadas:
+
+  - memória: LRU de até GEOCODE_CACHE_SIZE chaves, com a mesma validade do banco
+  - banco (geocode_cache): persistente entre reinícios, validade de
+    GEOCODE_TTL_DIAS (GEOCODE_TTL_NAO_ENCONTRADO_HORAS para coordenadas sem
+    endereço) e limitado a GEOCODE_CACHE_MAX_REGISTROS linhas, removendo as
+    de acesso mais antigo
+
+Com GEOCODE_GAZETTEER apontando para um arquivo de cidades (CSV com colunas
+cidade/estado/pais/latitude/longitude, ou o cities*.txt do GeoNames) as
+cidades são carregadas num geo.IndiceEspacial e a cidade mais próxima
+(até GEOCODE_OFFLINE_RAIO_KM) é usada quando o Nominatim falha ou, com
+GEOCODE_BACKEND=offline, sempre. Resultados offline não vão para o cache.
+
+get_geocode_stats() expõe taxa de acerto por camada e a latência das
+chamadas externas (Nominatim e ViaCEP).
+"""
+import os
+import csv
+import time
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+from flask import has_app_context
+
+GEOCODE_PRECISAO = int(os.getenv('GEOCODE_PRECISAO', 4))
+GEOCODE_TTL_DIAS = float(os.getenv('GEOCODE_TTL_DIAS', 30))
+GEOCODE_TTL_NAO_ENCONTRADO_HORAS = float(os.getenv('GEOCODE_TTL_NAO_ENCONTRADO_HORAS', 24))
+GEOCODE_CACHE_SIZE = int(os.getenv('GEOCODE_CACHE_SIZE', 10000))
+GEOCODE_CACHE_MAX_REGISTROS = int(os.getenv('GEOCODE_CACHE_MAX_REGISTROS', 200000))
+GEOCODE_LIMPEZA_A_CADA = int(os.getenv('GEOCODE_LIMPEZA_A_CADA', 500))
+GEOCODE_BACKEND = os.getenv('GEOCODE_BACKEND', 'online').lower()
+GEOCODE_GAZETTEER = os.getenv('GEOCODE_GAZETTEER', '')
+GEOCODE_OFFLINE_RAIO_KM = float(os.getenv('GEOCODE_OFFLINE_RAIO_KM', 50))
+
+AMOSTRAS_LATENCIA = 500
+
+
+def chave_coordenadas(lat, lng, precisao=None):
+    precisao = GEOCODE_PRECISAO if precisao is None else precisao
+    return f'{round(float(lat), precisao):.{precisao}f},{round(float(lng), precisao):.{precisao}f}'
+
+
+class GeocodeLRU:
+    """LRU em memória chave -> (expira_em, resultado), com os contadores do cache."""
+
+    def __init__(self, max_size=GEOCODE_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self.hits_memoria = 0
+        self.hits_banco = 0
+        self.misses = 0
+        self.offline = 0
+        self.gravacoes = 0
+        self._upstream = {}
+
+    def obter(self, chave):
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            if entrada[0] <= datetime.utcnow():
+                del self._entradas[chave]
+                return None
+            self._entradas.move_to_end(chave)
+            return entrada[1]
+
+    def guardar(self, chave, resultado, expira_em):
+        with self._lock:
+            self._entradas[chave] = (expira_em, resultado)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_size:
+                self._entradas.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def registrar(self, tipo):
+        with self._lock:
+            if tipo == 'memoria':
+                self.hits_memoria += 1
+            elif tipo == 'banco':
+                self.hits_banco += 1
+            elif tipo == 'offline':
+                self.offline += 1
+            else:
+                self.misses += 1
+
+    def registrar_upstream(self, servico, ms, sucesso):
+        with self._lock:
+            dados = self._upstream.setdefault(servico, {
+                'chamadas': 0, 'erros': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                'amostras': deque(maxlen=AMOSTRAS_LATENCIA)
+            })
+            dados['chamadas'] += 1
+            dados['erros'] += 0 if sucesso else 1
+            dados['total_ms'] += ms
+            dados['max_ms'] = max(dados['max_ms'], ms)
+            dados['amostras'].append(ms)
+
+    def stats(self):
+        with self._lock:
+            hits = self.hits_memoria + self.hits_banco
+            total = hits + self.misses
+            upstream = {}
+            for servico, dados in self._upstream.items():
+                amostras = sorted(dados['amostras'])
+                upstream[servico] = {
+                    'chamadas': dados['chamadas'],
+                    'erros': dados['erros'],
+                    'latencia_media_ms': round(dados['total_ms'] / dados['chamadas'], 1),
+                    'latencia_p50_ms': round(amostras[len(amostras) // 2], 1),
+                    'latencia_p95_ms': round(amostras[min(len(amostras) - 1, int(len(amostras) * 0.95))], 1),
+                    'latencia_max_ms': round(dados['max_ms'], 1)
+                }
+            return {
+                'backend': GEOCODE_BACKEND,
+                'precisao': GEOCODE_PRECISAO,
+                'entradas_memoria': len(self._entradas),
+                'max_memoria': self.max_size,
+                'hits': hits,
+                'hits_memoria': self.hits_memoria,
+                'hits_banco': self.hits_banco,
+                'misses': self.misses,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+                'resolvidos_offline': self.offline,
+                'upstream': upstream
+            }
+
+
+class GazetteerOffline:
+    """Cidades de um arquivo local num IndiceEspacial, para achar a mais próxima de uma coordenada."""
+
+    COLUNAS = {
+        'cidade': ('cidade', 'nome', 'name', 'municipio', 'city'),
+        'estado': ('estado', 'uf', 'state', 'admin1'),
+        'pais': ('pais', 'país', 'country', 'country_code'),
+        'latitude': ('latitude', 'lat'),
+        'longitude': ('longitude', 'lng', 'lon'),
+    }
+
+    def __init__(self, caminho):
+        from app.services import geo
+
+        self.caminho = caminho
+        self.cidades = []
+        latitudes, longitudes = [], []
+        for cidade, estado, pais, lat, lng in self._ler(caminho):
+            self.cidades.append((cidade, estado, pais))
+            latitudes.append(lat)
+            longitudes.append(lng)
+        self.indice = geo.IndiceEspacial(latitudes, longitudes)
+
+    def _ler(self, caminho):
+        with open(caminho, encoding='utf-8', newline='') as arquivo:
+            primeira = arquivo.readline()
+            arquivo.seek(0)
+            campos = primeira.rstrip('\n').split('\t')
+            if len(campos) >= 15 and _numero(campos[4]) is not None:
+                # cities*.txt do GeoNames: sem cabeçalho, separado por tab
+                for campos in csv.reader(arquivo, delimiter='\t', quoting=csv.QUOTE_NONE):
+                    lat, lng = _numero(campos[4]), _numero(campos[5])
+                    if lat is not None and lng is not None:
+                        yield campos[1], campos[10], campos[8], lat, lng
+                return
+
+            delimitador = csv.Sniffer().sniff(primeira, delimiters=',;\t').delimiter
+            leitor = csv.DictReader(arquivo, delimiter=delimitador)
+            nomes = {campo.strip().lower(): campo for campo in leitor.fieldnames or []}
+            coluna = {destino: next((nomes[a] for a in apelidos if a in nomes), None)
+                      for destino, apelidos in self.COLUNAS.items()}
+            if not coluna['latitude'] or not coluna['longitude']:
+                raise ValueError('Gazetteer sem colunas de latitude/longitude')
+            for linha in leitor:
+                lat, lng = _numero(linha[coluna['latitude']]), _numero(linha[coluna['longitude']])
+                if lat is None or lng is None:
+                    continue
+                yield tuple((linha[coluna[c]] or '').strip() if coluna[c] else ''
+                            for c in ('cidade', 'estado', 'pais')) + (lat, lng)
+
+    def resolver(self, lat, lng, raio_km=GEOCODE_OFFLINE_RAIO_KM):
+        indices, distancias = self.indice.k_proximos(lat, lng, 1, raio_metros=raio_km * 1000)
+        if not indices.size:
+            return None
+        cidade, estado, pais = self.cidades[int(indices[0])]
+        return {
+            'rua': '',
+            'numero': '',
+            'cep': '',
+            'bairro': '',
+            'cidade': cidade,
+            'estado': estado,
+            'pais': pais,
+            'endereco_completo': ', '.join(p for p in (cidade, estado) if p),
+            'raw': {'distancia_km': round(float(distancias[0]) / 1000, 2)},
+            'sucesso': True,
+            'fonte': 'offline'
+        }
+
+
+def _numero(valor):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+memoria = GeocodeLRU()
+
+_gazetteer = None
+_gazetteer_carregado = False
+_gazetteer_lock = threading.Lock()
+
+
+def obter_gazetteer():
+    """Gazetteer carregado na primeira chamada; None se GEOCODE_GAZETTEER não estiver configurado ou falhar."""
+    global _gazetteer, _gazetteer_carregado
+    if _gazetteer_carregado:
+        return _gazetteer
+    with _gazetteer_lock:
+        if not _gazetteer_carregado:
+            if GEOCODE_GAZETTEER:
+                try:
+                    inicio = time.perf_counter()
+                    _gazetteer = GazetteerOffline(GEOCODE_GAZETTEER)
+                    print(f"[GEOCODE] Gazetteer offline com {len(_gazetteer.cidades)} cidades carregado "
+                          f"em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+                except Exception as e:
+                    print(f"[GEOCODE] Erro ao carregar gazetteer {GEOCODE_GAZETTEER}: {e}")
+            _gazetteer_carregado = True
+    return _gazetteer
+
+
+def geocodificar_offline(lat, lng):
+    gazetteer = obter_gazetteer()
+    if gazetteer is None:
+        return None
+    resultado = gazetteer.resolver(lat, lng)
+    if resultado:
+        memoria.registrar('offline')
+    return resultado
+
+
+def offline_disponivel():
+    return obter_gazetteer() is not None
+
+
+def buscar(lat, lng):
+    """Resultado em cache (memória, depois banco) para a coordenada, ou None."""
+    from app.models import db, GeocodeCache
+
+    chave = chave_coordenadas(lat, lng)
+    resultado = memoria.obter(chave)
+    if resultado is not None:
+        memoria.registrar('memoria')
+        return dict(resultado, fonte='cache')
+
+    if has_app_context():
+        try:
+            agora = datetime.utcnow()
+            registro = GeocodeCache.query.filter(
+                GeocodeCache.chave == chave, GeocodeCache.expira_em > agora
+            ).first()
+            if registro:
+                registro.acessos = (registro.acessos or 0) + 1
+                registro.ultimo_acesso = agora
+                resultado = registro.resultado
+                expira_em = registro.expira_em
+                db.session.commit()
+                memoria.guardar(chave, resultado, expira_em)
+                memoria.registrar('banco')
+                return dict(resultado, fonte='cache')
+        except Exception as e:
+            db.session.rollback()
+            print(f"[GEOCODE] Erro ao ler cache: {e}")
+
+    memoria.registrar('miss')
+    return None
+
+
+def guardar(lat, lng, resultado, encontrado=True):
+    """Guarda o resultado do Nominatim nas duas camadas."""
+    from app.models import db, GeocodeCache
+
+    chave = chave_coordenadas(lat, lng)
+    validade = timedelta(days=GEOCODE_TTL_DIAS) if encontrado else timedelta(hours=GEOCODE_TTL_NAO_ENCONTRADO_HORAS)
+    agora = datetime.utcnow()
+    expira_em = agora + validade
+    resultado = {k: v for k, v in resultado.items() if k != 'fonte'}
+    memoria.guardar(chave, resultado, expira_em)
+
+    if not has_app_context():
+        return
+    try:
+        registro = GeocodeCache.query.filter_by(chave=chave).first()
+        if registro is None:
+            registro = GeocodeCache(chave=chave, latitude=float(lat), longitude=float(lng), acessos=0)
+            db.session.add(registro)
+        registro.resultado = resultado
+        registro.fonte = 'nominatim'
+        registro.criado_em = agora
+        registro.expira_em = expira_em
+        registro.ultimo_acesso = agora
+        db.session.commit()
+    except Exception as e:
+        # outra requisição gravou a mesma chave ao mesmo tempo
+        db.session.rollback()
+        print(f"[GEOCODE] Erro ao gravar cache: {e}")
+        return
+
+    memoria.gravacoes += 1
+    if GEOCODE_LIMPEZA_A_CADA and memoria.gravacoes % GEOCODE_LIMPEZA_A_CADA == 0:
+        limpar_cache()
+
+
+def limpar_cache(max_registros=None):
+    """Remove os registros vencidos e, acima de max_registros, os de acesso mais antigo. Devolve quantos removeu."""
+    from app.models import db, GeocodeCache
+
+    max_registros = GEOCODE_CACHE_MAX_REGISTROS if max_registros is None else max_registros
+    try:
+        removidos = GeocodeCache.query.filter(
+            GeocodeCache.expira_em <= datetime.utcnow()
+        ).delete(synchronize_session=False)
+        excesso = db.session.query(db.func.count(GeocodeCache.id)).scalar() - max_registros
+        if excesso > 0:
+            antigos = db.session.query(GeocodeCache.id).order_by(
+                GeocodeCache.ultimo_acesso
+            ).limit(excesso).subquery()
+            removidos += GeocodeCache.query.filter(
+                GeocodeCache.id.in_(db.select(antigos.c.id))
+            ).delete(synchronize_session=False)
+        db.session.commit()
+        return removidos
+    except Exception as e:
+        db.session.rollback()
+        print(f"[GEOCODE] Erro ao limpar cache: {e}")
+        return 0
+
+
+def registrar_upstream(servico, ms, sucesso):
+    memoria.registrar_upstream(servico, ms, sucesso)
+
+
+def get_geocode_stats():
+    stats = memoria.stats()
+    gazetteer = obter_gazetteer() if GEOCODE_GAZETTEER else None
+    stats['gazetteer'] = {
+        'arquivo': GEOCODE_GAZETTEER or None,
+        'cidades': len(gazetteer.cidades) if gazetteer else 0,
+        'raio_km': GEOCODE_OFFLINE_RAIO_KM
+    }
+    return stats
@@ -0,0 +1,368 @@
+"""
+Armazenamento em camadas dos pontos de GPS (gps_logs).
+
+Com o rastreamento contínuo a tabela cresce sem limite, então:
+
+  - no PostgreSQL gps_logs é particionada por mês no timestamp
+    (gps_logs_AAAA_MM, mais gps_logs_default); particionar_tabela converte a
+    tabela plana e criar_particoes abre os próximos meses
+  - o trajeto de uma OS é lido pelo índice (os_id, timestamp), limitado à data
+    de criação da OS para o planner descartar as partições anteriores
+  - a retenção (executar_retencao) transforma as posições brutas de meses
+    mais antigos que GPS_RETENCAO_DIAS em trajetos simplificados
+    (Douglas-Peucker com GPS_SIMPLIFICACAO_METROS de tolerância) guardados
+    como polyline codificada em gps_rotas_simplificadas, e remove os pontos
+    brutos: no PostgreSQL a partição é recriada só com os eventos discretos
+    (CHEGUEI, COLETEI, ...), nos demais bancos com DELETE em lotes
+  - obter_rota junta as duas camadas, então a API não precisa saber onde os
+    pontos estão
+
+Os eventos discretos nunca são removidos; só evento = 'POSICAO'.
+"""
+import os
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import text
+
+from app.models import db, GPSLog, GPSRotaSimplificada, OrdemServico
+from app.services import geo
+from app.services.gps_ingestao import EVENTO_POSICAO
+
+GPS_RETENCAO_DIAS = int(os.getenv('GPS_RETENCAO_DIAS', 90))
+GPS_SIMPLIFICACAO_METROS = float(os.getenv('GPS_SIMPLIFICACAO_METROS', 10))
+GPS_PARTICOES_A_FRENTE = int(os.getenv('GPS_PARTICOES_A_FRENTE', 3))
+
+LOTE_EXCLUSAO = 20000
+MARGEM_INICIO_OS = timedelta(days=1)
+
+
+def _inicio_mes(valor):
+    return datetime(valor.year, valor.month, 1)
+
+
+def nome_particao(mes):
+    return f'gps_logs_{mes:%Y_%m}'
+
+
+def _postgres():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def tabela_particionada():
+    if not _postgres():
+        return False
+    return db.session.execute(text("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = 'gps_logs'
+    """)).first() is not None
+
+
+# ---------------------------------------------------------------------------
+# Partições (PostgreSQL)
+# ---------------------------------------------------------------------------
+
+def _sql_criar_particao(mes):
+    proximo = mes + relativedelta(months=1)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {nome_particao(mes)} PARTITION OF gps_logs "
+        f"FOR VALUES FROM ('{mes:%Y-%m-%d}') TO ('{proximo:%Y-%m-%d}')"
+    )
+
+
+def criar_particoes(desde=None, meses_a_frente=GPS_PARTICOES_A_FRENTE):
+    """Garante as partições mensais de `desde` (padrão: mês atual) até meses_a_frente adiante."""
+    if not tabela_particionada():
+        return []
+
+    mes = _inicio_mes(desde or datetime.utcnow())
+    ultimo = _inicio_mes(datetime.utcnow()) + relativedelta(months=meses_a_frente)
+    criadas = []
+    while mes <= ultimo:
+        db.session.execute(text(_sql_criar_particao(mes)))
+        criadas.append(nome_particao(mes))
+        mes += relativedelta(months=1)
+    db.session.commit()
+    return criadas
+
+
+def particionar_tabela(meses_a_frente=GPS_PARTICOES_A_FRENTE):
+    """
+    Converte gps_logs numa tabela particionada por mês, numa única transação:
+    renomeia a tabela atual, cria a particionada com as partições necessárias,
+    copia os dados e remove a antiga. A sequência dos ids é reaproveitada.
+    Devolve o número de linhas copiadas, ou None se já estava particionada.
+    """
+    if not _postgres():
+        raise RuntimeError('Particionamento de gps_logs disponível apenas no PostgreSQL')
+    if tabela_particionada():
+        return None
+
+    intervalo = db.session.execute(text('SELECT MIN("timestamp"), MAX("timestamp") FROM gps_logs')).first()
+    agora = datetime.utcnow()
+    primeiro_mes = _inicio_mes(intervalo[0] or agora)
+    ultimo_mes = _inicio_mes(max(intervalo[1] or agora, agora)) + relativedelta(months=meses_a_frente)
+
+    colunas = 'id, os_id, evento, latitude, longitude, precisao, "timestamp", device_id, ip, dados_adicionais'
+    comandos = [
+        "ALTER TABLE gps_logs RENAME TO gps_logs_legado",
+        "ALTER TABLE gps_logs_legado RENAME CONSTRAINT gps_logs_pkey TO gps_logs_legado_pkey",
+        "ALTER INDEX IF EXISTS ix_gps_logs_timestamp RENAME TO ix_gps_logs_legado_timestamp",
+        "ALTER INDEX IF EXISTS ix_gps_logs_os_timestamp RENAME TO ix_gps_logs_legado_os_timestamp",
+        "ALTER INDEX IF EXISTS ux_gps_logs_posicao_device_timestamp RENAME TO ux_gps_logs_legado_posicao",
+        "ALTER SEQUENCE gps_logs_id_seq OWNED BY NONE",
+        """
+        CREATE TABLE gps_logs (
+            id INTEGER NOT NULL DEFAULT nextval('gps_logs_id_seq'),
+            os_id INTEGER NOT NULL REFERENCES ordens_servico(id),
+            evento VARCHAR(50) NOT NULL,
+            latitude DOUBLE PRECISION NOT NULL,
+            longitude DOUBLE PRECISION NOT NULL,
+            precisao DOUBLE PRECISION,
+            "timestamp" TIMESTAMP NOT NULL,
+            device_id VARCHAR(255),
+            ip VARCHAR(50),
+            dados_adicionais JSON,
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")
+        """,
+        "CREATE TABLE gps_logs_default PARTITION OF gps_logs DEFAULT",
+    ]
+    mes = primeiro_mes
+    while mes <= ultimo_mes:
+        comandos.append(_sql_criar_particao(mes))
+        mes += relativedelta(months=1)
+    comandos += [
+        f"INSERT INTO gps_logs ({colunas}) SELECT {colunas} FROM gps_logs_legado",
+        'CREATE INDEX ix_gps_logs_timestamp ON gps_logs ("timestamp")',
+        'CREATE INDEX ix_gps_logs_os_timestamp ON gps_logs (os_id, "timestamp")',
+        "CREATE UNIQUE INDEX ux_gps_logs_posicao_device_timestamp ON gps_logs (device_id, \"timestamp\") "
+        f"WHERE evento = '{EVENTO_POSICAO}'",
+        "ALTER SEQUENCE gps_logs_id_seq OWNED BY gps_logs.id",
+    ]
+
+    try:
+        for comando in comandos:
+            db.session.execute(text(comando))
+        copiadas = db.session.execute(text('SELECT COUNT(*) FROM gps_logs')).scalar()
+        db.session.execute(text('DROP TABLE gps_logs_legado'))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return copiadas
+
+
+# ---------------------------------------------------------------------------
+# Simplificação e codificação dos trajetos
+# ---------------------------------------------------------------------------
+
+def simplificar(pontos, tolerancia_metros=GPS_SIMPLIFICACAO_METROS):
+    """Douglas-Peucker (app/services/geo.py) sobre [(lat, lng, ...)]; mantém o primeiro e o último ponto."""
+    if len(pontos) <= 2:
+        return list(pontos)
+    indices = geo.simplificar_indices([p[0] for p in pontos], [p[1] for p in pontos], tolerancia_metros)
+    return [pontos[i] for i in indices]
+
+
+def _codificar_inteiro(valor, saida):
+    valor = ~(valor << 1) if valor < 0 else valor << 1
+    while valor >= 0x20:
+        saida.append(chr((0x20 | (valor & 0x1f)) + 63))
+        valor >>= 5
+    saida.append(chr(valor + 63))
+
+
+def codificar_polyline(pontos, inicio):
+    """
+    Polyline no formato do Google (precisão 1e-5) com uma terceira dimensão:
+    segundos desde `inicio`. Cada valor é codificado como diferença do anterior.
+    """
+    saida = []
+    anterior = (0, 0, 0)
+    for lat, lng, instante in pontos:
+        atual = (round(lat * 1e5), round(lng * 1e5), round((instante - inicio).total_seconds()))
+        for a, b in zip(atual, anterior):
+            _codificar_inteiro(a - b, saida)
+        anterior = atual
+    return ''.join(saida)
+
+
+def codificar_polyline_mapa(pontos):
+    """Polyline padrão do Google (lat, lng), que os componentes de mapa decodificam direto."""
+    saida = []
+    anterior = (0, 0)
+    for ponto in pontos:
+        atual = (round(ponto[0] * 1e5), round(ponto[1] * 1e5))
+        for a, b in zip(atual, anterior):
+            _codificar_inteiro(a - b, saida)
+        anterior = atual
+    return ''.join(saida)
+
+
+def decodificar_polyline(polyline, inicio):
+    valores = []
+    indice, atual = 0, 0
+    deslocamento, resultado = 0, 0
+    while indice < len(polyline):
+        byte = ord(polyline[indice]) - 63
+        indice += 1
+        resultado |= (byte & 0x1f) << deslocamento
+        deslocamento += 5
+        if byte < 0x20:
+            valores.append(~(resultado >> 1) if resultado & 1 else resultado >> 1)
+            deslocamento, resultado = 0, 0
+
+    pontos = []
+    lat = lng = segundos = 0
+    for i in range(0, len(valores) - 2, 3):
+        lat += valores[i]
+        lng += valores[i + 1]
+        segundos += valores[i + 2]
+        pontos.append((lat / 1e5, lng / 1e5, inicio + timedelta(seconds=segundos)))
+    return pontos
+
+
+# ---------------------------------------------------------------------------
+# Retenção
+# ---------------------------------------------------------------------------
+
+def _simplificar_mes(mes, proximo, tolerancia_metros):
+    """
+    Grava os trajetos simplificados do mês; devolve (trajetos, pontos_originais, pontos).
+    Pontos que chegarem atrasados para um mês já compactado viram um trajeto a mais.
+    """
+    consulta = db.session.query(
+        GPSLog.os_id, GPSLog.device_id, GPSLog.latitude, GPSLog.longitude, GPSLog.timestamp
+    ).filter(
+        GPSLog.evento == EVENTO_POSICAO,
+        GPSLog.timestamp >= mes,
+        GPSLog.timestamp < proximo
+    ).order_by(GPSLog.os_id, GPSLog.device_id, GPSLog.timestamp).yield_per(10000)
+
+    trajetos = originais = mantidos = 0
+    for (os_id, device_id), linhas in groupby(consulta, key=lambda r: (r.os_id, r.device_id)):
+        pontos = [(r.latitude, r.longitude, r.timestamp) for r in linhas]
+        simplificados = simplificar(pontos, tolerancia_metros)
+        inicio = pontos[0][2]
+        db.session.add(GPSRotaSimplificada(
+            os_id=os_id,
+            device_id=device_id,
+            inicio=inicio,
+            fim=pontos[-1][2],
+            pontos_originais=len(pontos),
+            pontos=len(simplificados),
+            tolerancia_metros=tolerancia_metros,
+            polyline=codificar_polyline(simplificados, inicio)
+        ))
+        trajetos += 1
+        originais += len(pontos)
+        mantidos += len(simplificados)
+    db.session.flush()
+    return trajetos, originais, mantidos
+
+
+def _remover_posicoes(mes, proximo):
+    particao = nome_particao(mes)
+    if tabela_particionada() and db.session.execute(
+        text("SELECT to_regclass(:nome)"), {'nome': particao}
+    ).scalar():
+        # Recria a partição só com os eventos discretos: DROP é O(1) e não
+        # deixa a partição cheia de tuplas mortas como um DELETE faria.
+        compacta = f'{particao}_compacta'
+        for comando in [
+            f"CREATE TABLE {compacta} (LIKE gps_logs INCLUDING DEFAULTS)",
+            f"INSERT INTO {compacta} SELECT * FROM {particao} WHERE evento <> '{EVENTO_POSICAO}'",
+            f"ALTER TABLE gps_logs DETACH PARTITION {particao}",
+            f"DROP TABLE {particao}",
+            f"ALTER TABLE {compacta} RENAME TO {particao}",
+            f"ALTER TABLE gps_logs ATTACH PARTITION {particao} "
+            f"FOR VALUES FROM ('{mes:%Y-%m-%d}') TO ('{proximo:%Y-%m-%d}')",
+        ]:
+            db.session.execute(text(comando))
+        return
+
+    while True:
+        ids = [i for (i,) in db.session.query(GPSLog.id).filter(
+            GPSLog.evento == EVENTO_POSICAO,
+            GPSLog.timestamp >= mes,
+            GPSLog.timestamp < proximo
+        ).limit(LOTE_EXCLUSAO)]
+        if not ids:
+            return
+        db.session.query(GPSLog).filter(GPSLog.id.in_(ids)).delete(synchronize_session=False)
+
+
+def compactar_mes(mes, tolerancia_metros=GPS_SIMPLIFICACAO_METROS):
+    """Simplifica as posições brutas de um mês e remove os pontos brutos, numa transação."""
+    mes = _inicio_mes(mes)
+    proximo = mes + relativedelta(months=1)
+    try:
+        trajetos, originais, mantidos = _simplificar_mes(mes, proximo, tolerancia_metros)
+        _remover_posicoes(mes, proximo)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'mes': f'{mes:%Y-%m}', 'trajetos': trajetos, 'pontos_originais': originais, 'pontos': mantidos}
+
+
+def executar_retencao(hoje=None, retencao_dias=GPS_RETENCAO_DIAS, tolerancia_metros=GPS_SIMPLIFICACAO_METROS):
+    """Compacta cada mês inteiro anterior ao limite de retenção que ainda tenha posições brutas."""
+    limite = (hoje or datetime.utcnow()) - timedelta(days=retencao_dias)
+    resumo = []
+    while True:
+        mais_antigo = db.session.query(db.func.min(GPSLog.timestamp)).filter(
+            GPSLog.evento == EVENTO_POSICAO
+        ).scalar()
+        if mais_antigo is None:
+            break
+        mes = _inicio_mes(mais_antigo)
+        if mes + relativedelta(months=1) > limite:
+            break
+        resumo.append(compactar_mes(mes, tolerancia_metros))
+    return resumo
+
+
+# ---------------------------------------------------------------------------
+# Leitura
+# ---------------------------------------------------------------------------
+
+def obter_rota(os_id, inicio=None, fim=None):
+    """
+    Trajeto da OS combinando os pontos brutos e os trajetos simplificados.
+    Devolve {'pontos': [(lat, lng, datetime)], 'eventos': [GPSLog], 'fontes': {...}}.
+    """
+    criado_em = db.session.query(OrdemServico.criado_em).filter(OrdemServico.id == os_id).scalar()
+    limite_inferior = criado_em - MARGEM_INICIO_OS if criado_em else None
+    if inicio is not None:
+        limite_inferior = max(limite_inferior, inicio) if limite_inferior else inicio
+
+    filtros = [GPSLog.os_id == os_id]
+    if limite_inferior is not None:
+        filtros.append(GPSLog.timestamp >= limite_inferior)
+    if fim is not None:
+        filtros.append(GPSLog.timestamp <= fim)
+
+    brutos = [
+        (r.latitude, r.longitude, r.timestamp)
+        for r in db.session.query(GPSLog.latitude, GPSLog.longitude, GPSLog.timestamp).filter(
+            *filtros, GPSLog.evento == EVENTO_POSICAO
+        ).order_by(GPSLog.timestamp)
+    ]
+    eventos = GPSLog.query.filter(*filtros, GPSLog.evento != EVENTO_POSICAO).order_by(GPSLog.timestamp).all()
+
+    simplificados = []
+    for trajeto in GPSRotaSimplificada.query.filter_by(os_id=os_id).order_by(GPSRotaSimplificada.inicio):
+        for ponto in decodificar_polyline(trajeto.polyline, trajeto.inicio):
+            if (inicio is None or ponto[2] >= inicio) and (fim is None or ponto[2] <= fim):
+                simplificados.append(ponto)
+
+    pontos = sorted(simplificados + brutos, key=lambda p: p[2]) if simplificados else brutos
+    return {
+        'pontos': pontos,
+        'eventos': eventos,
+        'fontes': {'bruto': len(brutos), 'simplificado': len(simplificados)}
+    }
@@ -0,0 +1,425 @@
+"""
+Ingestão contínua de posições GPS do app do motorista.
+
+O app envia uma posição a cada 5-10 s em lotes (POST /api/os/<id>/gps). Em vez
+de um INSERT + commit por ponto, como em registrar_evento, os pontos validados
+vão para um buffer em memória que uma thread grava em massa:
+
+  - a cada GPS_FLUSH_INTERVALO segundos ou quando o buffer passa de
+    GPS_FLUSH_PONTOS pontos
+  - no PostgreSQL com COPY para uma tabela temporária seguido de
+    INSERT ... SELECT ... ON CONFLICT DO NOTHING; nos demais bancos com
+    executemany e ON CONFLICT DO NOTHING
+  - a deduplicação por (device_id, timestamp) usa o índice único parcial
+    ux_gps_logs_posicao_device_timestamp (evento = 'POSICAO'), então reenvios
+    do app após falha de rede não duplicam pontos
+
+Os campos são validados e limitados ao tamanho das colunas quando o ponto é
+aceito. Se mesmo assim a gravação em massa falhar, o lote é regravado ponto a
+ponto uma vez: pontos que o banco recusa (DataError, IntegrityError) vão para
+uma lista de descartados (get_buffer_stats) em vez de voltar ao buffer, para
+que uma linha ruim não bloqueie a ingestão. Se a falha não for da linha
+(banco indisponível), os pontos ainda não gravados voltam para o buffer e são
+tentados no próximo flush. Acima de GPS_BUFFER_MAX pontos pendentes novas
+requisições recebem 503 com Retry-After. No encerramento do processo o buffer
+é gravado (atexit).
+
+Com vários workers cada processo tem o seu buffer. flush() grava só o do
+processo atual; flush_compartilhado() pede a todos os workers que gravem o
+que receberam até agora e espera a confirmação: o pedido é um contador em
+estado_compartilhado ('gps:flush_pedido') e cada worker, depois de um flush
+bem-sucedido, publica no hash 'gps:drenado' o último pedido atendido. Workers
+sem confirmação há mais de GPS_WORKER_INATIVO segundos são considerados
+encerrados e saem do hash.
+"""
+import io
+import os
+import csv
+import json
+import math
+import time
+import atexit
+import socket
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timezone, timedelta
+
+from app.services import estado_compartilhado
+
+logger = logging.getLogger(__name__)
+
+GPS_FLUSH_INTERVALO = float(os.getenv('GPS_FLUSH_INTERVALO', 1.0))
+GPS_FLUSH_PONTOS = int(os.getenv('GPS_FLUSH_PONTOS', 2000))
+GPS_BUFFER_MAX = int(os.getenv('GPS_BUFFER_MAX', 100000))
+GPS_LOTE_MAX = int(os.getenv('GPS_LOTE_MAX', 1000))
+GPS_TOLERANCIA_FUTURO = int(os.getenv('GPS_TOLERANCIA_FUTURO', 300))
+GPS_USAR_COPY = os.getenv('GPS_USAR_COPY', 'true').lower() == 'true'
+GPS_EXTRAS_MAX_BYTES = int(os.getenv('GPS_EXTRAS_MAX_BYTES', 2048))
+GPS_DESCARTADOS_MAX = int(os.getenv('GPS_DESCARTADOS_MAX', 100))
+GPS_FLUSH_ESPERA = float(os.getenv('GPS_FLUSH_ESPERA', 10))
+GPS_WORKER_INATIVO = float(os.getenv('GPS_WORKER_INATIVO', 60))
+
+CHAVE_FLUSH_PEDIDO = 'gps:flush_pedido'
+CHAVE_DRENADO = 'gps:drenado'
+
+# Tamanho das colunas de texto de gps_logs
+DEVICE_ID_MAX = 255
+IP_MAX = 50
+
+EVENTO_POSICAO = 'POSICAO'
+
+COLUNAS = ['os_id', 'evento', 'latitude', 'longitude', 'precisao', 'timestamp', 'device_id', 'ip',
+           'dados_adicionais']
+CAMPOS_PONTO = {'latitude', 'longitude', 'precisao', 'timestamp'}
+
+
+class GPSBufferCheio(Exception):
+    """Buffer de pontos cheio; retry_after indica em quantos segundos reenviar."""
+
+    def __init__(self, retry_after):
+        super().__init__('Buffer de GPS cheio')
+        self.retry_after = retry_after
+
+
+def converter_timestamp(valor):
+    """
+    Converte o timestamp do cliente para datetime UTC sem fuso (padrão do banco).
+    Aceita ISO 8601 (com ou sem fuso) ou epoch em segundos ou milissegundos.
+    """
+    if isinstance(valor, bool) or valor is None:
+        raise ValueError('timestamp é obrigatório')
+    if isinstance(valor, (int, float)):
+        segundos = valor / 1000.0 if valor > 1e11 else float(valor)
+        return datetime.fromtimestamp(segundos, tz=timezone.utc).replace(tzinfo=None)
+    data = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+    if data.tzinfo is not None:
+        data = data.astimezone(timezone.utc).replace(tzinfo=None)
+    return data
+
+
+def validar_pontos(os_id, device_id, pontos, ip=None):
+    """
+    Valida os pontos de um lote e devolve (linhas, rejeitados, duplicados).
+    Pontos inválidos não derrubam o lote; voltam em `rejeitados` com o índice.
+    device_id e ip são truncados ao tamanho das colunas; os campos extras do
+    ponto (dados_adicionais) precisam ser JSON válido, sem NaN, com até
+    GPS_EXTRAS_MAX_BYTES bytes.
+    """
+    device_id = str(device_id)[:DEVICE_ID_MAX]
+    ip = str(ip)[:IP_MAX] if ip else None
+    limite_futuro = datetime.utcnow() + timedelta(seconds=GPS_TOLERANCIA_FUTURO)
+    linhas = []
+    rejeitados = []
+    vistos = set()
+    duplicados = 0
+
+    for indice, ponto in enumerate(pontos):
+        try:
+            if not isinstance(ponto, dict):
+                raise ValueError('ponto deve ser um objeto')
+            latitude = float(ponto['latitude'])
+            longitude = float(ponto['longitude'])
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                raise ValueError('coordenadas fora do intervalo')
+            precisao = ponto.get('precisao')
+            precisao = float(precisao) if precisao is not None else None
+            if precisao is not None and not math.isfinite(precisao):
+                raise ValueError('precisao inválida')
+            timestamp = converter_timestamp(ponto.get('timestamp'))
+            if timestamp > limite_futuro:
+                raise ValueError('timestamp no futuro')
+            extras = {k: v for k, v in ponto.items() if k not in CAMPOS_PONTO}
+            if extras and len(json.dumps(extras, allow_nan=False)) > GPS_EXTRAS_MAX_BYTES:
+                raise ValueError(f'campos extras acima de {GPS_EXTRAS_MAX_BYTES} bytes')
+        except KeyError as e:
+            rejeitados.append({'indice': indice, 'erro': f'{e.args[0]} é obrigatório'})
+            continue
+        except (OverflowError, OSError):
+            rejeitados.append({'indice': indice, 'erro': 'timestamp fora do intervalo'})
+            continue
+        except (TypeError, ValueError) as e:
+            rejeitados.append({'indice': indice, 'erro': str(e)})
+            continue
+
+        if timestamp in vistos:
+            duplicados += 1
+            continue
+        vistos.add(timestamp)
+
+        linhas.append({
+            'os_id': os_id,
+            'evento': EVENTO_POSICAO,
+            'latitude': latitude,
+            'longitude': longitude,
+            'precisao': precisao,
+            'timestamp': timestamp,
+            'device_id': device_id,
+            'ip': ip,
+            'dados_adicionais': extras or None
+        })
+
+    return linhas, rejeitados, duplicados
+
+
+def _gravar_copy(db, linhas):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for linha in linhas:
+        writer.writerow([
+            linha['os_id'], linha['evento'], linha['latitude'], linha['longitude'], linha['precisao'],
+            linha['timestamp'].isoformat(), linha['device_id'], linha['ip'],
+            json.dumps(linha['dados_adicionais']) if linha['dados_adicionais'] is not None else None
+        ])
+    buffer.seek(0)
+
+    colunas = ', '.join(f'"{c}"' for c in COLUNAS)
+    conexao = db.engine.raw_connection()
+    try:
+        cursor = conexao.cursor()
+        cursor.execute("""
+            CREATE TEMP TABLE gps_logs_staging (
+                os_id INTEGER, evento VARCHAR(50), latitude DOUBLE PRECISION,
+                longitude DOUBLE PRECISION, precisao DOUBLE PRECISION, "timestamp" TIMESTAMP,
+                device_id VARCHAR(255), ip VARCHAR(50), dados_adicionais JSON
+            ) ON COMMIT DROP
+        """)
+        cursor.copy_expert(f"COPY gps_logs_staging ({colunas}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(f"""
+            INSERT INTO gps_logs ({colunas})
+            SELECT {colunas} FROM gps_logs_staging
+            ON CONFLICT (device_id, "timestamp") WHERE evento = '{EVENTO_POSICAO}' DO NOTHING
+        """)
+        inseridos = cursor.rowcount
+        conexao.commit()
+        return inseridos
+    except Exception:
+        conexao.rollback()
+        raise
+    finally:
+        conexao.close()
+
+
+def _gravar_executemany(db, linhas):
+    from sqlalchemy import text
+    from app.models import GPSLog
+
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = insert(GPSLog.__table__).on_conflict_do_nothing(
+        index_elements=['device_id', 'timestamp'],
+        index_where=text(f"evento = '{EVENTO_POSICAO}'")
+    )
+    with db.engine.begin() as conn:
+        conn.execute(stmt, linhas)
+    return None
+
+
+def gravar_pontos(linhas, usar_copy=GPS_USAR_COPY):
+    """
+    Grava os pontos em massa, ignorando (device_id, timestamp) já gravados.
+    Devolve o número de linhas inseridas quando o banco informa (COPY).
+    """
+    from app.models import db
+
+    if not linhas:
+        return 0
+    if usar_copy and db.engine.dialect.name == 'postgresql' and db.engine.driver == 'psycopg2':
+        return _gravar_copy(db, linhas)
+    return _gravar_executemany(db, linhas)
+
+
+def _erro_da_linha(erro):
+    """True se o banco recusou a linha em si, e não por estar indisponível."""
+    from sqlalchemy import exc
+
+    if isinstance(erro, (exc.DataError, exc.IntegrityError)):
+        return True
+    return isinstance(erro, exc.StatementError) and not isinstance(erro, exc.DBAPIError)
+
+
+class GPSBuffer:
+    def __init__(self, intervalo=GPS_FLUSH_INTERVALO, flush_pontos=GPS_FLUSH_PONTOS, maximo=GPS_BUFFER_MAX):
+        self.intervalo = intervalo
+        self.flush_pontos = flush_pontos
+        self.maximo = maximo
+        self.app = None
+        self.worker_id = None
+        self._pendentes = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._acordar = threading.Event()
+        self._worker = None
+        self._taxa_gravacao = 5000.0
+        self._descartados = deque(maxlen=GPS_DESCARTADOS_MAX)
+        self.recebidos = 0
+        self.processados = 0
+        self.descartados = 0
+        self.flushes = 0
+        self.erros = 0
+        self.ultimo_erro = None
+
+    def init_app(self, app):
+        self.app = app
+        atexit.register(self.flush)
+
+    def _garantir_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._executar, name='gps-flush', daemon=True)
+                self._worker.start()
+
+    def adicionar(self, linhas):
+        self._garantir_worker()
+        with self._lock:
+            if len(self._pendentes) + len(linhas) > self.maximo:
+                raise GPSBufferCheio(max(1, int(len(self._pendentes) / self._taxa_gravacao) + 1))
+            self._pendentes.extend(linhas)
+            self.recebidos += len(linhas)
+            cheio = len(self._pendentes) >= self.flush_pontos
+        if cheio:
+            self._acordar.set()
+        return len(linhas)
+
+    def _executar(self):
+        while True:
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('[GPS] Erro no flush')
+
+    def _gravar(self, linhas, usar_copy=GPS_USAR_COPY):
+        if self.app is None:
+            return gravar_pontos(linhas, usar_copy)
+        with self.app.app_context():
+            return gravar_pontos(linhas, usar_copy)
+
+    def _gravar_por_linha(self, linhas):
+        """
+        Regrava ponto a ponto depois de uma falha do lote. Pontos recusados pelo
+        banco são descartados; em qualquer outro erro os pontos ainda não
+        gravados voltam para o buffer e o erro é propagado. Devolve quantos foram
+        descartados.
+        """
+        descartados = 0
+        for indice, linha in enumerate(linhas):
+            try:
+                self._gravar([linha], usar_copy=False)
+            except Exception as e:
+                if not _erro_da_linha(e):
+                    with self._lock:
+                        self._pendentes = linhas[indice:] + self._pendentes
+                    raise
+                descartados += 1
+                self.descartados += 1
+                self._descartados.append({
+                    'os_id': linha.get('os_id'),
+                    'device_id': linha.get('device_id'),
+                    'timestamp': str(linha.get('timestamp')),
+                    'erro': str(getattr(e, 'orig', None) or e)[:300]
+                })
+                logger.warning('[GPS] Ponto descartado (OS %s, device %s): %s',
+                               linha.get('os_id'), linha.get('device_id'), e)
+        return descartados
+
+    def _confirmar_pedido(self, pedido):
+        """Publica que tudo o que este worker recebeu antes de `pedido` já foi gravado."""
+        worker = self.worker_id or f'{socket.gethostname()}:{os.getpid()}'
+        estado_compartilhado.definir_campo(CHAVE_DRENADO, worker, {'pedido': pedido, 'instante': time.time()})
+
+    def flush(self):
+        """
+        Grava tudo o que está pendente. Se o lote falhar, regrava ponto a ponto
+        uma vez (ver _gravar_por_linha).
+        """
+        with self._flush_lock:
+            pedido = estado_compartilhado.obter(CHAVE_FLUSH_PEDIDO) or 0
+            with self._lock:
+                linhas, self._pendentes = self._pendentes, []
+            if not linhas:
+                self._confirmar_pedido(pedido)
+                return 0
+
+            inicio = time.monotonic()
+            descartados = 0
+            try:
+                self._gravar(linhas)
+            except Exception as e:
+                self.erros += 1
+                self.ultimo_erro = str(e)[:300]
+                descartados = self._gravar_por_linha(linhas)
+
+            duracao = max(time.monotonic() - inicio, 1e-6)
+            self._taxa_gravacao = 0.8 * self._taxa_gravacao + 0.2 * (len(linhas) / duracao)
+            self.processados += len(linhas) - descartados
+            self.flushes += 1
+            self._confirmar_pedido(pedido)
+            return len(linhas) - descartados
+
+    def stats(self):
+        with self._lock:
+            pendentes = len(self._pendentes)
+        return {
+            'pendentes': pendentes,
+            'recebidos': self.recebidos,
+            'processados': self.processados,
+            'descartados': self.descartados,
+            'ultimos_descartados': list(self._descartados),
+            'flushes': self.flushes,
+            'erros': self.erros,
+            'ultimo_erro': self.ultimo_erro,
+            'pontos_por_segundo_gravacao': round(self._taxa_gravacao, 1)
+        }
+
+
+gps_buffer = GPSBuffer()
+
+
+def init_app(app):
+    gps_buffer.init_app(app)
+
+
+def enfileirar_pontos(linhas):
+    return gps_buffer.adicionar(linhas)
+
+
+def flush():
+    return gps_buffer.flush()
+
+
+def flush_compartilhado(espera=GPS_FLUSH_ESPERA):
+    """
+    Grava o buffer deste processo e espera até `espera` segundos que os outros
+    workers gravem os pontos que receberam antes da chamada (a thread de flush
+    de cada worker atende o pedido em até GPS_FLUSH_INTERVALO segundos).
+    Devolve True se todos confirmaram; False se algum não confirmou a tempo,
+    e os últimos pontos dele podem ficar de fora de quem ler o banco agora.
+    """
+    pedido = estado_compartilhado.incrementar(CHAVE_FLUSH_PEDIDO)
+    gps_buffer.flush()
+    limite = time.monotonic() + espera
+    while True:
+        agora = time.time()
+        pendentes = []
+        for worker, confirmacao in estado_compartilhado.ler_campos(CHAVE_DRENADO).items():
+            if confirmacao['instante'] < agora - GPS_WORKER_INATIVO:
+                estado_compartilhado.remover_campo(CHAVE_DRENADO, worker)
+            elif confirmacao['pedido'] < pedido:
+                pendentes.append(worker)
+        if not pendentes:
+            return True
+        if time.monotonic() >= limite:
+            logger.warning('[GPS] Workers sem confirmar o flush em %.0f s: %s', espera, ', '.join(pendentes))
+            return False
+        time.sleep(min(gps_buffer.intervalo, 0.5))
+
+
+def get_buffer_stats():
+    return gps_buffer.stats()
@@ -0,0 +1,175 @@
+"""
+Início, finalização e consolidação de inventário do WMS com operações de conjunto.
+
+iniciar_inventario carregava todos os lotes em estoque e mudava bloqueado,
+tipo_bloqueio etc. um objeto por vez antes de um único commit; finalizar e
+consolidar faziam o mesmo laço sobre lotes e InventarioContagem. Com 100 mil
+lotes eram minutos com as linhas travadas até o fim. Aqui:
+
+  - bloquear/desbloquear é um UPDATE ... WHERE <filtro> por faixa de
+    INVENTARIO_LOTE ids (keyset: a faixa termina no maior id dos próximos N
+    lotes do filtro), cada faixa na sua transação: as travas duram uma faixa
+  - a consolidação agrupa as contagens no banco (uma linha por lote com as
+    contagens 1, 2 e 3 lado a lado) e só traz os lotes divergentes
+  - a cada faixa, 'inventario_progresso' vai por Socket.IO para a sala
+    'admins'; no fim, um único 'lote_atualizado' para as telas de lotes
+    buscarem o delta (os UPDATEs em massa não passam pelos eventos por lote de
+    tempo_real); os eventos de lote_eventos de cada faixa são gravados na
+    mesma transação do UPDATE
+
+Se o processo cair no meio, as faixas já confirmadas ficam: o inventário
+continua EM_ANDAMENTO e finalizar desbloqueia o que foi bloqueado.
+"""
+import os
+from datetime import datetime
+
+from sqlalchemy import update, case, func, and_
+
+from app.models import db, Lote, InventarioContagem
+from app.services import lote_eventos
+
+INVENTARIO_LOTE = int(os.getenv('INVENTARIO_LOTE', '5000'))
+STATUS_INVENTARIAVEIS = ('EM_ESTOQUE', 'BLOQUEADO_QC', 'BLOQUEADO_INVENTARIO')
+
+
+def _motivo(inventario):
+    return f'Inventário {inventario.numero_inventario}'
+
+
+def _emitir(nome, dados):
+    try:
+        from app import socketio
+        if socketio.server is None:
+            return
+        socketio.emit(nome, dados, to='admins')
+    except Exception as e:
+        print(f"[INVENTARIO] Erro ao emitir {nome}: {e}")
+
+
+def _progresso(inventario_id, numero, etapa, processados, total, concluido=False):
+    _emitir('inventario_progresso', {
+        'inventario_id': inventario_id,
+        'numero_inventario': numero,
+        'etapa': etapa,
+        'processados': processados,
+        'total': total,
+        'concluido': concluido
+    })
+
+
+def _proximo_limite(consulta, coluna, ultimo):
+    """Maior valor de coluna entre os próximos INVENTARIO_LOTE registros depois de ultimo (None no fim)."""
+    faixa = consulta.filter(coluna > ultimo).with_entities(coluna.label('chave')).distinct() \
+        .order_by(coluna).limit(INVENTARIO_LOTE).subquery()
+    return db.session.query(func.max(faixa.c.chave)).scalar()
+
+
+def _atualizar_em_faixas(inventario, etapa, filtros, valores, acao, usuario_id=None):
+    inventario_id, numero = inventario.id, inventario.numero_inventario
+    detalhes = {'inventario_id': inventario_id, 'numero_inventario': numero}
+    consulta = Lote.query.filter(*filtros)
+    total = consulta.with_entities(func.count(Lote.id)).scalar()
+    _progresso(inventario_id, numero, etapa, 0, total)
+
+    processados, ultimo = 0, 0
+    while True:
+        limite = _proximo_limite(consulta, Lote.id, ultimo)
+        if limite is None:
+            break
+        faixa = [*filtros, Lote.id > ultimo, Lote.id <= limite]
+        lote_eventos.registrar_em_massa(faixa, valores, acao, usuario_id, detalhes)
+        resultado = db.session.execute(
+            update(Lote).where(*faixa).values(**valores)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        processados += resultado.rowcount
+        ultimo = limite
+        _progresso(inventario_id, numero, etapa, processados, total)
+
+    _progresso(inventario_id, numero, etapa, processados, total, concluido=True)
+    if processados:
+        _emitir('lote_atualizado', {
+            'tipo': 'lote', 'id': None, 'campos': ['bloqueado'], 'em_massa': True,
+            'inventario_id': inventario_id, 'total': processados,
+            'atualizado_em': datetime.utcnow().isoformat()
+        })
+    return processados
+
+
+def bloquear_lotes(inventario, usuario_id):
+    """Bloqueia os lotes do inventário (já gravado); devolve quantos foram bloqueados."""
+    if inventario.localizacao:
+        filtros = [Lote.localizacao_atual == inventario.localizacao]
+    else:
+        filtros = [Lote.status.in_(STATUS_INVENTARIAVEIS)]
+    return _atualizar_em_faixas(inventario, 'inicio', filtros, {
+        'bloqueado': True,
+        'tipo_bloqueio': 'INVENTARIO',
+        'motivo_bloqueio': _motivo(inventario),
+        'bloqueado_por_id': usuario_id,
+        'bloqueado_em': datetime.utcnow()
+    }, 'BLOQUEIO_INVENTARIO', usuario_id)
+
+
+def desbloquear_lotes(inventario, usuario_id=None):
+    """Libera os lotes bloqueados por este inventário; devolve quantos foram liberados."""
+    filtros = [
+        Lote.motivo_bloqueio == _motivo(inventario),
+        Lote.tipo_bloqueio == 'INVENTARIO',
+        Lote.bloqueado == True,
+    ]
+    if inventario.localizacao:
+        filtros.append(Lote.localizacao_atual == inventario.localizacao)
+    return _atualizar_em_faixas(inventario, 'finalizacao', filtros, {
+        'bloqueado': False,
+        'tipo_bloqueio': None,
+        'motivo_bloqueio': None
+    }, 'DESBLOQUEIO_INVENTARIO', usuario_id)
+
+
+def consolidar(inventario):
+    """
+    Compara as contagens por lote: divergente quando há 2 ou mais contagens e o
+    peso da 1ª difere do da 2ª. Devolve (total de lotes contados, divergências).
+    """
+    inventario_id, numero = inventario.id, inventario.numero_inventario
+    contagens = InventarioContagem.query.filter(InventarioContagem.inventario_id == inventario_id)
+    total = contagens.with_entities(func.count(func.distinct(InventarioContagem.lote_id))).scalar()
+    _progresso(inventario_id, numero, 'consolidacao', 0, total)
+
+    def peso(numero_contagem):
+        return func.max(case((InventarioContagem.numero_contagem == numero_contagem,
+                              InventarioContagem.peso_contado))).label(f'contagem_{numero_contagem}')
+
+    divergencias, processados, ultimo = [], 0, 0
+    while True:
+        limite = _proximo_limite(contagens, InventarioContagem.lote_id, ultimo)
+        if limite is None:
+            break
+        por_lote = contagens.filter(InventarioContagem.lote_id > ultimo, InventarioContagem.lote_id <= limite) \
+            .with_entities(InventarioContagem.lote_id.label('lote_id'), func.count().label('quantidade'),
+                           peso(1), peso(2), peso(3)) \
+            .group_by(InventarioContagem.lote_id).subquery()
+        processados += db.session.query(func.count()).select_from(por_lote).scalar()
+        linhas = db.session.query(
+            por_lote.c.lote_id, Lote.numero_lote, func.coalesce(Lote.peso_total_kg, 0),
+            por_lote.c.contagem_1, por_lote.c.contagem_2, por_lote.c.contagem_3
+        ).outerjoin(Lote, Lote.id == por_lote.c.lote_id).filter(
+            and_(por_lote.c.quantidade >= 2, por_lote.c.contagem_1.is_distinct_from(por_lote.c.contagem_2))
+        ).order_by(por_lote.c.lote_id)
+        for lote_id, lote_numero, peso_sistema, contagem_1, contagem_2, contagem_3 in linhas:
+            divergencias.append({
+                'lote_id': lote_id,
+                'lote_numero': lote_numero,
+                'peso_sistema': peso_sistema,
+                'contagem_1': contagem_1,
+                'contagem_2': contagem_2,
+                'contagem_3': contagem_3,
+                'status': 'DIVERGENTE'
+            })
+        ultimo = limite
+        _progresso(inventario_id, numero, 'consolidacao', processados, total)
+
+    _progresso(inventario_id, numero, 'consolidacao', processados, total, concluido=True)
+    return processados, divergencias
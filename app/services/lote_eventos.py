@@ -0,0 +1,331 @@
+"""
+Histórico de lotes em lote_eventos, uma linha por ação com só o que mudou.
+
+Até aqui cada bloqueio, reserva ou movimentação anexava a Lote.auditoria
+(um array JSON na própria linha do lote) uma entrada com o to_dict()
+inteiro em 'dados_before', e MovimentacaoEstoque guardava dois to_dict()
+completos (dados_before/dados_after). A cada ação o array inteiro era
+relido e regravado; um lote movimentado com frequência carregava centenas
+de snapshots, e o histórico não tinha índice nem consulta por data.
+
+Agora:
+
+  - qualquer flush que cria ou altera um Lote grava um LoteEvento com
+    alteracoes = {campo: [antes, depois]} (só as colunas que mudaram),
+    a partir do histórico de atributos do SQLAlchemy. As rotas só dizem o
+    nome da ação e os detalhes com registrar(lote, 'BLOQUEAR_LOTE', ...)
+  - UPDATEs em massa (inventário, movimentação por QR) não passam pelo flush: chamam
+    registrar_em_massa() na mesma transação, antes do UPDATE
+  - estado_em(lote, momento) parte do estado atual e desfaz os eventos
+    posteriores a momento (índice lote_id, criado_em, id)
+  - migrar_auditoria() explode os arrays antigos em eventos e compacta os
+    snapshots das movimentações (executar_manutencao_lote_eventos.py)
+"""
+import os
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import event, insert, update, inspect as sa_inspect
+from sqlalchemy.orm import Session
+
+from app.models import db, Lote, LoteEvento, MovimentacaoEstoque
+
+LOTE_EVENTOS_MIGRACAO_LOTE = int(os.getenv('LOTE_EVENTOS_MIGRACAO_LOTE', '500'))
+
+# colunas que não contam como alteração do lote
+CAMPOS_IGNORADOS = ('auditoria', 'data_atualizacao')
+CAMPOS_RASTREADOS = tuple(
+    atributo.key for atributo in sa_inspect(Lote).column_attrs if atributo.key not in CAMPOS_IGNORADOS
+)
+# chaves das entradas antigas de Lote.auditoria que viram colunas do evento
+_CHAVES_EVENTO = ('acao', 'usuario_id', 'usuario_nome', 'timestamp', 'ip', 'device_id', 'gps', 'dados_before',
+                  'detalhes')
+
+
+def _valor(valor):
+    """Valor de coluna como fica no JSON (datas em ISO, igual ao to_dict)."""
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    return valor
+
+
+def _usuario_id(valor):
+    # get_jwt_identity() devolve string
+    try:
+        return int(valor) if valor not in (None, '') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _usuario_atual():
+    try:
+        from flask_jwt_extended import get_jwt_identity
+        return _usuario_id(get_jwt_identity())
+    except Exception:
+        return None
+
+
+def registrar(lote, acao, usuario_id=None, detalhes=None, gps=None, device_id=None):
+    """
+    Dá nome (e detalhes) ao evento que o próximo flush grava para este lote.
+    As alterações saem do próprio lote; sem registrar(), o evento é gravado
+    como CRIACAO/ALTERACAO.
+    """
+    anotacoes = db.session.info.setdefault('lote_eventos', {})
+    anterior = anotacoes.get(id(lote), (lote, {}))[1]
+    anotacoes[id(lote)] = (lote, {
+        'acao': acao,
+        'usuario_id': _usuario_id(usuario_id) or anterior.get('usuario_id'),
+        'detalhes': {**anterior.get('detalhes', {}), **(detalhes or {})},
+        'gps': gps or anterior.get('gps'),
+        'device_id': device_id or anterior.get('device_id')
+    })
+
+
+def _guardar_anterior(alvo, valor, anterior, iniciador):
+    """
+    Não faz nada: o efeito está no registro com active_history=True, que faz
+    o SQLAlchemy carregar o valor antigo de uma coluna expirada (depois de um
+    commit) antes de atribuir o novo. Sem ele, o 'antes' do evento sairia
+    vazio. Não remover sem marcar as colunas com active_history no modelo.
+    """
+
+
+for _campo in CAMPOS_RASTREADOS:
+    event.listen(getattr(Lote, _campo), 'set', _guardar_anterior, active_history=True)
+
+
+def _alteracoes(lote, novo):
+    alteracoes = {}
+    estado = sa_inspect(lote)
+    # committed_state: só os atributos atribuídos desde o último flush
+    campos = CAMPOS_RASTREADOS if novo else [c for c in CAMPOS_RASTREADOS if c in estado.committed_state]
+    for campo in campos:
+        historico = estado.attrs[campo].history
+        if novo:
+            if historico.added and historico.added[0] is not None:
+                alteracoes[campo] = [None, _valor(historico.added[0])]
+            continue
+        if not historico.added:
+            continue
+        antes = historico.deleted[0] if historico.deleted else None
+        depois = historico.added[0]
+        if _valor(antes) != _valor(depois):
+            alteracoes[campo] = [_valor(antes), _valor(depois)]
+    if 'divergencias' in alteracoes:
+        # total_divergencias é recalculado durante o flush, depois deste evento
+        antes, depois = alteracoes['divergencias']
+        alteracoes['total_divergencias'] = [len(antes or []) if not novo else None, len(depois or [])]
+    return alteracoes
+
+
+@event.listens_for(Session, 'before_flush')
+def _gravar_eventos(session, flush_context, instancias):
+    anotacoes = session.info.pop('lote_eventos', {})
+    lotes = {id(obj): obj for obj in list(session.new) + list(session.dirty) if isinstance(obj, Lote)}
+    for chave, (lote, _) in anotacoes.items():
+        lotes.setdefault(chave, lote)
+
+    ip = request.remote_addr if has_request_context() else None
+    # session.new/deleted montam um conjunto novo a cada acesso: ler uma vez só
+    removidos = session.deleted
+    for chave, lote in lotes.items():
+        estado = sa_inspect(lote)
+        novo = estado.pending
+        if lote in removidos or estado.session_id != session.hash_key or not (novo or estado.persistent):
+            continue
+        anotacao = anotacoes.get(chave, (lote, None))[1]
+        alteracoes = _alteracoes(lote, novo)
+        if not alteracoes and anotacao is None:
+            continue
+        anotacao = anotacao or {}
+        session.add(LoteEvento(
+            lote=lote,
+            acao=anotacao.get('acao') or ('CRIACAO' if novo else 'ALTERACAO'),
+            usuario_id=anotacao.get('usuario_id') or _usuario_atual(),
+            criado_em=datetime.utcnow(),
+            ip=ip,
+            device_id=anotacao.get('device_id'),
+            gps=anotacao.get('gps'),
+            alteracoes=alteracoes,
+            detalhes=anotacao.get('detalhes') or None
+        ))
+
+
+def registrar_em_massa(filtros, valores, acao, usuario_id=None, detalhes=None, gps=None, device_id=None):
+    """
+    Eventos de um UPDATE em massa de lotes (que não passa pelo flush).
+    Chamar com os mesmos filtros e valores do UPDATE, antes dele e na mesma
+    transação; devolve quantos eventos gravou.
+    """
+    campos = list(valores)
+    depois = {campo: _valor(valores[campo]) for campo in campos}
+    agora = datetime.utcnow()
+    ip = request.remote_addr if has_request_context() else None
+    linhas = []
+    for lote_id, *atuais in db.session.query(Lote.id, *[getattr(Lote, c) for c in campos]).filter(*filtros):
+        alteracoes = {campo: [_valor(atual), depois[campo]]
+                      for campo, atual in zip(campos, atuais) if _valor(atual) != depois[campo]}
+        if alteracoes:
+            linhas.append({'lote_id': lote_id, 'acao': acao, 'usuario_id': _usuario_id(usuario_id),
+                           'criado_em': agora, 'ip': ip, 'device_id': device_id, 'gps': gps,
+                           'alteracoes': alteracoes, 'detalhes': detalhes})
+    if linhas:
+        db.session.execute(insert(LoteEvento.__table__), linhas)
+    return len(linhas)
+
+
+def estado_atual(lote):
+    return {campo: _valor(getattr(lote, campo)) for campo in CAMPOS_RASTREADOS}
+
+
+def estado_em(lote, momento):
+    """
+    Colunas do lote como estavam em momento (datetime UTC), desfazendo do
+    estado atual os eventos posteriores. Devolve (estado, eventos desfeitos);
+    estado None se o lote ainda não existia.
+    """
+    if lote.data_criacao and momento < lote.data_criacao:
+        return None, 0
+    estado = estado_atual(lote)
+    desfeitos = 0
+    posteriores = LoteEvento.query.filter(LoteEvento.lote_id == lote.id, LoteEvento.criado_em > momento) \
+        .order_by(LoteEvento.criado_em.desc(), LoteEvento.id.desc())
+    for evento in posteriores:
+        for campo, (antes, _) in (evento.alteracoes or {}).items():
+            if campo in estado:
+                estado[campo] = antes
+        desfeitos += 1
+    return estado, desfeitos
+
+
+# ---- migração do array Lote.auditoria ----
+
+def _data(valor, padrao):
+    try:
+        return datetime.fromisoformat(valor) if valor else padrao
+    except (TypeError, ValueError):
+        return padrao
+
+
+def _eventos_legados(lote_id, data_criacao, auditoria, estado):
+    """
+    Eventos de um array antigo, do mais novo para o mais antigo, partindo de
+    estado (o lote antes dos eventos novos). Onde a entrada tem o snapshot
+    'dados_before', a alteração é a diferença para o estado seguinte; nas
+    movimentações, a troca de localização; a entrada de criação recebe o
+    que restou do estado.
+    """
+    linhas = []
+    for posicao in range(len(auditoria) - 1, -1, -1):
+        entrada = auditoria[posicao]
+        if not isinstance(entrada, dict):
+            continue
+        acao = entrada.get('acao') or 'ALTERACAO'
+        alteracoes = {}
+        antes = entrada.get('dados_before')
+        if isinstance(antes, dict):
+            for campo in CAMPOS_RASTREADOS:
+                if campo in antes and antes[campo] != estado.get(campo):
+                    alteracoes[campo] = [antes[campo], estado.get(campo)]
+        elif 'localizacao_destino' in entrada:
+            alteracoes['localizacao_atual'] = [entrada.get('localizacao_origem'), entrada['localizacao_destino']]
+        elif posicao == 0 and 'CRIADO' in acao:
+            alteracoes = {campo: [None, valor] for campo, valor in estado.items() if valor is not None}
+        for campo, (valor_antes, _) in alteracoes.items():
+            estado[campo] = valor_antes
+
+        detalhes = dict(entrada.get('detalhes') or {}) if isinstance(entrada.get('detalhes'), dict) else {}
+        detalhes.update({chave: valor for chave, valor in entrada.items() if chave not in _CHAVES_EVENTO})
+        if entrada.get('usuario_nome'):
+            detalhes['usuario_nome'] = entrada['usuario_nome']
+        linhas.append({
+            'lote_id': lote_id,
+            'acao': acao[:50],
+            'usuario_id': _usuario_id(entrada.get('usuario_id')),
+            'criado_em': _data(entrada.get('timestamp'), data_criacao),
+            'ip': entrada.get('ip'),
+            'device_id': entrada.get('device_id'),
+            'gps': entrada.get('gps'),
+            'alteracoes': alteracoes,
+            'detalhes': detalhes or None
+        })
+    linhas.reverse()
+    return linhas
+
+
+def _compactar(antes, depois):
+    """Par de snapshots completos (to_dict) -> só as chaves que mudaram; None se não é snapshot."""
+    if not isinstance(depois, dict) or 'id' not in depois or 'numero_lote' not in depois:
+        return None
+    if isinstance(antes, dict) and 'id' in antes and 'numero_lote' in antes:
+        campos = [c for c in depois if antes.get(c) != depois.get(c)]
+        return {c: antes.get(c) for c in campos}, {c: depois.get(c) for c in campos}
+    # reversão: o antes já é pequeno, o depois era o lote inteiro
+    return antes, {'localizacao_atual': depois.get('localizacao_atual')}
+
+
+def migrar_auditoria(tamanho=None):
+    """
+    Explode Lote.auditoria em lote_eventos (e esvazia o array) e compacta os
+    snapshots de MovimentacaoEstoque, por faixas de ids com um commit por
+    faixa. Pode ser rodada de novo: só pega o que ainda não foi migrado.
+    Devolve {'lotes', 'eventos', 'movimentacoes'}.
+    """
+    tamanho = tamanho or LOTE_EVENTOS_MIGRACAO_LOTE
+    resumo = {'lotes': 0, 'eventos': 0, 'movimentacoes': 0}
+
+    ultimo = 0
+    while True:
+        lotes = Lote.query.filter(Lote.id > ultimo).order_by(Lote.id).limit(tamanho).all()
+        if not lotes:
+            break
+        ultimo = lotes[-1].id
+        com_auditoria = [lote for lote in lotes if lote.auditoria]
+        if com_auditoria:
+            # eventos já gravados pelo caminho novo vêm depois do array: desfeitos primeiro
+            novos = {}
+            for evento in LoteEvento.query.filter(LoteEvento.lote_id.in_([l.id for l in com_auditoria])) \
+                    .order_by(LoteEvento.criado_em.desc(), LoteEvento.id.desc()):
+                novos.setdefault(evento.lote_id, []).append(evento.alteracoes or {})
+            linhas = []
+            for lote in com_auditoria:
+                estado = estado_atual(lote)
+                for alteracoes in novos.get(lote.id, []):
+                    for campo, (antes, _) in alteracoes.items():
+                        if campo in estado:
+                            estado[campo] = antes
+                linhas.extend(_eventos_legados(lote.id, lote.data_criacao, lote.auditoria, estado))
+            if linhas:
+                db.session.execute(insert(LoteEvento.__table__), linhas)
+            # data_atualizacao explícita: esvaziar o array não é uma alteração do lote
+            db.session.execute(
+                update(Lote).where(Lote.id.in_([l.id for l in com_auditoria]))
+                .values(auditoria=[], data_atualizacao=Lote.data_atualizacao)
+                .execution_options(synchronize_session=False)
+            )
+            resumo['lotes'] += len(com_auditoria)
+            resumo['eventos'] += len(linhas)
+        db.session.commit()
+        db.session.expunge_all()
+
+    ultimo = 0
+    while True:
+        movimentacoes = db.session.query(
+            MovimentacaoEstoque.id, MovimentacaoEstoque.dados_before, MovimentacaoEstoque.dados_after
+        ).filter(MovimentacaoEstoque.id > ultimo).order_by(MovimentacaoEstoque.id).limit(tamanho).all()
+        if not movimentacoes:
+            break
+        ultimo = movimentacoes[-1].id
+        for mov_id, antes, depois in movimentacoes:
+            compacto = _compactar(antes, depois)
+            if compacto is None:
+                continue
+            db.session.execute(
+                update(MovimentacaoEstoque).where(MovimentacaoEstoque.id == mov_id)
+                .values(dados_before=compacto[0], dados_after=compacto[1])
+                .execution_options(synchronize_session=False)
+            )
+            resumo['movimentacoes'] += 1
+        db.session.commit()
+    return resumo
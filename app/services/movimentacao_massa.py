@@ -0,0 +1,110 @@
+"""
+Movimentação de vários lotes de uma vez, a partir dos números lidos por QR code.
+
+POST /api/wms/lotes/<id>/movimentar move um lote por requisição (consulta do
+usuário, leitura do lote e um commit cada): um palete com dezenas de lotes
+eram dezenas de requisições e de transações. Aqui a lista lida no coletor:
+
+  - é validada numa consulta só (numero_lote IN (...), com FOR UPDATE no
+    PostgreSQL para ninguém bloquear um lote entre a validação e o UPDATE)
+  - vira, numa transação, um INSERT em massa de MovimentacaoEstoque, os
+    eventos de lote_eventos e um UPDATE de localizacao_atual
+  - devolve o resultado de cada número lido, na ordem da leitura: movido,
+    nao_encontrado, bloqueado, ja_no_destino ou duplicado
+
+O UPDATE em massa não passa pelos eventos por lote de tempo_real: no fim vai
+um único 'lote_atualizado' para as telas de lotes buscarem o delta.
+"""
+import os
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import insert, update
+
+from app.models import db, Lote, MovimentacaoEstoque
+from app.services import lote_eventos
+
+MOVIMENTACAO_MASSA_MAXIMO = int(os.getenv('MOVIMENTACAO_MASSA_MAXIMO', '2000'))
+
+
+def _emitir(dados):
+    try:
+        from app import socketio
+        if socketio.server is None:
+            return
+        socketio.emit('lote_atualizado', dados, to='admins')
+    except Exception as e:
+        print(f"[MOVIMENTACAO] Erro ao emitir lote_atualizado: {e}")
+
+
+def movimentar(numeros, destino, usuario_id, usuario_nome=None, tipo='transferencia', observacoes='', gps=None,
+               device_id=None):
+    """
+    Move para destino os lotes de numeros (lista de numero_lote). Devolve
+    (resultados, movidos): um dicionário por número lido, na mesma ordem.
+    """
+    lidos = [str(numero).strip() for numero in numeros]
+    unicos = list(dict.fromkeys(numero for numero in lidos if numero))
+    encontrados = {}
+    if unicos:
+        linhas = db.session.query(Lote.id, Lote.numero_lote, Lote.localizacao_atual, Lote.bloqueado) \
+            .filter(Lote.numero_lote.in_(unicos)).with_for_update()
+        encontrados = {linha.numero_lote: linha for linha in linhas}
+
+    resultados, a_mover, vistos = [], [], set()
+    for numero in lidos:
+        lote = encontrados.get(numero)
+        if numero in vistos:
+            resultado = {'numero_lote': numero, 'resultado': 'duplicado'}
+        elif lote is None:
+            resultado = {'numero_lote': numero, 'resultado': 'nao_encontrado'}
+        elif lote.bloqueado:
+            resultado = {'numero_lote': numero, 'lote_id': lote.id, 'resultado': 'bloqueado'}
+        elif lote.localizacao_atual == destino:
+            resultado = {'numero_lote': numero, 'lote_id': lote.id, 'resultado': 'ja_no_destino'}
+        else:
+            resultado = {'numero_lote': numero, 'lote_id': lote.id, 'resultado': 'movido',
+                         'localizacao_origem': lote.localizacao_atual}
+            a_mover.append(lote)
+        vistos.add(numero)
+        resultados.append(resultado)
+
+    if a_mover:
+        ids = [lote.id for lote in a_mover]
+        agora = datetime.utcnow()
+        auditoria = [{
+            'usuario_id': usuario_id,
+            'usuario_nome': usuario_nome or 'Desconhecido',
+            'timestamp': agora.isoformat(),
+            'ip': request.remote_addr if has_request_context() else None,
+            'gps': gps,
+            'device_id': device_id,
+            'em_massa': True
+        }]
+        lote_eventos.registrar_em_massa([Lote.id.in_(ids)], {'localizacao_atual': destino}, 'MOVIMENTACAO',
+                                        usuario_id, {'tipo': tipo, 'em_massa': True}, gps=gps, device_id=device_id)
+        db.session.execute(insert(MovimentacaoEstoque.__table__), [{
+            'lote_id': lote.id,
+            'tipo': tipo,
+            'localizacao_origem': lote.localizacao_atual,
+            'localizacao_destino': destino,
+            'usuario_id': usuario_id,
+            'data_movimentacao': agora,
+            'observacoes': observacoes,
+            'dados_before': {'localizacao_atual': lote.localizacao_atual},
+            'dados_after': {'localizacao_atual': destino},
+            'auditoria': auditoria
+        } for lote in a_mover])
+        db.session.execute(
+            update(Lote).where(Lote.id.in_(ids)).values(localizacao_atual=destino)
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+
+    if a_mover:
+        _emitir({
+            'tipo': 'lote', 'id': None, 'campos': ['localizacao_atual'], 'em_massa': True,
+            'localizacao_destino': destino, 'total': len(a_mover),
+            'atualizado_em': datetime.utcnow().isoformat()
+        })
+    return resultados, len(a_mover)
@@ -0,0 +1,462 @@
+"""
+Envio de notificações para grupos de usuários (admins, financeiro, conferentes).
+
+Antes cada rota consultava a lista de admins e fazia db.session.add de uma
+Notificacao por usuário, e o flush gerava um INSERT por linha dentro da
+transação da requisição. Agora:
+
+  - os destinatários de cada grupo vêm de um índice papel -> usuários em
+    memória, montado com uma consulta só e refeito quando um usuário muda de
+    tipo/perfil/ativo (versão 'destinatarios' em estado_compartilhado, como o
+    índice de fornecedores) ou depois de NOTIFICACOES_INDICE_TTL segundos
+  - as notificações são gravadas com um insert em lote (executemany)
+  - depois do commit sai um único evento 'nova_notificacao' para a sala do
+    grupo ('grupo_<nome>', aberta em handle_connect), em vez de um por usuário
+  - com mais de NOTIFICACOES_ADIAR_ACIMA destinatários (ou adiar=True) o
+    insert e o evento vão para uma thread em segundo plano depois do commit;
+    a requisição não espera e um rollback descarta o envio
+
+Caixa de entrada:
+
+  - listar() pagina por (data_envio, id) decrescente com cursor (keyset), no
+    índice ix_notificacoes_usuario_data_id; sem OFFSET, a página 100 custa o
+    mesmo que a primeira
+  - o total de não lidas fica em notificacoes_nao_lidas, somado no insert
+    (em lote ou pelo ORM) e subtraído quando a notificação é lida; a linha do
+    usuário é criada com um count() na primeira consulta
+  - executar_retencao() move as lidas com mais de NOTIFICACOES_RETENCAO_DIAS
+    para notificacoes_arquivadas e recalcula os contadores que divergirem
+
+    notificacoes.notificar('admins', 'Fornecedor Fechado', 'OS 123: ...', tipo='alerta_motorista')
+    notificacoes.notificar([usuario_id], 'Solicitação Aprovada', '...')
+"""
+import os
+import time
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import event, insert, update, delete, select, func, literal, inspect
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+
+from app.models import db, Usuario, Perfil, Notificacao, NotificacaoContador, NotificacaoArquivada
+from app.services import estado_compartilhado
+
+NOTIFICACOES_INDICE_TTL = int(os.getenv('NOTIFICACOES_INDICE_TTL', 300))
+NOTIFICACOES_ADIAR_ACIMA = int(os.getenv('NOTIFICACOES_ADIAR_ACIMA', 200))
+NOTIFICACOES_LOTE = int(os.getenv('NOTIFICACOES_LOTE', 1000))
+NOTIFICACOES_WORKERS = int(os.getenv('NOTIFICACOES_WORKERS', 1))
+NOTIFICACOES_PAGINA = int(os.getenv('NOTIFICACOES_PAGINA', 50))
+NOTIFICACOES_PAGINA_MAXIMA = 200
+NOTIFICACOES_RETENCAO_DIAS = int(os.getenv('NOTIFICACOES_RETENCAO_DIAS', 90))
+NOTIFICACOES_RETENCAO_LOTE = int(os.getenv('NOTIFICACOES_RETENCAO_LOTE', 5000))
+
+# grupo -> regra sobre (tipo do usuário, nome do perfil)
+GRUPOS = {
+    'admins': lambda tipo, perfil: tipo == 'admin' or perfil == 'Administrador',
+    'financeiro': lambda tipo, perfil: tipo == 'admin' or perfil in ('Administrador', 'Financeiro'),
+    'conferentes': lambda tipo, perfil: perfil in ('Conferente / Estoque', 'Administrador'),
+    'todos': lambda tipo, perfil: True,
+}
+
+_CHAVE_EMISSOES = 'notificacoes_emissoes'
+_CHAVE_ADIADAS = 'notificacoes_adiadas'
+
+
+def sala_do_grupo(grupo):
+    return f'grupo_{grupo}'
+
+
+class IndiceDestinatarios:
+    def __init__(self, ttl=NOTIFICACOES_INDICE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._membros = {}
+        self._grupos_usuario = {}
+        self._construido_em = 0.0
+        self._desatualizado = True
+        self._versao = 0
+        self.reconstrucoes = 0
+        self.ultima_reconstrucao_ms = 0.0
+
+    def marcar_desatualizado(self):
+        self._desatualizado = True
+
+    def _atualizado(self, versao):
+        return (not self._desatualizado and versao == self._versao
+                and time.monotonic() - self._construido_em < self.ttl)
+
+    def _garantir(self):
+        versao = estado_compartilhado.versao('destinatarios')
+        if self._atualizado(versao):
+            return
+        with self._lock:
+            if self._atualizado(versao):
+                return
+            inicio = time.perf_counter()
+            self._desatualizado = False
+            self._versao = versao
+            linhas = db.session.query(Usuario.id, Usuario.tipo, Perfil.nome).outerjoin(
+                Perfil, Usuario.perfil_id == Perfil.id
+            ).filter(Usuario.ativo == True).order_by(Usuario.id).all()
+            membros = {grupo: [] for grupo in GRUPOS}
+            grupos_usuario = {}
+            for usuario_id, tipo, perfil in linhas:
+                for grupo, regra in GRUPOS.items():
+                    if regra(tipo, perfil):
+                        membros[grupo].append(usuario_id)
+                        grupos_usuario.setdefault(usuario_id, []).append(grupo)
+            self._membros = {grupo: tuple(ids) for grupo, ids in membros.items()}
+            self._grupos_usuario = grupos_usuario
+            self._construido_em = time.monotonic()
+            self.reconstrucoes += 1
+            self.ultima_reconstrucao_ms = (time.perf_counter() - inicio) * 1000
+
+    def membros(self, grupo):
+        if grupo not in GRUPOS:
+            raise ValueError(f'Grupo de notificação desconhecido: {grupo}')
+        self._garantir()
+        return self._membros[grupo]
+
+    def grupos_do_usuario(self, usuario_id):
+        self._garantir()
+        return list(self._grupos_usuario.get(int(usuario_id), ()))
+
+    def stats(self):
+        return {
+            'grupos': {grupo: len(ids) for grupo, ids in self._membros.items()},
+            'reconstrucoes': self.reconstrucoes,
+            'ultima_reconstrucao_ms': round(self.ultima_reconstrucao_ms, 2),
+            'versao': self._versao,
+            'ttl_segundos': self.ttl
+        }
+
+
+indice_destinatarios = IndiceDestinatarios()
+
+
+class Notificador:
+    def __init__(self, workers=NOTIFICACOES_WORKERS):
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notificacoes')
+        self.envios = 0
+        self.notificacoes = 0
+        self.adiados = 0
+        self.eventos = 0
+        self.erros = 0
+        self.ultimo_erro = None
+        self.tempo_insert_ms = 0.0
+
+    def _contar(self, **valores):
+        with self._lock:
+            for nome, valor in valores.items():
+                setattr(self, nome, getattr(self, nome) + valor)
+
+    def erro(self, e):
+        with self._lock:
+            self.erros += 1
+            self.ultimo_erro = str(e)
+
+    def inserir(self, sessao, envio):
+        inicio = time.perf_counter()
+        agora = datetime.utcnow()
+        linhas = [{
+            'usuario_id': usuario_id,
+            'titulo': envio['titulo'],
+            'mensagem': envio['mensagem'],
+            'tipo': envio['tipo'],
+            'lida': False,
+            'data_envio': agora
+        } for usuario_id in envio['ids']]
+        for i in range(0, len(linhas), NOTIFICACOES_LOTE):
+            sessao.execute(insert(Notificacao), linhas[i:i + NOTIFICACOES_LOTE])
+            # o insert em lote não passa pelos eventos do ORM: soma aqui
+            _somar_nao_lidas(sessao, envio['ids'][i:i + NOTIFICACOES_LOTE], 1)
+        self._contar(envios=1, notificacoes=len(linhas), tempo_insert_ms=(time.perf_counter() - inicio) * 1000)
+
+    def emitir(self, envio):
+        from app import socketio
+        if socketio.server is None:
+            return
+        dados = {'tipo': envio['tipo'], 'titulo': envio['titulo']}
+        dados.update(envio['dados'] or {})
+        socketio.emit('nova_notificacao', dados, to=envio['sala'])
+        self._contar(eventos=1)
+
+    def agendar(self, app, envio):
+        self._contar(adiados=1)
+        self._executor.submit(self._executar_adiado, app, envio)
+
+    def _executar_adiado(self, app, envio):
+        try:
+            with app.app_context():
+                self.inserir(db.session, envio)
+                db.session.commit()
+            self.emitir(envio)
+        except Exception as e:
+            self.erro(e)
+            print(f"[NOTIFICACOES] Erro no envio em segundo plano para {len(envio['ids'])} usuário(s): {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'envios': self.envios,
+                'notificacoes': self.notificacoes,
+                'adiados': self.adiados,
+                'eventos': self.eventos,
+                'erros': self.erros,
+                'ultimo_erro': self.ultimo_erro,
+                'tempo_insert_ms': round(self.tempo_insert_ms, 2),
+                'adiar_acima': NOTIFICACOES_ADIAR_ACIMA
+            }
+
+
+notificador = Notificador()
+
+
+def _resolver(destino, excluir):
+    excluir = {int(u) for u in excluir if u is not None}
+    if isinstance(destino, str):
+        ids = indice_destinatarios.membros(destino)
+        sala = sala_do_grupo(destino)
+    else:
+        ids = list(dict.fromkeys(int(u) for u in destino if u is not None))
+        sala = [f'user_{u}' for u in ids if u not in excluir]
+    return [u for u in ids if u not in excluir], sala
+
+
+def notificar(destino, titulo, mensagem, tipo=None, excluir=(), dados=None, adiar=None):
+    """
+    Cria uma notificação para cada destinatário e avisa por Socket.IO depois do commit.
+
+    destino: nome de um grupo de GRUPOS ou lista de ids de usuário.
+    excluir: ids que não recebem (ex.: quem fez a ação).
+    dados: campos extras do evento 'nova_notificacao'.
+    adiar: grava em segundo plano depois do commit; None decide pelo número de
+    destinatários. Devolve quantas notificações foram criadas ou agendadas.
+    """
+    ids, sala = _resolver(destino, excluir)
+    if not ids:
+        return 0
+    envio = {'ids': ids, 'sala': sala, 'titulo': titulo, 'mensagem': mensagem, 'tipo': tipo, 'dados': dados}
+    if adiar is None:
+        adiar = len(ids) > NOTIFICACOES_ADIAR_ACIMA
+    if adiar:
+        envio['app'] = current_app._get_current_object()
+        db.session.info.setdefault(_CHAVE_ADIADAS, []).append(envio)
+    else:
+        notificador.inserir(db.session, envio)
+        db.session.info.setdefault(_CHAVE_EMISSOES, []).append(envio)
+    return len(ids)
+
+
+def salas_do_usuario(usuario_id):
+    """Salas de grupo em que o usuário entra ao conectar no Socket.IO."""
+    return [sala_do_grupo(grupo) for grupo in indice_destinatarios.grupos_do_usuario(usuario_id)]
+
+
+def _apos_commit(session):
+    for envio in session.info.pop(_CHAVE_EMISSOES, ()):
+        try:
+            notificador.emitir(envio)
+        except Exception as e:
+            notificador.erro(e)
+            print(f"[NOTIFICACOES] Erro ao emitir evento: {e}")
+    for envio in session.info.pop(_CHAVE_ADIADAS, ()):
+        notificador.agendar(envio.pop('app'), envio)
+
+
+def _descartar(session):
+    session.info.pop(_CHAVE_EMISSOES, None)
+    session.info.pop(_CHAVE_ADIADAS, None)
+
+
+CAMPOS_MONITORADOS = {Usuario: ('tipo', 'perfil_id', 'ativo'), Perfil: ('nome',)}
+
+
+def _marcar_desatualizado(mapper, connection, target):
+    indice_destinatarios.marcar_desatualizado()
+    sessao = object_session(target)
+    if sessao is not None:
+        sessao.info['destinatarios_alterados'] = True
+
+
+def _conferir_alteracao(mapper, connection, target):
+    # foto, telefone etc. não mudam os grupos
+    estado = inspect(target)
+    if any(estado.attrs[campo].history.has_changes() for campo in CAMPOS_MONITORADOS[type(target)]):
+        _marcar_desatualizado(mapper, connection, target)
+
+
+def _publicar_versao(session):
+    if session.info.pop('destinatarios_alterados', False):
+        estado_compartilhado.nova_versao('destinatarios')
+
+
+def _descartar_alteracao(session):
+    session.info.pop('destinatarios_alterados', None)
+
+
+for _modelo in CAMPOS_MONITORADOS:
+    event.listen(_modelo, 'after_insert', _marcar_desatualizado)
+    event.listen(_modelo, 'after_update', _conferir_alteracao)
+    event.listen(_modelo, 'after_delete', _marcar_desatualizado)
+event.listen(Session, 'after_commit', _apos_commit)
+event.listen(Session, 'after_commit', _publicar_versao)
+event.listen(Session, 'after_rollback', _descartar)
+event.listen(Session, 'after_rollback', _descartar_alteracao)
+
+
+# ---------------------------------------------------------------------------
+# Caixa de entrada
+# ---------------------------------------------------------------------------
+
+def montar_cursor(notificacao):
+    return f'{notificacao.data_envio.isoformat()}_{notificacao.id}'
+
+
+def ler_cursor(valor):
+    """Converte ?cursor=<data_envio>_<id> em (data_envio, id); ValueError se inválido."""
+    try:
+        data_envio, notificacao_id = valor.rsplit('_', 1)
+        return datetime.fromisoformat(data_envio), int(notificacao_id)
+    except (AttributeError, ValueError):
+        raise ValueError('Parâmetro cursor inválido, use o cursor devolvido pela página anterior')
+
+
+def listar(usuario_id, limite=None, cursor=None):
+    """Uma página da caixa de entrada, mais recentes primeiro; devolve (notificacoes, proximo_cursor)."""
+    limite = min(max(int(limite or NOTIFICACOES_PAGINA), 1), NOTIFICACOES_PAGINA_MAXIMA)
+    consulta = Notificacao.query.filter(Notificacao.usuario_id == usuario_id)
+    if cursor:
+        data_envio, ultimo_id = ler_cursor(cursor)
+        consulta = consulta.filter(db.tuple_(Notificacao.data_envio, Notificacao.id) < (data_envio, ultimo_id))
+    notificacoes = consulta.order_by(
+        Notificacao.data_envio.desc(), Notificacao.id.desc()
+    ).limit(limite + 1).all()
+    if len(notificacoes) <= limite:
+        return notificacoes, None
+    notificacoes = notificacoes[:limite]
+    return notificacoes, montar_cursor(notificacoes[-1])
+
+
+def _somar_nao_lidas(executor, usuario_ids, delta):
+    if not usuario_ids or not delta:
+        return
+    contadores = NotificacaoContador.__table__
+    executor.execute(update(contadores).where(
+        contadores.c.usuario_id.in_(usuario_ids)
+    ).values(total=contadores.c.total + delta))
+
+
+def recalcular_nao_lidas(usuario_id):
+    """Cria (ou corrige) a linha do contador com um count() das não lidas."""
+    total = Notificacao.query.filter_by(usuario_id=usuario_id, lida=False).count()
+    contador = db.session.get(NotificacaoContador, usuario_id)
+    if contador is None:
+        db.session.add(NotificacaoContador(usuario_id=usuario_id, total=total))
+    else:
+        contador.total = total
+        contador.recalculado_em = datetime.utcnow()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # outra requisição criou a linha ao mesmo tempo
+        db.session.rollback()
+    return total
+
+
+def contar_nao_lidas(usuario_id):
+    total = db.session.query(NotificacaoContador.total).filter_by(usuario_id=usuario_id).scalar()
+    if total is None:
+        return recalcular_nao_lidas(usuario_id)
+    return max(total, 0)
+
+
+def marcar_todas_lidas(usuario_id):
+    """Um UPDATE só nas não lidas do usuário; devolve quantas foram marcadas."""
+    marcadas = db.session.execute(
+        update(Notificacao.__table__).where(
+            Notificacao.__table__.c.usuario_id == usuario_id,
+            Notificacao.__table__.c.lida == False
+        ).values(lida=True)
+    ).rowcount
+    # subtrai o que foi marcado em vez de zerar: uma notificação que chegou
+    # depois do UPDATE continua contada
+    _somar_nao_lidas(db.session, [usuario_id], -marcadas)
+    db.session.commit()
+    return marcadas
+
+
+def _contar_insert(mapper, connection, target):
+    if not target.lida:
+        _somar_nao_lidas(connection, [target.usuario_id], 1)
+
+
+def _contar_update(mapper, connection, target):
+    historico = inspect(target).attrs.lida.history
+    if historico.has_changes():
+        _somar_nao_lidas(connection, [target.usuario_id], -1 if target.lida else 1)
+
+
+def _contar_delete(mapper, connection, target):
+    if not target.lida:
+        _somar_nao_lidas(connection, [target.usuario_id], -1)
+
+
+event.listen(Notificacao, 'after_insert', _contar_insert)
+event.listen(Notificacao, 'after_update', _contar_update)
+event.listen(Notificacao, 'after_delete', _contar_delete)
+
+
+def reconciliar_contadores():
+    """Recalcula, num UPDATE só, os contadores que divergem da contagem real; devolve quantos mudaram."""
+    contadores = NotificacaoContador.__table__
+    notificacoes = Notificacao.__table__
+    real = select(func.count()).where(
+        notificacoes.c.usuario_id == contadores.c.usuario_id,
+        notificacoes.c.lida == False
+    ).scalar_subquery()
+    corrigidos = db.session.execute(
+        update(contadores).where(contadores.c.total != real).values(total=real, recalculado_em=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    return corrigidos
+
+
+def executar_retencao(retencao_dias=NOTIFICACOES_RETENCAO_DIAS, lote=NOTIFICACOES_RETENCAO_LOTE, hoje=None):
+    """Move as notificações lidas mais antigas que retencao_dias para notificacoes_arquivadas."""
+    limite = (hoje or datetime.utcnow()) - timedelta(days=retencao_dias)
+    notificacoes = Notificacao.__table__
+    notificacoes_arquivadas = NotificacaoArquivada.__table__
+    colunas = ('id', 'usuario_id', 'titulo', 'mensagem', 'tipo', 'data_envio')
+    total = 0
+    while True:
+        ids = [notificacao_id for (notificacao_id,) in db.session.query(Notificacao.id).filter(
+            Notificacao.lida == True,
+            Notificacao.data_envio < limite
+        ).order_by(Notificacao.id).limit(lote)]
+        if not ids:
+            break
+        try:
+            db.session.execute(insert(notificacoes_arquivadas).from_select(
+                list(colunas) + ['arquivada_em'],
+                select(*[notificacoes.c[c] for c in colunas], literal(datetime.utcnow())).where(
+                    notificacoes.c.id.in_(ids))
+            ))
+            # só lidas: o contador de não lidas não muda
+            db.session.execute(delete(notificacoes).where(notificacoes.c.id.in_(ids)))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        total += len(ids)
+    return {'arquivadas': total, 'limite': limite.isoformat(), 'contadores_corrigidos': reconciliar_contadores()}
+
+
+def get_notificacoes_stats():
+    stats = notificador.stats()
+    stats['indice'] = indice_destinatarios.stats()
+    return stats
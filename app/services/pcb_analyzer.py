@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
 import base64
+import io
 
 LOW_DENSITY_THRESHOLD = 0.00002
 HIGH_DENSITY_THRESHOLD = 0.00008
@@ -9,6 +10,115 @@ MIN_BOARD_RATIO = 0.05
 
 MIN_COMPONENT_AREA = 30
 MAX_COMPONENT_AREA = 80000
+LARGE_COMPONENT_AREA = 1000
+
+# Resolução máxima de trabalho. Fotos de celular (12-50 MP) são reduzidas
+# para este limite antes da análise; todas as constantes em pixels acima
+# são definidas na resolução original e reescaladas em tempo de execução.
+MAX_WORKING_PIXELS = 3_000_000
+
+# Faixas HSV (H, S, V) consideradas como substrato da placa.
+# verde (2 faixas), marrom, azul, amarelo e vermelho (2 faixas)
+BOARD_HSV_RANGES = [
+    ((35, 20, 20), (90, 255, 255)),
+    ((70, 15, 15), (100, 255, 255)),
+    ((8, 20, 20), (35, 255, 220)),
+    ((95, 20, 20), (135, 255, 255)),
+    ((15, 40, 40), (40, 255, 255)),
+    ((0, 30, 30), (10, 255, 255)),
+    ((160, 30, 30), (180, 255, 255)),
+]
+
+_board_lut = None
+
+
+def _get_board_lut():
+    """
+    Retorna a tabela de consulta HSV -> máscara da placa (0 ou 255).
+    A tabela é indexada por (H << 16) | (S << 8) | V e é construída uma única
+    vez por processo a partir de BOARD_HSV_RANGES, substituindo os sete
+    cv2.inRange e seis bitwise_or por uma única consulta.
+    """
+    global _board_lut
+    if _board_lut is None:
+        lut = np.zeros((256, 256, 256), dtype=np.uint8)
+        for (h_min, s_min, v_min), (h_max, s_max, v_max) in BOARD_HSV_RANGES:
+            lut[h_min:h_max + 1, s_min:s_max + 1, v_min:v_max + 1] = 255
+        _board_lut = lut.reshape(-1)
+    return _board_lut
+
+
+def _decode_image_bytes(image_data):
+    if isinstance(image_data, bytes):
+        return image_data
+    if isinstance(image_data, str):
+        if image_data.startswith('data:image'):
+            base64_data = image_data.split(',')[1] if ',' in image_data else image_data
+            return base64.b64decode(base64_data)
+        return base64.b64decode(image_data)
+    return None
+
+
+def _read_image_size(image_bytes):
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(image_bytes)) as pil_img:
+            return pil_img.size
+    except Exception:
+        return None
+
+
+def _load_working_image(image_bytes):
+    """
+    Decodifica a imagem já limitada a MAX_WORKING_PIXELS.
+    Para JPEGs grandes usa a decodificação reduzida do libjpeg (1/2, 1/4, 1/8)
+    e completa com INTER_AREA. Retorna (img, largura_original, altura_original).
+    """
+    nparr = np.frombuffer(image_bytes, np.uint8)
+
+    size = _read_image_size(image_bytes)
+    flag = cv2.IMREAD_COLOR
+    if size:
+        orig_pixels = size[0] * size[1]
+        for reduced_flag, factor in ((cv2.IMREAD_REDUCED_COLOR_8, 8),
+                                     (cv2.IMREAD_REDUCED_COLOR_4, 4),
+                                     (cv2.IMREAD_REDUCED_COLOR_2, 2)):
+            if orig_pixels / (factor * factor) >= MAX_WORKING_PIXELS:
+                flag = reduced_flag
+                break
+
+    img = cv2.imdecode(nparr, flag)
+    if img is None:
+        return None, 0, 0
+
+    if size:
+        orig_width, orig_height = size
+    else:
+        orig_height, orig_width = img.shape[:2]
+
+    height, width = img.shape[:2]
+    if height * width > MAX_WORKING_PIXELS:
+        factor = (MAX_WORKING_PIXELS / float(height * width)) ** 0.5
+        new_size = (max(1, int(width * factor)), max(1, int(height * factor)))
+        img = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+
+    return img, orig_width, orig_height
+
+
+def _scaled_odd_size(size, scale):
+    """Converte um tamanho de kernel da resolução original para a de trabalho (ímpar, >= 3)."""
+    return max(3, 2 * int(np.ceil((size * scale - 1) / 2.0)) + 1)
+
+
+def _scaled_morphology(mask, operation, size, scale):
+    """
+    Aplica uma operação morfológica cujo elemento estruturante quadrado tem
+    `size` pixels na resolução original (ex.: 5x5 com 2 iterações = 9x9).
+    """
+    size = _scaled_odd_size(size, scale)
+    kernel = np.ones((size, size), np.uint8)
+    return cv2.morphologyEx(mask, operation, kernel)
+
 
 def analyze_pcb_image(image_data) -> dict:
     """
@@ -19,17 +129,15 @@ def analyze_pcb_image(image_data) -> dict:
       - grade: 'LOW' | 'MEDIUM' | 'HIGH' ou None se placa não detectada
       - board_detected: bool indicando se uma placa foi detectada
       - debug: campos auxiliares para depuração
+
+    A análise roda numa resolução de trabalho limitada (MAX_WORKING_PIXELS).
+    Áreas, kernels e limiares de densidade são reescalados pela razão entre a
+    resolução de trabalho e a original, de modo que density_score continua
+    expresso em componentes por pixel da imagem original.
     """
     try:
-        if isinstance(image_data, bytes):
-            image_bytes = image_data
-        elif isinstance(image_data, str):
-            if image_data.startswith('data:image'):
-                base64_data = image_data.split(',')[1] if ',' in image_data else image_data
-                image_bytes = base64.b64decode(base64_data)
-            else:
-                image_bytes = base64.b64decode(image_data)
-        else:
+        image_bytes = _decode_image_bytes(image_data)
+        if image_bytes is None:
             return {
                 'components_count': 0,
                 'density_score': 0.0,
@@ -38,8 +146,7 @@ def analyze_pcb_image(image_data) -> dict:
                 'error': 'Formato de imagem inválido'
             }
         
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img, width, height = _load_working_image(image_bytes)
         
         if img is None:
             return {
@@ -50,52 +157,23 @@ def analyze_pcb_image(image_data) -> dict:
                 'error': 'Não foi possível decodificar a imagem'
             }
         
-        height, width = img.shape[:2]
         total_pixels = height * width
+        work_height, work_width = img.shape[:2]
+        work_pixels = work_height * work_width
+        area_scale = work_pixels / float(max(total_pixels, 1))
+        linear_scale = area_scale ** 0.5
         
         hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+        h, s, v = cv2.split(hsv)
+        lut_index = (h.astype(np.uint32) << 16) | (s.astype(np.uint32) << 8) | v
+        pcb_mask = _get_board_lut().take(lut_index)
         
-        lower_green1 = np.array([35, 20, 20])
-        upper_green1 = np.array([90, 255, 255])
-        
-        lower_green2 = np.array([70, 15, 15])
-        upper_green2 = np.array([100, 255, 255])
-        
-        lower_brown = np.array([8, 20, 20])
-        upper_brown = np.array([35, 255, 220])
-        
-        lower_blue = np.array([95, 20, 20])
-        upper_blue = np.array([135, 255, 255])
-        
-        lower_yellow = np.array([15, 40, 40])
-        upper_yellow = np.array([40, 255, 255])
+        pcb_mask = _scaled_morphology(pcb_mask, cv2.MORPH_CLOSE, 9, linear_scale)
+        pcb_mask = _scaled_morphology(pcb_mask, cv2.MORPH_OPEN, 5, linear_scale)
         
-        lower_red1 = np.array([0, 30, 30])
-        upper_red1 = np.array([10, 255, 255])
-        lower_red2 = np.array([160, 30, 30])
-        upper_red2 = np.array([180, 255, 255])
-        
-        mask_green1 = cv2.inRange(hsv, lower_green1, upper_green1)
-        mask_green2 = cv2.inRange(hsv, lower_green2, upper_green2)
-        mask_brown = cv2.inRange(hsv, lower_brown, upper_brown)
-        mask_blue = cv2.inRange(hsv, lower_blue, upper_blue)
-        mask_yellow = cv2.inRange(hsv, lower_yellow, upper_yellow)
-        mask_red1 = cv2.inRange(hsv, lower_red1, upper_red1)
-        mask_red2 = cv2.inRange(hsv, lower_red2, upper_red2)
-        
-        pcb_mask = cv2.bitwise_or(mask_green1, mask_green2)
-        pcb_mask = cv2.bitwise_or(pcb_mask, mask_brown)
-        pcb_mask = cv2.bitwise_or(pcb_mask, mask_blue)
-        pcb_mask = cv2.bitwise_or(pcb_mask, mask_yellow)
-        pcb_mask = cv2.bitwise_or(pcb_mask, mask_red1)
-        pcb_mask = cv2.bitwise_or(pcb_mask, mask_red2)
-        
-        kernel = np.ones((5, 5), np.uint8)
-        pcb_mask = cv2.morphologyEx(pcb_mask, cv2.MORPH_CLOSE, kernel, iterations=2)
-        pcb_mask = cv2.morphologyEx(pcb_mask, cv2.MORPH_OPEN, kernel, iterations=1)
-        
-        board_pixels = float(np.sum(pcb_mask) / 255)
-        board_ratio = board_pixels / max(total_pixels, 1)
+        work_board_pixels = float(cv2.countNonZero(pcb_mask))
+        board_ratio = work_board_pixels / max(work_pixels, 1)
+        board_pixels = work_board_pixels / area_scale
         
         if board_ratio < MIN_BOARD_RATIO:
             return {
@@ -108,47 +186,51 @@ def analyze_pcb_image(image_data) -> dict:
                     'board_pixels': int(board_pixels),
                     'total_pixels': total_pixels,
                     'min_board_ratio': MIN_BOARD_RATIO,
-                    'image_size': f'{width}x{height}'
+                    'image_size': f'{width}x{height}',
+                    'working_size': f'{work_width}x{work_height}'
                 }
             }
         
         components_mask = cv2.bitwise_not(pcb_mask)
         
-        kernel_small = np.ones((3, 3), np.uint8)
-        components_mask = cv2.morphologyEx(components_mask, cv2.MORPH_OPEN, kernel_small, iterations=2)
-        components_mask = cv2.morphologyEx(components_mask, cv2.MORPH_CLOSE, kernel_small, iterations=2)
+        components_mask = _scaled_morphology(components_mask, cv2.MORPH_OPEN, 5, linear_scale)
+        components_mask = _scaled_morphology(components_mask, cv2.MORPH_CLOSE, 5, linear_scale)
         
-        blurred = cv2.GaussianBlur(components_mask, (5, 5), 0)
+        blur_size = _scaled_odd_size(5, linear_scale)
+        blurred = cv2.GaussianBlur(components_mask, (blur_size, blur_size), 0)
         
         contours, _ = cv2.findContours(blurred, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         
-        valid_contours = []
-        total_component_area = 0
-        
-        for contour in contours:
-            area = cv2.contourArea(contour)
-            if MIN_COMPONENT_AREA <= area <= MAX_COMPONENT_AREA:
-                valid_contours.append(contour)
-                total_component_area += area
+        areas = np.fromiter((cv2.contourArea(c) for c in contours), dtype=np.float64, count=len(contours))
+        min_area = MIN_COMPONENT_AREA * area_scale
+        max_area = MAX_COMPONENT_AREA * area_scale
+        large_area = LARGE_COMPONENT_AREA * area_scale
+        valid_areas = areas[(areas >= min_area) & (areas <= max_area)]
         
-        components_count = len(valid_contours)
+        components_count = int(valid_areas.size)
+        total_component_area = float(valid_areas.sum()) / area_scale
         
-        board_area = max(board_pixels, 1.0)
-        density = components_count / board_area
+        # Limiares reescalados para a resolução de trabalho: comparar a
+        # densidade de trabalho com eles equivale a comparar a densidade
+        # original com LOW/HIGH_DENSITY_THRESHOLD.
+        low_threshold = LOW_DENSITY_THRESHOLD / area_scale
+        high_threshold = HIGH_DENSITY_THRESHOLD / area_scale
+        work_density = components_count / max(work_board_pixels, area_scale)
+        density = work_density * area_scale
         
-        if density < LOW_DENSITY_THRESHOLD:
+        if work_density < low_threshold:
             grade = 'LOW'
-        elif density < HIGH_DENSITY_THRESHOLD:
+        elif work_density < high_threshold:
             grade = 'MEDIUM'
         else:
             grade = 'HIGH'
         
-        large_components = sum(1 for c in valid_contours if cv2.contourArea(c) > 1000)
-        small_components = sum(1 for c in valid_contours if cv2.contourArea(c) <= 1000)
+        large_components = int(np.count_nonzero(valid_areas > large_area))
+        small_components = components_count - large_components
         
         return {
             'grade': grade,
-            'components_count': int(components_count),
+            'components_count': components_count,
             'density_score': float(density),
             'board_detected': True,
             'debug': {
@@ -156,6 +238,8 @@ def analyze_pcb_image(image_data) -> dict:
                 'board_pixels': int(board_pixels),
                 'total_pixels': total_pixels,
                 'image_size': f'{width}x{height}',
+                'working_size': f'{work_width}x{work_height}',
+                'scale': round(linear_scale, 4),
                 'total_contours': len(contours),
                 'valid_contours': components_count,
                 'large_components': large_components,
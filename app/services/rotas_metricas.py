@@ -0,0 +1,173 @@
+"""
+Métricas de rota das OS a partir da trilha de GPS.
+
+Para cada OS a trilha (pontos brutos + simplificados, via
+gps_armazenamento.obter_rota) passa pelo motor vetorizado de app/services/geo.py:
+filtro de saltos, distância percorrida, duração, tempo no fornecedor
+(raio RAIO_FORNECEDOR_METROS em volta das coordenadas do fornecedor), paradas
+e polyline simplificada para o mapa.
+
+Quando a OS chega a FINALIZADA o cálculo é agendado numa thread (depois de
+gravar o buffer de GPS de todos os workers, gps_ingestao.flush_compartilhado)
+e guardado em metricas_rotas_os, e o km_real das
+rotas operacionais da OS é preenchido. O dashboard de logística só lê esses
+números. OS em andamento são calculadas na hora, sem cache.
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app.models import db, OrdemServico, OrdemCompra, Fornecedor, MetricasRotaOS, RotaOperacional
+from app.services import geo, gps_armazenamento, gps_ingestao
+
+RAIO_FORNECEDOR_METROS = float(os.getenv('RAIO_FORNECEDOR_METROS', 150))
+TOLERANCIA_MAPA_METROS = float(os.getenv('TOLERANCIA_MAPA_METROS', 5))
+
+STATUS_FINALIZADA = 'FINALIZADA'
+
+_EPOCA = datetime(1970, 1, 1)
+
+
+def _coordenadas_fornecedor(os_):
+    fornecedor_id = db.session.query(OrdemCompra.fornecedor_id).filter(OrdemCompra.id == os_.oc_id).scalar()
+    if fornecedor_id is None and os_.fornecedor_snapshot:
+        fornecedor_id = os_.fornecedor_snapshot.get('id')
+    if fornecedor_id is None:
+        return None
+    coordenadas = db.session.query(Fornecedor.latitude, Fornecedor.longitude).filter(
+        Fornecedor.id == fornecedor_id
+    ).first()
+    if not coordenadas or coordenadas[0] is None or coordenadas[1] is None:
+        return None
+    return float(coordenadas[0]), float(coordenadas[1])
+
+
+def calcular_metricas(os_):
+    """Calcula as métricas da OS a partir da trilha; devolve um dict com os campos de MetricasRotaOS."""
+    pontos = gps_armazenamento.obter_rota(os_.id)['pontos']
+    resultado = {
+        'os_id': os_.id,
+        'motorista_id': os_.motorista_id,
+        'km_percorrido': 0.0,
+        'duracao_minutos': 0.0,
+        'tempo_fornecedor_minutos': None,
+        'paradas': [],
+        'pontos_originais': len(pontos),
+        'pontos_validos': len(pontos),
+        'polyline': gps_armazenamento.codificar_polyline_mapa(pontos),
+        'inicio': pontos[0][2] if pontos else None,
+        'fim': pontos[-1][2] if pontos else None,
+    }
+    if len(pontos) < 2:
+        return resultado
+
+    lat = np.fromiter((p[0] for p in pontos), dtype=np.float64, count=len(pontos))
+    lng = np.fromiter((p[1] for p in pontos), dtype=np.float64, count=len(pontos))
+    ts = np.fromiter(((p[2] - _EPOCA).total_seconds() for p in pontos), dtype=np.float64, count=len(pontos))
+
+    validos = geo.filtrar_ruido(lat, lng, ts)
+    lat, lng, ts = lat[validos], lng[validos], ts[validos]
+    mantidos = geo.simplificar_indices(lat, lng, TOLERANCIA_MAPA_METROS)
+
+    resultado.update({
+        'km_percorrido': round(geo.distancia_total_metros(lat, lng) / 1000, 3),
+        'duracao_minutos': round(float(ts[-1] - ts[0]) / 60, 2),
+        'pontos_validos': int(lat.size),
+        'polyline': gps_armazenamento.codificar_polyline_mapa(list(zip(lat[mantidos], lng[mantidos]))),
+        'paradas': [{
+            'inicio': (_EPOCA + timedelta(seconds=p['inicio'])).isoformat(),
+            'fim': (_EPOCA + timedelta(seconds=p['fim'])).isoformat(),
+            'latitude': round(p['latitude'], 6),
+            'longitude': round(p['longitude'], 6),
+            'duracao_minutos': round(p['duracao_segundos'] / 60, 2)
+        } for p in geo.detectar_paradas(lat, lng, ts)],
+    })
+
+    fornecedor = _coordenadas_fornecedor(os_)
+    if fornecedor:
+        segundos = geo.tempo_no_raio(lat, lng, ts, fornecedor[0], fornecedor[1], RAIO_FORNECEDOR_METROS)
+        resultado['tempo_fornecedor_minutos'] = round(segundos / 60, 2)
+    return resultado
+
+
+def atualizar_metricas_os(os_id):
+    """Recalcula e grava as métricas da OS e o km_real das suas rotas operacionais."""
+    os_ = db.session.get(OrdemServico, os_id)
+    if not os_:
+        return None
+
+    dados = calcular_metricas(os_)
+    metricas = MetricasRotaOS.query.filter_by(os_id=os_id).first() or MetricasRotaOS(os_id=os_id)
+    for campo, valor in dados.items():
+        setattr(metricas, campo, valor)
+    metricas.calculado_em = datetime.utcnow()
+    db.session.add(metricas)
+
+    RotaOperacional.query.filter_by(os_id=os_id).update(
+        {'km_real': dados['km_percorrido']}, synchronize_session=False
+    )
+    db.session.commit()
+    return metricas
+
+
+def obter_metricas(os_):
+    """Métricas guardadas da OS finalizada, ou calculadas na hora para OS em andamento."""
+    if os_.status == STATUS_FINALIZADA:
+        metricas = MetricasRotaOS.query.filter_by(os_id=os_.id).first()
+        if metricas:
+            return metricas.to_dict()
+        metricas = atualizar_metricas_os(os_.id)
+        return metricas.to_dict()
+
+    dados = calcular_metricas(os_)
+    for campo in ('inicio', 'fim'):
+        dados[campo] = dados[campo].isoformat() if dados[campo] else None
+    dados['calculado_em'] = None
+    return dados
+
+
+def agendar_calculo(app, os_id):
+    """
+    Calcula as métricas em segundo plano, depois de gravar os pontos ainda no
+    buffer deste e dos outros workers. Se algum worker não confirmar a gravação
+    em GPS_FLUSH_ESPERA segundos, calcula com os pontos já gravados e recalcula
+    uma vez quando todos confirmarem (até GPS_WORKER_INATIVO segundos depois).
+    """
+    def calcular():
+        with app.app_context():
+            atualizar_metricas_os(os_id)
+            from app.services.dashboard_stats import invalidar_dashboard
+            invalidar_dashboard()
+
+    def executar():
+        try:
+            completo = gps_ingestao.flush_compartilhado()
+            calcular()
+            if not completo and gps_ingestao.flush_compartilhado(gps_ingestao.GPS_WORKER_INATIVO):
+                calcular()
+        except Exception as e:
+            print(f"[ROTAS] Erro ao calcular métricas da OS {os_id}: {e}")
+
+    thread = threading.Thread(target=executar, name=f'metricas-os-{os_id}', daemon=True)
+    thread.start()
+    return thread
+
+
+def calcular_pendentes(limite=None):
+    """Calcula as métricas das OS finalizadas que ainda não têm; devolve quantas foram calculadas."""
+    consulta = db.session.query(OrdemServico.id).outerjoin(
+        MetricasRotaOS, MetricasRotaOS.os_id == OrdemServico.id
+    ).filter(
+        OrdemServico.status == STATUS_FINALIZADA,
+        MetricasRotaOS.id.is_(None)
+    ).order_by(OrdemServico.id)
+    if limite:
+        consulta = consulta.limit(limite)
+
+    calculadas = 0
+    for (os_id,) in consulta.all():
+        atualizar_metricas_os(os_id)
+        calculadas += 1
+    return calculadas
@@ -0,0 +1,466 @@
+"""
+Roteirização em lote das OS de coleta pendentes.
+
+Monta rotas com várias paradas saindo e voltando à matriz, respeitando a
+capacidade (kg) do veículo de cada motorista disponível e um limite de
+paradas por rota:
+
+  1. construção pelo vizinho mais próximo: cada viagem sai da matriz e segue
+     para o fornecedor mais próximo ainda não atendido que cabe no veículo
+  2. melhoria até não haver ganho ou acabar ROTEIRIZACAO_TEMPO_MAX:
+     - realocação (Or-opt de uma parada) entre rotas com capacidade sobrando
+     - 2-opt e Or-opt (trechos de 1 a 3 paradas) dentro de cada rota
+
+As distâncias vêm de geo.matriz_distancias (haversine) multiplicadas por
+ROTEIRIZACAO_FATOR_ESTRADA, e cada movimento é avaliado com NumPy sobre
+todas as posições candidatas de uma vez; 500 paradas levam poucos segundos.
+
+planejar() só calcula; aplicar_plano() atribui motorista/veículo às OS e
+grava uma RotaOperacional por OS, com a rota completa em `pontos` e em
+km_estimado o trecho da parada anterior até ela (mais a volta à matriz na
+última), de forma que a soma por rota dá o km da rota. OS atribuídas por
+outra requisição entre o planejamento e a aplicação ficam de fora, e a rota é
+recalculada sem elas.
+"""
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app.models import (
+    db, OrdemServico, OrdemCompra, Fornecedor, ItemSolicitacao,
+    Motorista, Veiculo, RotaOperacional, Configuracao
+)
+from app.services import geo, notificacoes
+
+MATRIZ_LATITUDE = os.getenv('MATRIZ_LATITUDE')
+MATRIZ_LONGITUDE = os.getenv('MATRIZ_LONGITUDE')
+ROTEIRIZACAO_FATOR_ESTRADA = float(os.getenv('ROTEIRIZACAO_FATOR_ESTRADA', 1.3))
+ROTEIRIZACAO_MAX_PARADAS = int(os.getenv('ROTEIRIZACAO_MAX_PARADAS', 25))
+ROTEIRIZACAO_MAX_VIAGENS = int(os.getenv('ROTEIRIZACAO_MAX_VIAGENS', 1))
+ROTEIRIZACAO_TEMPO_MAX = float(os.getenv('ROTEIRIZACAO_TEMPO_MAX', 5))
+
+STATUS_AGUARDANDO_COLETA = 'PENDENTE'
+STATUS_MOTORISTA_OCUPADO = ('AGENDADA', 'EM_ROTA', 'NO_FORNECEDOR', 'COLETADO', 'A_CAMINHO_MATRIZ')
+
+_EPSILON = 1e-6
+
+
+class RoteirizacaoErro(Exception):
+    pass
+
+
+# ---------------------------------------------------------------------------
+# Algoritmo (nó 0 = matriz, nós 1..n = paradas)
+# ---------------------------------------------------------------------------
+
+def _custo(D, rota):
+    caminho = np.concatenate(([0], rota, [0]))
+    return float(D[caminho[:-1], caminho[1:]].sum())
+
+
+def construir_vizinho_mais_proximo(D, demandas, capacidades, max_paradas):
+    """Uma rota por capacidade em `capacidades`, na ordem; devolve (rotas, nós não atendidos)."""
+    livres = np.ones(D.shape[0], dtype=bool)
+    livres[0] = False
+    rotas = []
+    for capacidade in capacidades:
+        if not livres.any():
+            break
+        rota, carga, atual = [], 0.0, 0
+        while len(rota) < max_paradas:
+            candidatos = livres & (demandas <= capacidade - carga + _EPSILON)
+            if not candidatos.any():
+                break
+            proximo = int(np.argmin(np.where(candidatos, D[atual], np.inf)))
+            rota.append(proximo)
+            carga += demandas[proximo]
+            livres[proximo] = False
+            atual = proximo
+        rotas.append(rota)
+    return rotas, [int(n) for n in np.flatnonzero(livres)]
+
+
+def dois_opt(D, rota):
+    """2-opt: inverte o trecho entre duas arestas sempre que isso encurta a rota."""
+    t = np.array([0] + list(rota) + [0])
+    melhorou = True
+    while melhorou:
+        melhorou = False
+        for i in range(len(t) - 3):
+            a, b = t[i], t[i + 1]
+            c, d = t[i + 2:-1], t[i + 3:]
+            delta = D[a, c] + D[b, d] - D[a, b] - D[c, d]
+            j = int(np.argmin(delta))
+            if delta[j] < -_EPSILON:
+                j += i + 2
+                t[i + 1:j + 1] = t[i + 1:j + 1][::-1].copy()
+                melhorou = True
+    return [int(n) for n in t[1:-1]]
+
+
+def or_opt(D, rota, max_trecho=3):
+    """Or-opt: move trechos de 1 a max_trecho paradas (em qualquer sentido) para outra posição da rota."""
+    t = [0] + list(rota) + [0]
+    melhorou = True
+    while melhorou:
+        melhorou = False
+        for tamanho in range(1, max_trecho + 1):
+            i = 1
+            while i + tamanho <= len(t) - 1:
+                trecho = t[i:i + tamanho]
+                anterior, seguinte = t[i - 1], t[i + tamanho]
+                ganho = D[anterior, trecho[0]] + D[trecho[-1], seguinte] - D[anterior, seguinte]
+                resto = t[:i] + t[i + tamanho:]
+                a, b = np.array(resto[:-1]), np.array(resto[1:])
+                direto = D[a, trecho[0]] + D[trecho[-1], b] - D[a, b]
+                invertido = D[a, trecho[-1]] + D[trecho[0], b] - D[a, b]
+                direto[i - 1] = invertido[i - 1] = np.inf  # posição original
+                melhor = min(direto.min(), invertido.min())
+                if melhor < ganho - _EPSILON:
+                    inverter = invertido.min() < direto.min()
+                    posicao = int(np.argmin(invertido if inverter else direto)) + 1
+                    t = resto[:posicao] + (trecho[::-1] if inverter else trecho) + resto[posicao:]
+                    melhorou = True
+                else:
+                    i += 1
+    return t[1:-1]
+
+
+def realocar_entre_rotas(D, rotas, demandas, capacidades, max_paradas):
+    """Move paradas para a melhor posição de outra rota que tenha capacidade; devolve se houve ganho."""
+    houve_ganho = False
+    cargas = [float(demandas[r].sum()) if r else 0.0 for r in rotas]
+    for origem in range(len(rotas)):
+        i = 0
+        while i < len(rotas[origem]):
+            rota = rotas[origem]
+            parada = rota[i]
+            anterior = rota[i - 1] if i > 0 else 0
+            seguinte = rota[i + 1] if i + 1 < len(rota) else 0
+            ganho = D[anterior, parada] + D[parada, seguinte] - D[anterior, seguinte]
+
+            a, b, destino = [], [], []
+            for k, outra in enumerate(rotas):
+                if k == origem or len(outra) >= max_paradas or \
+                        cargas[k] + demandas[parada] > capacidades[k] + _EPSILON:
+                    continue
+                caminho = [0] + outra + [0]
+                a.extend(caminho[:-1])
+                b.extend(caminho[1:])
+                destino.extend([(k, p) for p in range(len(caminho) - 1)])
+            if destino:
+                a, b = np.array(a), np.array(b)
+                custo = D[a, parada] + D[parada, b] - D[a, b]
+                melhor = int(np.argmin(custo))
+                if custo[melhor] < ganho - _EPSILON:
+                    k, posicao = destino[melhor]
+                    rota.pop(i)
+                    rotas[k].insert(posicao, parada)
+                    cargas[origem] -= demandas[parada]
+                    cargas[k] += demandas[parada]
+                    houve_ganho = True
+                    continue
+            i += 1
+    return houve_ganho
+
+
+def otimizar(D, demandas, capacidades, max_paradas=ROTEIRIZACAO_MAX_PARADAS, tempo_max=ROTEIRIZACAO_TEMPO_MAX,
+             melhorar=True):
+    """Vizinho mais próximo + melhorias; devolve (rotas, não atendidos, passadas de melhoria)."""
+    limite = time.perf_counter() + tempo_max
+    rotas, nao_atendidos = construir_vizinho_mais_proximo(D, demandas, capacidades, max_paradas)
+    passadas = 0
+    while melhorar and time.perf_counter() < limite:
+        passadas += 1
+        antes = sum(_custo(D, r) for r in rotas)
+        rotas = [or_opt(D, dois_opt(D, r)) if len(r) > 2 else r for r in rotas]
+        if time.perf_counter() >= limite:
+            break
+        realocar_entre_rotas(D, rotas, demandas, capacidades[:len(rotas)], max_paradas)
+        if sum(_custo(D, r) for r in rotas) > antes - _EPSILON:
+            break
+    return rotas, nao_atendidos, passadas
+
+
+def planejar(deposito, paradas, veiculos, max_paradas=ROTEIRIZACAO_MAX_PARADAS,
+             max_viagens=ROTEIRIZACAO_MAX_VIAGENS, tempo_max=ROTEIRIZACAO_TEMPO_MAX, melhorar=True):
+    """
+    deposito: (lat, lng) da matriz
+    paradas: [{'os_id', 'latitude', 'longitude', 'peso_kg', ...}]
+    veiculos: [{'motorista_id', 'veiculo_id', 'capacidade_kg' (None = sem limite), ...}]
+
+    Devolve o plano com as rotas (motorista, veículo, paradas em ordem, carga e
+    km), as paradas não atendidas e a comparação com uma OS por viagem.
+    """
+    inicio = time.perf_counter()
+    lat = [deposito[0]] + [p['latitude'] for p in paradas]
+    lng = [deposito[1]] + [p['longitude'] for p in paradas]
+    D = geo.matriz_distancias(lat, lng) * ROTEIRIZACAO_FATOR_ESTRADA / 1000
+    demandas = np.array([0.0] + [float(p.get('peso_kg') or 0) for p in paradas])
+
+    # veículos maiores primeiro; cada veículo pode fazer até max_viagens viagens
+    ordenados = sorted(veiculos, key=lambda v: -(v['capacidade_kg'] if v['capacidade_kg'] else np.inf))
+    slots = [v for _ in range(max_viagens) for v in ordenados]
+    capacidades = [v['capacidade_kg'] if v['capacidade_kg'] else np.inf for v in slots]
+
+    rotas, nao_atendidos, passadas = otimizar(D, demandas, capacidades, max_paradas, tempo_max, melhorar)
+
+    viagens = {}
+    resultado = []
+    for rota, veiculo in zip(rotas, slots):
+        if not rota:
+            continue
+        viagens[veiculo['motorista_id']] = viagens.get(veiculo['motorista_id'], 0) + 1
+        caminho = [0] + rota + [0]
+        trechos = D[caminho[:-1], caminho[1:]]
+        resultado.append(dict(veiculo, **{
+            'viagem': viagens[veiculo['motorista_id']],
+            'carga_kg': round(float(demandas[rota].sum()), 2),
+            'km': round(float(trechos.sum()), 2),
+            'paradas': [dict(paradas[n - 1], **{
+                'sequencia': ordem + 1,
+                'km_trecho': round(float(trechos[ordem] + (trechos[-1] if ordem == len(rota) - 1 else 0)), 3)
+            }) for ordem, n in enumerate(rota)]
+        }))
+
+    atendidos = [n for r in rotas for n in r]
+    km_total = sum(r['km'] for r in resultado)
+    km_uma_por_viagem = float(2 * D[0, atendidos].sum()) if atendidos else 0.0
+    return {
+        'deposito': {'latitude': deposito[0], 'longitude': deposito[1]},
+        'rotas': resultado,
+        'nao_atendidas': [paradas[n - 1] for n in nao_atendidos],
+        'total_paradas': len(atendidos),
+        'km_total': round(km_total, 2),
+        'km_uma_os_por_viagem': round(km_uma_por_viagem, 2),
+        'economia_km': round(km_uma_por_viagem - km_total, 2),
+        'economia_percentual': round((1 - km_total / km_uma_por_viagem) * 100, 1) if km_uma_por_viagem else 0.0,
+        'passadas_melhoria': passadas,
+        'tempo_ms': round((time.perf_counter() - inicio) * 1000, 1)
+    }
+
+
+# ---------------------------------------------------------------------------
+# Banco
+# ---------------------------------------------------------------------------
+
+def obter_deposito():
+    """Coordenadas da matriz: configurações matriz_latitude/matriz_longitude ou MATRIZ_LATITUDE/MATRIZ_LONGITUDE."""
+    valores = dict(db.session.query(Configuracao.chave, Configuracao.valor).filter(
+        Configuracao.chave.in_(('matriz_latitude', 'matriz_longitude'))
+    ).all())
+    lat = valores.get('matriz_latitude', MATRIZ_LATITUDE)
+    lng = valores.get('matriz_longitude', MATRIZ_LONGITUDE)
+    if lat is None or lng is None:
+        return None
+    return float(lat), float(lng)
+
+
+def carregar_paradas(os_ids=None):
+    """OS de coleta aguardando motorista, com coordenadas do fornecedor e peso; devolve (paradas, sem_coordenadas)."""
+    peso = db.session.query(
+        ItemSolicitacao.solicitacao_id, db.func.sum(ItemSolicitacao.peso_kg).label('peso_kg')
+    ).group_by(ItemSolicitacao.solicitacao_id).subquery()
+
+    consulta = db.session.query(
+        OrdemServico.id, OrdemServico.numero_os, Fornecedor.id, Fornecedor.nome,
+        Fornecedor.latitude, Fornecedor.longitude, peso.c.peso_kg
+    ).join(
+        OrdemCompra, OrdemCompra.id == OrdemServico.oc_id
+    ).join(
+        Fornecedor, Fornecedor.id == OrdemCompra.fornecedor_id
+    ).outerjoin(
+        peso, peso.c.solicitacao_id == OrdemCompra.solicitacao_id
+    ).filter(
+        OrdemServico.status == STATUS_AGUARDANDO_COLETA,
+        OrdemServico.motorista_id.is_(None),
+        OrdemServico.tipo == 'COLETA'
+    )
+    if os_ids:
+        consulta = consulta.filter(OrdemServico.id.in_(os_ids))
+
+    paradas, sem_coordenadas = [], []
+    for os_id, numero_os, fornecedor_id, nome, lat, lng, peso_kg in consulta.order_by(OrdemServico.id).all():
+        parada = {
+            'os_id': os_id,
+            'numero_os': numero_os,
+            'fornecedor_id': fornecedor_id,
+            'fornecedor_nome': nome,
+            'latitude': lat,
+            'longitude': lng,
+            'peso_kg': round(float(peso_kg or 0), 2)
+        }
+        (paradas if lat is not None and lng is not None else sem_coordenadas).append(parada)
+    return paradas, sem_coordenadas
+
+
+def carregar_veiculos(motorista_ids=None):
+    """Motoristas ativos com veículo ativo e sem OS em andamento ou agendada."""
+    ocupados = db.session.query(OrdemServico.motorista_id).filter(
+        OrdemServico.status.in_(STATUS_MOTORISTA_OCUPADO),
+        OrdemServico.motorista_id.isnot(None)
+    )
+    consulta = db.session.query(
+        Motorista.id, Motorista.nome, Veiculo.id, Veiculo.placa, Veiculo.capacidade
+    ).join(
+        Veiculo, Veiculo.id == Motorista.veiculo_id
+    ).filter(
+        Motorista.ativo == True,
+        Veiculo.ativo == True,
+        Motorista.id.notin_(ocupados)
+    )
+    if motorista_ids:
+        consulta = consulta.filter(Motorista.id.in_(motorista_ids))
+    return [{
+        'motorista_id': motorista_id,
+        'motorista_nome': nome,
+        'veiculo_id': veiculo_id,
+        'veiculo_placa': placa,
+        'capacidade_kg': capacidade
+    } for motorista_id, nome, veiculo_id, placa, capacidade in consulta.order_by(Motorista.id).all()]
+
+
+def planejar_pendentes(os_ids=None, motorista_ids=None, deposito=None, max_paradas=ROTEIRIZACAO_MAX_PARADAS,
+                       max_viagens=ROTEIRIZACAO_MAX_VIAGENS):
+    deposito = deposito or obter_deposito()
+    if deposito is None:
+        raise RoteirizacaoErro('Coordenadas da matriz não configuradas (matriz_latitude/matriz_longitude)')
+    paradas, sem_coordenadas = carregar_paradas(os_ids)
+    veiculos = carregar_veiculos(motorista_ids)
+    if paradas and not veiculos:
+        raise RoteirizacaoErro('Nenhum motorista disponível com veículo ativo')
+    plano = planejar(deposito, paradas, veiculos, max_paradas, max_viagens)
+    plano['sem_coordenadas'] = sem_coordenadas
+    plano['motoristas_disponiveis'] = len(veiculos)
+    return plano
+
+
+def _refazer_trechos(deposito, paradas):
+    """
+    km da rota matriz -> paradas (na ordem dada) -> matriz e as paradas com
+    sequencia e km_trecho recalculados, como em planejar().
+    """
+    lat = [deposito['latitude']] + [p['latitude'] for p in paradas] + [deposito['latitude']]
+    lng = [deposito['longitude']] + [p['longitude'] for p in paradas] + [deposito['longitude']]
+    trechos = geo.distancias_segmentos(lat, lng) * ROTEIRIZACAO_FATOR_ESTRADA / 1000
+    return round(float(trechos.sum()), 2), [dict(p, **{
+        'sequencia': ordem + 1,
+        'km_trecho': round(float(trechos[ordem] + (trechos[-1] if ordem == len(paradas) - 1 else 0)), 3)
+    }) for ordem, p in enumerate(paradas)]
+
+
+def _atualizar_totais(plano):
+    """Recalcula os totais do plano a partir das rotas (depois de remover paradas)."""
+    paradas = [p for rota in plano['rotas'] for p in rota['paradas']]
+    deposito = plano['deposito']
+    km_total = sum(rota['km'] for rota in plano['rotas'])
+    ida = geo.haversine_metros(deposito['latitude'], deposito['longitude'],
+                               [p['latitude'] for p in paradas], [p['longitude'] for p in paradas])
+    km_uma_por_viagem = float(2 * ida.sum()) * ROTEIRIZACAO_FATOR_ESTRADA / 1000 if paradas else 0.0
+    plano.update({
+        'total_paradas': len(paradas),
+        'km_total': round(km_total, 2),
+        'km_uma_os_por_viagem': round(km_uma_por_viagem, 2),
+        'economia_km': round(km_uma_por_viagem - km_total, 2),
+        'economia_percentual': round((1 - km_total / km_uma_por_viagem) * 100, 1) if km_uma_por_viagem else 0.0
+    })
+
+
+def aplicar_plano(plano, usuario_id, registrar_auditoria=None):
+    """
+    Atribui as OS de cada rota ao motorista/veículo (status AGENDADA), grava as
+    RotaOperacional e notifica cada motorista uma vez por rota (notificacoes,
+    com o aviso por Socket.IO depois do commit). Não faz commit.
+
+    As OS são relidas com SELECT ... FOR UPDATE. As que deixaram de estar
+    PENDENTE sem motorista desde o planejamento (atribuídas por outra
+    requisição) saem das rotas, que têm pontos e km recalculados só com as
+    paradas aplicadas; o plano é atualizado no lugar. Devolve os ids das OS
+    ignoradas.
+    """
+    os_ids = [p['os_id'] for rota in plano['rotas'] for p in rota['paradas']]
+    ordens = {o.id: o for o in OrdemServico.query.filter(
+        OrdemServico.id.in_(os_ids)
+    ).order_by(OrdemServico.id).populate_existing().with_for_update().all()} if os_ids else {}
+    usuarios = dict(db.session.query(Motorista.id, Motorista.usuario_id).filter(
+        Motorista.id.in_([r['motorista_id'] for r in plano['rotas']])
+    ).all()) if plano['rotas'] else {}
+    agora = datetime.utcnow()
+
+    ignoradas = []
+    rotas = []
+    for rota in plano['rotas']:
+        aplicaveis = []
+        for parada in rota['paradas']:
+            os_ = ordens.get(parada['os_id'])
+            if os_ is None or os_.status != STATUS_AGUARDANDO_COLETA or os_.motorista_id is not None:
+                ignoradas.append(parada['os_id'])
+            else:
+                aplicaveis.append(parada)
+        if not aplicaveis:
+            continue
+        if len(aplicaveis) < len(rota['paradas']):
+            km, aplicaveis = _refazer_trechos(plano['deposito'], aplicaveis)
+            rota.update({
+                'paradas': aplicaveis,
+                'km': km,
+                'carga_kg': round(sum(p['peso_kg'] for p in aplicaveis), 2)
+            })
+        rotas.append(rota)
+
+        pontos = [{'latitude': plano['deposito']['latitude'], 'longitude': plano['deposito']['longitude'],
+                   'tipo': 'MATRIZ'}]
+        pontos += [{
+            'sequencia': p['sequencia'],
+            'os_id': p['os_id'],
+            'fornecedor_id': p['fornecedor_id'],
+            'fornecedor_nome': p['fornecedor_nome'],
+            'latitude': p['latitude'],
+            'longitude': p['longitude'],
+            'peso_kg': p['peso_kg'],
+            'tipo': 'COLETA'
+        } for p in rota['paradas']]
+        pontos.append(dict(pontos[0]))
+
+        for parada in rota['paradas']:
+            os_ = ordens[parada['os_id']]
+            os_.motorista_id = rota['motorista_id']
+            os_.veiculo_id = rota['veiculo_id']
+            os_.status = 'AGENDADA'
+            os_.rota = {
+                'sequencia': parada['sequencia'],
+                'total_paradas': len(rota['paradas']),
+                'viagem': rota['viagem'],
+                'km_rota': rota['km'],
+                'pontos': pontos
+            }
+            if registrar_auditoria:
+                registrar_auditoria(os_, 'ROTEIRIZACAO', usuario_id, {
+                    'motorista_id': rota['motorista_id'],
+                    'veiculo_id': rota['veiculo_id'],
+                    'sequencia': parada['sequencia'],
+                    'km_rota': rota['km']
+                })
+            db.session.add(RotaOperacional(
+                os_id=os_.id,
+                motorista_id=rota['motorista_id'],
+                veiculo_id=rota['veiculo_id'],
+                pontos=pontos,
+                km_estimado=parada['km_trecho'],
+                criado_em=agora
+            ))
+
+        if usuarios.get(rota['motorista_id']):
+            notificacoes.notificar(
+                [usuarios[rota['motorista_id']]],
+                'Nova rota de coleta',
+                f"Rota com {len(rota['paradas'])} coletas ({rota['km']:.1f} km estimados), "
+                f"começando em {rota['paradas'][0]['fornecedor_nome']}"
+            )
+
+    if ignoradas:
+        plano['rotas'] = rotas
+        _atualizar_totais(plano)
+    return ignoradas
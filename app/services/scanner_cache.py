@@ -0,0 +1,242 @@
+"""
+Cache de resultados do scanner endereçado pelo conteúdo da imagem.
+
+A chave é o SHA-256 dos bytes da imagem mais a versão do ScannerConfig.
+Além da correspondência exata, um hash perceptual (dHash de 64 bits) permite
+reaproveitar o resultado de cópias recomprimidas ou redimensionadas da mesma
+foto, comuns quando o app reenvia a imagem após falha de rede. A
+correspondência por phash só considera análises do próprio usuário: uma foto
+parecida de outro usuário não é a mesma placa, e o resultado dela não deve
+vazar. A correspondência exata vale entre usuários, porque os mesmos bytes
+dão o mesmo resultado.
+
+O resultado em si fica na linha de ScannerAnalysis (colunas image_sha256,
+image_phash e config_version); em memória ficam apenas os índices
+hash -> id da análise, limitados a SCANNER_CACHE_SIZE entradas.
+
+O cálculo dos hashes decodifica a imagem; as rotas o executam fora do loop
+do eventlet (scanner_pool.run_in_thread).
+"""
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+SCANNER_CACHE_SIZE = int(os.getenv('SCANNER_CACHE_SIZE', 5000))
+PHASH_MAX_DISTANCE = int(os.getenv('SCANNER_PHASH_MAX_DISTANCE', 6))
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def compute_image_hashes(image_bytes):
+    """
+    Retorna (sha256_hex, phash_hex). O phash é None quando a imagem não pode
+    ser decodificada.
+    """
+    image_sha256 = hashlib.sha256(image_bytes).hexdigest()
+
+    gray = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return image_sha256, None
+
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bit)
+    return image_sha256, f'{value:016x}'
+
+
+def _hamming_distances(hashes, value):
+    xor = hashes ^ np.uint64(value)
+    return _POPCOUNT_TABLE[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class ScannerResultCache:
+    def __init__(self, max_size=SCANNER_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._version = None
+        self._exact = OrderedDict()
+        self._phash = OrderedDict()
+        self._phash_array = None
+        self._phash_ids = None
+        self._phash_users = None
+        self.hits_exact = 0
+        self.hits_similar = 0
+        self.misses = 0
+
+    def _reset(self, version):
+        self._version = version
+        self._exact.clear()
+        self._phash.clear()
+        self._phash_array = None
+
+    def ensure_version(self, version, loader=None):
+        """
+        Descarta os índices se a versão da configuração mudou e, se um loader
+        for informado, recarrega as análises mais recentes dessa versão.
+        """
+        with self._lock:
+            if self._version == version:
+                return
+            self._reset(version)
+        if loader:
+            for analysis_id, usuario_id, image_sha256, image_phash in loader(version, self.max_size):
+                self.add(version, image_sha256, image_phash, analysis_id, usuario_id)
+
+    def add(self, version, image_sha256, image_phash, analysis_id, usuario_id):
+        with self._lock:
+            if self._version != version:
+                return
+            if image_sha256:
+                self._exact[image_sha256] = analysis_id
+                self._exact.move_to_end(image_sha256)
+                while len(self._exact) > self.max_size:
+                    self._exact.popitem(last=False)
+            if image_phash:
+                self._phash[analysis_id] = (int(image_phash, 16), usuario_id)
+                while len(self._phash) > self.max_size:
+                    self._phash.popitem(last=False)
+                self._phash_array = None
+
+    def find_exact(self, image_sha256):
+        with self._lock:
+            analysis_id = self._exact.get(image_sha256)
+            if analysis_id is not None:
+                self._exact.move_to_end(image_sha256)
+            return analysis_id
+
+    def find_similar(self, image_phash, usuario_id):
+        """
+        Id da análise do usuário com o phash mais próximo dentro de
+        PHASH_MAX_DISTANCE.
+        """
+        if not image_phash:
+            return None
+        with self._lock:
+            if not self._phash:
+                return None
+            if self._phash_array is None:
+                count = len(self._phash)
+                self._phash_ids = np.fromiter(self._phash.keys(), dtype=np.int64, count=count)
+                self._phash_array = np.fromiter((h for h, _ in self._phash.values()), dtype=np.uint64, count=count)
+                self._phash_users = np.fromiter((u for _, u in self._phash.values()), dtype=np.int64, count=count)
+            own = np.flatnonzero(self._phash_users == usuario_id)
+            if not own.size:
+                return None
+            distances = _hamming_distances(self._phash_array[own], int(image_phash, 16))
+            best = int(np.argmin(distances))
+            if distances[best] > PHASH_MAX_DISTANCE:
+                return None
+            return int(self._phash_ids[own[best]])
+
+    def discard(self, analysis_id):
+        with self._lock:
+            for key in [k for k, v in self._exact.items() if v == analysis_id]:
+                del self._exact[key]
+            if self._phash.pop(analysis_id, None) is not None:
+                self._phash_array = None
+
+    def invalidate(self):
+        with self._lock:
+            self._reset(None)
+
+    def record(self, kind):
+        with self._lock:
+            if kind == 'exact':
+                self.hits_exact += 1
+            elif kind == 'similar':
+                self.hits_similar += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            hits = self.hits_exact + self.hits_similar
+            total = hits + self.misses
+            return {
+                'config_version': self._version,
+                'entries': len(self._exact),
+                'max_size': self.max_size,
+                'hits': hits,
+                'hits_exact': self.hits_exact,
+                'hits_similar': self.hits_similar,
+                'misses': self.misses,
+                'hit_rate': round(hits / total, 4) if total else 0.0,
+                'phash_max_distance': PHASH_MAX_DISTANCE
+            }
+
+
+result_cache = ScannerResultCache()
+
+
+def _load_recent_hashes(version, limit):
+    from app.models import db, ScannerAnalysis
+
+    rows = db.session.query(
+        ScannerAnalysis.id, ScannerAnalysis.usuario_id, ScannerAnalysis.image_sha256, ScannerAnalysis.image_phash
+    ).filter(
+        ScannerAnalysis.config_version == version,
+        ScannerAnalysis.image_sha256.isnot(None)
+    ).order_by(ScannerAnalysis.id.desc()).limit(limit).all()
+    return list(reversed(rows))
+
+
+def find_cached_analysis(image_sha256, image_phash, config_version, usuario_id):
+    """
+    Procura uma análise já feita para esta imagem na versão atual do
+    ScannerConfig: com os mesmos bytes (de qualquer usuário) ou, entre as
+    análises de usuario_id, com phash próximo.
+    Retorna (ScannerAnalysis, 'exact' | 'similar') ou (None, None).
+    """
+    from app.models import ScannerAnalysis
+
+    result_cache.ensure_version(config_version, _load_recent_hashes)
+
+    analysis = None
+    analysis_id = result_cache.find_exact(image_sha256)
+    if analysis_id is not None:
+        analysis = ScannerAnalysis.query.get(analysis_id)
+        if analysis is None:
+            result_cache.discard(analysis_id)
+
+    if analysis is None:
+        analysis = ScannerAnalysis.query.filter_by(
+            image_sha256=image_sha256,
+            config_version=config_version
+        ).order_by(ScannerAnalysis.id.desc()).first()
+    kind = 'exact' if analysis else None
+
+    if analysis is None:
+        analysis_id = result_cache.find_similar(image_phash, usuario_id)
+        if analysis_id is not None:
+            analysis = ScannerAnalysis.query.get(analysis_id)
+            kind = 'similar'
+            if analysis is None or analysis.usuario_id != usuario_id:
+                result_cache.discard(analysis_id)
+                analysis = None
+
+    if analysis is None:
+        kind = None
+    else:
+        remember_analysis(analysis)
+
+    result_cache.record(kind)
+    return analysis, kind
+
+
+def remember_analysis(analysis):
+    result_cache.add(analysis.config_version, analysis.image_sha256, analysis.image_phash,
+                     analysis.id, analysis.usuario_id)
+
+
+def invalidate_cache():
+    result_cache.invalidate()
+
+
+def get_cache_stats():
+    return result_cache.stats()
@@ -0,0 +1,212 @@
+"""
+Pool de processos para a análise OpenCV do scanner de placas.
+
+O servidor roda com gunicorn + eventlet e um único worker: qualquer trabalho
+de CPU executado dentro da requisição congela todas as outras requisições e o
+tráfego Socket.IO. Aqui a análise roda em processos separados e a requisição
+aguarda o resultado de forma cooperativa (time.sleep é cooperativo quando o
+eventlet faz o monkey patch), liberando o loop para os demais clientes.
+
+Controle de admissão: no máximo SCANNER_POOL_MAX_PENDING análises podem estar
+em andamento ou na fila; acima disso submit_analysis levanta ScannerPoolFull
+com uma estimativa de Retry-After.
+"""
+import os
+import math
+import time
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+SCANNER_POOL_WORKERS = int(os.getenv('SCANNER_POOL_WORKERS', max(1, min(2, os.cpu_count() or 1))))
+SCANNER_POOL_MAX_PENDING = int(os.getenv('SCANNER_POOL_MAX_PENDING', SCANNER_POOL_WORKERS * 4))
+SCANNER_POOL_TIMEOUT = float(os.getenv('SCANNER_POOL_TIMEOUT', 60))
+
+POLL_INTERVAL = 0.02
+
+_executor = None
+_lock = threading.Lock()
+_pending = 0
+_avg_duration = 1.0
+
+
+class ScannerPoolFull(Exception):
+    """Fila de análises cheia; retry_after indica em quantos segundos tentar novamente."""
+
+    def __init__(self, retry_after):
+        super().__init__('Fila de análises do scanner cheia')
+        self.retry_after = retry_after
+
+
+def _init_worker():
+    import cv2
+    from app.services.pcb_analyzer import _get_board_lut
+
+    cv2.setNumThreads(1)
+    _get_board_lut()
+
+
+def _run_analysis(image_bytes):
+    from app.services.pcb_analyzer import analyze_pcb_image
+
+    return analyze_pcb_image(image_bytes)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=SCANNER_POOL_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+        # Sob eventlet o encerramento automático do concurrent.futures não roda
+        # e o atexit do multiprocessing fica esperando os workers; registrado
+        # depois dele, este atexit roda antes e encerra o pool.
+        atexit.register(_shutdown_executor)
+    return _executor
+
+
+def _estimate_retry_after():
+    waves = math.ceil(max(_pending, 1) / float(SCANNER_POOL_WORKERS))
+    return max(1, int(math.ceil(waves * _avg_duration)))
+
+
+def get_pool_status():
+    return {
+        'workers': SCANNER_POOL_WORKERS,
+        'max_pending': SCANNER_POOL_MAX_PENDING,
+        'pending': _pending,
+        'avg_duration_s': round(_avg_duration, 3)
+    }
+
+
+def _release_slot(_future=None):
+    """Libera a vaga de uma análise. Chamado quando o future termina."""
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def _try_acquire_slot():
+    global _pending
+    with _lock:
+        if _pending >= SCANNER_POOL_MAX_PENDING:
+            return False
+        _pending += 1
+        return True
+
+
+def submit_analysis(image_bytes):
+    """
+    Executa analyze_pcb_image num processo do pool e devolve o resultado.
+    Levanta ScannerPoolFull quando a fila está cheia e TimeoutError quando a
+    análise excede SCANNER_POOL_TIMEOUT.
+
+    A vaga só é liberada quando o future termina: no tempo limite a análise
+    que já está rodando num processo continua ocupando o pool, e
+    future.cancel() só tem efeito se ela ainda estiver na fila.
+    """
+    global _avg_duration
+
+    if not _try_acquire_slot():
+        raise ScannerPoolFull(_estimate_retry_after())
+
+    inicio = time.monotonic()
+    try:
+        future = _get_executor().submit(_run_analysis, image_bytes)
+    except Exception:
+        _release_slot()
+        raise
+    future.add_done_callback(_release_slot)
+
+    while not future.done():
+        if time.monotonic() - inicio > SCANNER_POOL_TIMEOUT:
+            future.cancel()
+            raise TimeoutError('Tempo limite da análise do scanner excedido')
+        time.sleep(POLL_INTERVAL)
+
+    result = future.result()
+    _avg_duration = 0.8 * _avg_duration + 0.2 * (time.monotonic() - inicio)
+    return result
+
+
+def submit_batch(images):
+    """
+    Analisa uma lista de imagens no pool e devolve os resultados na mesma ordem.
+
+    O lote ocupa as vagas livres da fila (no máximo uma por imagem) e mantém
+    essa quantidade de análises em andamento até processar todas as imagens.
+    Cada vaga passa para o future da análise e é liberada quando ele termina;
+    para a imagem seguinte o lote volta a disputar uma vaga livre.
+    Levanta ScannerPoolFull se não houver nenhuma vaga livre.
+    """
+    global _pending, _avg_duration
+
+    with _lock:
+        slots = min(len(images), SCANNER_POOL_MAX_PENDING - _pending)
+        if slots <= 0:
+            raise ScannerPoolFull(_estimate_retry_after())
+        _pending += slots
+
+    # Vagas reservadas pelo lote que ainda não foram entregues a um future
+    reserved = slots
+    results = [None] * len(images)
+    executor = _get_executor()
+    in_flight = {}
+    next_index = 0
+    inicio = time.monotonic()
+    try:
+        while next_index < len(images) or in_flight:
+            while next_index < len(images) and len(in_flight) < slots:
+                if not reserved:
+                    if not _try_acquire_slot():
+                        break
+                    reserved += 1
+                future = executor.submit(_run_analysis, images[next_index])
+                reserved -= 1
+                future.add_done_callback(_release_slot)
+                in_flight[future] = (next_index, time.monotonic())
+                next_index += 1
+
+            if time.monotonic() - inicio > SCANNER_POOL_TIMEOUT * max(1, len(images) / float(slots)):
+                for future in in_flight:
+                    future.cancel()
+                raise TimeoutError('Tempo limite da análise do scanner excedido')
+
+            done = [f for f in in_flight if f.done()]
+            if not done:
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            for future in done:
+                index, started = in_flight.pop(future)
+                results[index] = future.result()
+                _avg_duration = 0.8 * _avg_duration + 0.2 * (time.monotonic() - started)
+
+        return results
+    finally:
+        with _lock:
+            _pending -= reserved
+
+
+def run_in_thread(fn, *args):
+    """
+    Executa um trabalho curto de CPU (hash, miniatura) numa thread do sistema
+    pelo tpool do eventlet e devolve o resultado. Decodificação do OpenCV e
+    SHA-256 liberam o GIL, então o loop continua atendendo as outras
+    requisições. Fora do eventlet (scripts, testes) roda direto.
+    """
+    try:
+        from eventlet import patcher, tpool
+    except ImportError:
+        return fn(*args)
+    if not patcher.is_monkey_patched('thread'):
+        return fn(*args)
+    return tpool.execute(fn, *args)
+
+
+def _shutdown_executor():
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
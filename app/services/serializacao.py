@@ -0,0 +1,217 @@
+"""
+Serialização de listas de modelos com carregamento declarado.
+
+Lote.to_dict() lê reservado_por, bloqueado_por, conferente, tipo_lote,
+fornecedor e solicitacao_origem.funcionario/fornecedor, e a listagem do WMS
+ainda soma len(lote.itens) e len(lote.sublotes): com carregamento lazy, cada
+acesso é uma consulta por lote (2.000 lotes passavam de 10.000 consultas).
+
+Aqui cada campo declara de que relacionamentos depende e cada conjunto de
+campos (completo, lista, detalhe, exportacao) é uma lista de nomes. Do
+conjunto saem:
+
+  - as opções de carregamento: joinedload para muitos-para-um (inclusive
+    caminhos como 'solicitacao_origem.funcionario'), selectinload para coleções
+  - as contagens (itens_count, sublotes_count) numa consulta agrupada por
+    contagem, com os ids da página, em vez de carregar as coleções
+
+    lotes = LOTE.consultar(Lote.query.filter_by(status='aprovado'), 'lista')
+
+O número de consultas é fixo: 1 da lista (com os JOINs) + 1 por contagem,
+qualquer que seja o número de lotes. Lote.to_dict() usa o conjunto
+'completo', então a saída de um lote avulso continua a mesma.
+"""
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models import db, Lote, ItemSolicitacao
+
+# valor de campo que não entra no dicionário (chaves que o to_dict só incluía quando havia relacionamento)
+OMITIR = object()
+
+
+class Campo:
+    def __init__(self, valor, *relacoes):
+        self.valor = valor
+        self.relacoes = relacoes
+
+
+class Serializador:
+    def __init__(self, modelo, campos, conjuntos, contagens=None):
+        """
+        campos: nome -> Campo; contagens: nome -> coluna do filho que aponta
+        para o id do modelo; conjuntos: nome -> lista de nomes de campos e contagens.
+        """
+        self.modelo = modelo
+        self.campos = campos
+        self.contagens = contagens or {}
+        self.conjuntos = {}
+        for nome, nomes in conjuntos.items():
+            desconhecidos = [c for c in nomes if c not in campos and c not in self.contagens]
+            if desconhecidos:
+                raise ValueError(f'Conjunto {nome}: campos desconhecidos {desconhecidos}')
+            self.conjuntos[nome] = tuple(nomes)
+        self._opcoes = {}
+
+    def _nomes(self, conjunto):
+        try:
+            return self.conjuntos[conjunto]
+        except KeyError:
+            raise ValueError(f'Conjunto de campos desconhecido: {conjunto}')
+
+    def relacoes(self, conjunto):
+        caminhos = set()
+        for nome in self._nomes(conjunto):
+            if nome in self.campos:
+                caminhos.update(self.campos[nome].relacoes)
+        return sorted(caminhos)
+
+    def opcoes(self, conjunto):
+        """Opções de carregamento para Query.options() que cobrem todos os campos do conjunto."""
+        if conjunto not in self._opcoes:
+            opcoes = []
+            for caminho in self.relacoes(conjunto):
+                modelo, opcao = self.modelo, None
+                for parte in caminho.split('.'):
+                    atributo = getattr(modelo, parte)
+                    carregar = selectinload if atributo.property.uselist else joinedload
+                    opcao = carregar(atributo) if opcao is None else getattr(opcao, carregar.__name__)(atributo)
+                    modelo = atributo.property.mapper.class_
+                opcoes.append(opcao)
+            self._opcoes[conjunto] = opcoes
+        return self._opcoes[conjunto]
+
+    def contar(self, ids, conjunto):
+        """nome da contagem -> {id: total}, uma consulta agrupada por contagem do conjunto."""
+        resultado = {}
+        for nome in self._nomes(conjunto):
+            if nome not in self.contagens:
+                continue
+            coluna = self.contagens[nome]
+            resultado[nome] = dict(
+                db.session.query(coluna, func.count()).filter(coluna.in_(ids)).group_by(coluna).all()
+            ) if ids else {}
+        return resultado
+
+    def serializar(self, obj, conjunto='completo', contagens=None):
+        nomes = self._nomes(conjunto)
+        if contagens is None and any(nome in self.contagens for nome in nomes):
+            contagens = self.contar([obj.id], conjunto)
+        dados = {}
+        for nome in nomes:
+            if nome in self.contagens:
+                dados[nome] = contagens[nome].get(obj.id, 0)
+                continue
+            valor = self.campos[nome].valor(obj)
+            if valor is not OMITIR:
+                dados[nome] = valor
+        return dados
+
+    def serializar_varios(self, objs, conjunto):
+        """Serializa objetos já carregados (ex.: lote.sublotes), com as contagens em lote."""
+        objs = list(objs)
+        contagens = self.contar([obj.id for obj in objs], conjunto)
+        return [self.serializar(obj, conjunto, contagens) for obj in objs]
+
+    def consultar(self, consulta, conjunto='lista'):
+        """Executa a consulta com o carregamento do conjunto e devolve a lista de dicionários."""
+        return self.serializar_varios(consulta.options(*self.opcoes(conjunto)).all(), conjunto)
+
+
+def _data(nome):
+    return Campo(lambda obj: getattr(obj, nome).isoformat() if getattr(obj, nome) else None)
+
+
+def _coluna(nome):
+    return Campo(lambda obj: getattr(obj, nome))
+
+
+def _nome(relacao):
+    return Campo(lambda obj: getattr(obj, relacao).nome if getattr(obj, relacao) else None, relacao)
+
+
+def _tolerante(valor, padrao):
+    # o to_dict antigo engolia erro ao ler tipo_lote/fornecedor (objeto fora da sessão)
+    def ler(obj):
+        try:
+            return valor(obj)
+        except Exception:
+            return padrao
+    return ler
+
+
+def _solicitacao_origem(lote):
+    solicitacao = lote.solicitacao_origem
+    if not solicitacao:
+        return OMITIR
+    return {
+        'id': solicitacao.id,
+        'funcionario_id': solicitacao.funcionario_id,
+        'funcionario_nome': solicitacao.funcionario.nome if solicitacao.funcionario else None,
+        'fornecedor_id': solicitacao.fornecedor_id,
+        'fornecedor_nome': solicitacao.fornecedor.nome if solicitacao.fornecedor else None
+    }
+
+
+CAMPOS_LOTE = {
+    **{nome: _coluna(nome) for nome in (
+        'id', 'numero_lote', 'tipo_lote_id', 'fornecedor_id', 'peso_total_kg', 'valor_total', 'status',
+        'localizacao_atual', 'observacoes', 'oc_id', 'os_id', 'conferencia_id', 'quantidade_itens',
+        'estrelas_media', 'classificacao_predominante', 'qualidade_recebida', 'tipo_retirada', 'reservado',
+        'reservado_para', 'reservado_por_id', 'bloqueado', 'tipo_bloqueio', 'bloqueado_por_id', 'motivo_bloqueio',
+        'conferente_id', 'anexos', 'divergencias', 'gps_inicio', 'gps_fim', 'ip_inicio', 'device_id',
+        'lote_pai_id', 'solicitacao_origem_id'
+    )},
+    **{nome: _data(nome) for nome in (
+        'data_criacao', 'reservado_em', 'bloqueado_em', 'data_fechamento', 'data_aprovacao'
+    )},
+    'reservado_por_nome': _nome('reservado_por'),
+    'bloqueado_por_nome': _nome('bloqueado_por'),
+    'conferente_nome': _nome('conferente'),
+    'tipo_lote': Campo(_tolerante(lambda l: {'id': l.tipo_lote.id, 'nome': l.tipo_lote.nome}
+                                  if l.tipo_lote else OMITIR, OMITIR), 'tipo_lote'),
+    'tipo_lote_nome': Campo(_tolerante(_nome('tipo_lote').valor, None), 'tipo_lote'),
+    'fornecedor': Campo(_tolerante(lambda l: {'id': l.fornecedor.id, 'nome': l.fornecedor.nome,
+                                              'cnpj': l.fornecedor.cnpj} if l.fornecedor else OMITIR, OMITIR),
+                        'fornecedor'),
+    'fornecedor_nome': Campo(_tolerante(_nome('fornecedor').valor, None), 'fornecedor'),
+    'solicitacao_origem': Campo(_solicitacao_origem, 'solicitacao_origem.funcionario',
+                                'solicitacao_origem.fornecedor'),
+    'funcionario_nome': Campo(lambda l: l.solicitacao_origem.funcionario.nome
+                              if l.solicitacao_origem and l.solicitacao_origem.funcionario else None,
+                              'solicitacao_origem.funcionario'),
+}
+
+# mesma ordem de chaves do antigo Lote.to_dict()
+_COMPLETO = (
+    'id', 'numero_lote', 'tipo_lote_id', 'fornecedor_id', 'peso_total_kg', 'valor_total', 'data_criacao', 'status',
+    'localizacao_atual', 'observacoes', 'oc_id', 'os_id', 'conferencia_id', 'quantidade_itens', 'estrelas_media',
+    'classificacao_predominante', 'qualidade_recebida', 'tipo_retirada', 'reservado', 'reservado_para',
+    'reservado_por_id', 'reservado_por_nome', 'reservado_em', 'bloqueado', 'tipo_bloqueio', 'bloqueado_por_id',
+    'bloqueado_por_nome', 'bloqueado_em', 'motivo_bloqueio', 'data_fechamento', 'data_aprovacao', 'conferente_id',
+    'conferente_nome', 'anexos', 'divergencias', 'gps_inicio', 'gps_fim', 'ip_inicio', 'device_id', 'lote_pai_id',
+    'solicitacao_origem_id', 'tipo_lote', 'tipo_lote_nome', 'fornecedor', 'fornecedor_nome', 'solicitacao_origem'
+)
+# dados de rastreio do dispositivo só no detalhe
+_RASTREIO = ('anexos', 'gps_inicio', 'gps_fim', 'ip_inicio', 'device_id')
+
+LOTE = Serializador(
+    Lote,
+    CAMPOS_LOTE,
+    conjuntos={
+        'completo': _COMPLETO,
+        'lista': tuple(c for c in _COMPLETO if c not in _RASTREIO) + ('itens_count', 'sublotes_count'),
+        'detalhe': _COMPLETO + ('itens_count', 'sublotes_count'),
+        'exportacao': (
+            'id', 'numero_lote', 'status', 'tipo_lote_nome', 'fornecedor_nome', 'peso_total_kg', 'valor_total',
+            'quantidade_itens', 'itens_count', 'sublotes_count', 'lote_pai_id', 'localizacao_atual', 'reservado',
+            'reservado_para', 'reservado_por_nome', 'bloqueado', 'tipo_bloqueio', 'bloqueado_por_nome',
+            'conferente_nome', 'solicitacao_origem_id', 'funcionario_nome', 'oc_id', 'os_id', 'data_criacao',
+            'data_fechamento', 'data_aprovacao'
+        ),
+    },
+    contagens={
+        'itens_count': ItemSolicitacao.lote_id,
+        'sublotes_count': Lote.lote_pai_id,
+    }
+)
@@ -0,0 +1,213 @@
+"""
+Eventos em tempo real das mudanças de estado de OS, solicitações e lotes.
+
+As telas de motorista, kanban, lotes aprovados e aprovação de solicitações
+recarregavam a lista inteira a cada 30 s. Agora:
+
+  - listeners de sessão do SQLAlchemy anotam, no flush, as OS, solicitações e
+    lotes que mudaram de status (ou de motorista/veículo/janela, no caso da
+    OS) e, só depois do commit, publicam um evento pequeno via Socket.IO nas
+    salas abertas em wsgi.handle_connect: 'admins', 'user_<id>' do
+    funcionário da solicitação e 'motorista_<id>' do motorista da OS
+  - o cliente, ao receber o evento, pede só o que mudou com ?since=<cursor>
+    no mesmo endpoint da lista (delta), em vez da lista completa
+
+O cursor é o horário do servidor no início da consulta; a consulta delta volta
+TEMPO_REAL_MARGEM_SEGUNDOS antes dele para não perder transações que gravaram
+atualizado_em antes do cursor e só confirmaram depois. Linhas repetidas são
+inofensivas: o cliente substitui pelo id.
+"""
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models import OrdemServico, Solicitacao, Lote
+
+TEMPO_REAL_ATIVO = os.getenv('TEMPO_REAL_ATIVO', 'true').lower() == 'true'
+TEMPO_REAL_MARGEM_SEGUNDOS = int(os.getenv('TEMPO_REAL_MARGEM_SEGUNDOS', 5))
+
+# modelo -> (tipo do evento, nome do evento Socket.IO, campos que geram evento)
+MONITORADOS = {
+    OrdemServico: ('os', 'os_atualizada',
+                   ('status', 'motorista_id', 'veiculo_id', 'janela_coleta_inicio', 'janela_coleta_fim')),
+    Solicitacao: ('solicitacao', 'solicitacao_atualizada', ('status',)),
+    Lote: ('lote', 'lote_atualizado', ('status', 'localizacao_atual', 'reservado', 'bloqueado')),
+}
+
+_CHAVE_SESSAO = 'tempo_real_eventos'
+
+
+class EstatisticasTempoReal:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.eventos = {}
+        self.erros = 0
+        self.ultimo_erro = None
+        self.consultas_delta = 0
+        self.linhas_delta = 0
+        self.consultas_completas = 0
+        self.linhas_completas = 0
+
+    def evento(self, tipo):
+        with self._lock:
+            self.eventos[tipo] = self.eventos.get(tipo, 0) + 1
+
+    def erro(self, e):
+        with self._lock:
+            self.erros += 1
+            self.ultimo_erro = str(e)
+
+    def consulta(self, delta, linhas):
+        with self._lock:
+            if delta:
+                self.consultas_delta += 1
+                self.linhas_delta += linhas
+            else:
+                self.consultas_completas += 1
+                self.linhas_completas += linhas
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'ativo': TEMPO_REAL_ATIVO,
+                'eventos_publicados': dict(self.eventos),
+                'erros': self.erros,
+                'ultimo_erro': self.ultimo_erro,
+                'consultas_delta': self.consultas_delta,
+                'linhas_delta': self.linhas_delta,
+                'consultas_completas': self.consultas_completas,
+                'linhas_completas': self.linhas_completas,
+                'margem_segundos': TEMPO_REAL_MARGEM_SEGUNDOS
+            }
+
+
+estatisticas = EstatisticasTempoReal()
+
+
+def _valor_anterior(estado, campo):
+    historico = estado.attrs[campo].history
+    if historico.deleted:
+        return historico.deleted[0]
+    return None
+
+
+def _montar_evento(obj, novo, removido):
+    tipo, nome, campos = MONITORADOS[type(obj)]
+    estado = inspect(obj)
+    if novo or removido:
+        alterados = []
+    else:
+        alterados = [c for c in campos if estado.attrs[c].history.has_changes()]
+        if not alterados:
+            return None
+    evento = {
+        'nome': nome,
+        'tipo': tipo,
+        'id': obj.id,
+        'status': obj.status,
+        'status_anterior': _valor_anterior(estado, 'status') if 'status' in alterados else None,
+        'campos': alterados,
+        'novo': novo,
+        'removido': removido,
+        'salas': {'admins'}
+    }
+    if tipo == 'os':
+        for motorista_id in (obj.motorista_id, _valor_anterior(estado, 'motorista_id')):
+            if motorista_id:
+                evento['salas'].add(f'motorista_{motorista_id}')
+        evento['numero_os'] = obj.numero_os
+    elif tipo == 'solicitacao':
+        evento['salas'].add(f'user_{obj.funcionario_id}')
+    else:
+        evento['numero_lote'] = obj.numero_lote
+    return evento
+
+
+def _coletar(session, flush_context):
+    if not TEMPO_REAL_ATIVO:
+        return
+    eventos = session.info.setdefault(_CHAVE_SESSAO, {})
+    for colecao, novo, removido in ((session.new, True, False), (session.dirty, False, False),
+                                    (session.deleted, False, True)):
+        for obj in colecao:
+            if type(obj) not in MONITORADOS:
+                continue
+            evento = _montar_evento(obj, novo, removido)
+            if evento is None:
+                continue
+            chave = (evento['tipo'], evento['id'])
+            anterior = eventos.get(chave)
+            if anterior:
+                # vários flushes na mesma transação: um evento só, com o status de antes do primeiro
+                evento['novo'] = anterior['novo'] or evento['novo']
+                evento['status_anterior'] = anterior['status_anterior'] or evento['status_anterior']
+                evento['campos'] = sorted(set(anterior['campos']) | set(evento['campos']))
+                evento['salas'] |= anterior['salas']
+            eventos[chave] = evento
+
+
+def _descartar(session):
+    session.info.pop(_CHAVE_SESSAO, None)
+
+
+def _publicar(session):
+    eventos = session.info.pop(_CHAVE_SESSAO, None)
+    if not eventos:
+        return
+    try:
+        from app import socketio
+        if socketio.server is None:
+            return
+        atualizado_em = datetime.utcnow().isoformat()
+        for evento in eventos.values():
+            nome = evento.pop('nome')
+            salas = evento.pop('salas')
+            evento['atualizado_em'] = atualizado_em
+            # uma emissão para todas as salas: quem está em duas (admin dono da
+            # solicitação) recebe uma vez, e com vários workers é uma publicação só na fila
+            socketio.emit(nome, evento, to=sorted(salas))
+            estatisticas.evento(evento['tipo'])
+    except Exception as e:
+        estatisticas.erro(e)
+        print(f"[TEMPO REAL] Erro ao publicar eventos: {e}")
+
+
+event.listen(Session, 'after_flush', _coletar)
+event.listen(Session, 'after_commit', _publicar)
+event.listen(Session, 'after_rollback', _descartar)
+
+
+def cursor_atual():
+    """Cursor para a próxima consulta delta: horário do servidor antes de ler as linhas."""
+    return datetime.utcnow().isoformat()
+
+
+def ler_cursor(valor):
+    """Converte ?since=<cursor> no limite inferior da consulta delta; ValueError se inválido."""
+    try:
+        cursor = datetime.fromisoformat(valor.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        raise ValueError('Parâmetro since inválido, use o cursor devolvido pela consulta anterior')
+    if cursor.tzinfo is not None:
+        cursor = cursor.astimezone(timezone.utc).replace(tzinfo=None)
+    return cursor - timedelta(seconds=TEMPO_REAL_MARGEM_SEGUNDOS)
+
+
+def registrar_consulta(delta, linhas):
+    estatisticas.consulta(delta, linhas)
+
+
+def get_tempo_real_stats():
+    """Contadores deste worker, com o pid e a fila de mensagens para conferir o modo multi-worker."""
+    from app import socketio
+    from app.services import estado_compartilhado
+
+    stats = estatisticas.to_dict()
+    stats['worker_pid'] = os.getpid()
+    stats['workers'] = int(os.getenv('WEB_CONCURRENCY', 1))
+    stats['fila_mensagens'] = type(socketio.server.manager).__name__ if socketio.server else None
+    stats['estado_compartilhado'] = estado_compartilhado.get_estado_stats()
+    return stats
@@ -171,7 +171,8 @@ function initWebSocket() {
     socket = io({
         auth: {
             token: getToken()
-        }
+        },
+        transports: ['websocket', 'polling']
     });
 
     socket.on('connect', () => {
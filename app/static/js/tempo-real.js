@@ -0,0 +1,129 @@
+/*
+ * Listas atualizadas por Socket.IO + consultas delta (?since=<cursor>).
+ *
+ * Carrega a lista completa uma vez e guarda o cursor (cabeçalho X-Cursor).
+ * Quando chega um dos eventos do servidor (os_atualizada,
+ * solicitacao_atualizada, lote_atualizado) busca só o que mudou desde o
+ * cursor e aplica na lista local. Sem WebSocket (desconectado ou socket.io
+ * indisponível) volta a consultar, também em modo delta, a cada
+ * intervaloFallback ms.
+ *
+ *   const lista = assinarTempoReal({
+ *       url: '/api/os',
+ *       eventos: ['os_atualizada'],
+ *       aoAtualizar: (itens) => renderizar(itens)
+ *   });
+ *   lista.atualizar();   // depois de uma ação do próprio usuário
+ */
+function assinarTempoReal({ url, eventos, aoAtualizar, ordenar = (a, b) => b.id - a.id, intervaloFallback = 30000, aoNaoAutorizado = null, aoErro = null }) {
+    const itens = new Map();
+    let cursor = null;
+    let socket = null;
+    let timerFallback = null;
+    let timerEvento = null;
+    let emAndamento = null;
+
+    function token() {
+        return localStorage.getItem('token');
+    }
+
+    function falhou(error) {
+        console.error('Erro ao atualizar lista:', error);
+        if (aoErro) aoErro(error);
+    }
+
+    function publicar() {
+        aoAtualizar(Array.from(itens.values()).sort(ordenar));
+    }
+
+    async function requisitar(endereco) {
+        const response = await fetch(endereco, {
+            headers: { 'Authorization': `Bearer ${token()}` }
+        });
+        if (response.status === 401 && aoNaoAutorizado) {
+            aoNaoAutorizado();
+            return null;
+        }
+        return response;
+    }
+
+    async function carregarCompleto() {
+        const response = await requisitar(url);
+        if (!response) return;
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        const lista = await response.json();
+        itens.clear();
+        lista.forEach(item => itens.set(item.id, item));
+        cursor = response.headers.get('X-Cursor');
+        publicar();
+    }
+
+    async function carregarDelta() {
+        if (!cursor) return carregarCompleto();
+        const separador = url.includes('?') ? '&' : '?';
+        const response = await requisitar(`${url}${separador}since=${encodeURIComponent(cursor)}`);
+        if (!response) return;
+        if (response.status === 400) return carregarCompleto();
+        if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+        const delta = await response.json();
+        delta.alterados.forEach(item => itens.set(item.id, item));
+        delta.removidos.forEach(id => itens.delete(id));
+        cursor = delta.cursor;
+        if (delta.alterados.length || delta.removidos.length) publicar();
+    }
+
+    function atualizar() {
+        // uma consulta por vez; eventos que chegam durante a consulta entram na próxima
+        if (emAndamento) {
+            return emAndamento.then(() => atualizar());
+        }
+        emAndamento = carregarDelta()
+            .catch(falhou)
+            .finally(() => { emAndamento = null; });
+        return emAndamento;
+    }
+
+    function agendar() {
+        clearTimeout(timerEvento);
+        timerEvento = setTimeout(atualizar, 300);
+    }
+
+    function iniciarFallback() {
+        if (!timerFallback) timerFallback = setInterval(atualizar, intervaloFallback);
+    }
+
+    function pararFallback() {
+        clearInterval(timerFallback);
+        timerFallback = null;
+    }
+
+    function conectar() {
+        if (typeof io === 'undefined' || !token()) {
+            iniciarFallback();
+            return;
+        }
+        socket = io('/', {
+            auth: { token: token() },
+            transports: ['websocket', 'polling']
+        });
+        socket.on('connect', () => {
+            pararFallback();
+            // eventos perdidos enquanto estava desconectado
+            if (cursor) atualizar();
+        });
+        socket.on('disconnect', iniciarFallback);
+        socket.on('connect_error', iniciarFallback);
+        eventos.forEach(nome => socket.on(nome, agendar));
+    }
+
+    carregarCompleto()
+        .catch(falhou)
+        .finally(conectar);
+
+    return {
+        atualizar,
+        recarregar: carregarCompleto,
+        itens: () => Array.from(itens.values()).sort(ordenar),
+        desconectar: () => { pararFallback(); if (socket) socket.disconnect(); }
+    };
+}
@@ -1,12 +1,22 @@
 """
 Utilitário de geocoding reverso (GPS → endereço)
 Usa Nominatim (OpenStreetMap) como fonte principal com fallback para ViaCEP
+
+Os resultados passam pelo cache de app/services/geocode_cache.py (memória +
+tabela geocode_cache, chave = coordenada arredondada) e, se houver gazetteer
+offline configurado, ele responde quando o Nominatim falha ou com
+GEOCODE_BACKEND=offline.
 """
 
 import requests
 from typing import Dict, Optional
 import time
 
+from app.services import geocode_cache
+
+ERRO_NAO_ENCONTRADO = 'Endereço não encontrado para estas coordenadas'
+
+
 def reverse_geocode(lat: float, lng: float, max_retries: int = 3) -> Dict[str, Optional[str]]:
     """
     Converte coordenadas GPS em endereço completo
@@ -17,10 +27,33 @@ def reverse_geocode(lat: float, lng: float, max_retries: int = 3) -> Dict[str, O
         max_retries: Número máximo de tentativas em caso de erro
     
     Returns:
-        Dict com chaves: rua, numero, cep, bairro, cidade, estado, pais, endereco_completo, raw
+        Dict com chaves: rua, numero, cep, bairro, cidade, estado, pais, endereco_completo, raw,
+        sucesso e fonte ('cache', 'nominatim' ou 'offline')
     """
-    
-    # Tentar Nominatim (OpenStreetMap) primeiro
+    lat, lng = float(lat), float(lng)
+
+    if geocode_cache.GEOCODE_BACKEND == 'offline':
+        return geocode_cache.geocodificar_offline(lat, lng) or _erro_nao_encontrado()
+
+    em_cache = geocode_cache.buscar(lat, lng)
+    if em_cache is not None:
+        return em_cache
+
+    # Com o gazetteer disponível não vale a pena esperar o backoff do Nominatim
+    offline = geocode_cache.offline_disponivel()
+    resultado = _consultar_nominatim(lat, lng, max_retries, esperar=not offline)
+
+    if resultado['sucesso']:
+        geocode_cache.guardar(lat, lng, resultado)
+    elif resultado.get('erro') == ERRO_NAO_ENCONTRADO:
+        geocode_cache.guardar(lat, lng, resultado, encontrado=False)
+    elif offline:
+        return geocode_cache.geocodificar_offline(lat, lng) or resultado
+    return resultado
+
+
+def _consultar_nominatim(lat: float, lng: float, max_retries: int, esperar: bool = True) -> Dict:
+    """Consulta o Nominatim (e o ViaCEP para o CEP), com backoff só quando `esperar`."""
     for tentativa in range(max_retries):
         try:
             # Nominatim exige User-Agent customizado
@@ -37,10 +70,17 @@ def reverse_geocode(lat: float, lng: float, max_retries: int = 3) -> Dict[str, O
                 'zoom': 18
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            inicio = time.perf_counter()
+            try:
+                response = requests.get(url, params=params, headers=headers, timeout=10)
+            except requests.RequestException:
+                geocode_cache.registrar_upstream('nominatim', (time.perf_counter() - inicio) * 1000, False)
+                raise
+            geocode_cache.registrar_upstream('nominatim', (time.perf_counter() - inicio) * 1000,
+                                             response.status_code == 200)
             
             if response.status_code == 429:  # Rate limit
-                if tentativa < max_retries - 1:
+                if esperar and tentativa < max_retries - 1:
                     time.sleep(2 ** tentativa)  # Backoff exponencial
                     continue
                 else:
@@ -108,18 +148,19 @@ def reverse_geocode(lat: float, lng: float, max_retries: int = 3) -> Dict[str, O
                     'pais': pais,
                     'endereco_completo': endereco_completo,
                     'raw': data,
-                    'sucesso': True
+                    'sucesso': True,
+                    'fonte': 'nominatim'
                 }
         
         except requests.Timeout:
-            if tentativa < max_retries - 1:
+            if esperar and tentativa < max_retries - 1:
                 time.sleep(1)
                 continue
             else:
                 return _erro_timeout()
         
         except requests.RequestException as e:
-            if tentativa < max_retries - 1:
+            if esperar and tentativa < max_retries - 1:
                 time.sleep(1)
                 continue
             else:
@@ -145,7 +186,14 @@ def _buscar_cep_viacep(rua: str, cidade: str, estado: str) -> Optional[str]:
         cidade_limpa = cidade.replace(' ', '%20')
         
         url = f'https://viacep.com.br/ws/{estado}/{cidade_limpa}/{rua_limpa}/json/'
-        response = requests.get(url, timeout=5)
+        inicio = time.perf_counter()
+        try:
+            response = requests.get(url, timeout=5)
+        except requests.RequestException:
+            geocode_cache.registrar_upstream('viacep', (time.perf_counter() - inicio) * 1000, False)
+            raise
+        geocode_cache.registrar_upstream('viacep', (time.perf_counter() - inicio) * 1000,
+                                         response.status_code == 200)
         
         if response.status_code == 200:
             data = response.json()
@@ -190,7 +238,7 @@ def _erro_nao_encontrado() -> Dict:
         'endereco_completo': '',
         'raw': {},
         'sucesso': False,
-        'erro': 'Endereço não encontrado para estas coordenadas'
+        'erro': ERRO_NAO_ENCONTRADO
     }
 
 
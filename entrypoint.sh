@@ -51,14 +51,22 @@ python init_db.py || {
     exit 1
 }
 
+# Workers: vários só com fila de mensagens do Socket.IO (ver DEPLOY_MULTIWORKER.md)
+export WEB_CONCURRENCY=${WEB_CONCURRENCY:-1}
+if [ "$WEB_CONCURRENCY" -gt 1 ] && [ -z "$SOCKETIO_MESSAGE_QUEUE" ] && [ -z "$REDIS_URL" ]; then
+    echo "⚠️  AVISO: WEB_CONCURRENCY=$WEB_CONCURRENCY sem SOCKETIO_MESSAGE_QUEUE/REDIS_URL"
+    echo "   Eventos Socket.IO e estado compartilhado exigem Redis; usando 1 worker"
+    export WEB_CONCURRENCY=1
+fi
+
 # Inicia o servidor Gunicorn
 echo ""
 echo "=========================================="
 echo "🌐 Iniciando servidor Gunicorn"
 echo "   - Worker: eventlet"
-echo "   - Workers: 1"
+echo "   - Workers: $WEB_CONCURRENCY"
 echo "   - Bind: 0.0.0.0:$PORT"
 echo "   - Timeout: 120s"
 echo "   - WSGI: wsgi:application"
 echo "=========================================="
-exec gunicorn --worker-class eventlet -w 1 --bind "0.0.0.0:$PORT" --timeout 120 --log-level info wsgi:application
+exec gunicorn --worker-class eventlet -w "$WEB_CONCURRENCY" --bind "0.0.0.0:$PORT" --timeout 120 --log-level info wsgi:application
@@ -0,0 +1,69 @@
+"""
+Manutenção do armazenamento de GPS (gps_logs)
+
+    python executar_manutencao_gps.py --particionar      # converte gps_logs em tabela particionada por mês (PostgreSQL)
+    python executar_manutencao_gps.py                    # cria as próximas partições e aplica a retenção
+    python executar_manutencao_gps.py --retencao-dias 60 --tolerancia 15
+    python executar_manutencao_gps.py --metricas-rotas   # calcula km/paradas das OS finalizadas sem métricas
+
+A retenção simplifica as posições brutas dos meses inteiros anteriores a
+--retencao-dias em gps_rotas_simplificadas e remove os pontos brutos; os
+eventos discretos (CHEGUEI, COLETEI, ...) são mantidos. Rodar diariamente
+via cron.
+"""
+import argparse
+
+
+def main():
+    from app.services import gps_armazenamento
+
+    parser = argparse.ArgumentParser(description='Partições e retenção de gps_logs')
+    parser.add_argument('--particionar', action='store_true', help='converte gps_logs numa tabela particionada')
+    parser.add_argument('--sem-retencao', action='store_true', help='não aplica a retenção')
+    parser.add_argument('--retencao-dias', type=int, default=gps_armazenamento.GPS_RETENCAO_DIAS,
+                        help='dias de pontos brutos mantidos')
+    parser.add_argument('--tolerancia', type=float, default=gps_armazenamento.GPS_SIMPLIFICACAO_METROS,
+                        help='tolerância do Douglas-Peucker em metros')
+    parser.add_argument('--metricas-rotas', action='store_true',
+                        help='calcula as métricas de rota das OS finalizadas que ainda não têm')
+    parser.add_argument('--meses-a-frente', type=int, default=gps_armazenamento.GPS_PARTICOES_A_FRENTE,
+                        help='partições criadas adiante do mês atual')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+
+    with app.app_context():
+        if args.particionar:
+            print("🔧 Particionando gps_logs por mês...")
+            copiadas = gps_armazenamento.particionar_tabela(args.meses_a_frente)
+            if copiadas is None:
+                print("   ✅ gps_logs já está particionada")
+            else:
+                print(f"   ✅ {copiadas} linhas copiadas para a tabela particionada")
+
+        criadas = gps_armazenamento.criar_particoes(meses_a_frente=args.meses_a_frente)
+        if criadas:
+            print(f"📅 Partições garantidas: {', '.join(criadas)}")
+
+        # As métricas leem a trilha completa; calcular antes da retenção simplificar os pontos
+        if args.metricas_rotas:
+            from app.services.rotas_metricas import calcular_pendentes
+            print("🚚 Calculando métricas de rota das OS finalizadas...")
+            print(f"   ✅ {calcular_pendentes()} OS calculadas")
+
+        if not args.sem_retencao:
+            print(f"🗜️  Aplicando retenção de {args.retencao_dias} dias (tolerância {args.tolerancia} m)...")
+            resumo = gps_armazenamento.executar_retencao(
+                retencao_dias=args.retencao_dias, tolerancia_metros=args.tolerancia
+            )
+            if not resumo:
+                print("   ✅ Nenhum mês para compactar")
+            for mes in resumo:
+                print(f"   ✅ {mes['mes']}: {mes['trajetos']} trajetos, "
+                      f"{mes['pontos_originais']} → {mes['pontos']} pontos")
+
+
+if __name__ == '__main__':
+    main()
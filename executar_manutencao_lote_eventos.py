@@ -0,0 +1,37 @@
+"""
+Migração do histórico de lotes para lote_eventos
+
+    python executar_manutencao_lote_eventos.py
+    python executar_manutencao_lote_eventos.py --tamanho 200
+
+Explode o array JSON Lote.auditoria de cada lote em linhas de lote_eventos
+(com alteracoes = {campo: [antes, depois]} derivadas dos snapshots
+'dados_before'), esvazia o array e troca os snapshots completos de
+MovimentacaoEstoque.dados_before/dados_after só pelas chaves que mudaram.
+Roda por faixas de ids, um commit por faixa; pode ser interrompida e rodada
+de novo.
+"""
+import argparse
+
+
+def main():
+    from app.services import lote_eventos
+
+    parser = argparse.ArgumentParser(description='Migra Lote.auditoria para lote_eventos')
+    parser.add_argument('--tamanho', type=int, default=lote_eventos.LOTE_EVENTOS_MIGRACAO_LOTE,
+                        help='lotes/movimentações por transação')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+
+    with app.app_context():
+        print("🔧 Migrando Lote.auditoria para lote_eventos...")
+        resumo = lote_eventos.migrar_auditoria(args.tamanho)
+        print(f"   ✅ {resumo['lotes']} lotes migrados, {resumo['eventos']} eventos gravados")
+        print(f"   ✅ {resumo['movimentacoes']} movimentações compactadas")
+
+
+if __name__ == '__main__':
+    main()
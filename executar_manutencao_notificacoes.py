@@ -0,0 +1,46 @@
+"""
+Retenção das notificações (notificacoes)
+
+    python executar_manutencao_notificacoes.py                     # arquiva as lidas com mais de 90 dias
+    python executar_manutencao_notificacoes.py --retencao-dias 30
+    python executar_manutencao_notificacoes.py --somente-contadores
+
+As notificações lidas mais antigas que --retencao-dias são copiadas para
+notificacoes_arquivadas e removidas da caixa de entrada, em lotes de
+--lote linhas, cada lote na sua transação. As não lidas nunca são
+arquivadas. No fim os contadores de não lidas (notificacoes_nao_lidas) que
+divergirem da contagem real são recalculados. Rodar diariamente via cron.
+"""
+import argparse
+
+
+def main():
+    from app.services import notificacoes
+
+    parser = argparse.ArgumentParser(description='Retenção das notificações lidas')
+    parser.add_argument('--retencao-dias', type=int, default=notificacoes.NOTIFICACOES_RETENCAO_DIAS,
+                        help='dias que as notificações lidas ficam na caixa de entrada')
+    parser.add_argument('--lote', type=int, default=notificacoes.NOTIFICACOES_RETENCAO_LOTE,
+                        help='notificações arquivadas por transação')
+    parser.add_argument('--somente-contadores', action='store_true',
+                        help='só recalcula os contadores de não lidas')
+    args = parser.parse_args()
+
+    from app import create_app
+
+    app = create_app()
+
+    with app.app_context():
+        if args.somente_contadores:
+            print("🔢 Recalculando contadores de não lidas...")
+            print(f"   ✅ {notificacoes.reconciliar_contadores()} contadores corrigidos")
+            return
+
+        print(f"🗄️  Arquivando notificações lidas com mais de {args.retencao_dias} dias...")
+        resumo = notificacoes.executar_retencao(retencao_dias=args.retencao_dias, lote=args.lote)
+        print(f"   ✅ {resumo['arquivadas']} notificações arquivadas (anteriores a {resumo['limite'][:10]})")
+        print(f"   ✅ {resumo['contadores_corrigidos']} contadores de não lidas corrigidos")
+
+
+if __name__ == '__main__':
+    main()
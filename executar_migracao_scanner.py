@@ -37,6 +37,37 @@ def run_migration():
         if 'image_mimetype' not in columns:
             migrations.append("ALTER TABLE scanner_analyses ADD COLUMN image_mimetype VARCHAR(50)")
         
+        if 'image_key' not in columns:
+            migrations.append("ALTER TABLE scanner_analyses ADD COLUMN image_key VARCHAR(64)")
+        
+        if 'thumbnail_key' not in columns:
+            migrations.append("ALTER TABLE scanner_analyses ADD COLUMN thumbnail_key VARCHAR(64)")
+        
+        if 'image_size' not in columns:
+            migrations.append("ALTER TABLE scanner_analyses ADD COLUMN image_size INTEGER")
+        
+        if 'image_sha256' not in columns:
+            migrations.append("ALTER TABLE scanner_analyses ADD COLUMN image_sha256 VARCHAR(64)")
+        
+        if 'image_phash' not in columns:
+            migrations.append("ALTER TABLE scanner_analyses ADD COLUMN image_phash VARCHAR(16)")
+        
+        if 'config_version' not in columns:
+            migrations.append("ALTER TABLE scanner_analyses ADD COLUMN config_version INTEGER")
+        
+        if 'board_detected' not in columns:
+            migrations.append("ALTER TABLE scanner_analyses ADD COLUMN board_detected BOOLEAN")
+        
+        for column in ('image_sha256', 'image_key', 'thumbnail_key'):
+            migrations.append(
+                f"CREATE INDEX IF NOT EXISTS ix_scanner_analyses_{column} ON scanner_analyses ({column})"
+            )
+        
+        if 'scanner_config' in inspector.get_table_names():
+            config_columns = [col['name'] for col in inspector.get_columns('scanner_config')]
+            if 'version' not in config_columns:
+                migrations.append("ALTER TABLE scanner_config ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        
         for migration in migrations:
             try:
                 print(f"Executando: {migration}")
@@ -0,0 +1,53 @@
+"""
+Backfill, atualização e verificação dos rollups diários do dashboard
+
+    python executar_rollups_dashboard.py               # atualização incremental
+    python executar_rollups_dashboard.py --rebuild     # reconstrói tudo do zero (backfill)
+    python executar_rollups_dashboard.py --verificar   # compara rollups x tabelas de origem
+
+--verificar pode ser combinado com as outras opções e termina com código 1
+se encontrar divergências (útil em cron / CI).
+"""
+import sys
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rollups diários do dashboard')
+    parser.add_argument('--rebuild', action='store_true', help='reconstrói os rollups a partir das tabelas de origem')
+    parser.add_argument('--verificar', action='store_true', help='compara os rollups com as tabelas de origem')
+    parser.add_argument('--max-divergencias', type=int, default=20, help='divergências exibidas por tabela')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.services.dashboard_rollups import atualizar_rollups, verificar_rollups
+
+    app = create_app()
+
+    with app.app_context():
+        if args.rebuild or not args.verificar:
+            print(f"🔄 {'Reconstruindo' if args.rebuild else 'Atualizando'} rollups do dashboard...")
+            resumo = atualizar_rollups(completo=args.rebuild)
+            for nome, info in resumo.items():
+                modo = 'completo' if info['completo'] else f"{info['dias_recalculados']} dias"
+                print(f"   ✅ {nome}: {modo} em {info['ms']} ms")
+
+        if args.verificar:
+            print("\n🔍 Verificando rollups contra as tabelas de origem...")
+            relatorio = verificar_rollups()
+            total_divergencias = 0
+            for nome, info in relatorio.items():
+                divergencias = info['divergencias']
+                total_divergencias += len(divergencias)
+                marca = '✅' if not divergencias else '❌'
+                print(f"   {marca} {nome}: {info['linhas']} grupos, {len(divergencias)} divergências")
+                for d in divergencias[:args.max_divergencias]:
+                    print(f"      {d['chave']}: origem={d['origem']} rollup={d['rollup']}")
+
+            if total_divergencias:
+                print("\n⚠️  Rode com --rebuild para reconstruir os rollups")
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Migração das imagens do scanner do banco (scanner_analyses.image_data) para o
+blob store configurado em SCANNER_BLOB_BACKEND.
+
+Percorre as análises em lotes pelo id (sem OFFSET), grava a imagem original e
+a miniatura no blob store, preenche image_key/thumbnail_key/image_size e limpa
+image_data. Cada lote é confirmado separadamente, então a migração pode ser
+interrompida e retomada a qualquer momento.
+
+    python migrar_imagens_scanner.py                  # migra tudo
+    python migrar_imagens_scanner.py --batch-size 50  # lotes menores
+    python migrar_imagens_scanner.py --dry-run        # só conta as linhas
+"""
+import argparse
+
+
+def run_migration(batch_size=100, dry_run=False):
+    from app import create_app
+    from app.models import db, ScannerAnalysis
+    from app.services.blob_store import store_scanner_image, SCANNER_BLOB_BACKEND
+
+    app = create_app()
+
+    with app.app_context():
+        pendentes = ScannerAnalysis.query.filter(
+            ScannerAnalysis.image_data.isnot(None),
+            ScannerAnalysis.image_key.is_(None)
+        ).count()
+        print(f"📦 Backend: {SCANNER_BLOB_BACKEND}")
+        print(f"🔍 {pendentes} análises com imagem no banco")
+
+        if dry_run or pendentes == 0:
+            return
+
+        ultimo_id = 0
+        migradas = 0
+        bytes_migrados = 0
+        while True:
+            ids = [row.id for row in db.session.query(ScannerAnalysis.id).filter(
+                ScannerAnalysis.id > ultimo_id,
+                ScannerAnalysis.image_data.isnot(None),
+                ScannerAnalysis.image_key.is_(None)
+            ).order_by(ScannerAnalysis.id).limit(batch_size)]
+            if not ids:
+                break
+
+            try:
+                for analysis in ScannerAnalysis.query.filter(ScannerAnalysis.id.in_(ids)):
+                    image_data = bytes(analysis.image_data)
+                    fields = store_scanner_image(image_data, analysis.image_mimetype)
+                    analysis.image_key = fields['image_key']
+                    analysis.thumbnail_key = fields['thumbnail_key']
+                    analysis.image_size = fields['image_size']
+                    analysis.image_mimetype = fields['image_mimetype']
+                    analysis.image_data = None
+                    bytes_migrados += len(image_data)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"❌ Erro no lote a partir do id {ids[0]}: {e}")
+                raise
+            finally:
+                db.session.expunge_all()
+
+            ultimo_id = ids[-1]
+            migradas += len(ids)
+            print(f"   ✅ {migradas}/{pendentes} migradas (até id {ultimo_id})")
+
+        print(f"\n🎉 Migração concluída: {migradas} imagens, {bytes_migrados / 1e6:.1f} MB fora do banco")
+        print("   Rode VACUUM FULL scanner_analyses (fora do horário de pico) para devolver o espaço ao disco")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migra imagens do scanner para o blob store')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    run_migration(batch_size=args.batch_size, dry_run=args.dry_run)
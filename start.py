@@ -18,10 +18,16 @@ def main():
     print(f"ℹ️  Usando PORT: {port}")
     print(f"ℹ️  DATABASE_URL está configurado: {'Sim' if os.environ.get('DATABASE_URL') else 'Não'}")
     
+    workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+    if workers > 1 and not (os.environ.get('SOCKETIO_MESSAGE_QUEUE') or os.environ.get('REDIS_URL')):
+        print(f"⚠️  WEB_CONCURRENCY={workers} sem SOCKETIO_MESSAGE_QUEUE/REDIS_URL, usando 1 worker")
+        workers = 1
+    os.environ['WEB_CONCURRENCY'] = str(workers)
+    
     cmd = [
         "gunicorn",
         "--worker-class", "eventlet",
-        "-w", "1",
+        "-w", str(workers),
         "--bind", f"0.0.0.0:{port}",
         "--timeout", "120",
         "app:application"
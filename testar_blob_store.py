@@ -0,0 +1,158 @@
+"""
+Script para testar o blob store do scanner e a rota GET /api/scanner/blobs/<key>
+
+1. Backend S3 (S3BlobStore) com o Stubber do botocore, sem rede: put grava
+   sob o prefixo com Cache-Control privado e não regrava uma chave que já
+   existe; get lê o objeto e devolve None para chave ausente.
+2. Backend tiered: a leitura que cai no S3 aquece o cache local, e a
+   seguinte não chega ao S3.
+3. Rota de blobs: exige token, serve a imagem e a miniatura ao dono e ao
+   admin, responde 404 a outro usuário e nunca marca a resposta como pública.
+
+    python testar_blob_store.py
+"""
+import io
+import os
+import shutil
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_blob_store.db')
+os.environ.setdefault('SCANNER_BLOB_DIR', '/tmp/benchmark_blob_store')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'teste')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'teste')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+from testar_scanner_opencv import gerar_placa
+
+
+def s3_com_stub(prefixo='scanner/'):
+    from botocore.stub import Stubber
+    from app.services.blob_store import S3BlobStore
+
+    store = S3BlobStore(bucket='placas', prefix=prefixo)
+    return store, Stubber(store.client)
+
+
+def testar_s3(foto):
+    from botocore.response import StreamingBody
+    from botocore.stub import ANY
+    from app.services.blob_store import content_key
+
+    print("🪣 Backend S3\n")
+    chave = content_key(foto)
+    objeto = f'scanner/{chave[:2]}/{chave}'
+    store, stub = s3_com_stub()
+
+    stub.add_client_error('head_object', service_error_code='404', http_status_code=404,
+                          expected_params={'Bucket': 'placas', 'Key': objeto})
+    stub.add_response('put_object', {}, expected_params={
+        'Bucket': 'placas', 'Key': objeto, 'Body': foto, 'ContentType': 'image/jpeg',
+        'CacheControl': 'private, max-age=31536000, immutable'
+    })
+    stub.add_response('head_object', {}, expected_params={'Bucket': 'placas', 'Key': objeto})
+    stub.add_response('get_object', {'Body': StreamingBody(io.BytesIO(foto), len(foto))},
+                      expected_params={'Bucket': 'placas', 'Key': objeto})
+    stub.add_client_error('get_object', service_error_code='NoSuchKey', http_status_code=404,
+                          expected_params={'Bucket': 'placas', 'Key': ANY})
+
+    with stub:
+        gravada = store.put(foto)
+        regravada = store.put(foto)
+        lida = store.get(chave)
+        ausente = store.get('0' * 64)
+    stub.assert_no_pending_responses()
+
+    ok = gravada == regravada == chave and lida == foto and ausente is None
+    print(f"   {'✅' if ok else '❌'} put/get sob {objeto[:24]}..., sem regravar a mesma chave")
+    return ok
+
+
+def testar_tiered(foto):
+    from botocore.response import StreamingBody
+    from app.services.blob_store import LocalBlobStore, TieredBlobStore, content_key
+
+    print("\n🗄️  Backend tiered (S3 + cache local)\n")
+    chave = content_key(foto)
+    cache = LocalBlobStore(os.path.join(os.environ['SCANNER_BLOB_DIR'], 'tiered'))
+    cache.delete(chave)
+    s3, stub = s3_com_stub()
+    store = TieredBlobStore(s3, cache)
+
+    stub.add_response('get_object', {'Body': StreamingBody(io.BytesIO(foto), len(foto))})
+    with stub:
+        primeira = store.get(chave)
+        segunda = store.get(chave)
+    stub.assert_no_pending_responses()
+
+    ok = primeira == segunda == foto and cache.exists(chave)
+    print(f"   {'✅' if ok else '❌'} Uma leitura no S3, a segunda servida pelo cache local")
+    return ok
+
+
+def testar_rota(foto):
+    from flask_jwt_extended import create_access_token
+    import wsgi
+    from app.models import db, Usuario, ScannerAnalysis
+    from app.services.blob_store import store_scanner_image
+
+    print("\n🔒 GET /api/scanner/blobs/<key>\n")
+    app = wsgi.app
+    with app.app_context():
+        ids = {}
+        for email, tipo in (('blob.dono@mrx.test', 'funcionario'), ('blob.outro@mrx.test', 'funcionario'),
+                            ('blob.admin@mrx.test', 'admin')):
+            usuario = Usuario.query.filter_by(email=email).first()
+            if not usuario:
+                usuario = Usuario(nome=email.split('@')[0], email=email, senha_hash='x', tipo=tipo)
+                db.session.add(usuario)
+                db.session.commit()
+            ids[email.split('.')[1].split('@')[0]] = usuario.id
+
+        campos = store_scanner_image(foto, 'image/jpeg')
+        ScannerAnalysis.query.filter_by(usuario_id=ids['dono']).delete()
+        db.session.add(ScannerAnalysis(usuario_id=ids['dono'], grade='MEDIUM', board_detected=True, **campos))
+        db.session.commit()
+        tokens = {nome: create_access_token(identity=str(usuario_id)) for nome, usuario_id in ids.items()}
+
+    cliente = app.test_client()
+
+    def baixar(chave, quem=None):
+        cabecalho = {'Authorization': f'Bearer {tokens[quem]}'} if quem else {}
+        return cliente.get(f'/api/scanner/blobs/{chave}', headers=cabecalho)
+
+    casos = [
+        ('Sem token', baixar(campos['image_key']), 401),
+        ('Dono, imagem', baixar(campos['image_key'], 'dono'), 200),
+        ('Dono, miniatura', baixar(campos['thumbnail_key'], 'dono'), 200),
+        ('Outro usuário', baixar(campos['image_key'], 'outro'), 404),
+        ('Admin', baixar(campos['image_key'], 'admin'), 200),
+    ]
+
+    ok = True
+    for nome, resposta, esperado in casos:
+        cache_control = resposta.headers.get('Cache-Control', '')
+        certo = resposta.status_code == esperado and 'public' not in cache_control
+        if esperado == 200:
+            certo &= 'private' in cache_control
+        ok &= certo
+        print(f"   {'✅' if certo else '❌'} {nome:<16} {resposta.status_code}  {cache_control}")
+
+    dono = casos[1][1]
+    condicional = cliente.get(f"/api/scanner/blobs/{campos['image_key']}",
+                              headers={'Authorization': f"Bearer {tokens['dono']}",
+                                       'If-None-Match': f'"{campos["image_key"]}"'})
+    ok &= dono.data == foto and condicional.status_code == 304
+    print(f"   {'✅' if condicional.status_code == 304 else '❌'} If-None-Match com a chave: {condicional.status_code}")
+    return ok
+
+
+def main():
+    print("🧪 TESTE DO BLOB STORE DO SCANNER\n")
+    shutil.rmtree(os.environ['SCANNER_BLOB_DIR'], ignore_errors=True)
+    foto = gerar_placa(1280, 960, (40, 120, 30), 6.0e-5, 11)
+
+    resultados = [testar_s3(foto), testar_tiered(foto), testar_rota(foto)]
+    assert all(resultados), 'Blob store do scanner com resultado inesperado'
+
+
+if __name__ == '__main__':
+    main()
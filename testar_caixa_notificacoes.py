@@ -0,0 +1,193 @@
+"""
+Benchmark da caixa de entrada de notificações (paginação por cursor,
+contador de não lidas e retenção)
+
+Um usuário com 50.000 notificações (30% não lidas, metade com mais de 90
+dias) e mais 2.000 usuários com 20 notificações cada. Compara:
+
+  - GET /api/notificacoes: antes devolvia tudo; agora páginas de 50 por
+    cursor (keyset). Mede a 1ª página, uma página funda (a 500ª) pelo cursor
+    e a mesma página por OFFSET, que é o que a paginação tradicional faria
+  - GET /api/notificacoes/nao-lidas: count() a cada consulta x contador
+  - consistência do contador depois de envio em lote, insert pelo ORM,
+    marcar uma, marcar todas e retenção
+  - percorrer todas as páginas devolve cada notificação uma vez, mesmo com
+    milhares de linhas com o mesmo data_envio (envio em lote)
+
+    python testar_caixa_notificacoes.py
+"""
+import os
+import time
+import random
+import statistics
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_caixa_notificacoes.db')
+
+NOTIFICACOES_USUARIO = 50000
+OUTROS_USUARIOS = 2000
+NOTIFICACOES_OUTROS = 20
+REPETICOES = 20
+
+
+def popular(db):
+    from sqlalchemy import insert
+    from app.models import Usuario, Notificacao
+
+    usuario = Usuario.query.filter_by(email='caixa.cheia@mrx.test').first()
+    if usuario:
+        return usuario.id
+    rng = random.Random(3)
+    usuario = Usuario(nome='Caixa Cheia', email='caixa.cheia@mrx.test', senha_hash='x', tipo='funcionario')
+    db.session.add(usuario)
+    db.session.flush()
+    outros = [{'nome': f'Outro {i}', 'email': f'caixa.outro.{i}@mrx.test', 'senha_hash': 'x',
+               'tipo': 'funcionario', 'ativo': True, 'data_cadastro': datetime.utcnow()}
+              for i in range(OUTROS_USUARIOS)]
+    db.session.execute(insert(Usuario), outros)
+    ids_outros = [u.id for u in Usuario.query.filter(Usuario.email.like('caixa.outro.%')).all()]
+
+    agora = datetime.utcnow()
+    linhas = []
+    for i in range(NOTIFICACOES_USUARIO):
+        # blocos de 500 com o mesmo horário, como um envio em lote
+        data_envio = agora - timedelta(days=180 * (i // 500) / (NOTIFICACOES_USUARIO // 500))
+        linhas.append({'usuario_id': usuario.id, 'titulo': f'Notificação {i}', 'mensagem': 'x' * 120,
+                       'tipo': 'benchmark', 'lida': rng.random() > 0.3, 'data_envio': data_envio})
+    for usuario_id in ids_outros:
+        for i in range(NOTIFICACOES_OUTROS):
+            linhas.append({'usuario_id': usuario_id, 'titulo': 'Outra', 'mensagem': 'y' * 120, 'tipo': 'benchmark',
+                           'lida': rng.random() > 0.5, 'data_envio': agora - timedelta(hours=i)})
+    # direto na tabela, sem passar pelos contadores: a primeira consulta cria a linha com count()
+    for i in range(0, len(linhas), 5000):
+        db.session.execute(insert(Notificacao.__table__), linhas[i:i + 5000])
+    db.session.commit()
+    return usuario.id
+
+
+def medir(funcao, repeticoes=REPETICOES):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos), resultado
+
+
+def main():
+    from flask import jsonify
+    from flask_jwt_extended import create_access_token
+    import wsgi
+    from app.models import db, Notificacao, NotificacaoContador, NotificacaoArquivada
+    from app.services import notificacoes
+
+    app = wsgi.app
+    print("🧪 BENCHMARK: CAIXA DE ENTRADA DE NOTIFICAÇÕES\n")
+    with app.app_context():
+        usuario_id = popular(db)
+        token = create_access_token(identity=str(usuario_id))
+    cabecalho = {'Authorization': f'Bearer {token}'}
+    cliente = app.test_client()
+
+    def reais_nao_lidas():
+        with app.app_context():
+            return Notificacao.query.filter_by(usuario_id=usuario_id, lida=False).count()
+
+    def contador():
+        return cliente.get('/api/notificacoes/nao-lidas', headers=cabecalho).get_json()['count']
+
+    # lista: tudo (antes) x primeira página x página funda por cursor x por OFFSET
+    def lista_completa():
+        with app.test_request_context():
+            todas = Notificacao.query.filter_by(usuario_id=usuario_id).order_by(Notificacao.data_envio.desc()).all()
+            return len(jsonify([n.to_dict() for n in todas]).data)
+
+    ms_tudo, bytes_tudo = medir(lista_completa, 3)
+    ms_pagina, resposta = medir(lambda: cliente.get('/api/notificacoes', headers=cabecalho))
+    bytes_pagina = len(resposta.data)
+
+    # percorre todas as páginas guardando o cursor da 500ª
+    vistos, cursor, paginas, cursor_funda = [], None, 0, None
+    while True:
+        url = f'/api/notificacoes?limite=50' + (f'&cursor={cursor}' if cursor else '')
+        resposta = cliente.get(url, headers=cabecalho)
+        vistos.extend(n['id'] for n in resposta.get_json())
+        paginas += 1
+        cursor = resposta.headers.get('X-Proximo-Cursor')
+        if paginas == 499:
+            cursor_funda = cursor
+        if not cursor:
+            break
+    paginacao_ok = len(vistos) == len(set(vistos)) == NOTIFICACOES_USUARIO
+
+    ms_funda, _ = medir(lambda: cliente.get(f'/api/notificacoes?limite=50&cursor={cursor_funda}', headers=cabecalho))
+
+    def por_offset():
+        with app.app_context():
+            return Notificacao.query.filter_by(usuario_id=usuario_id).order_by(
+                Notificacao.data_envio.desc(), Notificacao.id.desc()).offset(499 * 50).limit(50).all()
+    ms_offset, _ = medir(por_offset)
+
+    # não lidas: count() x contador
+    def por_count():
+        with app.app_context():
+            return Notificacao.query.filter_by(usuario_id=usuario_id, lida=False).count()
+    ms_count, _ = medir(por_count)
+    contador()  # cria a linha do contador
+    ms_contador, _ = medir(contador)
+
+    print(f"{'Operação':<42} | {'Antes':>18} | {'Agora':>18}")
+    print("-" * 84)
+    print(f"{'GET /api/notificacoes':<42} | {ms_tudo:>8.1f} ms {bytes_tudo / 1024:>5.0f} KB | "
+          f"{ms_pagina:>8.1f} ms {bytes_pagina / 1024:>5.0f} KB")
+    print(f"{'Página 500 (OFFSET x cursor)':<42} | {ms_offset:>15.2f} ms | {ms_funda:>15.2f} ms")
+    print(f"{'GET /nao-lidas (count() x contador)':<42} | {ms_count:>15.2f} ms | {ms_contador:>15.2f} ms")
+    print(f"\n   {'✅' if paginacao_ok else '❌'} {paginas} páginas por cursor: {len(vistos)} notificações, "
+          f"sem repetição nem falta")
+
+    # consistência do contador
+    verificacoes = []
+    with app.test_request_context():
+        notificacoes.notificar([usuario_id], 'Em lote', 'teste', adiar=False)
+        db.session.add(Notificacao(usuario_id=usuario_id, titulo='ORM', mensagem='teste'))
+        db.session.commit()
+    verificacoes.append(('envio em lote + insert pelo ORM', contador(), reais_nao_lidas()))
+    with app.app_context():
+        uma = Notificacao.query.filter_by(usuario_id=usuario_id, lida=False).first().id
+    cliente.put(f'/api/notificacoes/{uma}/marcar-lida', headers=cabecalho)
+    verificacoes.append(('marcar uma como lida', contador(), reais_nao_lidas()))
+
+    with app.app_context():
+        inicio = time.perf_counter()
+        resumo = notificacoes.executar_retencao(retencao_dias=90)
+        ms_retencao = (time.perf_counter() - inicio) * 1000
+        restantes = Notificacao.query.filter_by(usuario_id=usuario_id).count()
+        antigas_lidas = Notificacao.query.filter(Notificacao.lida == True, Notificacao.data_envio <
+                                                 datetime.utcnow() - timedelta(days=90)).count()
+        arquivadas = NotificacaoArquivada.query.count()
+    verificacoes.append(('retenção', contador(), reais_nao_lidas()))
+
+    inicio = time.perf_counter()
+    marcadas = cliente.put('/api/notificacoes/marcar-todas-lidas', headers=cabecalho).get_json()['marcadas']
+    ms_todas = (time.perf_counter() - inicio) * 1000
+    verificacoes.append(('marcar todas como lidas', contador(), reais_nao_lidas()))
+
+    for nome, valor, real in verificacoes:
+        print(f"   {'✅' if valor == real else '❌'} Contador depois de {nome}: {valor} (real {real})")
+    print(f"   {'✅' if antigas_lidas == 0 and arquivadas == resumo['arquivadas'] else '❌'} Retenção: "
+          f"{resumo['arquivadas']} lidas com mais de 90 dias arquivadas em {ms_retencao:.0f} ms, "
+          f"{restantes} na caixa de entrada")
+    print(f"   ✅ marcar-todas-lidas: {marcadas} notificações num UPDATE em {ms_todas:.0f} ms")
+
+    with app.app_context():
+        db.session.query(NotificacaoContador).filter_by(usuario_id=usuario_id).update({'total': 999})
+        db.session.commit()
+        corrigidos = notificacoes.reconciliar_contadores()
+    print(f"   {'✅' if contador() == reais_nao_lidas() else '❌'} Contador adulterado corrigido pela "
+          f"reconciliação ({corrigidos} corrigido)")
+    invalido = cliente.get('/api/notificacoes?cursor=ontem', headers=cabecalho)
+    print(f"   {'✅' if invalido.status_code == 400 else '❌'} Cursor inválido → {invalido.status_code}")
+
+
+if __name__ == '__main__':
+    main()
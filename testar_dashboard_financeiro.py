@@ -0,0 +1,165 @@
+"""
+Benchmark das métricas financeiras do dashboard (/api/dashboard/financeiro)
+
+Popula um banco com compradores, fornecedores e lotes aprovados nos últimos
+meses e compara a implementação original (3 consultas por comprador + 6
+mensais) com a versão agrupada sobre os rollups diários de
+app/services/dashboard_stats.py, conferindo que o payload é idêntico e que o
+número de consultas não cresce com a quantidade de compradores.
+
+    python testar_dashboard_financeiro.py             # 50 e 500 compradores
+    python testar_dashboard_financeiro.py 50 500 2000
+"""
+import os
+import sys
+import math
+import time
+import random
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_financeiro.db')
+
+CENARIOS = [int(n) for n in sys.argv[1:]] or [50, 500]
+LOTES_POR_COMPRADOR = 40
+RODADAS = 3
+
+
+def metricas_legado():
+    """Implementação original, com consultas por comprador, usada como referência."""
+    from sqlalchemy import func
+    from dateutil.relativedelta import relativedelta
+    from app.models import db, Usuario, Lote, Fornecedor
+
+    hoje = datetime.now()
+    mes_atual = datetime(hoje.year, hoje.month, 1)
+    # Semana a partir da meia-noite de segunda-feira, como nos rollups diários
+    inicio_semana = datetime(hoje.year, hoje.month, hoje.day) - timedelta(days=hoje.weekday())
+
+    compradores = Usuario.query.filter(
+        Usuario.tipo.in_(['admin', 'funcionario']),
+        Usuario.ativo == True
+    ).all()
+
+    gastos_por_comprador = []
+    for comprador in compradores:
+        base = db.session.query(func.sum(Lote.valor_total)).join(
+            Fornecedor, Lote.fornecedor_id == Fornecedor.id
+        ).filter(Fornecedor.comprador_responsavel_id == comprador.id, Lote.status == 'aprovado')
+        valor_mes = base.filter(Lote.data_criacao >= mes_atual).scalar() or 0
+        valor_semana = base.filter(Lote.data_criacao >= inicio_semana).scalar() or 0
+        qtd_compras = db.session.query(func.count(Lote.id)).join(
+            Fornecedor, Lote.fornecedor_id == Fornecedor.id
+        ).filter(
+            Fornecedor.comprador_responsavel_id == comprador.id,
+            Lote.data_criacao >= mes_atual,
+            Lote.status == 'aprovado'
+        ).scalar() or 0
+        gastos_por_comprador.append({
+            'nome': comprador.nome,
+            'valor_mes': float(valor_mes),
+            'valor_semana': float(valor_semana),
+            'qtd_compras': qtd_compras,
+            'ticket_medio': (float(valor_mes) / qtd_compras) if qtd_compras > 0 else 0
+        })
+
+    gastos_mensais = []
+    for i in range(5, -1, -1):
+        inicio_mes = mes_atual - relativedelta(months=i)
+        valor = db.session.query(func.sum(Lote.valor_total)).filter(
+            Lote.data_criacao >= inicio_mes,
+            Lote.data_criacao < inicio_mes + relativedelta(months=1),
+            Lote.status == 'aprovado'
+        ).scalar() or 0
+        gastos_mensais.append({'mes': inicio_mes.month, 'valor': float(valor)})
+
+    return gastos_por_comprador, gastos_mensais
+
+
+def popular(db, compradores_desejados):
+    from app.models import Usuario, Fornecedor, TipoLote, Lote
+
+    existentes = Usuario.query.filter(Usuario.email.like('comprador.bench%')).count()
+    if existentes >= compradores_desejados:
+        return
+
+    rng = random.Random(existentes)
+    tipo = TipoLote.query.filter_by(nome='Tipo Benchmark Financeiro').first()
+    if not tipo:
+        tipo = TipoLote(nome='Tipo Benchmark Financeiro', classificacao='media')
+        db.session.add(tipo)
+        db.session.commit()
+
+    agora = datetime.now()
+    for i in range(existentes, compradores_desejados):
+        comprador = Usuario(nome=f'Comprador {i}', email=f'comprador.bench{i}@teste.com',
+                            senha_hash='x', tipo='funcionario')
+        db.session.add(comprador)
+        db.session.flush()
+        fornecedor = Fornecedor(nome=f'Fornecedor Financeiro {i}', comprador_responsavel_id=comprador.id)
+        db.session.add(fornecedor)
+        db.session.flush()
+        db.session.execute(Lote.__table__.insert(), [{
+            'numero_lote': f'FIN-{i:05d}-{j:03d}',
+            'fornecedor_id': fornecedor.id,
+            'tipo_lote_id': tipo.id,
+            'status': rng.choice(['aprovado', 'aprovado', 'aberto']),
+            'valor_total': round(rng.uniform(100, 5000), 2),
+            'data_criacao': agora - timedelta(days=rng.uniform(0, 200))
+        } for j in range(LOTES_POR_COMPRADOR)])
+    db.session.commit()
+
+
+def medir(funcao, consultas):
+    tempos = []
+    resultado = None
+    consultas.clear()
+    for _ in range(RODADAS):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, sorted(tempos)[len(tempos) // 2], len(consultas) // RODADAS
+
+
+def main():
+    from sqlalchemy import event
+    from app import create_app
+    from app.models import db
+    from app.services.dashboard_stats import calcular_metricas_financeiras
+    from app.services.dashboard_rollups import atualizar_rollups
+
+    app = create_app()
+
+    with app.app_context():
+        print("🧪 BENCHMARK DAS MÉTRICAS FINANCEIRAS DO DASHBOARD\n")
+        print(f"{'Compradores':>11} | {'Legado ms':>9} | {'Consultas':>9} | {'Novo ms':>8} | {'Consultas':>9} | Payload")
+        print("-" * 75)
+
+        consultas = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: consultas.append(1))
+
+        for quantidade in sorted(CENARIOS):
+            popular(db, quantidade)
+            atualizar_rollups()
+            db.session.expire_all()
+
+            (por_comprador, mensais), ms_legado, q_legado = medir(metricas_legado, consultas)
+            novo, ms_novo, q_novo = medir(calcular_metricas_financeiras, consultas)
+
+            iguais = (
+                [c['nome'] for c in por_comprador] == [c['nome'] for c in novo['gastos_por_comprador']]
+                and all(
+                    a['qtd_compras'] == b['qtd_compras']
+                    and all(math.isclose(a[k], b[k], rel_tol=1e-9, abs_tol=1e-6)
+                            for k in ('valor_mes', 'valor_semana', 'ticket_medio'))
+                    for a, b in zip(por_comprador, novo['gastos_por_comprador'])
+                )
+                and all(math.isclose(a['valor'], b['valor'], rel_tol=1e-9, abs_tol=1e-6)
+                        for a, b in zip(mensais, novo['gastos_mensais']))
+            )
+            total = len(novo['gastos_por_comprador'])
+            print(f"{total:>11} | {ms_legado:9.1f} | {q_legado:>9} | {ms_novo:8.1f} | {q_novo:>9} | "
+                  f"{'✅' if iguais else '❌'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Benchmark da análise de fornecedores do dashboard (/api/dashboard/analise-fornecedores)
+
+Popula um banco com fornecedores, solicitações e lotes aprovados no mês e
+compara a implementação original (cinco consultas por fornecedor, ordenação
+em Python) com a versão paginada de app/services/dashboard_stats.py,
+conferindo que o top 10 e páginas ordenadas por outras métricas são
+idênticos e que o número de consultas não cresce com os fornecedores.
+
+    python testar_dashboard_fornecedores.py             # 200 e 2000 fornecedores
+    python testar_dashboard_fornecedores.py 200 5000
+"""
+import os
+import sys
+import math
+import time
+import random
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_fornecedores.db')
+
+CENARIOS = [int(n) for n in sys.argv[1:]] or [200, 2000]
+SOLICITACOES_POR_FORNECEDOR = 6
+LOTES_POR_FORNECEDOR = 8
+RODADAS = 3
+
+
+def analise_legado():
+    """Implementação original, com consultas por fornecedor, usada como referência."""
+    from sqlalchemy import func
+    from app.models import db, Fornecedor, Solicitacao, Lote
+
+    hoje = datetime.now()
+    mes_atual = datetime(hoje.year, hoje.month, 1)
+
+    analise = []
+    for fornecedor in Fornecedor.query.filter_by(ativo=True).all():
+        total_solicitacoes = Solicitacao.query.filter(
+            Solicitacao.fornecedor_id == fornecedor.id,
+            Solicitacao.data_envio >= mes_atual
+        ).count()
+        solicitacoes_aprovadas = Solicitacao.query.filter(
+            Solicitacao.fornecedor_id == fornecedor.id,
+            Solicitacao.status == 'aprovada',
+            Solicitacao.data_envio >= mes_atual
+        ).count()
+        aprovadas = Solicitacao.query.filter(
+            Solicitacao.fornecedor_id == fornecedor.id,
+            Solicitacao.status == 'aprovada',
+            Solicitacao.data_confirmacao.isnot(None),
+            Solicitacao.data_envio >= mes_atual
+        ).all()
+        tempos = [(s.data_confirmacao - s.data_envio).total_seconds() / 3600 for s in aprovadas]
+        tempo_medio = sum(tempos) / len(tempos) if tempos else 0
+        peso_total = db.session.query(func.sum(Lote.peso_total_kg)).filter(
+            Lote.fornecedor_id == fornecedor.id,
+            Lote.status == 'aprovado',
+            Lote.data_criacao >= mes_atual
+        ).scalar() or 0
+        valor_total = db.session.query(func.sum(Lote.valor_total)).filter(
+            Lote.fornecedor_id == fornecedor.id,
+            Lote.status == 'aprovado',
+            Lote.data_criacao >= mes_atual
+        ).scalar() or 0
+
+        analise.append({
+            'id': fornecedor.id,
+            'nome': fornecedor.nome,
+            'total_solicitacoes': total_solicitacoes,
+            'solicitacoes_aprovadas': solicitacoes_aprovadas,
+            'taxa_aprovacao': round((solicitacoes_aprovadas / total_solicitacoes * 100)
+                                    if total_solicitacoes else 0, 2),
+            'tempo_medio_aprovacao_horas': round(tempo_medio, 2),
+            'peso_total_kg': float(peso_total),
+            'valor_total': float(valor_total),
+            'preco_medio_kg': round((float(valor_total) / float(peso_total)) if peso_total else 0, 2)
+        })
+    return analise
+
+
+def ordenar_legado(analise, metrica, ordem):
+    """Mesma ordem do banco: métrica e, no empate, id do fornecedor."""
+    chave = sorted(analise, key=lambda f: f['id'])
+    return sorted(chave, key=lambda f: f[metrica], reverse=(ordem == 'desc'))
+
+
+def popular(db, fornecedores_desejados):
+    from app.models import Usuario, Fornecedor, TipoLote, Lote, Solicitacao
+
+    existentes = Fornecedor.query.filter(Fornecedor.nome.like('Fornecedor Analise %')).count()
+    if existentes >= fornecedores_desejados:
+        return
+
+    rng = random.Random(existentes)
+    funcionario = Usuario.query.filter_by(tipo='admin').first()
+    tipo = TipoLote.query.filter_by(nome='Tipo Benchmark Fornecedores').first()
+    if not tipo:
+        tipo = TipoLote(nome='Tipo Benchmark Fornecedores', classificacao='media')
+        db.session.add(tipo)
+        db.session.commit()
+
+    hoje = datetime.now()
+    mes_atual = datetime(hoje.year, hoje.month, 1)
+    dias_no_mes = max((hoje - mes_atual).total_seconds() / 86400, 0.01)
+
+    def data_no_mes():
+        return mes_atual + timedelta(days=rng.uniform(0, dias_no_mes))
+
+    for i in range(existentes, fornecedores_desejados):
+        fornecedor = Fornecedor(nome=f'Fornecedor Analise {i:05d}')
+        db.session.add(fornecedor)
+        db.session.flush()
+
+        solicitacoes = []
+        for _ in range(rng.randint(0, SOLICITACOES_POR_FORNECEDOR)):
+            envio = data_no_mes()
+            status = rng.choice(['pendente', 'aprovada', 'aprovada', 'rejeitada'])
+            solicitacoes.append({
+                'funcionario_id': funcionario.id,
+                'fornecedor_id': fornecedor.id,
+                'status': status,
+                'data_envio': envio,
+                'data_confirmacao': envio + timedelta(hours=rng.uniform(1, 72)) if status == 'aprovada' else None
+            })
+        if solicitacoes:
+            db.session.execute(Solicitacao.__table__.insert(), solicitacoes)
+
+        lotes = [{
+            'numero_lote': f'ANL-{i:05d}-{j:03d}',
+            'fornecedor_id': fornecedor.id,
+            'tipo_lote_id': tipo.id,
+            'status': rng.choice(['aprovado', 'aprovado', 'aberto']),
+            'peso_total_kg': round(rng.uniform(1, 500), 2),
+            'valor_total': round(rng.uniform(10, 20000), 2),
+            'data_criacao': data_no_mes()
+        } for j in range(rng.randint(0, LOTES_POR_FORNECEDOR))]
+        if lotes:
+            db.session.execute(Lote.__table__.insert(), lotes)
+    db.session.commit()
+
+
+def medir(funcao, consultas):
+    tempos = []
+    resultado = None
+    consultas.clear()
+    for _ in range(RODADAS):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, sorted(tempos)[len(tempos) // 2], len(consultas) // RODADAS
+
+
+def mesmos_itens(esperado, obtido):
+    if [f['nome'] for f in esperado] != [f['nome'] for f in obtido]:
+        return False
+    return all(
+        math.isclose(a[k], b[k], rel_tol=1e-9, abs_tol=0.011)
+        for a, b in zip(esperado, obtido)
+        for k in a if k not in ('id', 'nome')
+    )
+
+
+def main():
+    from sqlalchemy import event
+    from app import create_app
+    from app.models import db
+    from app.services.dashboard_stats import calcular_analise_fornecedores
+    from app.services.dashboard_rollups import atualizar_rollups
+
+    app = create_app()
+
+    with app.app_context():
+        print("🧪 BENCHMARK DA ANÁLISE DE FORNECEDORES DO DASHBOARD\n")
+        print(f"{'Fornecedores':>12} | {'Legado ms':>9} | {'Consultas':>9} | {'Top 10 ms':>9} | "
+              f"{'Consultas':>9} | {'Página ms':>9} | Resultado")
+        print("-" * 90)
+
+        consultas = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: consultas.append(1))
+
+        for quantidade in sorted(CENARIOS):
+            popular(db, quantidade)
+            atualizar_rollups()
+            db.session.expire_all()
+
+            legado, ms_legado, q_legado = medir(analise_legado, consultas)
+            top, ms_top, q_top = medir(calcular_analise_fornecedores, consultas)
+            pagina, ms_pagina, _ = medir(lambda: calcular_analise_fornecedores(
+                ordenar_por='taxa_aprovacao', ordem='asc', pagina=3, por_pagina=25
+            ), consultas)
+
+            iguais = (
+                top['total_fornecedores'] == len(legado)
+                and mesmos_itens(ordenar_legado(legado, 'valor_total', 'desc')[:10], top['top_fornecedores'])
+                and mesmos_itens(ordenar_legado(legado, 'taxa_aprovacao', 'asc')[50:75], pagina['top_fornecedores'])
+            )
+            print(f"{len(legado):>12} | {ms_legado:9.1f} | {q_legado:>9} | {ms_top:9.1f} | "
+                  f"{q_top:>9} | {ms_pagina:9.1f} | {'✅' if iguais else '❌'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Benchmark das estatísticas do dashboard (/api/dashboard/stats)
+
+Popula um banco com N lotes (padrão 1.000.000) e solicitações, e compara a
+implementação original (uma consulta por indicador) com a agregação
+condicional sobre os rollups diários (app/services/dashboard_stats.py), com
+e sem cache, e mede o backfill e a atualização incremental dos rollups.
+
+    python testar_dashboard_stats.py                  # 1M lotes em SQLite temporário
+    python testar_dashboard_stats.py 200000           # quantidade de lotes
+    DATABASE_URL=postgresql://... python testar_dashboard_stats.py
+
+O banco só é populado se estiver vazio; rodadas seguintes reaproveitam os dados.
+"""
+import os
+import sys
+import math
+import time
+import random
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_dashboard.db')
+
+QUANTIDADE_LOTES = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+LOTE_INSERCAO = 20_000
+RODADAS = 5
+
+STATUS_SOLICITACAO = ['pendente', 'aprovada', 'rejeitada']
+STATUS_LOTE = ['aberto', 'aprovado', 'em_estoque', 'reprovado']
+
+
+def estatisticas_legado():
+    """Implementação original, uma consulta por indicador, usada como referência."""
+    from sqlalchemy import func
+    from app.models import db, Solicitacao, Lote, TipoLote
+
+    total_pendentes = Solicitacao.query.filter_by(status='pendente').count()
+    total_aprovados = Solicitacao.query.filter_by(status='aprovada').count()
+    total_reprovados = Solicitacao.query.filter_by(status='rejeitada').count()
+
+    valor_total = db.session.query(func.sum(Lote.valor_total)).filter(
+        Lote.status == 'aprovado'
+    ).scalar() or 0
+
+    quilos = {}
+    for classificacao in ('leve', 'media', 'pesada'):
+        quilos[classificacao] = float(db.session.query(func.sum(Lote.peso_total_kg)).join(
+            TipoLote, Lote.tipo_lote_id == TipoLote.id
+        ).filter(
+            TipoLote.classificacao == classificacao
+        ).scalar() or 0)
+
+    return {
+        'relatorios': {
+            'pendentes': total_pendentes,
+            'aprovados': total_aprovados,
+            'reprovados': total_reprovados
+        },
+        'valor_total': float(valor_total),
+        'quilos_por_tipo': quilos
+    }
+
+
+def popular(db, quantidade):
+    from app.models import Fornecedor, TipoLote, Solicitacao, Lote, Usuario
+
+    if db.session.query(Lote.id).first():
+        print(f"   Banco já populado ({Lote.query.count()} lotes)")
+        return
+
+    rng = random.Random(42)
+    agora = datetime.utcnow()
+    funcionario = Usuario.query.filter_by(tipo='admin').first()
+
+    fornecedores = [Fornecedor(nome=f'Fornecedor Benchmark {i}') for i in range(200)]
+    tipos = [TipoLote(nome=f'Tipo Benchmark {c}', classificacao=c) for c in ('leve', 'media', 'pesada')]
+    db.session.add_all(fornecedores + tipos)
+    db.session.commit()
+    fornecedor_ids = [f.id for f in fornecedores]
+    tipo_ids = [t.id for t in tipos]
+
+    db.session.execute(Solicitacao.__table__.insert(), [{
+        'funcionario_id': funcionario.id,
+        'fornecedor_id': rng.choice(fornecedor_ids),
+        'status': rng.choice(STATUS_SOLICITACAO),
+        'data_envio': agora - timedelta(days=rng.uniform(0, 730))
+    } for _ in range(quantidade // 10)])
+    db.session.commit()
+
+    inicio = time.monotonic()
+    for offset in range(0, quantidade, LOTE_INSERCAO):
+        db.session.execute(Lote.__table__.insert(), [{
+            'numero_lote': f'BENCH-{offset + i:09d}',
+            'fornecedor_id': rng.choice(fornecedor_ids),
+            'tipo_lote_id': rng.choice(tipo_ids),
+            'status': rng.choice(STATUS_LOTE),
+            'peso_total_kg': round(rng.uniform(1, 500), 2),
+            'valor_total': round(rng.uniform(10, 20000), 2),
+            'data_criacao': agora - timedelta(days=rng.uniform(0, 730))
+        } for i in range(min(LOTE_INSERCAO, quantidade - offset))])
+        db.session.commit()
+        print(f"\r   Inserindo lotes: {min(offset + LOTE_INSERCAO, quantidade)}/{quantidade}", end='', flush=True)
+    print(f"\n   Lotes inseridos em {time.monotonic() - inicio:.1f}s")
+
+
+def medir(funcao):
+    tempos = []
+    resultado = None
+    for _ in range(RODADAS):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, sorted(tempos)[len(tempos) // 2]
+
+
+def main():
+    from sqlalchemy import event
+    from app import create_app
+    from app.models import db
+    from app.services import dashboard_stats, dashboard_rollups
+
+    app = create_app()
+
+    with app.app_context():
+        print("🧪 BENCHMARK DAS ESTATÍSTICAS DO DASHBOARD\n")
+        print(f"   Banco: {db.engine.url}")
+        popular(db, QUANTIDADE_LOTES)
+
+        inicio = time.perf_counter()
+        dashboard_rollups.reconstruir_rollups()
+        print(f"   Backfill dos rollups: {(time.perf_counter() - inicio) * 1000:.0f} ms")
+        inicio = time.perf_counter()
+        dashboard_rollups.atualizar_rollups()
+        print(f"   Atualização incremental: {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+        consultas = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: consultas.append(1))
+
+        legado, ms_legado = medir(estatisticas_legado)
+        consultas_legado = len(consultas) // RODADAS
+
+        consultas.clear()
+        novo, ms_novo = medir(dashboard_stats.calcular_estatisticas)
+        consultas_novo = len(consultas) // RODADAS
+
+        dashboard_stats.invalidar_dashboard()
+        dashboard_stats.obter_estatisticas('admin')
+        consultas.clear()
+        _, ms_cache = medir(lambda: dashboard_stats.obter_estatisticas('admin'))
+        consultas_cache = len(consultas) // RODADAS
+
+        print(f"\n📊 Legado (sem ranking): {ms_legado:8.1f} ms | {consultas_legado} consultas")
+        print(f"📊 Rollups:               {ms_novo:7.1f} ms | {consultas_novo} consultas (inclui ranking)")
+        print(f"📊 Com cache:             {ms_cache:7.2f} ms | {consultas_cache} consultas")
+
+        iguais = (
+            legado['relatorios'] == novo['relatorios']
+            and math.isclose(legado['valor_total'], novo['valor_total'], rel_tol=1e-9)
+            and all(math.isclose(legado['quilos_por_tipo'][k], novo['quilos_por_tipo'][k], rel_tol=1e-9)
+                    for k in legado['quilos_por_tipo'])
+        )
+        print(f"\n   {'✅' if iguais else '❌'} Resultados idênticos à implementação original")
+        print(f"   ⏱️  {ms_legado / max(ms_novo, 1e-6):.1f}x mais rápido sem cache")
+
+        # Outra atualização em andamento: a leitura não espera nem reescreve os rollups
+        dashboard_rollups.marcar_desatualizado()
+        with dashboard_rollups._lock:
+            consultas.clear()
+            dashboard_rollups.garantir_atualizados()
+        sem_espera = not consultas and not dashboard_rollups._desatualizado
+        print(f"   {'✅' if sem_espera else '❌'} Leitura durante outra atualização usa os rollups atuais")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark da busca espacial de fornecedores (app/services/fornecedores_proximos.py)
+
+Popula 100k fornecedores espalhados pelo Sudeste e compara, para consultas
+a partir de posições aleatórias de motoristas:
+
+  - varredura: ler lat/lng de todos os fornecedores e calcular a distância
+    de cada um (o que qualquer busca faria sem índice)
+  - índice: KD-tree em memória, por raio de 15 km e k mais próximos
+
+conferindo que os resultados são os mesmos. Mede também a reconstrução do
+índice depois de uma alteração e os endpoints /api/fornecedores/proximos e
+/api/fornecedores/mais-proximos pelo cliente de teste do Flask.
+
+    python testar_fornecedores_proximos.py            # 100000 fornecedores
+    python testar_fornecedores_proximos.py 20000
+"""
+import os
+import sys
+import math
+import time
+import random
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_fornecedores_proximos.db')
+
+FORNECEDORES = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+CONSULTAS = 200
+RAIO_KM = 15
+K = 10
+PREFIXO = 'Fornecedor Espacial'
+
+
+def popular(db):
+    from app.models import Fornecedor
+
+    existentes = Fornecedor.query.filter(Fornecedor.nome.like(f'{PREFIXO}%')).count()
+    if existentes >= FORNECEDORES:
+        return
+    rng = random.Random(17)
+    linhas = []
+    for i in range(existentes, FORNECEDORES):
+        linhas.append({
+            'nome': f'{PREFIXO} {i}', 'cidade': 'Benchmark', 'estado': 'SP', 'ativo': True,
+            'latitude': rng.uniform(-25.0, -19.0), 'longitude': rng.uniform(-51.0, -41.0)
+        })
+    for inicio in range(0, len(linhas), 20000):
+        db.session.execute(Fornecedor.__table__.insert(), linhas[inicio:inicio + 20000])
+    db.session.commit()
+
+
+def varredura_raio(db, lat, lng, raio_metros):
+    """Sem índice: todas as linhas e distância de cada uma em Python."""
+    from app.models import Fornecedor
+
+    r = 6371008.8
+    p1 = math.radians(lat)
+    encontrados = []
+    for fornecedor_id, flat, flng in db.session.query(Fornecedor.id, Fornecedor.latitude, Fornecedor.longitude).filter(
+        Fornecedor.ativo == True, Fornecedor.latitude.isnot(None), Fornecedor.longitude.isnot(None)
+    ):
+        p2 = math.radians(flat)
+        a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(flng - lng) / 2) ** 2
+        d = 2 * r * math.asin(math.sqrt(a))
+        if d <= raio_metros:
+            encontrados.append((d, fornecedor_id))
+    encontrados.sort()
+    return encontrados
+
+
+def cronometrar(funcao, consultas):
+    inicio = time.perf_counter()
+    resultados = [funcao(lat, lng) for lat, lng in consultas]
+    return resultados, (time.perf_counter() - inicio) * 1000 / len(consultas)
+
+
+def main():
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+    from app.models import db, Fornecedor, Usuario
+    from app.services import fornecedores_proximos
+
+    app = create_app()
+    print("🧪 BENCHMARK DA BUSCA ESPACIAL DE FORNECEDORES\n")
+
+    with app.app_context():
+        popular(db)
+        total = db.session.query(db.func.count(Fornecedor.id)).scalar()
+        print(f"   {total} fornecedores no banco\n")
+
+        rng = random.Random(2)
+        consultas = [(rng.uniform(-24.5, -19.5), rng.uniform(-50.5, -41.5)) for _ in range(CONSULTAS)]
+        indice = fornecedores_proximos.indice_fornecedores
+        indice.marcar_desatualizado()
+
+        inicio = time.perf_counter()
+        fornecedores_proximos.buscar_mais_proximos(*consultas[0], 1)
+        print(f"🌳 Índice construído em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+        amostra = consultas[:20]
+        varredura, ms_varredura = cronometrar(lambda a, b: varredura_raio(db, a, b, RAIO_KM * 1000), amostra)
+        raio, ms_raio = cronometrar(
+            lambda a, b: fornecedores_proximos.buscar_no_raio(a, b, RAIO_KM * 1000)[0], consultas
+        )
+        knn, ms_knn = cronometrar(lambda a, b: fornecedores_proximos.buscar_mais_proximos(a, b, K), consultas)
+
+        iguais = all(
+            [i for i, _ in raio[n]] == [i for _, i in varredura[n]]
+            and all(abs(d - dv) < 0.01 for (_, d), (dv, _) in zip(raio[n], varredura[n]))
+            for n in range(len(amostra))
+        )
+        knn_ok = all(
+            [i for i, _ in knn[n]] == [i for _, i in varredura_raio(db, *consultas[n], 10 ** 8)[:K]]
+            for n in range(5)
+        )
+        media = sum(len(r) for r in raio) / len(raio)
+
+        print(f"📊 Raio {RAIO_KM} km, varredura completa: {ms_varredura:9.2f} ms/consulta")
+        print(f"📊 Raio {RAIO_KM} km, índice:             {ms_raio:9.2f} ms/consulta ({media:.0f} fornecedores em média)")
+        print(f"📊 {K} mais próximos, índice:          {ms_knn:9.2f} ms/consulta")
+        print(f"   {'✅' if iguais else '❌'} Mesmos fornecedores e distâncias que a varredura")
+        print(f"   {'✅' if knn_ok else '❌'} k mais próximos conferem com a varredura ordenada")
+
+        fornecedor = Fornecedor.query.filter(Fornecedor.nome.like(f'{PREFIXO}%')).first()
+        lat, lng = consultas[1]
+        fornecedor.latitude, fornecedor.longitude = lat + 0.0001, lng
+        db.session.commit()
+        inicio = time.perf_counter()
+        primeiro = fornecedores_proximos.buscar_mais_proximos(lat, lng, 1)
+        ms_reconstrucao = (time.perf_counter() - inicio) * 1000
+        print(f"\n🔁 Fornecedor movido: reconstrução + consulta em {ms_reconstrucao:.0f} ms "
+              f"{'✅' if primeiro and primeiro[0][0] == fornecedor.id else '❌'}")
+
+        admin = Usuario.query.filter_by(tipo='admin').first()
+        token = create_access_token(identity=str(admin.id))
+
+    cliente = app.test_client()
+    cabecalho = {'Authorization': f'Bearer {token}'}
+    for rota in (f'/api/fornecedores/proximos?raio={RAIO_KM}', f'/api/fornecedores/mais-proximos?k={K}'):
+        inicio = time.perf_counter()
+        respostas = [cliente.get(f'{rota}&lat={a}&lng={b}', headers=cabecalho) for a, b in consultas[:50]]
+        ms = (time.perf_counter() - inicio) * 1000 / 50
+        ok = all(r.status_code == 200 for r in respostas)
+        print(f"🌐 GET {rota.split('?')[0]:<32} {ms:7.2f} ms/requisição {'✅' if ok else '❌'}")
+
+    ruim = cliente.get('/api/fornecedores/proximos?lat=200&lng=0', headers=cabecalho)
+    print(f"   {'✅' if ruim.status_code == 400 else '❌'} Coordenadas inválidas → {ruim.status_code}")
+
+
+if __name__ == '__main__':
+    main()
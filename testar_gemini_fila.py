@@ -0,0 +1,114 @@
+"""
+Script para testar a fila de classificação do Gemini contra um servidor falso
+
+Sobe localmente um servidor que imita o endpoint generateContent da API do
+Gemini (latência fixa e uma fração de respostas 429) e compara:
+
+  - modo antigo: um genai.Client novo por imagem, chamadas em sequência
+  - fila: workers concorrentes, cliente compartilhado, token bucket e backoff
+
+    python testar_gemini_fila.py                 # 40 imagens, 0.3s, 10% de 429
+    python testar_gemini_fila.py 100 0.5 0.2     # imagens, latência, taxa de 429
+"""
+import os
+import sys
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+LATENCIA = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+TAXA_429 = float(sys.argv[3]) if len(sys.argv) > 3 else 0.1
+IMAGENS = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+
+contadores = {'chamadas': 0, '429': 0}
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        contadores['chamadas'] += 1
+        time.sleep(LATENCIA)
+
+        if random.random() < TAXA_429:
+            contadores['429'] += 1
+            status, corpo = 429, {'error': {'code': 429, 'message': 'Resource exhausted', 'status': 'RESOURCE_EXHAUSTED'}}
+        else:
+            texto = random.choice([
+                'Classificação: LEVE — Muito verde visível',
+                'Classificação: MÉDIA — Densidade moderada de componentes',
+                'Classificação: PESADA — Placa densa, pouco verde visível',
+            ])
+            status, corpo = 200, {'candidates': [{'content': {'role': 'model', 'parts': [{'text': texto}]}}]}
+
+        dados = json.dumps(corpo).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+
+def iniciar_servidor():
+    servidor = ThreadingHTTPServer(('127.0.0.1', 0), FakeGeminiHandler)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{servidor.server_address[1]}'
+
+
+def main():
+    base_url = iniciar_servidor()
+    os.environ['GEMINI_API_KEY'] = 'fake'
+    os.environ['GEMINI_BASE_URL'] = base_url
+    os.environ.setdefault('GEMINI_BACKOFF_BASE', '0.2')
+    os.environ.setdefault('GEMINI_RATE_PER_MINUTE', '600')
+
+    from google import genai
+    from google.genai import types
+    from app.services.gemini_analyzer import analyze_images, _get_prompt, _parse_gemini_response
+    from app.services.gemini_queue import get_queue_stats
+
+    imagens = [os.urandom(2048) for _ in range(IMAGENS)]
+
+    print("🧪 TESTE DA FILA DE CLASSIFICAÇÃO DO GEMINI\n")
+    print(f"   Servidor falso: {base_url} | latência {LATENCIA}s | 429 em {TAXA_429:.0%}")
+    print(f"   Imagens: {IMAGENS}\n")
+
+    # Modo antigo: cliente novo por chamada, uma imagem depois da outra, 429 vira erro
+    inicio = time.monotonic()
+    erros_antigo = 0
+    for imagem in imagens:
+        try:
+            client = genai.Client(api_key='fake', http_options=types.HttpOptions(base_url=base_url))
+            response = client.models.generate_content(
+                model='gemini-2.0-flash-exp',
+                contents=[types.Part.from_bytes(data=imagem, mime_type='image/jpeg'), _get_prompt('placa')]
+            )
+            _parse_gemini_response(response.text)
+        except Exception:
+            erros_antigo += 1
+    duracao_antigo = time.monotonic() - inicio
+
+    contadores.update({'chamadas': 0, '429': 0})
+    inicio = time.monotonic()
+    resultados = analyze_images(imagens, use_case='placa')
+    duracao_fila = time.monotonic() - inicio
+    erros_fila = sum(1 for r in resultados if 'erro' in r)
+
+    print(f"📊 Sequencial: {duracao_antigo:.1f}s ({IMAGENS / duracao_antigo:.1f} img/s), {erros_antigo} erros")
+    print(f"📊 Fila:       {duracao_fila:.1f}s ({IMAGENS / duracao_fila:.1f} img/s), {erros_fila} erros")
+    print(f"   Chamadas ao servidor: {contadores['chamadas']} ({contadores['429']} respondidas com 429)")
+    print(f"   Estatísticas da fila: {get_queue_stats()}")
+
+    print(f"\n   {'✅' if erros_fila == 0 else '❌'} Todos os 429 foram repetidos com sucesso")
+    print(f"   {'✅' if duracao_fila < duracao_antigo else '❌'} Fila mais rápida que o modo sequencial "
+          f"({duracao_antigo / duracao_fila:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Benchmark do cache de geocoding reverso e do gazetteer offline
+
+1. Gazetteer sintético de 50k cidades: carga do IndiceEspacial e cidade mais
+   próxima pela KD-tree x varredura completa com haversine, conferindo que
+   o resultado é o mesmo.
+2. Carga de trabalho com coordenadas repetidas de fornecedores (com o ruído
+   do GPS) contra um Nominatim simulado com 150 ms de latência: sem cache,
+   com cache em memória e depois de um reinício (só o banco aquecido).
+3. Nominatim respondendo 429: com o gazetteer a resposta vem offline, sem o
+   backoff dentro da requisição.
+
+    python testar_geocode_cache.py
+"""
+import os
+import csv
+import time
+import random
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_geocode.db')
+os.environ.setdefault('GEOCODE_GAZETTEER', '/tmp/benchmark_gazetteer.csv')
+
+CIDADES = 50_000
+CONSULTAS_GAZETTEER = 2_000
+FORNECEDORES = 100
+CONSULTAS = 3_000
+LATENCIA_NOMINATIM = 0.15
+
+
+def gerar_gazetteer(caminho):
+    rng = random.Random(21)
+    with open(caminho, 'w', newline='', encoding='utf-8') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(['cidade', 'estado', 'pais', 'latitude', 'longitude'])
+        for i in range(CIDADES):
+            escritor.writerow([f'Cidade {i}', f'UF{i % 27}', 'Brasil',
+                               round(rng.uniform(-33.7, 5.2), 6), round(rng.uniform(-73.9, -34.8), 6)])
+
+
+class RespostaSimulada:
+    def __init__(self, status_code, dados=None):
+        self.status_code = status_code
+        self._dados = dados or {}
+
+    def json(self):
+        return self._dados
+
+
+class NominatimSimulado:
+    """Substitui requests.get do módulo de geolocalização durante o benchmark."""
+
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.chamadas = 0
+
+    def __call__(self, url, params=None, headers=None, timeout=None):
+        self.chamadas += 1
+        time.sleep(LATENCIA_NOMINATIM)
+        if self.status_code != 200:
+            return RespostaSimulada(self.status_code)
+        return RespostaSimulada(200, {'address': {
+            'road': f"Rua {params['lat']:.3f}", 'house_number': '10', 'suburb': 'Centro',
+            'city': 'São Paulo', 'state': 'SP', 'country': 'Brasil', 'postcode': '01000000'
+        }})
+
+
+def testar_gazetteer():
+    import numpy as np
+    from app.services import geo, geocode_cache
+
+    print("🗺️  Gazetteer offline\n")
+    inicio = time.perf_counter()
+    gazetteer = geocode_cache.obter_gazetteer()
+    print(f"   {len(gazetteer.cidades)} cidades carregadas em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+    rng = random.Random(4)
+    consultas = [(rng.uniform(-30, 0), rng.uniform(-60, -40)) for _ in range(CONSULTAS_GAZETTEER)]
+    todas_lat, todas_lng = [], []
+    with open(geocode_cache.GEOCODE_GAZETTEER, encoding='utf-8') as arquivo:
+        for linha in csv.DictReader(arquivo):
+            todas_lat.append(float(linha['latitude']))
+            todas_lng.append(float(linha['longitude']))
+    todas_lat, todas_lng = np.array(todas_lat), np.array(todas_lng)
+
+    inicio = time.perf_counter()
+    arvore = [int(gazetteer.indice.k_proximos(a, b)[0][0]) for a, b in consultas]
+    ms_arvore = (time.perf_counter() - inicio) * 1000
+    inicio = time.perf_counter()
+    varredura = [int(np.argmin(geo.haversine_metros(todas_lat, todas_lng, a, b))) for a, b in consultas]
+    ms_varredura = (time.perf_counter() - inicio) * 1000
+
+    print(f"   KD-tree:            {ms_arvore / len(consultas) * 1000:8.1f} µs/consulta")
+    print(f"   Varredura completa: {ms_varredura / len(consultas) * 1000:8.1f} µs/consulta")
+    print(f"   {'✅' if arvore == varredura else '❌'} Mesma cidade em {len(consultas)} consultas")
+
+
+def testar_cache(app):
+    from app.models import db, GeocodeCache
+    from app.services import geocode_cache
+    from app.utils import geolocation
+
+    print("\n📍 Cache de geocoding\n")
+    rng = random.Random(8)
+    fornecedores = [(rng.uniform(-24, -23), rng.uniform(-47, -46)) for _ in range(FORNECEDORES)]
+    # GPS do mesmo fornecedor varia alguns metros entre as leituras
+    consultas = [(lat + rng.gauss(0, 0.000015), lng + rng.gauss(0, 0.000015))
+                 for lat, lng in (rng.choice(fornecedores) for _ in range(CONSULTAS))]
+
+    simulado = NominatimSimulado()
+    original = geolocation.requests.get
+    geolocation.requests.get = simulado
+    try:
+        with app.test_request_context():
+            GeocodeCache.query.delete()
+            db.session.commit()
+            geocode_cache.memoria.limpar()
+
+            ms_sem_cache = len(consultas) * LATENCIA_NOMINATIM * 1000
+            inicio = time.perf_counter()
+            resultados = [geolocation.reverse_geocode(lat, lng) for lat, lng in consultas]
+            ms_com_cache = (time.perf_counter() - inicio) * 1000
+            chamadas = simulado.chamadas
+            stats = geocode_cache.get_geocode_stats()
+
+            geocode_cache.memoria.limpar()
+            inicio = time.perf_counter()
+            for lat, lng in consultas[:500]:
+                geolocation.reverse_geocode(lat, lng)
+            ms_reinicio = (time.perf_counter() - inicio) * 1000
+            stats_reinicio = geocode_cache.get_geocode_stats()
+
+            registros = GeocodeCache.query.count()
+    finally:
+        geolocation.requests.get = original
+
+    print(f"   Sem cache (estimado): {ms_sem_cache / 1000:8.1f} s para {len(consultas)} consultas")
+    print(f"   Com cache:            {ms_com_cache / 1000:8.1f} s, {chamadas} chamadas ao Nominatim")
+    print(f"   Taxa de acerto:       {stats['hit_rate']:.1%} ({stats['hits_memoria']} memória, "
+          f"{stats['hits_banco']} banco, {stats['misses']} misses)")
+    print(f"   Após reinício (500):  {ms_reinicio:8.1f} ms, {stats_reinicio['hits_banco']} acertos no banco, "
+          f"{simulado.chamadas - chamadas} chamadas novas")
+    print(f"   Latência Nominatim:   p50 {stats['upstream']['nominatim']['latencia_p50_ms']} ms, "
+          f"p95 {stats['upstream']['nominatim']['latencia_p95_ms']} ms")
+    print(f"   {'✅' if all(r['sucesso'] for r in resultados) else '❌'} Todas as consultas resolvidas, "
+          f"{registros} coordenadas em geocode_cache")
+
+
+def testar_rate_limit(app):
+    from app.services import geocode_cache
+    from app.utils import geolocation
+
+    print("\n🚦 Nominatim com rate limit (429)\n")
+    simulado = NominatimSimulado(status_code=429)
+    original = geolocation.requests.get
+    geolocation.requests.get = simulado
+    try:
+        with app.test_request_context():
+            geocode_cache.memoria.limpar()
+            inicio = time.perf_counter()
+            resultado = geolocation.reverse_geocode(-15.79, -47.88)
+            ms = (time.perf_counter() - inicio) * 1000
+    finally:
+        geolocation.requests.get = original
+
+    print(f"   Resposta em {ms:.0f} ms (antes: até {LATENCIA_NOMINATIM * 3 * 1000 + 3000:.0f} ms com backoff), "
+          f"fonte {resultado.get('fonte')}: {resultado.get('endereco_completo')}")
+    print(f"   {'✅' if resultado['sucesso'] and resultado.get('fonte') == 'offline' else '❌'} "
+          f"Fallback offline sem backoff")
+
+
+def main():
+    from app import create_app
+
+    print("🧪 BENCHMARK DO CACHE DE GEOCODING\n")
+    if not os.path.exists(os.environ['GEOCODE_GAZETTEER']):
+        gerar_gazetteer(os.environ['GEOCODE_GAZETTEER'])
+
+    app = create_app()
+    testar_gazetteer()
+    testar_cache(app)
+    testar_rate_limit(app)
+
+
+if __name__ == '__main__':
+    main()
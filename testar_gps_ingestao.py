@@ -0,0 +1,235 @@
+"""
+Teste de carga da ingestão de GPS em lote (POST /api/os/<id>/gps)
+
+Simula N motoristas enviando lotes de posições pelo app, num único processo
+(equivalente a um worker), e mede:
+
+  - a taxa do caminho antigo: um GPSLog por ponto, com as consultas de
+    usuário, motorista e OS e um commit cada (como em registrar_evento)
+  - a taxa ponta a ponta do endpoint novo: requisições HTTP + gravação em
+    massa pelo buffer, até o último ponto estar no banco
+  - a deduplicação: reenviar lotes já gravados não cria linhas novas
+  - pontos que o banco recusa são descartados sem travar o buffer, e o
+    device_id é truncado ao tamanho da coluna
+  - flush_compartilhado espera o buffer de outro worker (simulado com um
+    segundo GPSBuffer), ignora workers encerrados e desiste dos que não
+    respondem
+
+    python testar_gps_ingestao.py                  # 20 motoristas x 50 lotes x 60 pontos
+    python testar_gps_ingestao.py 50 100 60
+    DATABASE_URL=postgresql://... python testar_gps_ingestao.py
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_gps.db')
+
+MOTORISTAS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+LOTES_POR_MOTORISTA = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+PONTOS_POR_LOTE = int(sys.argv[3]) if len(sys.argv) > 3 else 60
+PONTOS_LEGADO = 500
+META_PONTOS_POR_SEGUNDO = 2000
+
+
+def preparar(db):
+    """Cria motoristas com uma OS atribuída a cada um; devolve [(usuario_id, os_id)]."""
+    from app.models import Usuario, Motorista, Fornecedor, Solicitacao, OrdemCompra, OrdemServico
+
+    sufixo = datetime.now().strftime('%Y%m%d%H%M%S')
+    admin = Usuario.query.filter_by(tipo='admin').first()
+    fornecedor = Fornecedor(nome=f'Fornecedor GPS {sufixo}')
+    db.session.add(fornecedor)
+    db.session.flush()
+
+    pares = []
+    for i in range(MOTORISTAS):
+        usuario = Usuario(nome=f'Motorista GPS {i}', email=f'motorista.gps.{sufixo}.{i}@teste.com',
+                          senha_hash='x', tipo='funcionario')
+        db.session.add(usuario)
+        db.session.flush()
+        motorista = Motorista(usuario_id=usuario.id, nome=usuario.nome, cpf=f'{sufixo[-8:]}{i:06d}')
+        solicitacao = Solicitacao(funcionario_id=admin.id, fornecedor_id=fornecedor.id, status='aprovada')
+        db.session.add_all([motorista, solicitacao])
+        db.session.flush()
+        oc = OrdemCompra(solicitacao_id=solicitacao.id, fornecedor_id=fornecedor.id, criado_por=admin.id)
+        db.session.add(oc)
+        db.session.flush()
+        os_ = OrdemServico(oc_id=oc.id, numero_os=f'OS-GPS-{sufixo}-{i}', fornecedor_snapshot={'id': fornecedor.id},
+                           motorista_id=motorista.id, created_by=admin.id, status='EM_ROTA')
+        db.session.add(os_)
+        db.session.flush()
+        pares.append((usuario.id, os_.id))
+    db.session.commit()
+    return pares
+
+
+def gerar_lotes(pares, sufixo):
+    """Lotes de pontos por motorista, um ponto a cada 5 s, com o device_id do aparelho."""
+    rng = random.Random(7)
+    inicio = datetime.utcnow() - timedelta(days=1)
+    lotes = []
+    for indice, (usuario_id, os_id) in enumerate(pares):
+        device_id = f'device-{sufixo}-{indice}'
+        lat, lng = -23.55 + rng.uniform(-0.1, 0.1), -46.63 + rng.uniform(-0.1, 0.1)
+        instante = inicio
+        for _ in range(LOTES_POR_MOTORISTA):
+            pontos = []
+            for _ in range(PONTOS_POR_LOTE):
+                lat += rng.uniform(-0.0005, 0.0005)
+                lng += rng.uniform(-0.0005, 0.0005)
+                pontos.append({
+                    'latitude': round(lat, 6),
+                    'longitude': round(lng, 6),
+                    'precisao': round(rng.uniform(3, 25), 1),
+                    'timestamp': instante.isoformat() + 'Z',
+                    'velocidade': round(rng.uniform(0, 60), 1)
+                })
+                instante += timedelta(seconds=5)
+            lotes.append((usuario_id, os_id, {'device_id': device_id, 'pontos': pontos}))
+    return lotes
+
+
+def medir_legado(db, usuario_id, os_id):
+    """Caminho antigo: um INSERT e um commit por ponto, com as três consultas de registrar_evento."""
+    from app.models import Usuario, Motorista, OrdemServico, GPSLog
+
+    inicio = time.perf_counter()
+    for i in range(PONTOS_LEGADO):
+        Usuario.query.get(usuario_id)
+        os_ = OrdemServico.query.get(os_id)
+        Motorista.query.filter_by(usuario_id=usuario_id).first()
+        db.session.add(GPSLog(os_id=os_.id, evento='LEGADO', latitude=-23.5, longitude=-46.6,
+                              precisao=10.0, device_id='legado', ip='127.0.0.1'))
+        db.session.commit()
+    return PONTOS_LEGADO / (time.perf_counter() - inicio)
+
+
+def contar(db, dispositivos):
+    from app.models import GPSLog
+    return GPSLog.query.filter(GPSLog.evento == 'POSICAO', GPSLog.device_id.in_(dispositivos)).count()
+
+
+def main():
+    from flask_jwt_extended import create_access_token
+    from app import create_app
+    from app.models import db
+    from app.services import gps_ingestao
+
+    app = create_app()
+    client = app.test_client()
+
+    with app.app_context():
+        print("🧪 TESTE DE CARGA DA INGESTÃO DE GPS\n")
+        print(f"   Banco: {db.engine.url}")
+        print(f"   {MOTORISTAS} motoristas x {LOTES_POR_MOTORISTA} lotes x {PONTOS_POR_LOTE} pontos\n")
+
+        pares = preparar(db)
+        sufixo = datetime.now().strftime('%H%M%S%f')
+        lotes = gerar_lotes(pares, sufixo)
+        tokens = {usuario_id: create_access_token(identity=str(usuario_id)) for usuario_id, _ in pares}
+        dispositivos = list({corpo['device_id'] for _, _, corpo in lotes})
+        total_pontos = sum(len(corpo['pontos']) for _, _, corpo in lotes)
+
+        taxa_legado = medir_legado(db, *pares[0])
+        print(f"📊 Caminho antigo (1 commit por ponto): {taxa_legado:8.0f} pontos/s")
+
+    inicio = time.perf_counter()
+    for usuario_id, os_id, corpo in lotes:
+        resposta = client.post(f'/api/os/{os_id}/gps', json=corpo,
+                               headers={'Authorization': f'Bearer {tokens[usuario_id]}'})
+        if resposta.status_code == 503:
+            time.sleep(float(resposta.headers.get('Retry-After', 1)))
+            resposta = client.post(f'/api/os/{os_id}/gps', json=corpo,
+                                   headers={'Authorization': f'Bearer {tokens[usuario_id]}'})
+        if resposta.status_code != 202:
+            print(f"❌ Resposta inesperada: {resposta.status_code} {resposta.get_json()}")
+            return
+    ms_requisicoes = (time.perf_counter() - inicio) * 1000
+    gps_ingestao.flush()
+    ms_total = (time.perf_counter() - inicio) * 1000
+    taxa = total_pontos / (ms_total / 1000)
+
+    print(f"📊 Endpoint em lote (HTTP + gravação):   {taxa:8.0f} pontos/s "
+          f"({len(lotes)} requisições em {ms_requisicoes:.0f} ms, tudo gravado em {ms_total:.0f} ms)")
+    print(f"   Buffer: {gps_ingestao.get_buffer_stats()}")
+
+    with app.app_context():
+        gravados = contar(db, dispositivos)
+
+    # Reenvio dos 10 primeiros lotes (como o app faz após uma falha de rede)
+    for usuario_id, os_id, corpo in lotes[:10]:
+        client.post(f'/api/os/{os_id}/gps', json=corpo, headers={'Authorization': f'Bearer {tokens[usuario_id]}'})
+    gps_ingestao.flush()
+
+    with app.app_context():
+        apos_reenvio = contar(db, dispositivos)
+
+    print(f"\n   {'✅' if gravados == total_pontos else '❌'} {gravados}/{total_pontos} pontos gravados")
+    print(f"   {'✅' if apos_reenvio == gravados else '❌'} Reenvio deduplicado por (device_id, timestamp): "
+          f"{apos_reenvio} linhas")
+    print(f"   {'✅' if taxa >= META_PONTOS_POR_SEGUNDO else '❌'} Meta de {META_PONTOS_POR_SEGUNDO} pontos/s "
+          f"num worker ({taxa / taxa_legado:.0f}x o caminho antigo)")
+
+    # Um lote com linhas que o banco recusa não volta para o buffer
+    device_longo = f'device-longo-{sufixo}-' + 'x' * 400
+    linhas, _, _ = gps_ingestao.validar_pontos(pares[0][1], device_longo, [
+        {'latitude': -23.5, 'longitude': -46.6, 'timestamp': f'2024-01-01T00:00:{i:02d}Z'} for i in range(5)
+    ])
+    linhas[1] = dict(linhas[1], latitude=None)
+    linhas[3] = dict(linhas[3], timestamp='ontem')
+    descartados_antes = gps_ingestao.get_buffer_stats()['descartados']
+    gps_ingestao.enfileirar_pontos(linhas)
+    gravados_lote = gps_ingestao.flush()
+    stats = gps_ingestao.get_buffer_stats()
+
+    with app.app_context():
+        do_device = contar(db, [device_longo[:gps_ingestao.DEVICE_ID_MAX]])
+
+    print(f"   {'✅' if len(linhas[0]['device_id']) == gps_ingestao.DEVICE_ID_MAX else '❌'} "
+          f"device_id truncado para {gps_ingestao.DEVICE_ID_MAX} caracteres")
+    descartou = (gravados_lote == do_device == 3 and stats['pendentes'] == 0
+                 and stats['descartados'] - descartados_antes == 2)
+    print(f"   {'✅' if descartou else '❌'} Linhas inválidas descartadas: {do_device} gravadas, "
+          f"{stats['descartados'] - descartados_antes} descartadas, {stats['pendentes']} pendentes")
+
+    testar_flush_compartilhado(app, db, pares[0][1], sufixo)
+
+
+def testar_flush_compartilhado(app, db, os_id, sufixo):
+    from app.services import estado_compartilhado, gps_ingestao
+
+    # Outro worker com pontos no buffer, gravados pela própria thread de flush
+    outro = gps_ingestao.GPSBuffer(intervalo=0.5)
+    outro.app = app
+    outro.worker_id = f'worker-teste-{sufixo}'
+    outro.flush()
+    device = f'device-outro-worker-{sufixo}'
+    linhas, _, _ = gps_ingestao.validar_pontos(os_id, device, [
+        {'latitude': -23.5, 'longitude': -46.6, 'timestamp': f'2024-02-01T00:00:{i:02d}Z'} for i in range(10)
+    ])
+    outro.adicionar(linhas)
+    estado_compartilhado.definir_campo(gps_ingestao.CHAVE_DRENADO, 'worker-encerrado',
+                                       {'pedido': 0, 'instante': time.time() - 2 * gps_ingestao.GPS_WORKER_INATIVO})
+
+    confirmado = gps_ingestao.flush_compartilhado(espera=5)
+    with app.app_context():
+        gravados = contar(db, [device])
+    workers = estado_compartilhado.ler_campos(gps_ingestao.CHAVE_DRENADO)
+    print(f"   {'✅' if confirmado and gravados == 10 else '❌'} flush_compartilhado esperou o outro worker: "
+          f"{gravados}/10 pontos gravados")
+    print(f"   {'✅' if 'worker-encerrado' not in workers else '❌'} Worker encerrado removido de {gps_ingestao.CHAVE_DRENADO}")
+
+    # Worker que não responde: desiste depois da espera
+    estado_compartilhado.definir_campo(gps_ingestao.CHAVE_DRENADO, 'worker-travado',
+                                       {'pedido': 0, 'instante': time.time()})
+    inicio = time.perf_counter()
+    desistiu = not gps_ingestao.flush_compartilhado(espera=1)
+    estado_compartilhado.remover_campo(gps_ingestao.CHAVE_DRENADO, 'worker-travado')
+    print(f"   {'✅' if desistiu else '❌'} Worker sem resposta: desiste em {time.perf_counter() - inicio:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
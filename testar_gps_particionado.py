@@ -0,0 +1,232 @@
+"""
+Benchmark do armazenamento em camadas de gps_logs
+
+Reproduz um ano de rastreamento sintético de uma frota (motoristas fazendo
+várias OS por dia, com uma posição a cada 15 s e os eventos discretos) e mede:
+
+  - a leitura do trajeto de uma OS só com o índice de timestamp (como antes)
+    e com o índice (os_id, timestamp) via gps_armazenamento.obter_rota
+  - a retenção: tempo, linhas brutas removidas e tamanho das polylines
+  - a leitura de trajetos antigos (camada simplificada) e o desvio máximo
+    entre os pontos originais e o trajeto simplificado
+
+    python testar_gps_particionado.py                # 10 motoristas, 3 OS/dia, 120 pontos por OS
+    python testar_gps_particionado.py 20 4 240
+    DATABASE_URL=postgresql://... python testar_gps_particionado.py   # rode antes executar_manutencao_gps.py --particionar
+
+O banco só é populado se ainda não houver dados do benchmark.
+"""
+import os
+import sys
+import math
+import time
+import random
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_gps_particionado.db')
+
+MOTORISTAS = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+OS_POR_DIA = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+PONTOS_POR_OS = int(sys.argv[3]) if len(sys.argv) > 3 else 120
+DIAS = 365
+INTERVALO_SEGUNDOS = 15
+AMOSTRA_OS = 50
+LOTE_INSERCAO = 50000
+
+
+def popular(db):
+    from app.models import Usuario, Motorista, Fornecedor, Solicitacao, OrdemCompra, OrdemServico, GPSLog
+
+    if Fornecedor.query.filter_by(nome='Fornecedor Frota Benchmark').first():
+        print(f"   Banco já populado ({GPSLog.query.count()} linhas em gps_logs)")
+        return
+
+    rng = random.Random(11)
+    admin = Usuario.query.filter_by(tipo='admin').first()
+    fornecedor = Fornecedor(nome='Fornecedor Frota Benchmark')
+    db.session.add(fornecedor)
+    db.session.flush()
+
+    motoristas = []
+    for i in range(MOTORISTAS):
+        motorista = Motorista(nome=f'Motorista Frota {i}', cpf=f'9{i:010d}')
+        db.session.add(motorista)
+        motoristas.append(motorista)
+    db.session.flush()
+
+    inicio_ano = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=DIAS)
+    linhas = []
+    inseridas = 0
+
+    def descarregar():
+        nonlocal linhas, inseridas
+        if linhas:
+            db.session.execute(GPSLog.__table__.insert(), linhas)
+            inseridas += len(linhas)
+            linhas = []
+            print(f"\r   Inserindo pontos: {inseridas}", end='', flush=True)
+
+    for dia in range(DIAS):
+        data = inicio_ano + timedelta(days=dia)
+        ordens = []
+        for motorista in motoristas:
+            for n in range(OS_POR_DIA):
+                saida = data + timedelta(hours=7 + n * 3, minutes=rng.randint(0, 60))
+                solicitacao = Solicitacao(funcionario_id=admin.id, fornecedor_id=fornecedor.id, status='aprovada')
+                db.session.add(solicitacao)
+                db.session.flush()
+                oc = OrdemCompra(solicitacao_id=solicitacao.id, fornecedor_id=fornecedor.id, criado_por=admin.id)
+                db.session.add(oc)
+                db.session.flush()
+                os_ = OrdemServico(oc_id=oc.id, numero_os=f'OS-FROTA-{dia}-{motorista.id}-{n}',
+                                   fornecedor_snapshot={'id': fornecedor.id}, motorista_id=motorista.id,
+                                   created_by=admin.id, status='FINALIZADA', criado_em=saida - timedelta(hours=1))
+                db.session.add(os_)
+                ordens.append((os_, motorista, saida))
+        db.session.flush()
+
+        for os_, motorista, saida in ordens:
+            lat, lng = -23.55 + rng.uniform(-0.2, 0.2), -46.63 + rng.uniform(-0.2, 0.2)
+            rumo = rng.uniform(0, 2 * math.pi)
+            device_id = f'frota-{motorista.id}'
+            for p in range(PONTOS_POR_OS):
+                rumo += rng.gauss(0, 0.15)
+                passo = rng.uniform(0, 0.0015)
+                lat += passo * math.cos(rumo)
+                lng += passo * math.sin(rumo)
+                instante = saida + timedelta(seconds=p * INTERVALO_SEGUNDOS)
+                linhas.append({
+                    'os_id': os_.id, 'evento': 'POSICAO', 'latitude': lat, 'longitude': lng,
+                    'precisao': 8.0, 'timestamp': instante, 'device_id': device_id
+                })
+                if p in (0, PONTOS_POR_OS // 2, PONTOS_POR_OS - 1):
+                    evento = {0: 'INICIO_ROTA', PONTOS_POR_OS // 2: 'COLETEI'}.get(p, 'FINALIZEI')
+                    linhas.append({
+                        'os_id': os_.id, 'evento': evento, 'latitude': lat, 'longitude': lng,
+                        'precisao': 8.0, 'timestamp': instante, 'device_id': device_id
+                    })
+        if len(linhas) >= LOTE_INSERCAO:
+            descarregar()
+            db.session.commit()
+    descarregar()
+    db.session.commit()
+    print()
+
+
+def trajeto_legado(os_id):
+    """Leitura original: todos os GPSLog da OS, só com o índice de timestamp disponível."""
+    from app.models import GPSLog
+    return [(g.latitude, g.longitude, g.timestamp)
+            for g in GPSLog.query.filter_by(os_id=os_id).order_by(GPSLog.timestamp).all()
+            if g.evento == 'POSICAO']
+
+
+def medir(funcao, ids):
+    inicio = time.perf_counter()
+    for os_id in ids:
+        funcao(os_id)
+    return (time.perf_counter() - inicio) * 1000 / len(ids)
+
+
+def desvio_maximo(originais, simplificados):
+    """Maior distância, em metros, de um ponto original ao trajeto simplificado."""
+    lat0 = math.radians(sum(p[0] for p in originais) / len(originais))
+    r = 6371008.8
+
+    def xy(p):
+        return math.radians(p[1]) * r * math.cos(lat0), math.radians(p[0]) * r
+
+    segmentos = [(xy(a), xy(b)) for a, b in zip(simplificados, simplificados[1:])] or [(xy(simplificados[0]),) * 2]
+    pior = 0.0
+    for ponto in originais:
+        px, py = xy(ponto)
+        melhor = float('inf')
+        for (x1, y1), (x2, y2) in segmentos:
+            dx, dy = x2 - x1, y2 - y1
+            comp = dx * dx + dy * dy
+            t = 0.0 if comp == 0 else max(0.0, min(1.0, ((px - x1) * dx + (py - y1) * dy) / comp))
+            melhor = min(melhor, math.hypot(px - x1 - t * dx, py - y1 - t * dy))
+        pior = max(pior, melhor)
+    return pior
+
+
+def main():
+    from sqlalchemy import text
+    from app import create_app
+    from app.models import db, GPSLog, GPSRotaSimplificada, OrdemServico
+    from app.services import gps_armazenamento
+
+    app = create_app()
+
+    with app.app_context():
+        print("🧪 BENCHMARK DO ARMAZENAMENTO DE GPS\n")
+        print(f"   Banco: {db.engine.url}")
+        print(f"   Particionada: {'sim' if gps_armazenamento.tabela_particionada() else 'não'}")
+        popular(db)
+
+        total_linhas = db.session.query(db.func.count(GPSLog.id)).scalar()
+        print(f"   {total_linhas} linhas em gps_logs\n")
+
+        rng = random.Random(3)
+        ids_os = [i for (i,) in db.session.query(OrdemServico.id).filter(
+            OrdemServico.numero_os.like('OS-FROTA-%')
+        ).order_by(OrdemServico.id)]
+        limite = datetime.utcnow() - timedelta(days=gps_armazenamento.GPS_RETENCAO_DIAS + 31)
+        antigas = [i for (i,) in db.session.query(OrdemServico.id).filter(
+            OrdemServico.id.in_(ids_os), OrdemServico.criado_em < limite
+        )]
+        amostra = rng.sample(ids_os, min(AMOSTRA_OS, len(ids_os)))
+        amostra_antigas = rng.sample(antigas, min(10, len(antigas)))
+
+        db.session.execute(text('DROP INDEX IF EXISTS ix_gps_logs_os_timestamp'))
+        db.session.commit()
+        ms_sem_indice = medir(trajeto_legado, amostra[:5])
+        db.session.execute(text('CREATE INDEX IF NOT EXISTS ix_gps_logs_os_timestamp ON gps_logs (os_id, "timestamp")'))
+        db.session.commit()
+        ms_legado = medir(trajeto_legado, amostra)
+        ms_rota = medir(gps_armazenamento.obter_rota, amostra)
+
+        print(f"📊 Trajeto de uma OS, só índice de timestamp: {ms_sem_indice:9.1f} ms")
+        print(f"📊 Trajeto de uma OS, índice (os_id, ts):      {ms_legado:9.2f} ms (leitura original)")
+        print(f"📊 Trajeto de uma OS, obter_rota:              {ms_rota:9.2f} ms")
+
+        originais = {os_id: gps_armazenamento.obter_rota(os_id)['pontos'] for os_id in amostra_antigas}
+
+        inicio = time.perf_counter()
+        resumo = gps_armazenamento.executar_retencao()
+        ms_retencao = (time.perf_counter() - inicio) * 1000
+        linhas_depois = db.session.query(db.func.count(GPSLog.id)).scalar()
+        bytes_polyline = db.session.query(db.func.sum(db.func.length(GPSRotaSimplificada.polyline))).scalar() or 0
+        pontos_originais = sum(m['pontos_originais'] for m in resumo)
+        pontos_mantidos = sum(m['pontos'] for m in resumo)
+
+        print(f"\n🗜️  Retenção de {len(resumo)} meses em {ms_retencao / 1000:.1f}s")
+        print(f"   gps_logs: {total_linhas} → {linhas_depois} linhas")
+        print(f"   {pontos_originais} pontos brutos → {pontos_mantidos} simplificados "
+              f"({pontos_mantidos / max(pontos_originais, 1):.1%}), {bytes_polyline / 1024:.0f} KiB de polyline")
+
+        ms_antigas = medir(gps_armazenamento.obter_rota, amostra_antigas) if amostra_antigas else 0
+        pior = 0.0
+        extremos = True
+        for os_id, pontos in originais.items():
+            rota = gps_armazenamento.obter_rota(os_id)
+            simplificados = rota['pontos']
+            if rota['fontes']['bruto'] or not simplificados:
+                extremos = False
+                continue
+            pior = max(pior, desvio_maximo(pontos, simplificados))
+            extremos &= (abs(simplificados[0][0] - pontos[0][0]) < 1e-5
+                         and abs(simplificados[-1][1] - pontos[-1][1]) < 1e-5
+                         and abs((simplificados[-1][2] - pontos[-1][2]).total_seconds()) < 1)
+        eventos_ok = all(gps_armazenamento.obter_rota(os_id)['eventos'] for os_id in amostra_antigas)
+
+        print(f"📊 Trajeto de uma OS antiga (simplificado):   {ms_antigas:9.2f} ms")
+        tolerancia = gps_armazenamento.GPS_SIMPLIFICACAO_METROS
+        print(f"\n   {'✅' if pior <= tolerancia + 2 else '❌'} Desvio máximo do trajeto simplificado: {pior:.1f} m "
+              f"(tolerância {tolerancia} m + arredondamento da polyline)")
+        print(f"   {'✅' if extremos else '❌'} Início e fim dos trajetos preservados")
+        print(f"   {'✅' if eventos_ok else '❌'} Eventos discretos mantidos após a retenção")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+"""
+Benchmark do inventário do WMS com operações de conjunto (app/services/inventario.py)
+
+Popula 100.000 lotes (80% em estoque) e 30.000 lotes com contagens (1ª e 2ª,
+10% com pesos diferentes, alguns com 3ª contagem) e compara, para um
+inventário GERAL:
+
+  - antes: o laço das rotas iniciar/finalizar/consolidar (carrega os lotes,
+    muda um objeto por vez e confirma tudo num commit só)
+  - agora: UPDATE por faixas de INVENTARIO_LOTE ids, um commit por faixa, e a
+    consolidação agrupada no banco
+
+Mede o tempo total e a transação mais longa (o tempo em que as linhas ficam
+travadas), confere que o resultado é o mesmo e conta os eventos
+'inventario_progresso' recebidos por um admin conectado no Socket.IO.
+
+    python testar_inventario.py
+"""
+import os
+import time
+import random
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_inventario.db')
+
+TOTAL_LOTES = 100000
+LOTES_CONTADOS = 30000
+
+
+def popular(db):
+    from sqlalchemy import insert
+    from app.models import Fornecedor, TipoLote, Lote, InventarioContagem, Inventario, Usuario
+
+    admin = Usuario.query.filter_by(tipo='admin').first()
+    existente = Inventario.query.filter_by(observacoes='benchmark-contagens').first()
+    if existente:
+        return admin.id, existente.id
+    rng = random.Random(23)
+    fornecedor = Fornecedor(nome='Fornecedor Inventário')
+    tipo = TipoLote(nome='Tipo Inventário')
+    db.session.add_all([fornecedor, tipo])
+    db.session.commit()
+
+    agora = datetime.utcnow()
+    linhas = [{
+        'numero_lote': f'INV-{i:07d}', 'fornecedor_id': fornecedor.id, 'tipo_lote_id': tipo.id,
+        'status': 'EM_ESTOQUE' if rng.random() < 0.8 else 'vendido', 'peso_total_kg': round(rng.uniform(1, 500), 1),
+        'valor_total': 0.0, 'reservado': False, 'bloqueado': False, 'total_divergencias': 0,
+        'localizacao_atual': rng.choice(['GALPAO_A', 'GALPAO_B', 'DOCA_1']), 'data_criacao': agora
+    } for i in range(TOTAL_LOTES)]
+    for i in range(0, len(linhas), 10000):
+        db.session.execute(insert(Lote.__table__), linhas[i:i + 10000])
+    db.session.commit()
+
+    # inventário só com as contagens (a consolidação é comparada nele)
+    inventario = Inventario(tipo='GERAL', criado_por_id=admin.id, observacoes='benchmark-contagens')
+    db.session.add(inventario)
+    db.session.commit()
+    lote_ids = [i for (i,) in db.session.query(Lote.id).filter(Lote.numero_lote.like('INV-%'))]
+    contagens = []
+    for lote_id in rng.sample(lote_ids, LOTES_CONTADOS):
+        peso = round(rng.uniform(1, 500), 1)
+        contagens.append({'inventario_id': inventario.id, 'lote_id': lote_id, 'numero_contagem': 1,
+                          'peso_contado': peso, 'contador_id': admin.id, 'data_contagem': agora})
+        segunda = peso if rng.random() > 0.1 else round(peso + rng.uniform(-5, 5), 1)
+        if rng.random() > 0.02:
+            contagens.append({'inventario_id': inventario.id, 'lote_id': lote_id, 'numero_contagem': 2,
+                              'peso_contado': segunda, 'contador_id': admin.id, 'data_contagem': agora})
+        if segunda != peso or rng.random() < 0.01:
+            contagens.append({'inventario_id': inventario.id, 'lote_id': lote_id, 'numero_contagem': 3,
+                              'peso_contado': peso, 'contador_id': admin.id, 'data_contagem': agora})
+    for i in range(0, len(contagens), 10000):
+        db.session.execute(insert(InventarioContagem.__table__), contagens[i:i + 10000])
+    db.session.commit()
+    return admin.id, inventario.id
+
+
+class Transacoes:
+    """Duração de cada transação na conexão (begin -> commit/rollback)."""
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.duracoes = []
+        self._inicio = None
+        event.listen(engine, 'begin', self._begin)
+        event.listen(engine, 'commit', self._fim)
+        event.listen(engine, 'rollback', self._fim)
+
+    def _begin(self, conn):
+        self._inicio = time.perf_counter()
+
+    def _fim(self, conn):
+        if self._inicio is not None:
+            self.duracoes.append((time.perf_counter() - self._inicio) * 1000)
+            self._inicio = None
+
+    def medir(self, funcao):
+        self.duracoes = []
+        inicio = time.perf_counter()
+        resultado = funcao()
+        return (time.perf_counter() - inicio) * 1000, max(self.duracoes or [0]), resultado
+
+
+def eventos_progresso(socket):
+    """
+    Conta os 'inventario_progresso' recebidos pelo cliente e esvazia a fila.
+    Lê socket.queue direto: get_received() é quadrático (pkt not in r) e não
+    termina com os ~80 mil 'lote_atualizado' que o laço antigo emite, um por lote.
+    """
+    recebidos, socket.queue = socket.queue, []
+    return sum(1 for e in recebidos if e['name'] == 'inventario_progresso')
+
+
+# ---- o que as rotas faziam antes ----
+
+def iniciar_antigo(db, inventario, usuario_id):
+    from app.models import Lote
+    lotes = Lote.query.filter(Lote.status.in_(['EM_ESTOQUE', 'BLOQUEADO_QC', 'BLOQUEADO_INVENTARIO'])).all()
+    for lote in lotes:
+        lote.bloqueado = True
+        lote.tipo_bloqueio = 'INVENTARIO'
+        lote.motivo_bloqueio = f'Inventário {inventario.numero_inventario}'
+        lote.bloqueado_por_id = usuario_id
+        lote.bloqueado_em = datetime.utcnow()
+    db.session.commit()
+    return len(lotes)
+
+
+def finalizar_antigo(db, inventario):
+    from app.models import Lote
+    lotes = Lote.query.filter_by(bloqueado=True, tipo_bloqueio='INVENTARIO').all()
+    for lote in lotes:
+        if lote.motivo_bloqueio and inventario.numero_inventario in lote.motivo_bloqueio:
+            lote.bloqueado = False
+            lote.tipo_bloqueio = None
+            lote.motivo_bloqueio = None
+    db.session.commit()
+    return len(lotes)
+
+
+def consolidar_antigo(inventario_id):
+    from app.models import Lote, InventarioContagem
+    lotes_contados = {}
+    for contagem in InventarioContagem.query.filter_by(inventario_id=inventario_id).all():
+        if contagem.lote_id not in lotes_contados:
+            lotes_contados[contagem.lote_id] = {'lote_numero': contagem.lote.numero_lote, 'contagens': {}}
+        lotes_contados[contagem.lote_id]['contagens'][contagem.numero_contagem] = {
+            'peso': contagem.peso_contado, 'contador': contagem.contador.nome}
+    divergencias = []
+    for lote_id, dados in lotes_contados.items():
+        contagens_dict = dados['contagens']
+        if len(contagens_dict) >= 2:
+            contagem_1 = contagens_dict.get(1, {}).get('peso')
+            contagem_2 = contagens_dict.get(2, {}).get('peso')
+            contagem_3 = contagens_dict.get(3, {}).get('peso')
+            lote = Lote.query.get(lote_id)
+            if contagem_1 != contagem_2:
+                divergencias.append({'lote_id': lote_id, 'lote_numero': dados['lote_numero'],
+                                     'peso_sistema': lote.peso_total_kg if lote else 0, 'contagem_1': contagem_1,
+                                     'contagem_2': contagem_2, 'contagem_3': contagem_3, 'status': 'DIVERGENTE'})
+    return len(lotes_contados), divergencias
+
+
+def main():
+    from flask_jwt_extended import create_access_token
+    import wsgi
+    from app import socketio
+    from app.models import db, Lote, Inventario
+    from app.services import inventario as servico
+
+    app = wsgi.app
+    print("🧪 BENCHMARK: INVENTÁRIO EM OPERAÇÕES DE CONJUNTO\n")
+    with app.app_context():
+        admin_id, inventario_contagens_id = popular(db)
+        elegiveis = Lote.query.filter(Lote.status == 'EM_ESTOQUE').count()
+        token = create_access_token(identity=str(admin_id))
+        transacoes = Transacoes(db.engine)
+    print(f"   {TOTAL_LOTES} lotes, {elegiveis} em estoque, faixas de {servico.INVENTARIO_LOTE}\n")
+    socket = socketio.test_client(app, auth={'token': token})
+
+    def bloqueados(numero):
+        return Lote.query.filter_by(bloqueado=True, tipo_bloqueio='INVENTARIO',
+                                    motivo_bloqueio=f'Inventário {numero}').count()
+
+    print(f"{'Operação':<14} | {'Modo':<6} | {'Total (ms)':>10} | {'Maior transação (ms)':>20} | "
+          f"{'Lotes':>6} | {'Eventos':>7} | OK")
+    print("-" * 88)
+    for modo in ('antes', 'agora'):
+        with app.app_context():
+            inventario = Inventario(tipo='GERAL', criado_por_id=admin_id)
+            db.session.add(inventario)
+            db.session.commit()
+            numero = inventario.numero_inventario
+
+            eventos_progresso(socket)
+            if modo == 'antes':
+                ms, maior, lotes = transacoes.medir(lambda: iniciar_antigo(db, inventario, admin_id))
+            else:
+                ms, maior, lotes = transacoes.medir(lambda: servico.bloquear_lotes(inventario, admin_id))
+            eventos = eventos_progresso(socket)
+            ok = bloqueados(numero) == lotes == elegiveis
+            print(f"{'Início':<14} | {modo:<6} | {ms:>10.0f} | {maior:>20.0f} | {lotes:>6} | {eventos:>7} | "
+                  f"{'✅' if ok else '❌'}")
+
+            db.session.expunge_all()
+            inventario = Inventario.query.filter_by(numero_inventario=numero).first()
+            eventos_progresso(socket)
+            if modo == 'antes':
+                ms, maior, lotes = transacoes.medir(lambda: finalizar_antigo(db, inventario))
+            else:
+                ms, maior, lotes = transacoes.medir(lambda: servico.desbloquear_lotes(inventario))
+            eventos = eventos_progresso(socket)
+            ok = bloqueados(numero) == 0 and Lote.query.filter_by(bloqueado=True).count() == 0
+            print(f"{'Finalização':<14} | {modo:<6} | {ms:>10.0f} | {maior:>20.0f} | {lotes:>6} | {eventos:>7} | "
+                  f"{'✅' if ok else '❌'}")
+
+    with app.app_context():
+        db.session.expunge_all()
+        ms_antes, _, (total_antes, divergencias_antes) = transacoes.medir(
+            lambda: consolidar_antigo(inventario_contagens_id))
+        db.session.expunge_all()
+        inventario = Inventario.query.get(inventario_contagens_id)
+        eventos_progresso(socket)
+        ms_agora, _, (total_agora, divergencias_agora) = transacoes.medir(lambda: servico.consolidar(inventario))
+        eventos = eventos_progresso(socket)
+        iguais = total_antes == total_agora and sorted(divergencias_antes, key=lambda d: d['lote_id']) == \
+            divergencias_agora
+        print(f"{'Consolidação':<14} | {'antes':<6} | {ms_antes:>10.0f} | {'—':>20} | {total_antes:>6} | {'—':>7} |")
+        print(f"{'Consolidação':<14} | {'agora':<6} | {ms_agora:>10.0f} | {'—':>20} | {total_agora:>6} | "
+              f"{eventos:>7} | {'✅' if iguais else '❌'}")
+        print(f"\n   {'✅' if iguais else '❌'} Consolidação: {len(divergencias_agora)} lotes divergentes, "
+              f"mesmas divergências do laço antigo")
+
+    # fluxo completo pelas rotas
+    cliente = app.test_client()
+    cabecalho = {'Authorization': f'Bearer {token}'}
+    criado = cliente.post('/api/wms/inventarios', json={'tipo': 'LOCAL', 'localizacao': 'GALPAO_A'},
+                          headers=cabecalho)
+    inv_id = criado.get_json()['inventario']['id']
+    finalizado = cliente.post(f'/api/wms/inventarios/{inv_id}/finalizar', headers=cabecalho)
+    with app.app_context():
+        auditoria = Inventario.query.get(inv_id).auditoria
+    print(f"   {'✅' if criado.status_code == 201 and finalizado.status_code == 200 else '❌'} Rotas: "
+          f"{criado.get_json()['mensagem']} / {finalizado.get_json()['mensagem']}")
+    print(f"   {'✅' if [a['acao'] for a in auditoria] == ['CRIAR_INVENTARIO', 'FINALIZAR_INVENTARIO'] else '❌'} "
+          f"Auditoria gravada: {[a['acao'] for a in auditoria]}")
+    socket.disconnect()
+
+
+if __name__ == '__main__':
+    main()
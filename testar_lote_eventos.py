@@ -0,0 +1,310 @@
+"""
+Benchmark do histórico de lotes em lote_eventos (app/services/lote_eventos.py)
+
+Aplica a mesma sequência aleatória de ações (movimentar, bloquear/
+desbloquear, reservar/liberar) a dois grupos de lotes e compara:
+
+  - antes: o código das rotas do WMS antes desta mudança — to_dict() inteiro
+    em 'dados_before' no array Lote.auditoria (regravado a cada ação) e dois
+    to_dict() em MovimentacaoEstoque
+  - agora: lote_eventos com só as colunas que mudaram, gravado no flush
+
+Mede bytes gravados (parâmetros dos INSERT/UPDATE) e tempo por ação, o
+espaço ocupado pelo histórico, e confere que:
+
+  - GET /lotes/<id>/estado?em=... devolve, para cada ação, o lote como ele
+    estava naquele momento (nos dois grupos: o 'antes' depois da migração
+    migrar_auditoria, que explode os arrays)
+  - o append in-place do código antigo (lote.auditoria or []) perdia as
+    entradas a partir da segunda
+  - o inventário em massa grava um evento por lote bloqueado
+
+    python testar_lote_eventos.py
+"""
+import os
+import time
+import random
+import statistics
+from types import SimpleNamespace
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_lote_eventos.db')
+
+LOTES = 200
+ACOES = 30
+LOCALIZACOES = ['PATIO_RECEBIMENTO', 'GALPAO_A', 'GALPAO_B', 'DOCA_1', 'EXPEDICAO']
+
+
+def popular(db, prefixo, fornecedor_id, tipo_id):
+    from sqlalchemy import insert
+    from app.models import Lote
+
+    agora = datetime.utcnow()
+    db.session.execute(insert(Lote.__table__), [{
+        'numero_lote': f'{prefixo}-{i:05d}', 'fornecedor_id': fornecedor_id, 'tipo_lote_id': tipo_id,
+        'status': 'EM_ESTOQUE', 'peso_total_kg': 100.0, 'valor_total': 0.0, 'reservado': False,
+        'bloqueado': False, 'total_divergencias': 0, 'localizacao_atual': 'PATIO_RECEBIMENTO',
+        'anexos': [], 'divergencias': [], 'auditoria': [], 'data_criacao': agora
+    } for i in range(LOTES)])
+    db.session.commit()
+    return [i for (i,) in db.session.query(Lote.id).filter(Lote.numero_lote.like(f'{prefixo}-%')).order_by(Lote.id)]
+
+
+class Escritas:
+    """Bytes dos parâmetros de INSERT/UPDATE enviados ao banco."""
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.total = 0
+        event.listen(engine, 'before_cursor_execute', self._contar)
+
+    def _contar(self, conn, cursor, sql, parametros, contexto, executemany):
+        if sql.lstrip().upper().startswith(('INSERT', 'UPDATE')):
+            self.total += len(str(parametros))
+
+
+# ---- o que as rotas faziam antes (com a lista copiada, como pretendiam) ----
+
+def _anexar(lote, entrada):
+    auditoria = list(lote.auditoria or [])
+    auditoria.append(entrada)
+    lote.auditoria = auditoria
+
+
+def acao_antiga(db, lote, acao, usuario, destino):
+    from app.models import MovimentacaoEstoque
+    usuario_id = str(usuario.id)
+    base = {'usuario_id': usuario_id, 'usuario_nome': usuario.nome, 'timestamp': datetime.utcnow().isoformat(),
+            'ip': '127.0.0.1'}
+    dados_before = lote.to_dict()
+    if acao == 'MOVIMENTACAO':
+        movimentacao = MovimentacaoEstoque(lote_id=lote.id, tipo='transferencia', localizacao_origem=lote.localizacao_atual,
+                                           localizacao_destino=destino, usuario_id=usuario.id, observacoes='',
+                                           dados_before=dados_before)
+        lote.localizacao_atual = destino
+        movimentacao.dados_after = lote.to_dict()
+        movimentacao.auditoria = [base]
+        _anexar(lote, {'acao': 'MOVIMENTACAO', **base, 'tipo': 'transferencia',
+                       'localizacao_origem': movimentacao.localizacao_origem, 'localizacao_destino': destino,
+                       'gps': None})
+        db.session.add(movimentacao)
+    else:
+        _aplicar(lote, acao, usuario.id)
+        _anexar(lote, {'acao': acao, **base, 'dados_before': dados_before})
+    db.session.commit()
+
+
+def acao_nova(db, lote, acao, usuario, destino):
+    from app.models import MovimentacaoEstoque
+    from app.services import lote_eventos
+    if acao == 'MOVIMENTACAO':
+        movimentacao = MovimentacaoEstoque(lote_id=lote.id, tipo='transferencia', localizacao_origem=lote.localizacao_atual,
+                                           localizacao_destino=destino, usuario_id=usuario.id, observacoes='',
+                                           dados_before={'localizacao_atual': lote.localizacao_atual},
+                                           dados_after={'localizacao_atual': destino})
+        movimentacao.auditoria = [{'usuario_id': usuario.id, 'usuario_nome': usuario.nome,
+                                   'timestamp': datetime.utcnow().isoformat(), 'ip': '127.0.0.1'}]
+        lote.localizacao_atual = destino
+        lote_eventos.registrar(lote, 'MOVIMENTACAO', usuario.id, {'tipo': 'transferencia'})
+        db.session.add(movimentacao)
+    else:
+        _aplicar(lote, acao, usuario.id)
+        lote_eventos.registrar(lote, acao, usuario.id)
+    db.session.commit()
+
+
+def _aplicar(lote, acao, usuario_id):
+    if acao == 'BLOQUEAR_LOTE':
+        lote.bloqueado, lote.tipo_bloqueio, lote.motivo_bloqueio = True, 'QC', 'benchmark'
+        lote.bloqueado_por_id, lote.bloqueado_em = usuario_id, datetime.utcnow()
+    elif acao == 'DESBLOQUEAR_LOTE':
+        lote.bloqueado, lote.tipo_bloqueio, lote.motivo_bloqueio = False, None, None
+    elif acao == 'RESERVAR_LOTE':
+        lote.reservado, lote.reservado_para = True, 'Cliente benchmark'
+        lote.reservado_por_id, lote.reservado_em = usuario_id, datetime.utcnow()
+    elif acao == 'LIBERAR_RESERVA':
+        lote.reservado, lote.reservado_para, lote.reservado_por_id, lote.reservado_em = False, None, None, None
+
+
+def sequencia(rng):
+    """Ações válidas em sequência (não movimenta bloqueado, não reserva bloqueado)."""
+    bloqueado = reservado = False
+    for _ in range(ACOES):
+        opcoes = ['MOVIMENTACAO'] * 3 if not bloqueado else []
+        opcoes.append('DESBLOQUEAR_LOTE' if bloqueado else 'BLOQUEAR_LOTE')
+        if reservado:
+            opcoes.append('LIBERAR_RESERVA')
+        elif not bloqueado:
+            opcoes.append('RESERVAR_LOTE')
+        acao = rng.choice(opcoes)
+        bloqueado = {'BLOQUEAR_LOTE': True, 'DESBLOQUEAR_LOTE': False}.get(acao, bloqueado)
+        reservado = {'RESERVAR_LOTE': True, 'LIBERAR_RESERVA': False}.get(acao, reservado)
+        yield acao, rng.choice(LOCALIZACOES)
+
+
+def executar(db, lote_ids, funcao, usuario, escritas):
+    """Roda a sequência em cada lote; devolve (ms por ação, bytes por ação, [(lote_id, momento, estado)])."""
+    from app.models import Lote
+    from app.services.lote_eventos import estado_atual
+    rng = random.Random(24)
+    tempos, bytes_, estados = [], [], []
+    for lote_id in lote_ids:
+        lote = Lote.query.get(lote_id)
+        for acao, destino in sequencia(rng):
+            antes = escritas.total
+            inicio = time.perf_counter()
+            funcao(db, lote, acao, usuario, destino)
+            tempos.append((time.perf_counter() - inicio) * 1000)
+            bytes_.append(escritas.total - antes)
+            estados.append((lote_id, datetime.utcnow(), estado_atual(lote)))
+        db.session.expunge_all()
+    return tempos, bytes_, estados
+
+
+def tamanho_historico(db, lote_ids):
+    """Bytes (texto JSON) do histórico dos lotes: array auditoria, snapshots das movimentações e eventos."""
+    from sqlalchemy import func
+    from app.models import Lote, LoteEvento, MovimentacaoEstoque
+
+    total = 0
+    for coluna, lote_id in ((Lote.auditoria, Lote.id), (MovimentacaoEstoque.dados_before, MovimentacaoEstoque.lote_id),
+                            (MovimentacaoEstoque.dados_after, MovimentacaoEstoque.lote_id),
+                            (LoteEvento.alteracoes, LoteEvento.lote_id), (LoteEvento.detalhes, LoteEvento.lote_id)):
+        total += db.session.query(func.coalesce(func.sum(func.length(db.cast(coluna, db.String))), 0)) \
+            .filter(coluna.isnot(None), lote_id.in_(lote_ids)).scalar()
+    return total
+
+
+def conferir_estados(cliente, cabecalho, estados):
+    erros = 0
+    for lote_id, momento, esperado in estados:
+        resposta = cliente.get(f'/api/wms/lotes/{lote_id}/estado?em={momento.isoformat()}', headers=cabecalho)
+        if resposta.status_code != 200 or resposta.get_json()['estado'] != esperado:
+            erros += 1
+    return erros
+
+
+def main():
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+    import wsgi
+    from app.models import db, Lote, LoteEvento, MovimentacaoEstoque, Fornecedor, TipoLote, Usuario, Inventario
+    from app.services import lote_eventos, inventario as inventario_service
+
+    app = wsgi.app
+    print("🧪 BENCHMARK: HISTÓRICO DE LOTES EM LOTE_EVENTOS\n")
+    with app.app_context():
+        db.session.execute(db.delete(LoteEvento))
+        db.session.execute(db.delete(MovimentacaoEstoque))
+        db.session.execute(db.delete(Lote.__table__).where(Lote.numero_lote.like('EVT-%')))
+        db.session.commit()
+        admin = Usuario.query.filter_by(tipo='admin').first()
+        # as ações rodam com expunge_all entre os lotes: só id e nome
+        usuario = SimpleNamespace(id=admin.id, nome=admin.nome)
+        fornecedor = Fornecedor.query.filter_by(nome='Fornecedor Eventos').first() or Fornecedor(nome='Fornecedor Eventos')
+        tipo = TipoLote.query.filter_by(nome='Tipo Eventos').first() or TipoLote(nome='Tipo Eventos')
+        db.session.add_all([fornecedor, tipo])
+        db.session.commit()
+        antigos = popular(db, 'EVT-A', fornecedor.id, tipo.id)
+        novos = popular(db, 'EVT-N', fornecedor.id, tipo.id)
+        token = create_access_token(identity=str(usuario.id))
+        escritas = Escritas(db.engine)
+
+        # antes: sem o listener, como o código antigo rodava
+        event.remove(Session, 'before_flush', lote_eventos._gravar_eventos)
+        ms_antes, bytes_antes, estados_antes = executar(db, antigos, acao_antiga, usuario, escritas)
+        event.listen(Session, 'before_flush', lote_eventos._gravar_eventos)
+        tamanho_antes = tamanho_historico(db, antigos)
+
+        ms_agora, bytes_agora, estados_agora = executar(db, novos, acao_nova, usuario, escritas)
+        tamanho_agora = tamanho_historico(db, novos)
+
+        print(f"   {LOTES} lotes × {ACOES} ações por modo\n")
+        print(f"{'Modo':<6} | {'ms/ação':>8} | {'bytes/ação':>10} | {'bytes/ação (30ª)':>16} | {'Histórico (KB)':>14}")
+        print("-" * 68)
+        ultimas_antes = [b for i, b in enumerate(bytes_antes) if i % ACOES == ACOES - 1]
+        ultimas_agora = [b for i, b in enumerate(bytes_agora) if i % ACOES == ACOES - 1]
+        print(f"{'antes':<6} | {statistics.mean(ms_antes):>8.2f} | {statistics.mean(bytes_antes):>10.0f} | "
+              f"{statistics.mean(ultimas_antes):>16.0f} | {tamanho_antes / 1024:>14.0f}")
+        print(f"{'agora':<6} | {statistics.mean(ms_agora):>8.2f} | {statistics.mean(bytes_agora):>10.0f} | "
+              f"{statistics.mean(ultimas_agora):>16.0f} | {tamanho_agora / 1024:>14.0f}")
+
+        # migração dos arrays antigos
+        inicio = time.perf_counter()
+        resumo = lote_eventos.migrar_auditoria()
+        ms_migracao = (time.perf_counter() - inicio) * 1000
+        tamanho_migrado = tamanho_historico(db, antigos)
+        print(f"\n   Migração: {resumo['lotes']} lotes, {resumo['eventos']} eventos, "
+              f"{resumo['movimentacoes']} movimentações compactadas em {ms_migracao:.0f} ms; "
+              f"histórico {tamanho_antes / 1024:.0f} KB → {tamanho_migrado / 1024:.0f} KB")
+        de_novo = lote_eventos.migrar_auditoria()
+        print(f"   {'✅' if de_novo == {'lotes': 0, 'eventos': 0, 'movimentacoes': 0} else '❌'} "
+              f"Rodar a migração de novo não muda nada: {de_novo}")
+
+    cliente = app.test_client()
+    cabecalho = {'Authorization': f'Bearer {token}'}
+    for nome, estados in (('agora', estados_agora), ('antes, migrado', estados_antes)):
+        erros = conferir_estados(cliente, cabecalho, estados)
+        print(f"   {'✅' if not erros else '❌'} Estado reconstruído ({nome}): "
+              f"{len(estados) - erros}/{len(estados)} momentos iguais ao lote naquele instante")
+
+    # rotas
+    lote_id = novos[0]
+    vistos, cursor = [], None
+    while True:
+        pagina = cliente.get(f'/api/wms/lotes/{lote_id}/eventos?limite=7' + (f'&cursor={cursor}' if cursor else ''),
+                             headers=cabecalho)
+        vistos.extend(e['id'] for e in pagina.get_json())
+        cursor = pagina.headers.get('X-Proximo-Cursor')
+        if not cursor:
+            break
+    with app.app_context():
+        total = LoteEvento.query.filter_by(lote_id=lote_id).count()
+    print(f"   {'✅' if len(vistos) == len(set(vistos)) == total else '❌'} Eventos paginados: {len(vistos)} de {total}")
+
+    movido = cliente.post(f'/api/wms/lotes/{novos[1]}/movimentar', json={'localizacao_destino': 'DOCA_9'},
+                          headers=cabecalho)
+    evento = cliente.get(f'/api/wms/lotes/{novos[1]}/eventos?limite=1', headers=cabecalho).get_json()[0]
+    mov = movido.get_json().get('movimentacao', {})
+    print(f"   {'✅' if movido.status_code == 201 and evento['acao'] == 'MOVIMENTACAO' else '❌'} "
+          f"POST movimentar → {movido.status_code}, evento {evento['acao']} {evento['alteracoes']}, "
+          f"movimentação {mov.get('dados_before')} → {mov.get('dados_after')}")
+    anterior = cliente.get(f'/api/wms/lotes/{novos[1]}/estado?em=2000-01-01T00:00:00', headers=cabecalho)
+    print(f"   {'✅' if anterior.status_code == 404 else '❌'} Estado antes da criação → {anterior.status_code}")
+    com_fuso = [cliente.get(f'/api/wms/lotes/{novos[1]}/estado?em={em}', headers=cabecalho).status_code
+                for em in ('2000-01-01T00:00:00Z', '2000-01-01T00:00:00-03:00')]
+    invalida = cliente.get(f'/api/wms/lotes/{novos[1]}/estado?em=ontem', headers=cabecalho).status_code
+    print(f"   {'✅' if com_fuso == [404, 404] and invalida == 400 else '❌'} em com Z/offset → {com_fuso}, "
+          f"inválida → {invalida}")
+    zero = cliente.get(f'/api/wms/lotes/{novos[1]}/eventos?limite=0', headers=cabecalho)
+    print(f"   {'✅' if zero.status_code == 200 and len(zero.get_json()) == 1 else '❌'} "
+          f"Eventos com limite=0 → {zero.status_code}, {len(zero.get_json() or [])} evento")
+
+    with app.app_context():
+        # o código antigo: lote.auditoria or [] + append + reatribuição da mesma lista
+        lote = Lote.query.get(novos[2])
+        for i in range(3):
+            auditoria = lote.auditoria or []
+            auditoria.append({'acao': f'TESTE_{i}'})
+            lote.auditoria = auditoria
+            db.session.commit()
+        db.session.expunge_all()
+        gravadas = len(Lote.query.get(novos[2]).auditoria or [])
+        print(f"   {'✅' if gravadas == 1 else '❌'} Código antigo: 3 entradas anexadas, {gravadas} gravada no banco")
+        db.session.execute(db.update(Lote).where(Lote.id == novos[2]).values(auditoria=[]))
+        db.session.commit()
+
+        inventario = Inventario(tipo='LOCAL', localizacao='DOCA_1', criado_por_id=usuario.id)
+        db.session.add(inventario)
+        db.session.commit()
+        bloqueados = inventario_service.bloquear_lotes(inventario, usuario.id)
+        eventos = LoteEvento.query.filter_by(acao='BLOQUEIO_INVENTARIO').count()
+        inventario_service.desbloquear_lotes(inventario, usuario.id)
+        liberados = LoteEvento.query.filter_by(acao='DESBLOQUEIO_INVENTARIO').count()
+        print(f"   {'✅' if bloqueados and bloqueados == eventos and liberados <= bloqueados else '❌'} "
+              f"Inventário em massa: {bloqueados} lotes bloqueados, {eventos} eventos de bloqueio, "
+              f"{liberados} de desbloqueio")
+
+
+if __name__ == '__main__':
+    main()
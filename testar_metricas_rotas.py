@@ -0,0 +1,219 @@
+"""
+Benchmark do motor geodésico (app/services/geo.py) e das métricas de rota
+
+1. Trilhas sintéticas de 10k a 200k pontos: distância com haversine em laço
+   Python x NumPy, e Douglas-Peucker em Python puro x vetorizado, conferindo
+   que os resultados são iguais.
+2. Trilha com uma parada conhecida de 10 minutos no fornecedor: confere a
+   parada detectada e o tempo no fornecedor.
+3. Dashboard de logística: calcula as métricas das OS finalizadas e compara o
+   cálculo na hora (trilha de cada OS por motorista) com a leitura agrupada
+   dos números pré-calculados, em tempo e número de consultas.
+
+    python testar_metricas_rotas.py
+"""
+import os
+import math
+import time
+import random
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_metricas_rotas.db')
+
+TAMANHOS = [10_000, 50_000, 200_000]
+MOTORISTAS = 30
+OS_POR_MOTORISTA = 20
+PONTOS_POR_OS = 240
+
+
+def trilha(n, rng, inicio=(-23.55, -46.63)):
+    lat, lng = inicio
+    rumo = 0.0
+    pontos = []
+    for _ in range(n):
+        rumo += rng.gauss(0, 0.2)
+        passo = rng.uniform(0, 0.0008)
+        lat += passo * math.cos(rumo)
+        lng += passo * math.sin(rumo)
+        pontos.append((lat, lng))
+    return pontos
+
+
+def distancia_python(pontos):
+    total = 0.0
+    for (lat1, lng1), (lat2, lng2) in zip(pontos, pontos[1:]):
+        p1, p2 = math.radians(lat1), math.radians(lat2)
+        a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+        total += 2 * 6371008.8 * math.asin(math.sqrt(a))
+    return total
+
+
+def douglas_peucker_python(pontos, tolerancia):
+    """Douglas-Peucker em Python puro, mesma projeção de geo.simplificar_indices."""
+    lat0 = math.radians(sum(p[0] for p in pontos) / len(pontos))
+    escala = math.radians(1.0) * 6371008.8
+    xy = [(p[1] * escala * math.cos(lat0), p[0] * escala) for p in pontos]
+    manter = [False] * len(pontos)
+    manter[0] = manter[-1] = True
+    pilha = [(0, len(pontos) - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        (x1, y1), (x2, y2) = xy[inicio], xy[fim]
+        dx, dy = x2 - x1, y2 - y1
+        comp = dx * dx + dy * dy
+        maior, indice = -1.0, inicio
+        for i in range(inicio + 1, fim):
+            px, py = xy[i][0] - x1, xy[i][1] - y1
+            t = 0.0 if comp == 0 else max(0.0, min(1.0, (px * dx + py * dy) / comp))
+            d2 = (px - t * dx) ** 2 + (py - t * dy) ** 2
+            if d2 > maior:
+                maior, indice = d2, i
+        if maior > tolerancia * tolerancia:
+            manter[indice] = True
+            pilha.append((inicio, indice))
+            pilha.append((indice, fim))
+    return [i for i, m in enumerate(manter) if m]
+
+
+def cronometrar(funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+
+def testar_motor():
+    from app.services import geo
+
+    print("📐 Motor geodésico\n")
+    print(f"{'Pontos':>8} | {'Dist. Python':>12} | {'Dist. NumPy':>11} | {'DP Python':>10} | {'DP NumPy':>9} | Igual")
+    print("-" * 72)
+    rng = random.Random(5)
+    for n in TAMANHOS:
+        pontos = trilha(n, rng)
+        lat = [p[0] for p in pontos]
+        lng = [p[1] for p in pontos]
+        d_py, ms_d_py = cronometrar(distancia_python, pontos)
+        d_np, ms_d_np = cronometrar(geo.distancia_total_metros, lat, lng)
+        dp_py, ms_dp_py = cronometrar(douglas_peucker_python, pontos, 5.0)
+        dp_np, ms_dp_np = cronometrar(geo.simplificar_indices, lat, lng, 5.0)
+        igual = math.isclose(d_py, d_np, rel_tol=1e-9) and list(dp_np) == dp_py
+        print(f"{n:>8} | {ms_d_py:10.1f}ms | {ms_d_np:9.1f}ms | {ms_dp_py:8.1f}ms | {ms_dp_np:7.1f}ms | "
+              f"{'✅' if igual else '❌'}")
+
+
+def testar_parada():
+    from app.services import geo
+
+    rng = random.Random(9)
+    ida = trilha(120, rng)
+    fornecedor = ida[-1]
+    parada = [(fornecedor[0] + rng.gauss(0, 0.00003), fornecedor[1] + rng.gauss(0, 0.00003)) for _ in range(60)]
+    volta = trilha(120, rng, inicio=fornecedor)
+    pontos = ida + parada + volta
+    ts = [i * 10.0 for i in range(len(pontos))]
+    lat = [p[0] for p in pontos]
+    lng = [p[1] for p in pontos]
+
+    paradas = geo.detectar_paradas(lat, lng, ts)
+    no_fornecedor = geo.tempo_no_raio(lat, lng, ts, fornecedor[0], fornecedor[1], 150)
+    maior = max((p['duracao_segundos'] for p in paradas), default=0)
+    print(f"\n🅿️  Parada de 600 s no fornecedor: detectada {maior:.0f} s em {len(paradas)} parada(s), "
+          f"{no_fornecedor:.0f} s dentro de 150 m {'✅' if 540 <= maior <= 660 and no_fornecedor >= 590 else '❌'}")
+
+
+def popular(db):
+    from app.models import Usuario, Motorista, Fornecedor, Solicitacao, OrdemCompra, OrdemServico, GPSLog
+
+    if Fornecedor.query.filter_by(nome='Fornecedor Metricas Benchmark').first():
+        return
+    rng = random.Random(13)
+    admin = Usuario.query.filter_by(tipo='admin').first()
+    fornecedor = Fornecedor(nome='Fornecedor Metricas Benchmark', latitude=-23.55, longitude=-46.63)
+    db.session.add(fornecedor)
+    db.session.flush()
+    agora = datetime.now()
+    inicio_mes = datetime(agora.year, agora.month, 1)
+    for i in range(MOTORISTAS):
+        motorista = Motorista(nome=f'Motorista Metricas {i}', cpf=f'8{i:010d}')
+        db.session.add(motorista)
+        db.session.flush()
+        linhas = []
+        for j in range(OS_POR_MOTORISTA):
+            solicitacao = Solicitacao(funcionario_id=admin.id, fornecedor_id=fornecedor.id, status='aprovada')
+            db.session.add(solicitacao)
+            db.session.flush()
+            oc = OrdemCompra(solicitacao_id=solicitacao.id, fornecedor_id=fornecedor.id, criado_por=admin.id)
+            db.session.add(oc)
+            db.session.flush()
+            criado = inicio_mes + (agora - inicio_mes) * rng.random()
+            os_ = OrdemServico(oc_id=oc.id, numero_os=f'OS-MET-{i}-{j}', fornecedor_snapshot={'id': fornecedor.id},
+                               motorista_id=motorista.id, created_by=admin.id, criado_em=criado,
+                               status='FINALIZADA' if j % 4 else 'EM_ROTA')
+            db.session.add(os_)
+            db.session.flush()
+            for k, (lat, lng) in enumerate(trilha(PONTOS_POR_OS, rng)):
+                linhas.append({'os_id': os_.id, 'evento': 'POSICAO', 'latitude': lat, 'longitude': lng,
+                               'timestamp': criado + timedelta(seconds=10 * k), 'device_id': f'met-{i}'})
+        db.session.execute(GPSLog.__table__.insert(), linhas)
+    db.session.commit()
+
+
+def logistica_na_hora():
+    """Como seria sem pré-cálculo: consultas por motorista e a trilha de cada OS finalizada."""
+    from app.models import Motorista, OrdemServico
+    from app.services import rotas_metricas
+
+    hoje = datetime.now()
+    mes_atual = datetime(hoje.year, hoje.month, 1)
+    resultado = []
+    for motorista in Motorista.query.filter(Motorista.ativo == True).all():
+        ordens = OrdemServico.query.filter(
+            OrdemServico.motorista_id == motorista.id,
+            OrdemServico.criado_em >= mes_atual
+        ).all()
+        km = sum(rotas_metricas.calcular_metricas(o)['km_percorrido'] for o in ordens if o.status == 'FINALIZADA')
+        resultado.append((motorista.nome, len(ordens), round(km, 3)))
+    return resultado
+
+
+def main():
+    from sqlalchemy import event
+    from app import create_app
+    from app.models import db
+    from app.services import rotas_metricas, dashboard_stats
+
+    print("🧪 BENCHMARK DAS MÉTRICAS DE ROTA\n")
+    testar_motor()
+    testar_parada()
+
+    app = create_app()
+    with app.app_context():
+        popular(db)
+        inicio = time.perf_counter()
+        calculadas = rotas_metricas.calcular_pendentes()
+        print(f"\n🚚 {calculadas} OS finalizadas calculadas em {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+        consultas = []
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: consultas.append(1))
+
+        na_hora, ms_na_hora = cronometrar(logistica_na_hora)
+        q_na_hora = len(consultas)
+        consultas.clear()
+        novo, ms_novo = cronometrar(dashboard_stats.calcular_metricas_logistica)
+        q_novo = len(consultas)
+
+        por_nome = {m['nome']: m for m in novo['metricas_motoristas']}
+        iguais = all(
+            nome in por_nome and por_nome[nome]['total_os'] == total
+            and math.isclose(por_nome[nome]['km_total'], km, abs_tol=0.01)
+            for nome, total, km in na_hora
+        )
+        print(f"📊 Logística calculada na hora: {ms_na_hora:8.1f} ms | {q_na_hora} consultas")
+        print(f"📊 Logística pré-calculada:     {ms_novo:8.1f} ms | {q_novo} consultas")
+        print(f"   {'✅' if iguais else '❌'} Mesmos km e OS por motorista ({novo['total_km_mes']:.1f} km no mês)")
+
+
+if __name__ == '__main__':
+    main()
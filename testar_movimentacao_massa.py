@@ -0,0 +1,128 @@
+"""
+Benchmark da movimentação em massa por QR code (POST /api/wms/movimentacoes/lote-em-massa)
+
+Popula 5.000 lotes e move 1.000 para outro galpão:
+
+  - antes: um POST /api/wms/lotes/<id>/movimentar por lote (o que o coletor
+    fazia a cada leitura)
+  - agora: um POST /api/wms/movimentacoes/lote-em-massa com os 1.000
+    numero_lote lidos
+
+Conta consultas SQL, commits e tempo, e confere que os lotes mudaram de
+local, que há uma movimentação e um evento de lote_eventos por lote, e os
+resultados por número (lidos repetidos, inexistentes, bloqueados e já no
+destino).
+
+    python testar_movimentacao_massa.py
+"""
+import os
+import time
+import random
+from datetime import datetime
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_movimentacao_massa.db')
+
+TOTAL_LOTES = 5000
+MOVIDOS = 1000
+
+
+def popular(db):
+    from sqlalchemy import insert
+    from app.models import Fornecedor, TipoLote, Lote
+
+    if db.session.query(Lote.id).filter(Lote.numero_lote.like('QR-%')).first():
+        return
+    fornecedor = Fornecedor(nome='Fornecedor QR')
+    tipo = TipoLote(nome='Tipo QR')
+    db.session.add_all([fornecedor, tipo])
+    db.session.commit()
+    agora = datetime.utcnow()
+    db.session.execute(insert(Lote.__table__), [{
+        'numero_lote': f'QR-{i:06d}', 'fornecedor_id': fornecedor.id, 'tipo_lote_id': tipo.id,
+        'status': 'EM_ESTOQUE', 'peso_total_kg': 50.0, 'valor_total': 0.0, 'reservado': False,
+        'bloqueado': False, 'total_divergencias': 0, 'localizacao_atual': 'PATIO_RECEBIMENTO',
+        'anexos': [], 'divergencias': [], 'auditoria': [], 'data_criacao': agora
+    } for i in range(TOTAL_LOTES)])
+    db.session.commit()
+
+
+class Contador:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.consultas = self.commits = 0
+        event.listen(engine, 'before_cursor_execute', self._consulta)
+        event.listen(engine, 'commit', self._commit)
+
+    def _consulta(self, *args):
+        self.consultas += 1
+
+    def _commit(self, *args):
+        self.commits += 1
+
+    def medir(self, funcao):
+        consultas, commits = self.consultas, self.commits
+        inicio = time.perf_counter()
+        resultado = funcao()
+        return (time.perf_counter() - inicio) * 1000, self.consultas - consultas, self.commits - commits, resultado
+
+
+def main():
+    from flask_jwt_extended import create_access_token
+    import wsgi
+    from app.models import db, Lote, LoteEvento, MovimentacaoEstoque, Usuario
+
+    app = wsgi.app
+    print("🧪 BENCHMARK: MOVIMENTAÇÃO EM MASSA POR QR CODE\n")
+    with app.app_context():
+        popular(db)
+        token = create_access_token(identity=str(Usuario.query.filter_by(tipo='admin').first().id))
+        contador = Contador(db.engine)
+        lotes = db.session.query(Lote.id, Lote.numero_lote).filter(Lote.numero_lote.like('QR-%')).order_by(Lote.id).all()
+    rng = random.Random(25)
+    amostra = rng.sample(lotes, MOVIDOS * 2)
+    individuais, em_massa = amostra[:MOVIDOS], amostra[MOVIDOS:]
+    cliente = app.test_client()
+    cabecalho = {'Authorization': f'Bearer {token}'}
+
+    def um_por_um():
+        codigos = [cliente.post(f'/api/wms/lotes/{lote_id}/movimentar', json={'localizacao_destino': 'GALPAO_A'},
+                                headers=cabecalho).status_code for lote_id, _ in individuais]
+        return sum(1 for c in codigos if c == 201)
+
+    def de_uma_vez():
+        resposta = cliente.post('/api/wms/movimentacoes/lote-em-massa', headers=cabecalho, json={
+            'numeros_lote': [numero for _, numero in em_massa], 'localizacao_destino': 'GALPAO_B'})
+        return resposta.get_json()['movidos']
+
+    print(f"{'Modo':<22} | {'Lotes':>5} | {'Total (ms)':>10} | {'Consultas':>9} | {'Commits':>7}")
+    print("-" * 66)
+    for nome, funcao in (('antes (1 POST/lote)', um_por_um), ('agora (1 POST)', de_uma_vez)):
+        ms, consultas, commits, movidos = contador.medir(funcao)
+        print(f"{nome:<22} | {movidos:>5} | {ms:>10.0f} | {consultas:>9} | {commits:>7}")
+
+    with app.app_context():
+        ids = [lote_id for lote_id, _ in em_massa]
+        no_destino = Lote.query.filter(Lote.id.in_(ids), Lote.localizacao_atual == 'GALPAO_B').count()
+        movimentacoes = MovimentacaoEstoque.query.filter(MovimentacaoEstoque.lote_id.in_(ids),
+                                                         MovimentacaoEstoque.localizacao_destino == 'GALPAO_B').count()
+        eventos = LoteEvento.query.filter(LoteEvento.lote_id.in_(ids), LoteEvento.acao == 'MOVIMENTACAO').count()
+        print(f"\n   {'✅' if no_destino == movimentacoes == eventos == MOVIDOS else '❌'} {no_destino} lotes em GALPAO_B, "
+              f"{movimentacoes} movimentações, {eventos} eventos de lote")
+        # casos da leitura: bloqueado, repetido, inexistente e já no destino
+        bloqueado_id, bloqueado_numero = individuais[0]
+        db.session.execute(db.update(Lote).where(Lote.id == bloqueado_id).values(bloqueado=True))
+        db.session.commit()
+
+    numeros = [em_massa[0][1], individuais[1][1], individuais[1][1], bloqueado_numero, 'QR-INEXISTENTE', '']
+    resposta = cliente.post('/api/wms/movimentacoes/lote-em-massa', headers=cabecalho,
+                            json={'numeros_lote': numeros, 'localizacao_destino': 'GALPAO_B'})
+    obtidos = [r['resultado'] for r in resposta.get_json()['resultados']]
+    esperados = ['ja_no_destino', 'movido', 'duplicado', 'bloqueado', 'nao_encontrado', 'nao_encontrado']
+    print(f"   {'✅' if obtidos == esperados else '❌'} Resultados por número lido: {obtidos}")
+
+    vazio = cliente.post('/api/wms/movimentacoes/lote-em-massa', headers=cabecalho, json={'numeros_lote': []})
+    print(f"   {'✅' if vazio.status_code == 400 else '❌'} Sem destino/lista → {vazio.status_code}")
+
+
+if __name__ == '__main__':
+    main()
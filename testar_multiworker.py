@@ -0,0 +1,408 @@
+"""
+Teste do modo multi-worker: gunicorn + eventlet com 4 workers e Socket.IO via Redis
+
+Sobe um Redis simulado (servidor RESP em Python com pub/sub e os comandos
+usados por estado_compartilhado, dispensa o redis-server) e roda o gunicorn
+em três configurações:
+
+  1. 1 worker (modo atual)
+  2. 4 workers sem fila de mensagens
+  3. 4 workers com SOCKETIO_MESSAGE_QUEUE apontando para o Redis simulado
+
+Em cada uma um gerador de carga mede:
+
+  - requisições/s em GET /api/os (lista de OS, CPU-bound) com 16 conexões
+  - quantos workers diferentes responderam (pid em /api/os/tempo-real/stats)
+  - entrega de eventos: 24 clientes Socket.IO (só WebSocket) conectados como
+    admin e 20 aprovações de solicitação feitas por HTTP em workers
+    aleatórios; cada cliente deveria receber os 20 solicitacao_atualizada
+  - alertas de metais: um alerta criado e 40 leituras, quantas o encontram
+
+Requer gunicorn, eventlet, redis e o cliente Socket.IO síncrono:
+
+    pip install gunicorn eventlet redis "python-socketio[client]"
+    python testar_multiworker.py
+"""
+import os
+import sys
+import time
+import socket
+import random
+import threading
+import subprocess
+import socketserver
+from concurrent.futures import ThreadPoolExecutor
+
+BANCO = '/tmp/benchmark_multiworker.db'
+os.environ.setdefault('DATABASE_URL', f'sqlite:///{BANCO}')
+
+OS_TOTAL = 300
+SOLICITACOES = 200
+CLIENTES_SOCKET = 24
+APROVACOES = 20
+REQUISICOES = 400
+CONEXOES = 16
+LEITURAS_ALERTA = 40
+
+
+# ---------------------------------------------------------------- Redis simulado
+
+class Push(list):
+    """Mensagem de pub/sub: '>' no RESP3, array comum no RESP2."""
+
+
+class ConexaoRedis(socketserver.StreamRequestHandler):
+    """Protocolo RESP2/RESP3 com os comandos usados pelo python-socketio e por estado_compartilhado."""
+
+    def _ler_comando(self):
+        linha = self.rfile.readline()
+        if not linha:
+            return None
+        if not linha.startswith(b'*'):
+            return linha.strip().split()
+        partes = []
+        for _ in range(int(linha[1:])):
+            tamanho = int(self.rfile.readline()[1:])
+            partes.append(self.rfile.read(tamanho + 2)[:-2])
+        return partes
+
+    def _codificar(self, valor):
+        if valor is None:
+            return b'_\r\n' if self.resp3 else b'$-1\r\n'
+        if isinstance(valor, Exception):
+            return b'-ERR ' + str(valor).encode() + b'\r\n'
+        if isinstance(valor, bool):
+            return b':%d\r\n' % int(valor)
+        if isinstance(valor, int):
+            return b':%d\r\n' % valor
+        if isinstance(valor, str):
+            return b'+' + valor.encode() + b'\r\n'
+        if isinstance(valor, dict):
+            if not self.resp3:
+                return self._codificar([v for par in valor.items() for v in par])
+            return b'%%%d\r\n' % len(valor) + b''.join(self._codificar(k) + self._codificar(v)
+                                                       for k, v in valor.items())
+        if isinstance(valor, Push):
+            inicio = b'>' if self.resp3 else b'*'
+            return inicio + b'%d\r\n' % len(valor) + b''.join(self._codificar(v) for v in valor)
+        if isinstance(valor, (list, tuple)):
+            return b'*%d\r\n' % len(valor) + b''.join(self._codificar(v) for v in valor)
+        return b'$%d\r\n%s\r\n' % (len(valor), valor)
+
+    def _enviar(self, valor):
+        with self.trava_escrita:
+            self.wfile.write(self._codificar(valor))
+            self.wfile.flush()
+
+    def handle(self):
+        self.trava_escrita = threading.Lock()
+        self.resp3 = False
+        servidor = self.server
+        transacao = None
+        while True:
+            try:
+                comando = self._ler_comando()
+            except (ConnectionError, ValueError):
+                break
+            if comando is None:
+                break
+            nome = comando[0].upper().decode()
+            if nome == 'HELLO':
+                self.resp3 = len(comando) > 1 and comando[1] == b'3'
+                self._enviar({b'server': b'redis', b'version': b'7.0.0', b'proto': 3 if self.resp3 else 2})
+            elif nome == 'MULTI':
+                transacao = []
+                self._enviar('OK')
+            elif nome == 'EXEC':
+                self._enviar([servidor.executar(c[0].upper().decode(), c[1:]) for c in transacao or []])
+                transacao = None
+            elif transacao is not None:
+                transacao.append(comando)
+                self._enviar('QUEUED')
+            elif nome == 'SUBSCRIBE':
+                for canal in comando[1:]:
+                    servidor.assinar(canal, self)
+                    self._enviar(Push([b'subscribe', canal, 1]))
+            elif nome == 'UNSUBSCRIBE':
+                for canal in comando[1:] or list(servidor.canais):
+                    servidor.cancelar(canal, self)
+                    self._enviar(Push([b'unsubscribe', canal, 0]))
+            else:
+                self._enviar(servidor.executar(nome, comando[1:]))
+        for canal in list(servidor.canais):
+            servidor.cancelar(canal, self)
+
+
+class RedisSimulado(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, porta):
+        super().__init__(('127.0.0.1', porta), ConexaoRedis)
+        self.trava = threading.Lock()
+        self.dados = {}
+        self.expira = {}
+        self.canais = {}
+        self.publicacoes = 0
+
+    def assinar(self, canal, conexao):
+        with self.trava:
+            self.canais.setdefault(canal, set()).add(conexao)
+
+    def cancelar(self, canal, conexao):
+        with self.trava:
+            self.canais.get(canal, set()).discard(conexao)
+
+    def _vivo(self, chave):
+        if chave in self.expira and self.expira[chave] < time.time():
+            self.dados.pop(chave, None)
+            self.expira.pop(chave, None)
+        return chave in self.dados
+
+    def executar(self, nome, args):
+        with self.trava:
+            if nome == 'PING':
+                return 'PONG'
+            if nome in ('CLIENT', 'SELECT', 'FLUSHALL'):
+                if nome == 'FLUSHALL':
+                    self.dados.clear()
+                return 'OK'
+            if nome == 'PUBLISH':
+                self.publicacoes += 1
+                assinantes = list(self.canais.get(args[0], ()))
+            elif nome == 'GET':
+                return self.dados[args[0]] if self._vivo(args[0]) else None
+            elif nome == 'SET':
+                self.dados[args[0]] = args[1]
+                self.expira.pop(args[0], None)
+                if len(args) > 3 and args[2].upper() == b'EX':
+                    self.expira[args[0]] = time.time() + int(args[3])
+                return 'OK'
+            elif nome == 'DEL':
+                return sum(1 for chave in args if self.dados.pop(chave, None) is not None)
+            elif nome in ('INCR', 'INCRBY'):
+                passo = int(args[1]) if len(args) > 1 else 1
+                valor = (int(self.dados[args[0]]) if self._vivo(args[0]) else 0) + passo
+                self.dados[args[0]] = str(valor).encode()
+                return valor
+            elif nome == 'EXPIRE':
+                self.expira[args[0]] = time.time() + int(args[1])
+                return 1
+            elif nome == 'HSET':
+                hash_ = self.dados.setdefault(args[0], {})
+                novos = sum(1 for i in range(1, len(args), 2) if args[i] not in hash_)
+                hash_.update(zip(args[1::2], args[2::2]))
+                return novos
+            elif nome == 'HDEL':
+                hash_ = self.dados.get(args[0], {})
+                return sum(1 for campo in args[1:] if hash_.pop(campo, None) is not None)
+            elif nome == 'HGETALL':
+                return dict(self.dados.get(args[0], {}))
+            elif nome == 'RPUSH':
+                lista = self.dados.setdefault(args[0], [])
+                lista.extend(args[1:])
+                return len(lista)
+            elif nome == 'LTRIM':
+                lista = self.dados.get(args[0], [])
+                inicio, fim = int(args[1]), int(args[2])
+                fim = len(lista) if fim == -1 else fim + 1
+                self.dados[args[0]] = lista[inicio:fim] if inicio >= 0 else lista[max(len(lista) + inicio, 0):fim]
+                return 'OK'
+            elif nome == 'LRANGE':
+                lista = self.dados.get(args[0], []) if self._vivo(args[0]) else []
+                fim = int(args[2])
+                return lista[int(args[1]):len(lista) if fim == -1 else fim + 1]
+            else:
+                return Exception(f"comando não suportado pelo Redis simulado: {nome}")
+        # PUBLISH: entrega fora da trava
+        for conexao in assinantes:
+            try:
+                conexao._enviar(Push([b'message', args[0], args[1]]))
+            except OSError:
+                pass
+        return len(assinantes)
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# ---------------------------------------------------------------- banco e servidor
+
+def popular():
+    from werkzeug.security import generate_password_hash
+    from app import create_app
+    from app.models import db, Usuario, Fornecedor, Solicitacao, ItemSolicitacao, OrdemCompra, OrdemServico
+
+    app = create_app()
+    with app.app_context():
+        admin = Usuario.query.filter_by(tipo='admin').first()
+        if not Fornecedor.query.filter_by(nome='Fornecedor Multiworker').first():
+            fornecedor = Fornecedor(nome='Fornecedor Multiworker', cidade='São Paulo', estado='SP')
+            db.session.add(fornecedor)
+            db.session.flush()
+            for i in range(OS_TOTAL):
+                solicitacao = Solicitacao(funcionario_id=admin.id, fornecedor_id=fornecedor.id, status='aprovada')
+                db.session.add(solicitacao)
+                db.session.flush()
+                oc = OrdemCompra(solicitacao_id=solicitacao.id, fornecedor_id=fornecedor.id, criado_por=admin.id)
+                db.session.add(oc)
+                db.session.flush()
+                db.session.add(OrdemServico(oc_id=oc.id, numero_os=f'OS-MW-{i:05d}', created_by=admin.id,
+                                            fornecedor_snapshot={'id': fornecedor.id, 'nome': fornecedor.nome}))
+        fornecedor = Fornecedor.query.filter_by(nome='Fornecedor Multiworker').first()
+        # aprovações de cada rodada consomem solicitações aguardando
+        faltam = SOLICITACOES - Solicitacao.query.filter_by(status='aguardando_aprovacao').count()
+        for _ in range(max(faltam, 0)):
+            solicitacao = Solicitacao(funcionario_id=admin.id, fornecedor_id=fornecedor.id,
+                                      status='aguardando_aprovacao')
+            db.session.add(solicitacao)
+            db.session.flush()
+            db.session.add(ItemSolicitacao(solicitacao_id=solicitacao.id, peso_kg=100))
+        db.session.commit()
+        from flask_jwt_extended import create_access_token
+        return create_access_token(identity=str(admin.id))
+
+
+def iniciar_gunicorn(workers, porta, fila=None):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), PYTHONUNBUFFERED='1')
+    env.pop('SOCKETIO_MESSAGE_QUEUE', None)
+    env.pop('REDIS_URL', None)
+    if fila:
+        env['SOCKETIO_MESSAGE_QUEUE'] = fila
+    processo = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--worker-class', 'eventlet', '-w', str(workers),
+         '--bind', f'127.0.0.1:{porta}', '--timeout', '120', '--graceful-timeout', '5',
+         '--log-level', 'warning', 'wsgi:application'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    import requests
+    limite = time.time() + 90
+    vivos = set()
+    while time.time() < limite:
+        try:
+            vivos.add(requests.get(f'http://127.0.0.1:{porta}/api/os/tempo-real/stats', timeout=5,
+                                   headers=iniciar_gunicorn.cabecalho).json()['worker_pid'])
+            if len(vivos) >= workers or time.time() > limite - 60:
+                return processo
+        except Exception:
+            time.sleep(0.5)
+    processo.kill()
+    raise RuntimeError('gunicorn não respondeu')
+
+
+# ---------------------------------------------------------------- gerador de carga
+
+def medir(porta, token, workers, fila):
+    import requests
+    import socketio as socketio_cliente
+
+    base = f'http://127.0.0.1:{porta}'
+    cabecalho = {'Authorization': f'Bearer {token}'}
+    sessao = requests.Session()
+    locais = threading.local()
+
+    def get(caminho):
+        # requests.Session não é segura entre threads: uma por thread do pool
+        if not hasattr(locais, 'sessao'):
+            locais.sessao = requests.Session()
+        return locais.sessao.get(base + caminho, headers=cabecalho, timeout=60)
+
+    # vazão e distribuição entre workers
+    with ThreadPoolExecutor(CONEXOES) as executor:
+        list(executor.map(lambda _: get('/api/os'), range(CONEXOES)))
+        inicio = time.perf_counter()
+        respostas = list(executor.map(lambda _: get('/api/os').status_code, range(REQUISICOES)))
+        segundos = time.perf_counter() - inicio
+        pids = set(executor.map(lambda _: get('/api/os/tempo-real/stats').json()['worker_pid'], range(200)))
+    ok = all(r == 200 for r in respostas)
+
+    # eventos Socket.IO
+    recebidos = [0] * CLIENTES_SOCKET
+    clientes = []
+    for i in range(CLIENTES_SOCKET):
+        cliente = socketio_cliente.Client(reconnection=False)
+
+        def ao_receber(dados, i=i):
+            recebidos[i] += 1
+        cliente.on('solicitacao_atualizada', ao_receber)
+        cliente.connect(base, auth={'token': token}, transports=['websocket'], wait_timeout=10)
+        clientes.append(cliente)
+    time.sleep(1)
+    with sessao.get(base + '/api/solicitacao-lotes/aguardando-aprovacao', headers=cabecalho) as r:
+        pendentes = [s['id'] for s in r.json()][:APROVACOES]
+    with ThreadPoolExecutor(4) as executor:
+        list(executor.map(lambda s_id: requests.put(f'{base}/api/solicitacao-lotes/{s_id}/aprovar',
+                                                    headers=cabecalho, timeout=30), pendentes))
+    time.sleep(2)
+    for cliente in clientes:
+        cliente.disconnect()
+    entrega = sum(recebidos) / float(CLIENTES_SOCKET * len(pendentes))
+
+    # alertas de metais
+    alerta = requests.post(f'{base}/api/metais/alertas', json={'metal': 'XAU', 'condition': 'acima',
+                                                               'price': random.randint(1000, 9999)},
+                           headers=cabecalho, timeout=30).json()
+    encontrados = sum(1 for _ in range(LEITURAS_ALERTA)
+                      if any(a['id'] == alerta['id'] for a in requests.get(f'{base}/api/metais/alertas',
+                                                                           timeout=30).json()))
+    requests.delete(f"{base}/api/metais/alertas?id={alerta['id']}", timeout=30)
+
+    return {
+        'req_s': REQUISICOES / segundos, 'ok': ok, 'pids': len(pids),
+        'entrega': entrega, 'alertas': encontrados / float(LEITURAS_ALERTA)
+    }
+
+
+def main():
+    print("🧪 TESTE MULTI-WORKER (gunicorn + eventlet + Socket.IO)\n")
+    if os.path.exists(BANCO):
+        os.remove(BANCO)
+    token = popular()
+    iniciar_gunicorn.cabecalho = {'Authorization': f'Bearer {token}'}
+
+    porta_redis = porta_livre()
+    redis_simulado = RedisSimulado(porta_redis)
+    threading.Thread(target=redis_simulado.serve_forever, daemon=True).start()
+    url_redis = f'redis://127.0.0.1:{porta_redis}/0'
+    print(f"   Redis simulado em {url_redis}\n")
+
+    cenarios = [
+        ('1 worker', 1, None),
+        ('4 workers sem fila', 4, None),
+        ('4 workers + Redis', 4, url_redis),
+    ]
+    print(f"{'Cenário':<20} | {'req/s':>7} | {'Workers':>7} | {'Eventos entregues':>17} | {'Alertas vistos':>14}")
+    print("-" * 80)
+    resultados = {}
+    for nome, workers, fila in cenarios:
+        popular()
+        porta = porta_livre()
+        processo = iniciar_gunicorn(workers, porta, fila)
+        try:
+            r = medir(porta, token, workers, fila)
+        finally:
+            processo.terminate()
+            try:
+                processo.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+                processo.wait()
+        resultados[nome] = r
+        print(f"{nome:<20} | {r['req_s']:>7.1f} | {r['pids']:>7} | {r['entrega']:>16.0%} | {r['alertas']:>13.0%}"
+              f" {'✅' if r['ok'] else '❌'}")
+
+    multi, unico = resultados['4 workers + Redis'], resultados['1 worker']
+    print(f"\n   {'✅' if multi['entrega'] == 1 else '❌'} Com Redis todos os clientes recebem todos os eventos")
+    print(f"   {'✅' if multi['alertas'] == 1 else '❌'} Com Redis o alerta aparece em todos os workers")
+    print(f"   Vazão com 4 workers: {multi['req_s'] / unico['req_s']:.1f}x a de 1 worker em "
+          f"{os.cpu_count()} CPU(s) ({redis_simulado.publicacoes} publicações no Redis)")
+    if (os.cpu_count() or 1) < 4:
+        print("   ⚠️  Com menos de 4 CPUs os workers disputam o mesmo núcleo e a vazão não escala")
+    redis_simulado.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark do envio de notificações em massa (app/services/notificacoes.py)
+
+Cria 1000 usuários do perfil Financeiro e compara, para a notificação
+'Nova Ordem de Compra' da aprovação de solicitação:
+
+  - antes: consulta dos usuários financeiro/admin com Usuario.perfil.has(...)
+    e um db.session.add(Notificacao(...)) por usuário antes do commit
+  - notificar(): índice papel -> usuários em memória + insert em lote
+  - notificar(adiar=True): a requisição só registra o envio; o insert roda em
+    segundo plano depois do commit
+
+Mede o tempo que a requisição fica presa (até o commit), o tempo até todas as
+linhas estarem gravadas, e confere: 1000 linhas por envio, o autor excluído,
+um evento Socket.IO só por envio e nada gravado depois de rollback.
+
+    python testar_notificacoes.py
+"""
+import os
+import time
+import statistics
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_notificacoes.db')
+
+DESTINATARIOS = 1000
+RODADAS = 5
+TITULO = 'Nova Ordem de Compra - Aprovação Pendente'
+
+
+def popular(db):
+    from app.models import Usuario, Perfil
+
+    if Usuario.query.filter(Usuario.email.like('financeiro.%@mrx.test')).count() >= DESTINATARIOS:
+        return
+    perfil = Perfil.query.filter_by(nome='Financeiro').first()
+    db.session.add_all([
+        Usuario(nome=f'Financeiro {i}', email=f'financeiro.{i}@mrx.test', senha_hash='x',
+                tipo='funcionario', perfil_id=perfil.id)
+        for i in range(DESTINATARIOS)
+    ])
+    db.session.commit()
+
+
+def envio_antigo(db, autor_id, mensagem):
+    """O laço que existia em aprovar_solicitacao (solicitacoes_new.py)."""
+    from app.models import Usuario, Perfil, Notificacao
+
+    usuarios_financeiro = Usuario.query.filter(
+        db.and_(
+            Usuario.ativo == True,
+            db.or_(
+                Usuario.tipo == 'admin',
+                Usuario.perfil.has(Perfil.nome.in_(['Administrador', 'Financeiro']))
+            )
+        )
+    ).all()
+    notificados = set()
+    for usuario_fin in usuarios_financeiro:
+        if usuario_fin.id not in notificados and usuario_fin.id != autor_id:
+            db.session.add(Notificacao(usuario_id=usuario_fin.id, titulo=TITULO, mensagem=mensagem))
+            notificados.add(usuario_fin.id)
+    return len(notificados)
+
+
+def aguardar_fila(notificacoes, esperado):
+    while notificacoes.notificador.stats()['notificacoes'] < esperado:
+        time.sleep(0.005)
+
+
+def main():
+    import wsgi
+    from app import socketio
+    from app.models import db, Usuario, Notificacao
+    from app.services import notificacoes
+
+    app = wsgi.app
+    print("🧪 BENCHMARK: NOTIFICAÇÕES EM MASSA\n")
+
+    with app.app_context():
+        popular(db)
+        autor_id = Usuario.query.filter(Usuario.email.like('financeiro.%@mrx.test')).first().id
+        total_grupo = len(notificacoes.indice_destinatarios.membros('financeiro'))
+    print(f"   Grupo financeiro: {total_grupo} destinatários (autor excluído)\n")
+
+    # um cliente do grupo financeiro conectado, para contar os eventos que chegam
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        token = create_access_token(identity=str(autor_id + 1))
+    socket = socketio.test_client(app, auth={'token': token})
+
+    def contar(mensagem):
+        with app.app_context():
+            return Notificacao.query.filter_by(mensagem=mensagem).count()
+
+    modos = {
+        'Antes (add por usuário)': lambda m: envio_antigo(db, autor_id, m),
+        'notificar() em lote': lambda m: notificacoes.notificar('financeiro', TITULO, m, excluir=[autor_id],
+                                                                adiar=False),
+        'notificar(adiar=True)': lambda m: notificacoes.notificar('financeiro', TITULO, m, excluir=[autor_id],
+                                                                  adiar=True),
+    }
+    print(f"{'Modo':<26} | {'Requisição (ms)':>15} | {'Gravado (ms)':>12} | {'Linhas':>6} | {'Eventos':>7} | OK")
+    print("-" * 86)
+    resultados = {}
+    for nome, enviar in modos.items():
+        tempos_requisicao, tempos_total = [], []
+        linhas = eventos = 0
+        for rodada in range(RODADAS):
+            mensagem = f'{nome} rodada {rodada}'
+            socket.get_received()
+            gravadas_antes = notificacoes.notificador.stats()['notificacoes']
+            with app.test_request_context():
+                inicio = time.perf_counter()
+                criadas = enviar(mensagem)
+                db.session.commit()
+                tempos_requisicao.append((time.perf_counter() - inicio) * 1000)
+                if 'adiar' in nome:
+                    aguardar_fila(notificacoes, gravadas_antes + criadas)
+                tempos_total.append((time.perf_counter() - inicio) * 1000)
+            linhas = contar(mensagem)
+            eventos = len([e for e in socket.get_received() if e['name'] == 'nova_notificacao'])
+        resultados[nome] = statistics.median(tempos_requisicao)
+        ok = linhas == total_grupo - 1
+        print(f"{nome:<26} | {statistics.median(tempos_requisicao):>15.1f} | {statistics.median(tempos_total):>12.1f} | "
+              f"{linhas:>6} | {eventos:>7} | {'✅' if ok else '❌'}")
+
+    antes = resultados['Antes (add por usuário)']
+    print(f"\n   Requisição {antes / resultados['notificar() em lote']:.1f}x mais rápida em lote, "
+          f"{antes / resultados['notificar(adiar=True)']:.0f}x adiando o envio")
+
+    with app.test_request_context():
+        notificacoes.notificar('financeiro', TITULO, 'desfeita', adiar=False)
+        notificacoes.notificar('financeiro', TITULO, 'desfeita', adiar=True)
+        db.session.rollback()
+    time.sleep(0.2)
+    print(f"   {'✅' if contar('desfeita') == 0 else '❌'} Rollback descarta o envio (em lote e adiado)")
+
+    with app.app_context():
+        novo = Usuario(nome='Financeiro novo', email=f'financeiro.novo.{time.time()}@mrx.test', senha_hash='x',
+                       tipo='admin')
+        db.session.add(novo)
+        db.session.commit()
+        incluido = novo.id in notificacoes.indice_destinatarios.membros('financeiro')
+    print(f"   {'✅' if incluido else '❌'} Usuário novo entra no grupo sem esperar o TTL do índice")
+    print(f"   Estatísticas: {notificacoes.get_notificacoes_stats()}")
+    socket.disconnect()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Benchmark da roteirização das coletas (app/services/roteirizacao.py)
+
+1. Algoritmo: 100, 250 e 500 coletas num raio de ~55 km da matriz, 30
+   motoristas com veículos de 3, 5 e 8 t. Compara o km de uma OS por viagem
+   (atribuição manual atual: matriz → fornecedor → matriz), do vizinho mais
+   próximo e do vizinho mais próximo + 2-opt/Or-opt, e confere capacidade,
+   limite de paradas e que cada OS aparece uma vez.
+2. Banco: cria OS pendentes; confere que aplicar_plano pula uma OS atribuída
+   depois do planejamento e recalcula a rota sem ela; chama POST
+   /api/os/roteirizar com aplicar=true e confere as RotaOperacional gravadas
+   e o 'nova_notificacao' no Socket.IO do motorista de uma das rotas.
+
+    python testar_roteirizacao.py
+"""
+import os
+import time
+import random
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_roteirizacao.db')
+
+TAMANHOS = [100, 250, 500]
+MOTORISTAS = 30
+MATRIZ = (-23.55, -46.63)
+OS_BANCO = 150
+
+
+def gerar(n, rng):
+    paradas = [{
+        'os_id': i + 1,
+        'fornecedor_nome': f'Fornecedor {i}',
+        'latitude': MATRIZ[0] + rng.uniform(-0.5, 0.5),
+        'longitude': MATRIZ[1] + rng.uniform(-0.5, 0.5),
+        'peso_kg': round(rng.uniform(50, 600), 1)
+    } for i in range(n)]
+    veiculos = [{'motorista_id': i + 1, 'veiculo_id': i + 1, 'capacidade_kg': rng.choice([3000, 5000, 8000])}
+                for i in range(MOTORISTAS)]
+    return paradas, veiculos
+
+
+def valido(plano, n):
+    ids = [p['os_id'] for r in plano['rotas'] for p in r['paradas']]
+    return (len(ids) == len(set(ids)) and len(ids) + len(plano['nao_atendidas']) == n
+            and all(r['carga_kg'] <= r['capacidade_kg'] + 1e-6 and len(r['paradas']) <= 25 for r in plano['rotas']))
+
+
+def testar_algoritmo():
+    from app.services import roteirizacao
+
+    print("🚚 Algoritmo\n")
+    print(f"{'Coletas':>7} | {'1 OS/viagem':>11} | {'Viz. próximo':>12} | {'+ 2-opt/Or-opt':>14} | "
+          f"{'Economia':>8} | {'Tempo':>8} | OK")
+    print("-" * 86)
+    rng = random.Random(7)
+    for n in TAMANHOS:
+        paradas, veiculos = gerar(n, rng)
+        construcao = roteirizacao.planejar(MATRIZ, paradas, veiculos, melhorar=False)
+        plano = roteirizacao.planejar(MATRIZ, paradas, veiculos)
+        ok = valido(construcao, n) and valido(plano, n)
+        print(f"{n:>7} | {plano['km_uma_os_por_viagem']:>8.0f} km | {construcao['km_total']:>9.0f} km | "
+              f"{plano['km_total']:>11.0f} km | {plano['economia_percentual']:>7.1f}% | "
+              f"{plano['tempo_ms']:>6.0f}ms | {'✅' if ok else '❌'}")
+        melhoria = (1 - plano['km_total'] / construcao['km_total']) * 100
+        print(f"{'':>7}   {len(plano['rotas'])} rotas, melhoria sobre o vizinho mais próximo: {melhoria:.1f}%")
+
+
+def popular(db):
+    from app.models import (Usuario, Fornecedor, Solicitacao, ItemSolicitacao, OrdemCompra, OrdemServico,
+                            Motorista, Veiculo, Configuracao)
+
+    if Fornecedor.query.filter(Fornecedor.nome.like('Fornecedor Rota %')).first():
+        return
+    rng = random.Random(3)
+    admin = Usuario.query.filter_by(tipo='admin').first()
+    for chave, valor in (('matriz_latitude', MATRIZ[0]), ('matriz_longitude', MATRIZ[1])):
+        db.session.add(Configuracao(chave=chave, valor=str(valor), tipo='numero'))
+    for i in range(MOTORISTAS):
+        veiculo = Veiculo(placa=f'ROT{i:04d}', tipo='caminhao', capacidade=rng.choice([3000, 5000, 8000]))
+        db.session.add(veiculo)
+        db.session.flush()
+        db.session.add(Motorista(nome=f'Motorista Rota {i}', cpf=f'7{i:010d}', veiculo_id=veiculo.id))
+    for i in range(OS_BANCO):
+        fornecedor = Fornecedor(nome=f'Fornecedor Rota {i}', latitude=MATRIZ[0] + rng.uniform(-0.5, 0.5),
+                                longitude=MATRIZ[1] + rng.uniform(-0.5, 0.5))
+        db.session.add(fornecedor)
+        db.session.flush()
+        solicitacao = Solicitacao(funcionario_id=admin.id, fornecedor_id=fornecedor.id, status='aprovada')
+        db.session.add(solicitacao)
+        db.session.flush()
+        db.session.add(ItemSolicitacao(solicitacao_id=solicitacao.id, peso_kg=round(rng.uniform(50, 600), 1)))
+        oc = OrdemCompra(solicitacao_id=solicitacao.id, fornecedor_id=fornecedor.id, criado_por=admin.id)
+        db.session.add(oc)
+        db.session.flush()
+        db.session.add(OrdemServico(oc_id=oc.id, numero_os=f'OS-ROTA-{i}', fornecedor_snapshot={'id': fornecedor.id},
+                                    created_by=admin.id, status='PENDENTE'))
+    db.session.commit()
+
+
+def testar_banco():
+    from flask_jwt_extended import create_access_token
+    import wsgi
+    from app import socketio
+    from app.models import db, Usuario, Motorista, OrdemServico, RotaOperacional
+
+    print("\n🗄️  Banco\n")
+    # wsgi registra o connect do Socket.IO que põe o usuário na própria sala
+    app = wsgi.app
+    with app.app_context():
+        popular(db)
+        admin = Usuario.query.filter_by(tipo='admin').first()
+        token = create_access_token(identity=str(admin.id))
+        testar_plano_defasado(db, admin.id)
+
+    cliente = app.test_client()
+    cabecalho = {'Authorization': f'Bearer {token}'}
+    inicio = time.perf_counter()
+    previa = cliente.post('/api/os/roteirizar', json={}, headers=cabecalho)
+    ms_previa = (time.perf_counter() - inicio) * 1000
+
+    if not previa.get_json().get('rotas'):
+        print(f"   ❌ Nenhuma OS pendente: apague {os.environ['DATABASE_URL']} e rode de novo")
+        return
+
+    # o motorista da 1ª rota da prévia ganha um usuário e abre o app
+    motorista_id = previa.get_json()['rotas'][0]['motorista_id']
+    with app.app_context():
+        motorista = Motorista.query.get(motorista_id)
+        if not motorista.usuario_id:
+            usuario = Usuario(nome=motorista.nome, email=f'motorista.rota.{motorista_id}@mrx.test',
+                              senha_hash='x', tipo='motorista')
+            db.session.add(usuario)
+            db.session.flush()
+            motorista.usuario_id = usuario.id
+            db.session.commit()
+        socket = socketio.test_client(app, auth={'token': create_access_token(identity=str(motorista.usuario_id))})
+    socket.get_received()
+    inicio = time.perf_counter()
+    resposta = cliente.post('/api/os/roteirizar', json={'aplicar': True}, headers=cabecalho)
+    ms_aplicar = (time.perf_counter() - inicio) * 1000
+    plano = resposta.get_json()
+    if resposta.status_code != 200:
+        print(f"   ❌ {resposta.status_code}: {plano}")
+        return
+
+    with app.app_context():
+        rotas = RotaOperacional.query.all()
+        agendadas = OrdemServico.query.filter(OrdemServico.numero_os.like('OS-ROTA-%'),
+                                              OrdemServico.status == 'AGENDADA').count()
+        km_gravado = sum(r.km_estimado for r in rotas)
+
+    print(f"   Prévia:  {previa.status_code} em {ms_previa:.0f} ms, {previa.get_json().get('total_paradas')} coletas")
+    print(f"   Aplicar: {resposta.status_code} em {ms_aplicar:.0f} ms, {len(plano['rotas'])} rotas, "
+          f"{plano['km_total']:.0f} km (1 OS/viagem: {plano['km_uma_os_por_viagem']:.0f} km, "
+          f"economia {plano['economia_percentual']:.1f}%)")
+    print(f"   {'✅' if len(rotas) == agendadas == plano['total_paradas'] else '❌'} "
+          f"{len(rotas)} RotaOperacional, {agendadas} OS agendadas")
+    print(f"   {'✅' if abs(km_gravado - plano['km_total']) < 1 else '❌'} Soma de km_estimado = km das rotas "
+          f"({km_gravado:.0f} km)")
+    avisos = [e for e in socket.get_received() if e['name'] == 'nova_notificacao']
+    socket.disconnect()
+    do_motorista = sum(1 for r in plano['rotas'] if r['motorista_id'] == motorista_id)
+    print(f"   {'✅' if do_motorista and len(avisos) == do_motorista else '❌'} Motorista recebeu "
+          f"{len(avisos)} 'nova_notificacao' no Socket.IO para {do_motorista} rota(s)")
+    segunda = cliente.post('/api/os/roteirizar', json={}, headers=cabecalho).get_json()
+    print(f"   {'✅' if segunda.get('total_paradas') == 0 else '❌'} Nova roteirização não repete OS já atribuídas")
+
+
+def testar_plano_defasado(db, admin_id):
+    """Uma OS do plano é atribuída por outra requisição antes de aplicar; nada é gravado no fim."""
+    from app.models import OrdemServico, RotaOperacional
+    from app.services import roteirizacao
+
+    plano = roteirizacao.planejar_pendentes()
+    if not plano['rotas']:
+        return
+    rota = max(plano['rotas'], key=lambda r: len(r['paradas']))
+    tomada = rota['paradas'][0]['os_id']
+    total_antes, km_antes = plano['total_paradas'], rota['km']
+
+    # outra requisição atribui a OS entre o planejamento e a aplicação
+    OrdemServico.query.filter_by(id=tomada).update({'motorista_id': rota['motorista_id']})
+    db.session.commit()
+
+    ignoradas = roteirizacao.aplicar_plano(plano, admin_id)
+    db.session.flush()
+    gravadas = RotaOperacional.query.filter_by(motorista_id=rota['motorista_id']).all()
+    km_gravado = sum(r.km_estimado for r in gravadas)
+    db.session.rollback()
+    OrdemServico.query.filter_by(id=tomada).update({'motorista_id': None})
+    db.session.commit()
+
+    ok = (ignoradas == [tomada] and plano['total_paradas'] == total_antes - 1
+          and tomada not in [p['os_id'] for r in plano['rotas'] for p in r['paradas']]
+          and [p['sequencia'] for p in rota['paradas']] == list(range(1, len(rota['paradas']) + 1))
+          and len(gravadas) == len(rota['paradas']) and abs(km_gravado - rota['km']) < 0.01)
+    print(f"   {'✅' if ok else '❌'} Plano defasado: OS {tomada} ignorada, rota refeita com "
+          f"{len(rota['paradas'])} paradas ({km_antes:.1f} → {rota['km']:.1f} km)")
+
+
+def main():
+    print("🧪 BENCHMARK DA ROTEIRIZAÇÃO\n")
+    testar_algoritmo()
+    testar_banco()
+
+
+if __name__ == '__main__':
+    main()
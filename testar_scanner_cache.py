@@ -0,0 +1,107 @@
+"""
+Script para testar o cache de resultados do scanner entre usuários
+
+Dois usuários enviam fotos da mesma placa para POST /api/scanner/analyze:
+
+  1. A envia a foto original: análise nova
+  2. A reenvia a foto recomprimida: acerto por phash ('similar') na própria análise
+  3. B envia a mesma foto recomprimida: o phash não casa com análises de
+     outro usuário, então a placa é analisada de novo
+  4. B envia os bytes originais de A: acerto exato, com uma cópia da análise
+     para B apontando para os mesmos blobs
+
+Confere também que board_detected vem da linha gravada e que cada usuário vê
+apenas as próprias análises no histórico.
+
+    python testar_scanner_cache.py
+"""
+import io
+import os
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_scanner_cache.db')
+os.environ.setdefault('SCANNER_BLOB_DIR', '/tmp/benchmark_scanner_cache_blobs')
+
+import cv2
+import numpy as np
+
+from testar_scanner_opencv import gerar_placa
+
+
+def usuario_teste(db, email):
+    from app.models import Usuario
+
+    usuario = Usuario.query.filter_by(email=email).first()
+    if not usuario:
+        usuario = Usuario(nome=email.split('@')[0], email=email, senha_hash='x', tipo='funcionario')
+        db.session.add(usuario)
+        db.session.commit()
+    return usuario.id
+
+
+def recomprimir(image_bytes):
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 70])[1].tobytes()
+
+
+def main():
+    from flask_jwt_extended import create_access_token
+    import wsgi
+    from app.models import db, ScannerAnalysis
+    from app.services.scanner_cache import invalidate_cache
+
+    app = wsgi.app
+    print("🧪 TESTE DO CACHE DO SCANNER ENTRE USUÁRIOS\n")
+    with app.app_context():
+        ScannerAnalysis.query.delete()
+        db.session.commit()
+        invalidate_cache()
+        id_a = usuario_teste(db, 'scanner.a@mrx.test')
+        id_b = usuario_teste(db, 'scanner.b@mrx.test')
+        cabecalho_a = {'Authorization': f'Bearer {create_access_token(identity=str(id_a))}'}
+        cabecalho_b = {'Authorization': f'Bearer {create_access_token(identity=str(id_b))}'}
+    cliente = app.test_client()
+
+    foto = gerar_placa(1280, 960, (40, 120, 30), 6.0e-5, 7)
+    copia = recomprimir(foto)
+
+    def analisar(cabecalho, image_bytes):
+        resposta = cliente.post('/api/scanner/analyze', headers=cabecalho,
+                                data={'image': (io.BytesIO(image_bytes), 'placa.jpg', 'image/jpeg')},
+                                content_type='multipart/form-data')
+        return resposta.get_json()
+
+    passos = [
+        ('A envia a foto', analisar(cabecalho_a, foto), False, None),
+        ('A reenvia recomprimida', analisar(cabecalho_a, copia), True, 'similar'),
+        ('B envia a recomprimida', analisar(cabecalho_b, copia), False, None),
+        ('B envia os bytes de A', analisar(cabecalho_b, foto), True, 'exact'),
+    ]
+
+    ok = True
+    for nome, resposta, esperado_cache, esperado_match in passos:
+        certo = (resposta.get('cached') == esperado_cache and resposta.get('cache_match') == esperado_match
+                 and resposta.get('board_detected') is True)
+        ok &= certo
+        print(f"   {'✅' if certo else '❌'} {nome:<26} cached={resposta.get('cached')} "
+              f"match={resposta.get('cache_match')} board_detected={resposta.get('board_detected')} "
+              f"grade={resposta.get('grade')}")
+
+    with app.app_context():
+        linhas_a = ScannerAnalysis.query.filter_by(usuario_id=id_a).all()
+        linhas_b = ScannerAnalysis.query.filter_by(usuario_id=id_b).all()
+        copia_b = ScannerAnalysis.query.get(passos[3][1]['id'])
+        original_a = linhas_a[0] if linhas_a else None
+
+        separados = len(linhas_a) == 1 and len(linhas_b) == 2
+        print(f"\n   {'✅' if separados else '❌'} Histórico: A com {len(linhas_a)} análise(s), B com {len(linhas_b)}")
+        mesmos_blobs = bool(copia_b and original_a and copia_b.image_key == original_a.image_key
+                            and copia_b.thumbnail_key == original_a.thumbnail_key)
+        print(f"   {'✅' if mesmos_blobs else '❌'} Cópia de B aponta para os blobs da análise de A")
+        gravado = all(a.board_detected is True for a in linhas_a + linhas_b)
+        print(f"   {'✅' if gravado else '❌'} board_detected gravado em todas as análises")
+
+    assert ok and separados and mesmos_blobs and gravado, 'Cache do scanner com resultado inesperado'
+
+
+if __name__ == '__main__':
+    main()
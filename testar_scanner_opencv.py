@@ -0,0 +1,186 @@
+"""
+Script de regressão e benchmark do scanner OpenCV de placas (pcb_analyzer)
+
+Compara as grades do motor atual (resolução de trabalho limitada + LUT HSV)
+com a implementação de referência em resolução cheia, sobre um corpus
+sintético de placas em várias resoluções e, opcionalmente, sobre fotos reais:
+
+    python testar_scanner_opencv.py                 # corpus sintético
+    python testar_scanner_opencv.py fotos/          # + todas as imagens da pasta
+
+A referência é uma cópia do analyze_pcb_image original (inRange + morfologia
+em resolução cheia, constantes sem reescala). Ao final imprime a concordância
+das grades e a latência por megapixel, e falha se alguma grade do corpus
+sintético divergir.
+"""
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from app.services.pcb_analyzer import analyze_pcb_image
+
+RESOLUCOES = [
+    (1280, 960),     # ~1.2 MP (abaixo do limite de trabalho)
+    (4000, 3000),    # 12 MP
+    (5664, 4248),    # 24 MP
+    (8160, 6120),    # 50 MP
+]
+
+# Componentes por pixel: duas placas LOW, duas MEDIUM e uma HIGH, longe dos
+# limiares LOW_DENSITY_THRESHOLD/HIGH_DENSITY_THRESHOLD.
+DENSIDADES = (1.0e-5, 1.5e-5, 5.0e-5, 6.0e-5, 1.2e-4)
+
+CORES_PLACA = {
+    'verde': (40, 120, 30),
+    'azul': (140, 60, 20),
+    'marrom': (40, 90, 140),
+}
+
+
+def analisar_legado(image_bytes):
+    """
+    analyze_pcb_image original (baseline), em resolução cheia e com as
+    constantes em pixels sem reescala, usada como referência das grades.
+    """
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    height, width = img.shape[:2]
+    total_pixels = height * width
+    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+
+    mask_green1 = cv2.inRange(hsv, np.array([35, 20, 20]), np.array([90, 255, 255]))
+    mask_green2 = cv2.inRange(hsv, np.array([70, 15, 15]), np.array([100, 255, 255]))
+    mask_brown = cv2.inRange(hsv, np.array([8, 20, 20]), np.array([35, 255, 220]))
+    mask_blue = cv2.inRange(hsv, np.array([95, 20, 20]), np.array([135, 255, 255]))
+    mask_yellow = cv2.inRange(hsv, np.array([15, 40, 40]), np.array([40, 255, 255]))
+    mask_red1 = cv2.inRange(hsv, np.array([0, 30, 30]), np.array([10, 255, 255]))
+    mask_red2 = cv2.inRange(hsv, np.array([160, 30, 30]), np.array([180, 255, 255]))
+
+    pcb_mask = cv2.bitwise_or(mask_green1, mask_green2)
+    pcb_mask = cv2.bitwise_or(pcb_mask, mask_brown)
+    pcb_mask = cv2.bitwise_or(pcb_mask, mask_blue)
+    pcb_mask = cv2.bitwise_or(pcb_mask, mask_yellow)
+    pcb_mask = cv2.bitwise_or(pcb_mask, mask_red1)
+    pcb_mask = cv2.bitwise_or(pcb_mask, mask_red2)
+
+    kernel = np.ones((5, 5), np.uint8)
+    pcb_mask = cv2.morphologyEx(pcb_mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    pcb_mask = cv2.morphologyEx(pcb_mask, cv2.MORPH_OPEN, kernel, iterations=1)
+
+    board_pixels = float(np.sum(pcb_mask) / 255)
+    if board_pixels / max(total_pixels, 1) < 0.05:
+        return None
+
+    components_mask = cv2.bitwise_not(pcb_mask)
+    kernel_small = np.ones((3, 3), np.uint8)
+    components_mask = cv2.morphologyEx(components_mask, cv2.MORPH_OPEN, kernel_small, iterations=2)
+    components_mask = cv2.morphologyEx(components_mask, cv2.MORPH_CLOSE, kernel_small, iterations=2)
+    blurred = cv2.GaussianBlur(components_mask, (5, 5), 0)
+    contours, _ = cv2.findContours(blurred, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    count = sum(1 for c in contours if 30 <= cv2.contourArea(c) <= 80000)
+    density = count / max(board_pixels, 1.0)
+
+    if density < 0.00002:
+        return 'LOW'
+    elif density < 0.00008:
+        return 'MEDIUM'
+    return 'HIGH'
+
+
+def gerar_placa(largura, altura, cor, densidade, seed):
+    """
+    Gera uma placa sintética ocupando todo o quadro, como nas fotos de campo.
+
+    Os componentes ficam numa grade com `densidade` componentes por pixel e
+    têm o tamanho que teriam numa foto de mais resolução da mesma placa
+    (crescem com a raiz da área acima de 3 MP), sem se sobrepor.
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full((altura, largura, 3), cor, np.uint8)
+    margem_x, margem_y = largura // 40, altura // 40
+
+    passo = int(round(densidade ** -0.5))
+    escala = max(1.0, largura * altura / 3_000_000) ** 0.5
+    for y0 in range(margem_y, altura - margem_y - passo + 1, passo):
+        for x0 in range(margem_x, largura - margem_x - passo + 1, passo):
+            w = int(rng.integers(12, 17) * escala)
+            h = int(rng.integers(12, 17) * escala)
+            x = x0 + (passo - w) // 2 + int(rng.integers(-2, 3) * escala)
+            y = y0 + (passo - h) // 2 + int(rng.integers(-2, 3) * escala)
+            # Componentes pretos (CIs) ou prateados (conectores): sem saturação,
+            # fora de todas as faixas HSV da placa.
+            tom = int(rng.choice((rng.integers(0, 12), rng.integers(170, 230))))
+            cv2.rectangle(img, (x, y), (x + w, y + h), (tom, tom, tom), -1)
+
+    ok, buffer = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return buffer.tobytes()
+
+
+def montar_corpus(pasta=None):
+    corpus = []
+    seed = 0
+    for largura, altura in RESOLUCOES:
+        for nome_cor, cor in CORES_PLACA.items():
+            for densidade in DENSIDADES:
+                nome = f'sintetica_{nome_cor}_{densidade:.1e}_{largura}x{altura}'
+                corpus.append((nome, gerar_placa(largura, altura, cor, densidade, seed)))
+                seed += 1
+
+    if pasta and os.path.isdir(pasta):
+        for arquivo in sorted(os.listdir(pasta)):
+            if arquivo.lower().endswith(('.jpg', '.jpeg', '.png')):
+                with open(os.path.join(pasta, arquivo), 'rb') as f:
+                    corpus.append((arquivo, f.read()))
+    return corpus
+
+
+def main():
+    pasta = sys.argv[1] if len(sys.argv) > 1 else None
+    corpus = montar_corpus(pasta)
+
+    print("🧪 REGRESSÃO DO SCANNER OPENCV\n")
+    print(f"{'Imagem':<45} | {'MP':>5} | {'Legado':<7} | {'Novo':<7} | {'ms legado':>9} | {'ms novo':>8}")
+    print("-" * 100)
+
+    iguais = 0
+    divergentes = []
+    tempo_legado = tempo_novo = megapixels = 0.0
+    for nome, image_bytes in corpus:
+        img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        mp = img.shape[0] * img.shape[1] * 64 / 1e6
+
+        inicio = time.perf_counter()
+        grade_legado = analisar_legado(image_bytes)
+        ms_legado = (time.perf_counter() - inicio) * 1000
+
+        inicio = time.perf_counter()
+        grade_novo = analyze_pcb_image(image_bytes).get('grade')
+        ms_novo = (time.perf_counter() - inicio) * 1000
+
+        iguais += grade_legado == grade_novo
+        if grade_legado != grade_novo and nome.startswith('sintetica_'):
+            divergentes.append(nome)
+        tempo_legado += ms_legado
+        tempo_novo += ms_novo
+        megapixels += mp
+
+        marca = '✅' if grade_legado == grade_novo else '❌'
+        print(f"{nome[:45]:<45} | {mp:5.1f} | {str(grade_legado):<7} | {str(grade_novo):<7} | "
+              f"{ms_legado:9.1f} | {ms_novo:8.1f} {marca}")
+
+    print("-" * 100)
+    print(f"\n📊 Concordância de grades: {iguais}/{len(corpus)} ({100.0 * iguais / len(corpus):.1f}%)")
+    print(f"⏱️  Legado: {tempo_legado / megapixels:.1f} ms/MP")
+    print(f"⏱️  Novo:   {tempo_novo / megapixels:.1f} ms/MP")
+
+    assert not divergentes, f"Grades divergentes no corpus sintético: {', '.join(divergentes)}"
+    print("\n✅ Todas as grades do corpus sintético coincidem com a referência")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Script para testar o pool de processos do scanner sob eventlet
+
+Reproduz o ambiente de produção (gunicorn --worker-class eventlet -w 1):
+dispara 10 análises simultâneas de fotos de 12 MP e, enquanto elas rodam,
+mede a latência de um endpoint leve (/ping) servido pelo mesmo loop.
+Em seguida satura a fila para conferir a resposta 503 com Retry-After e
+confere que uma análise que estoura o tempo limite continua ocupando a vaga
+até terminar de fato no processo do pool.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import os
+os.environ.setdefault('SCANNER_POOL_WORKERS', '2')
+os.environ.setdefault('SCANNER_POOL_MAX_PENDING', '10')
+
+import time
+
+import cv2
+import numpy as np
+from flask import Flask, jsonify
+
+from app.services import scanner_pool
+from app.services.scanner_pool import submit_analysis, ScannerPoolFull
+
+ANALISES_SIMULTANEAS = 10
+
+
+def gerar_foto(largura=4000, altura=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    img = np.full((altura, largura, 3), (40, 120, 30), np.uint8)
+    for _ in range(800):
+        x, y = int(rng.integers(0, largura - 60)), int(rng.integers(0, altura - 60))
+        tom = int(rng.integers(10, 60))
+        cv2.rectangle(img, (x, y), (x + int(rng.integers(10, 60)), y + int(rng.integers(10, 60))), (tom, tom, tom), -1)
+    return cv2.imencode('.jpg', img)[1].tobytes()
+
+
+def criar_app(foto):
+    app = Flask(__name__)
+
+    @app.route('/ping')
+    def ping():
+        return jsonify({'ok': True})
+
+    @app.route('/analyze', methods=['POST'])
+    def analyze():
+        try:
+            return jsonify(submit_analysis(foto))
+        except ScannerPoolFull as e:
+            response = jsonify({'erro': 'Scanner ocupado', 'retry_after': e.retry_after})
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
+
+    return app
+
+
+def main():
+    import requests
+    from eventlet import wsgi
+
+    foto = gerar_foto()
+    app = criar_app(foto)
+    sock = eventlet.listen(('127.0.0.1', 0))
+    porta = sock.getsockname()[1]
+    eventlet.spawn(wsgi.server, sock, app, log_output=False)
+    base = f'http://127.0.0.1:{porta}'
+
+    print("🧪 TESTE DO POOL DE PROCESSOS DO SCANNER\n")
+    print(f"   Workers: {scanner_pool.SCANNER_POOL_WORKERS} | Fila máxima: {scanner_pool.SCANNER_POOL_MAX_PENDING}")
+
+    # Aquece o pool (spawn dos processos + LUT)
+    requests.post(f'{base}/analyze')
+
+    inicio = time.monotonic()
+    analises = [eventlet.spawn(requests.post, f'{base}/analyze') for _ in range(ANALISES_SIMULTANEAS)]
+
+    latencias = []
+    while not all(a.dead for a in analises):
+        t0 = time.monotonic()
+        requests.get(f'{base}/ping')
+        latencias.append((time.monotonic() - t0) * 1000)
+        eventlet.sleep(0.05)
+
+    status = [a.wait().status_code for a in analises]
+    duracao = time.monotonic() - inicio
+
+    print(f"\n📊 {ANALISES_SIMULTANEAS} análises concluídas em {duracao:.1f}s: {status}")
+    print(f"   /ping durante as análises: {len(latencias)} chamadas, "
+          f"mediana {np.median(latencias):.1f} ms, máx {max(latencias):.1f} ms")
+
+    responsivo = max(latencias) < 250
+    print(f"   {'✅' if responsivo else '❌'} Loop permaneceu responsivo")
+
+    excedentes = [eventlet.spawn(requests.post, f'{base}/analyze') for _ in range(ANALISES_SIMULTANEAS + 5)]
+    respostas = [e.wait() for e in excedentes]
+    rejeitadas = [r for r in respostas if r.status_code == 503]
+    print(f"\n📊 Saturação: {len(rejeitadas)} de {len(respostas)} requisições rejeitadas com 503")
+    if rejeitadas:
+        print(f"   Retry-After: {rejeitadas[0].headers.get('Retry-After')}s")
+    print(f"   {'✅' if rejeitadas else '❌'} Controle de admissão ativo")
+
+    while scanner_pool.get_pool_status()['pending']:
+        eventlet.sleep(0.05)
+    tempo_limite = scanner_pool.SCANNER_POOL_TIMEOUT
+    scanner_pool.SCANNER_POOL_TIMEOUT = 0.05
+    try:
+        submit_analysis(foto)
+        print("\n❌ Tempo limite não disparou")
+    except TimeoutError:
+        ocupadas = scanner_pool.get_pool_status()['pending']
+        print(f"\n📊 Após o tempo limite: {ocupadas} vaga(s) ocupada(s) pela análise ainda em execução")
+        print(f"   {'✅' if ocupadas == 1 else '❌'} Vaga mantida enquanto o processo trabalha")
+    finally:
+        scanner_pool.SCANNER_POOL_TIMEOUT = tempo_limite
+
+    inicio = time.monotonic()
+    while scanner_pool.get_pool_status()['pending'] and time.monotonic() - inicio < 30:
+        eventlet.sleep(0.05)
+    liberada = scanner_pool.get_pool_status()['pending'] == 0
+    print(f"   {'✅' if liberada else '❌'} Vaga liberada quando a análise terminou")
+
+
+if __name__ == '__main__':
+    main()
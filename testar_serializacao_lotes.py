@@ -0,0 +1,161 @@
+"""
+Benchmark da serialização de lotes (app/services/serializacao.py)
+
+Popula 2000 lotes com fornecedor, tipo, reserva/bloqueio, conferente,
+solicitação de origem, itens e sublotes e, para 100, 500 e 2000 lotes,
+conta as consultas SQL e o tempo de:
+
+  - antes: query.all() e, por lote, to_dict() + len(lote.itens) +
+    len(lote.sublotes) com carregamento lazy (o laço de listar_lotes_wms)
+  - LOTE.consultar(query, 'lista'): JOINs declarados + contagens agrupadas
+
+Confere que as consultas não crescem com o número de lotes, que a saída é a
+mesma do laço antigo (sem os campos de rastreio que saíram da lista) e as
+rotas GET /api/wms/lotes e /api/wms/lotes/exportar.
+
+    python testar_serializacao_lotes.py
+"""
+import os
+import time
+import random
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_serializacao_lotes.db')
+
+TOTAL_LOTES = 2000
+TAMANHOS = (100, 500, 2000)
+
+
+def popular(db):
+    from app.models import Fornecedor, TipoLote, Solicitacao, Lote, Usuario, ItemSolicitacao
+
+    if db.session.query(Lote.id).filter(Lote.numero_lote.like('SER-%')).first():
+        return
+    rng = random.Random(21)
+    agora = datetime.utcnow()
+    usuarios = [Usuario(nome=f'Operador {i}', email=f'serializacao.{i}@mrx.test', senha_hash='x',
+                        tipo='funcionario') for i in range(20)]
+    fornecedores = [Fornecedor(nome=f'Fornecedor Serialização {i}', cnpj=f'{i:014d}') for i in range(100)]
+    tipos = [TipoLote(nome=f'Tipo Serialização {i}') for i in range(5)]
+    db.session.add_all(usuarios + fornecedores + tipos)
+    db.session.commit()
+    usuario_ids = [u.id for u in usuarios]
+    fornecedor_ids = [f.id for f in fornecedores]
+    tipo_ids = [t.id for t in tipos]
+
+    db.session.execute(Solicitacao.__table__.insert(), [{
+        'funcionario_id': rng.choice(usuario_ids), 'fornecedor_id': rng.choice(fornecedor_ids),
+        'tipo_retirada': 'buscar', 'status': 'aprovada', 'data_envio': agora
+    } for _ in range(300)])
+    solicitacao_ids = [s.id for s in Solicitacao.query.all()]
+
+    def talvez(valores, chance):
+        return rng.choice(valores) if rng.random() < chance else None
+
+    db.session.execute(Lote.__table__.insert(), [{
+        'numero_lote': f'SER-{i:06d}', 'fornecedor_id': rng.choice(fornecedor_ids),
+        'tipo_lote_id': rng.choice(tipo_ids), 'status': rng.choice(['aberto', 'aprovado', 'em_estoque']),
+        'peso_total_kg': round(rng.uniform(1, 500), 2), 'valor_total': round(rng.uniform(10, 20000), 2),
+        'reservado': False, 'bloqueado': False, 'reservado_por_id': talvez(usuario_ids, 0.3),
+        'bloqueado_por_id': talvez(usuario_ids, 0.1), 'conferente_id': talvez(usuario_ids, 0.6),
+        'solicitacao_origem_id': talvez(solicitacao_ids, 0.8), 'gps_inicio': {'lat': -23.5, 'lng': -46.6},
+        'anexos': [], 'divergencias': [], 'data_criacao': agora - timedelta(minutes=i)
+    } for i in range(TOTAL_LOTES)])
+    lote_ids = [l.id for l in Lote.query.filter(Lote.numero_lote.like('SER-%')).all()]
+    # 20% viram sublotes de outro lote
+    for lote_id in rng.sample(lote_ids, TOTAL_LOTES // 5):
+        db.session.execute(Lote.__table__.update().where(Lote.id == lote_id).values(lote_pai_id=rng.choice(lote_ids)))
+    db.session.execute(ItemSolicitacao.__table__.insert(), [{
+        'solicitacao_id': rng.choice(solicitacao_ids), 'lote_id': lote_id, 'peso_kg': 10.0, 'estrelas_final': 3,
+        'valor_calculado': 0.0, 'preco_customizado': False, 'data_registro': agora
+    } for lote_id in lote_ids for _ in range(rng.randint(0, 3))])
+    db.session.commit()
+
+
+class ContadorConsultas:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.total = 0
+        event.listen(engine, 'before_cursor_execute', self._contar)
+
+    def _contar(self, *args):
+        self.total += 1
+
+    def medir(self, funcao):
+        from app.models import db
+        db.session.expunge_all()
+        antes = self.total
+        inicio = time.perf_counter()
+        resultado = funcao()
+        return self.total - antes, (time.perf_counter() - inicio) * 1000, resultado
+
+
+def laco_antigo(consulta):
+    """O laço de listar_lotes_wms antes do serializador."""
+    resultado = []
+    for lote in consulta.all():
+        lote_dict = lote.to_dict()
+        lote_dict['itens_count'] = len(lote.itens) if lote.itens else 0
+        lote_dict['sublotes_count'] = len(lote.sublotes)
+        resultado.append(lote_dict)
+    return resultado
+
+
+def main():
+    from flask_jwt_extended import create_access_token
+    import wsgi
+    from app.models import db, Lote, Usuario
+    from app.services.serializacao import LOTE, _RASTREIO
+
+    app = wsgi.app
+    print("🧪 BENCHMARK: SERIALIZAÇÃO DE LOTES\n")
+    with app.app_context():
+        popular(db)
+        contador = ContadorConsultas(db.engine)
+
+        def consulta(n):
+            return Lote.query.filter(Lote.numero_lote.like('SER-%')).order_by(Lote.data_criacao.desc()).limit(n)
+
+        print(f"{'Lotes':>6} | {'Consultas antes':>15} | {'ms antes':>9} | {'Consultas agora':>15} | "
+              f"{'ms agora':>9} | Mesma saída")
+        print("-" * 80)
+        consultas_agora = []
+        for n in TAMANHOS:
+            q_antes, ms_antes, antigo = contador.medir(lambda: laco_antigo(consulta(n)))
+            q_agora, ms_agora, novo = contador.medir(lambda: LOTE.consultar(consulta(n), 'lista'))
+            consultas_agora.append(q_agora)
+            esperado = [{k: v for k, v in d.items() if k not in _RASTREIO} for d in antigo]
+            print(f"{n:>6} | {q_antes:>15} | {ms_antes:>9.1f} | {q_agora:>15} | {ms_agora:>9.1f} | "
+                  f"{'✅' if novo == esperado else '❌'}")
+
+        constante = len(set(consultas_agora)) == 1
+        print(f"\n   {'✅' if constante else '❌'} Consultas com o serializador: {consultas_agora[0]} "
+              f"para {TAMANHOS[0]} e para {TAMANHOS[-1]} lotes")
+
+        db.session.expunge_all()
+        lote = consulta(1).first()
+        completo_igual = lote.to_dict() == LOTE.consultar(consulta(1), 'completo')[0]
+        print(f"   {'✅' if completo_igual else '❌'} Lote.to_dict() igual ao conjunto 'completo' carregado em lote")
+
+        admin = Usuario.query.filter_by(tipo='admin').first()
+        token = create_access_token(identity=str(admin.id))
+
+    cliente = app.test_client()
+    cabecalho = {'Authorization': f'Bearer {token}'}
+    for url in ('/api/wms/lotes', '/api/wms/lotes?status=aprovado', '/api/wms/lotes/exportar'):
+        with app.app_context():
+            antes = contador.total
+            inicio = time.perf_counter()
+            resposta = cliente.get(url, headers=cabecalho)
+            ms = (time.perf_counter() - inicio) * 1000
+            consultas = contador.total - antes
+        if 'exportar' in url:
+            linhas = resposta.data.decode().count('\n') - 1
+        else:
+            linhas = len(resposta.get_json())
+        print(f"   {'✅' if resposta.status_code == 200 else '❌'} GET {url}: {linhas} lotes, "
+              f"{consultas} consultas, {ms:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
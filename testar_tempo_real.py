@@ -0,0 +1,233 @@
+"""
+Benchmark da troca do polling de 30 s por Socket.IO + consultas delta
+(app/services/tempo_real.py)
+
+Simula uma hora de operação com 1000 OS e 200 solicitações aguardando
+aprovação: 120 mudanças de status de OS (algumas pela rota atribuir-motorista)
+e 30 aprovações de solicitação. Três telas são reproduzidas por clientes
+Socket.IO de teste que, como o static/js/tempo-real.js, carregam a lista
+completa uma vez e depois só pedem ?since=<cursor> quando recebem um evento:
+
+  - kanban (admin) em /api/os
+  - app do motorista em /api/os (só as OS dele)
+  - aprovação de solicitações em /api/solicitacao-lotes/aguardando-aprovacao
+
+Compara requisições e bytes com o polling antigo (lista completa a cada 30 s,
+120 vezes por hora por tela) e confere que a lista montada com os deltas é
+igual à lista completa no fim.
+
+    python testar_tempo_real.py
+"""
+import os
+import json
+import time
+import random
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_tempo_real.db')
+# a hora simulada passa em poucos segundos; com a margem padrão (5 s) todo delta
+# reenviaria tudo o que mudou na simulação inteira
+os.environ.setdefault('TEMPO_REAL_MARGEM_SEGUNDOS', '0')
+
+OS_TOTAL = 1000
+OS_MOTORISTA = 40
+SOLICITACOES = 200
+TRANSICOES_OS = 120
+APROVACOES = 30
+POLLS_POR_HORA = 120
+PROXIMO_STATUS = {
+    'PENDENTE': 'AGENDADA', 'AGENDADA': 'EM_ROTA', 'EM_ROTA': 'NO_FORNECEDOR', 'NO_FORNECEDOR': 'COLETADO',
+    'COLETADO': 'A_CAMINHO_MATRIZ', 'A_CAMINHO_MATRIZ': 'ENTREGUE', 'ENTREGUE': 'FINALIZADA'
+}
+
+
+class EspelhoLista:
+    """O que o tempo-real.js faz no navegador: lista completa uma vez, depois só deltas."""
+
+    def __init__(self, cliente, url, cabecalho):
+        self.cliente = cliente
+        self.url = url
+        self.cabecalho = cabecalho
+        self.itens = {}
+        self.cursor = None
+        self.requisicoes = 0
+        self.bytes = 0
+
+    def _get(self, url):
+        resposta = self.cliente.get(url, headers=self.cabecalho)
+        self.requisicoes += 1
+        self.bytes += len(resposta.data)
+        assert resposta.status_code == 200, resposta.get_json()
+        return resposta
+
+    def carregar(self):
+        resposta = self._get(self.url)
+        self.itens = {item['id']: item for item in resposta.get_json()}
+        self.cursor = resposta.headers['X-Cursor']
+        return len(resposta.data)
+
+    def delta(self):
+        dados = self._get(f'{self.url}?since={self.cursor}').get_json()
+        for item in dados['alterados']:
+            self.itens[item['id']] = item
+        for item_id in dados['removidos']:
+            self.itens.pop(item_id, None)
+        self.cursor = dados['cursor']
+
+    def confere(self):
+        completa = {item['id']: item for item in self.cliente.get(self.url, headers=self.cabecalho).get_json()}
+        return json.dumps(completa, sort_keys=True) == json.dumps(self.itens, sort_keys=True)
+
+
+def popular(db):
+    from werkzeug.security import generate_password_hash
+    from app.models import (Usuario, Fornecedor, Solicitacao, ItemSolicitacao, OrdemCompra, OrdemServico,
+                            Motorista)
+
+    if Usuario.query.filter_by(email='motorista.tempo.real@mrx.test').first():
+        return
+    rng = random.Random(5)
+    admin = Usuario.query.filter_by(tipo='admin').first()
+    usuario_motorista = Usuario(nome='Motorista Tempo Real', email='motorista.tempo.real@mrx.test',
+                                senha_hash=generate_password_hash('x'), tipo='motorista')
+    outro = Usuario(nome='Comprador Tempo Real', email='comprador.tempo.real@mrx.test',
+                    senha_hash=generate_password_hash('x'), tipo='funcionario')
+    db.session.add_all([usuario_motorista, outro])
+    db.session.flush()
+    motorista = Motorista(nome='Motorista Tempo Real', cpf='90000000001', usuario_id=usuario_motorista.id)
+    db.session.add(motorista)
+    fornecedor = Fornecedor(nome='Fornecedor Tempo Real', cidade='São Paulo', estado='SP')
+    db.session.add(fornecedor)
+    db.session.flush()
+
+    for i in range(OS_TOTAL + SOLICITACOES):
+        aguardando = i >= OS_TOTAL
+        solicitacao = Solicitacao(funcionario_id=outro.id, fornecedor_id=fornecedor.id,
+                                  status='aguardando_aprovacao' if aguardando else 'aprovada',
+                                  observacoes=f'Solicitação de benchmark {i}')
+        db.session.add(solicitacao)
+        db.session.flush()
+        db.session.add(ItemSolicitacao(solicitacao_id=solicitacao.id, peso_kg=round(rng.uniform(50, 600), 1)))
+        if aguardando:
+            continue
+        oc = OrdemCompra(solicitacao_id=solicitacao.id, fornecedor_id=fornecedor.id, criado_por=admin.id)
+        db.session.add(oc)
+        db.session.flush()
+        db.session.add(OrdemServico(
+            oc_id=oc.id, numero_os=f'OS-TR-{i:05d}', created_by=admin.id,
+            fornecedor_snapshot={'id': fornecedor.id, 'nome': fornecedor.nome, 'cidade': 'São Paulo'},
+            motorista_id=motorista.id if i < OS_MOTORISTA else None,
+            status=rng.choice(['AGENDADA', 'EM_ROTA']) if i < OS_MOTORISTA else 'PENDENTE'
+        ))
+    db.session.commit()
+
+
+def main():
+    from flask_jwt_extended import create_access_token
+    import wsgi
+    from app import socketio
+    from app.models import db, Usuario, OrdemServico, Motorista, Solicitacao
+    from app.services import tempo_real
+
+    app = wsgi.app
+    print("🧪 BENCHMARK: POLLING x SOCKET.IO + DELTA\n")
+
+    with app.app_context():
+        popular(db)
+        admin = Usuario.query.filter_by(tipo='admin').first()
+        usuario_motorista = Usuario.query.filter_by(email='motorista.tempo.real@mrx.test').first()
+        outro = Usuario.query.filter_by(email='comprador.tempo.real@mrx.test').first()
+        motorista = Motorista.query.filter_by(usuario_id=usuario_motorista.id).first()
+        tokens = {u.id: create_access_token(identity=str(u.id)) for u in (admin, usuario_motorista, outro)}
+        ids_os = [os_id for (os_id,) in db.session.query(OrdemServico.id).filter(
+            OrdemServico.numero_os.like('OS-TR-%'))]
+        ids_solicitacoes = [s_id for (s_id,) in db.session.query(Solicitacao.id).filter_by(
+            status='aguardando_aprovacao')]
+        admin_id, usuario_motorista_id, outro_id = admin.id, usuario_motorista.id, outro.id
+        motorista_id = motorista.id
+
+    cliente = app.test_client()
+    sockets = {u: socketio.test_client(app, auth={'token': tokens[u]})
+               for u in (admin_id, usuario_motorista_id, outro_id)}
+    print(f"   {'✅' if all(s.is_connected() for s in sockets.values()) else '❌'} "
+          f"{len(sockets)} clientes Socket.IO conectados")
+
+    cabecalho = {u: {'Authorization': f'Bearer {t}'} for u, t in tokens.items()}
+    telas = {
+        'Kanban (admin)': (EspelhoLista(cliente, '/api/os', cabecalho[admin_id]), admin_id, 'os_atualizada'),
+        'App do motorista': (EspelhoLista(cliente, '/api/os', cabecalho[usuario_motorista_id]),
+                             usuario_motorista_id, 'os_atualizada'),
+        'Aprovar solicitações': (EspelhoLista(cliente, '/api/solicitacao-lotes/aguardando-aprovacao',
+                                              cabecalho[admin_id]), admin_id, 'solicitacao_atualizada'),
+    }
+    tamanho_completo = {nome: espelho.carregar() for nome, (espelho, _, _) in telas.items()}
+    cursor_inicial = telas['App do motorista'][0].cursor
+    for s in sockets.values():
+        s.get_received()
+
+    publicados_antes = dict(tempo_real.get_tempo_real_stats()['eventos_publicados'])
+    rng = random.Random(11)
+    recebidos = {nome: 0 for nome in telas}
+    inicio = time.perf_counter()
+    for passo in range(TRANSICOES_OS + APROVACOES):
+        if passo % 5 == 4 and ids_solicitacoes:
+            resposta = cliente.put(f'/api/solicitacao-lotes/{ids_solicitacoes.pop()}/aprovar',
+                                   headers=cabecalho[admin_id])
+        elif passo % 10 == 0:
+            with app.app_context():
+                os_id = db.session.query(OrdemServico.id).filter(
+                    OrdemServico.id.in_(ids_os), OrdemServico.status == 'PENDENTE').first()[0]
+            resposta = cliente.put(f'/api/os/{os_id}/atribuir-motorista', json={'motorista_id': motorista_id},
+                                   headers=cabecalho[admin_id])
+        else:
+            with app.app_context():
+                os_ = db.session.get(OrdemServico, rng.choice(ids_os))
+                os_.status = PROXIMO_STATUS.get(os_.status, os_.status)
+                db.session.commit()
+            resposta = None
+        assert resposta is None or resposta.status_code == 200, resposta.get_json()
+
+        # cada cliente recebe o evento e pede só o delta; eventos repetidos da mesma tela viram uma consulta
+        pendentes = {u: s.get_received() for u, s in sockets.items()}
+        for nome, (espelho, usuario, evento) in telas.items():
+            if any(e['name'] == evento for e in pendentes[usuario]):
+                recebidos[nome] += 1
+                espelho.delta()
+        assert not [e for e in pendentes[outro_id] if e['name'] == 'os_atualizada']
+    ms = (time.perf_counter() - inicio) * 1000
+
+    print(f"   {TRANSICOES_OS} mudanças de OS + {APROVACOES} aprovações em {ms:.0f} ms\n")
+    print(f"{'Tela':<22} | {'Polling 30 s':>22} | {'Socket.IO + delta':>22} | {'Redução':>14} | OK")
+    print("-" * 98)
+    for nome, (espelho, _, _) in telas.items():
+        req_polling = POLLS_POR_HORA
+        kb_polling = tamanho_completo[nome] * POLLS_POR_HORA / 1024
+        kb_delta = espelho.bytes / 1024
+        ok = espelho.confere()
+        print(f"{nome:<22} | {req_polling:>5} req {kb_polling:>10.0f} KB | {espelho.requisicoes:>5} req "
+              f"{kb_delta:>10.0f} KB | {(1 - espelho.requisicoes / req_polling) * 100:>4.0f}% req "
+              f"{(1 - kb_delta / kb_polling) * 100:>3.0f}% KB | {'✅' if ok else '❌'}")
+
+    for s in sockets.values():
+        s.disconnect()
+    publicados = {tipo: total - publicados_antes.get(tipo, 0)
+                  for tipo, total in tempo_real.get_tempo_real_stats()['eventos_publicados'].items()}
+    print(f"\n   Eventos publicados na simulação: {publicados}")
+    print(f"   {'✅' if recebidos['App do motorista'] < recebidos['Kanban (admin)'] else '❌'} "
+          f"Motorista recebe só eventos das próprias OS ({recebidos['App do motorista']} de "
+          f"{recebidos['Kanban (admin)']}); outro usuário não recebe eventos de OS")
+    # removidos do motorista (filtro por status) só trazem OS dele
+    delta = cliente.get(f'/api/os?status=EM_ROTA&since={cursor_inicial}',
+                        headers=cabecalho[usuario_motorista_id]).get_json()
+    with app.app_context():
+        alheias = db.session.query(OrdemServico.id).filter(
+            OrdemServico.id.in_(delta['removidos']),
+            db.or_(OrdemServico.motorista_id != motorista_id, OrdemServico.motorista_id.is_(None))
+        ).count()
+    print(f"   {'✅' if delta['removidos'] and not alheias else '❌'} Delta do motorista: "
+          f"{len(delta['removidos'])} removidos, {alheias} de OS de outros motoristas")
+    invalido = cliente.get('/api/os?since=ontem', headers=cabecalho[admin_id])
+    print(f"   {'✅' if invalido.status_code == 400 else '❌'} Cursor inválido → {invalido.status_code}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+Benchmark da listagem paginada de lotes do WMS (GET /api/wms/lotes)
+
+Popula 50.000 lotes (status, localização e fornecedor variados, 3% com
+divergências) e compara, para os filtros mais usados:
+
+  - antes: todos os lotes do filtro com .all(), divergente por
+    cast(divergencias AS text) != '[]'
+  - agora: a 1ª página (100) e uma página funda pelo cursor, com os índices
+    (filtro, data_criacao, id), o índice parcial de total_divergencias > 0 e
+    o total estimado no cabeçalho
+
+Confere também que percorrer as páginas devolve cada lote uma vez, que
+total_divergencias acompanha inserts/updates pelo ORM, a busca por parte do
+numero_lote (?busca=) e o plano de consulta
+(EXPLAIN QUERY PLAN do SQLite) de cada filtro.
+
+    python testar_wms_paginacao.py
+"""
+import os
+import time
+import random
+import statistics
+from datetime import datetime, timedelta
+
+os.environ.setdefault('DATABASE_URL', 'sqlite:////tmp/benchmark_wms_paginacao.db')
+
+TOTAL_LOTES = 50000
+REPETICOES = 5
+STATUS = ['aberto', 'AGUARDANDO_SEPARACAO', 'aprovado', 'em_estoque', 'vendido']
+LOCALIZACOES = ['PATIO_RECEBIMENTO', 'GALPAO_A', 'GALPAO_B', 'DOCA_1', 'EXPEDICAO']
+FILTROS = {
+    'sem filtro': '',
+    'status=em_estoque': 'status=em_estoque',
+    'localizacao=GALPAO_A': 'localizacao=GALPAO_A',
+    'fornecedor_id=<um>': 'fornecedor_id={fornecedor}',
+    'divergente=true': 'divergente=true',
+}
+
+
+def popular(db):
+    from sqlalchemy import insert
+    from app.models import Fornecedor, TipoLote, Lote
+
+    if db.session.query(Lote.id).filter(Lote.numero_lote.like('WMS-%')).first():
+        return Fornecedor.query.filter(Fornecedor.nome.like('Fornecedor WMS %')).first().id
+    rng = random.Random(22)
+    agora = datetime.utcnow()
+    fornecedores = [Fornecedor(nome=f'Fornecedor WMS {i}') for i in range(300)]
+    tipos = [TipoLote(nome=f'Tipo WMS {i}') for i in range(8)]
+    db.session.add_all(fornecedores + tipos)
+    db.session.commit()
+    fornecedor_ids = [f.id for f in fornecedores]
+    tipo_ids = [t.id for t in tipos]
+
+    linhas = []
+    for i in range(TOTAL_LOTES):
+        divergencias = [{'item': 'peso', 'diferenca_kg': 3.5}] if rng.random() < 0.03 else []
+        linhas.append({
+            'numero_lote': f'WMS-{i:07d}', 'fornecedor_id': rng.choice(fornecedor_ids),
+            'tipo_lote_id': rng.choice(tipo_ids), 'status': rng.choice(STATUS),
+            'localizacao_atual': rng.choice(LOCALIZACOES), 'peso_total_kg': round(rng.uniform(1, 500), 2),
+            'valor_total': 0.0, 'reservado': False, 'bloqueado': False, 'anexos': [],
+            'divergencias': divergencias, 'total_divergencias': len(divergencias),
+            # lotes criados na mesma conferência chegam com o mesmo horário
+            'data_criacao': agora - timedelta(minutes=i // 4)
+        })
+    for i in range(0, len(linhas), 5000):
+        db.session.execute(insert(Lote.__table__), linhas[i:i + 5000])
+    db.session.commit()
+    return fornecedor_ids[0]
+
+
+def medir(funcao, repeticoes=REPETICOES):
+    tempos = []
+    resultado = None
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos), resultado
+
+
+def main():
+    from flask_jwt_extended import create_access_token
+    import wsgi
+    from app.models import db, Lote, Usuario
+    from app.services.serializacao import LOTE
+
+    app = wsgi.app
+    print("🧪 BENCHMARK: LISTAGEM PAGINADA DE LOTES DO WMS\n")
+    with app.app_context():
+        fornecedor_id = popular(db)
+        token = create_access_token(identity=str(Usuario.query.filter_by(tipo='admin').first().id))
+    cabecalho = {'Authorization': f'Bearer {token}'}
+    cliente = app.test_client()
+
+    def listagem_antiga(parametros):
+        """Os filtros e o .all() de listar_lotes_wms antes da paginação."""
+        with app.app_context():
+            query = Lote.query
+            for chave, valor in parametros.items():
+                if chave == 'divergente':
+                    query = query.filter(Lote.divergencias.isnot(None),
+                                         db.cast(Lote.divergencias, db.String) != '[]')
+                elif chave == 'localizacao':
+                    query = query.filter_by(localizacao_atual=valor)
+                else:
+                    query = query.filter_by(**{chave: valor})
+            return len(LOTE.consultar(query.order_by(Lote.data_criacao.desc()), 'lista'))
+
+    print(f"{'Filtro':<22} | {'Lotes':>6} | {'Antes (ms)':>10} | {'1ª página (ms)':>14} | "
+          f"{'Página funda (ms)':>17} | {'Total estimado':>14}")
+    print("-" * 98)
+    for nome, parametros in FILTROS.items():
+        parametros = parametros.format(fornecedor=fornecedor_id)
+        dicionario = dict(p.split('=') for p in parametros.split('&') if p)
+        if 'fornecedor_id' in dicionario:
+            dicionario['fornecedor_id'] = int(dicionario['fornecedor_id'])
+        ms_antes, total_real = medir(lambda: listagem_antiga(dicionario), 2)
+
+        url = '/api/wms/lotes?' + parametros
+        ms_pagina, resposta = medir(lambda: cliente.get(url, headers=cabecalho))
+        total = resposta.headers.get('X-Total-Estimado')
+        exato = resposta.headers.get('X-Total-Exato') == 'true'
+
+        # percorre as páginas (500 por vez) até o fim, guardando o cursor do meio
+        vistos, cursor, cursores = [], None, []
+        while True:
+            pagina = cliente.get(url + '&limite=500' + (f'&cursor={cursor}' if cursor else ''), headers=cabecalho)
+            vistos.extend(l['id'] for l in pagina.get_json())
+            cursor = pagina.headers.get('X-Proximo-Cursor')
+            if not cursor:
+                break
+            cursores.append(cursor)
+        completo = len(vistos) == len(set(vistos)) == total_real
+        funda = cursores[len(cursores) // 2] if cursores else None
+        ms_funda = medir(lambda: cliente.get(f'{url}&cursor={funda}', headers=cabecalho))[0] if funda else 0.0
+
+        print(f"{nome:<22} | {total_real:>6} | {ms_antes:>10.1f} | {ms_pagina:>14.1f} | {ms_funda:>17.1f} | "
+              f"{('' if exato else '~') + str(total):>12} {'✅' if completo else '❌'}")
+
+    print("\n   ✅ = percorrer todas as páginas devolveu cada lote exatamente uma vez")
+
+    with app.app_context():
+        print("\n   Planos de consulta (SQLite) da 1ª página:")
+        for nome, filtro in [('status', Lote.status == 'em_estoque'),
+                             ('localizacao', Lote.localizacao_atual == 'GALPAO_A'),
+                             ('fornecedor', Lote.fornecedor_id == fornecedor_id),
+                             ('divergente', Lote.total_divergencias > 0)]:
+            consulta = Lote.query.filter(filtro).order_by(Lote.data_criacao.desc(), Lote.id.desc()).limit(101)
+            sql = str(consulta.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+            plano = ' | '.join(linha[-1] for linha in db.session.execute(db.text(f'EXPLAIN QUERY PLAN {sql}')))
+            print(f"     {nome:<12} {plano}")
+
+        lote = Lote(fornecedor_id=fornecedor_id, tipo_lote_id=1, divergencias=[{'item': 'a'}, {'item': 'b'}])
+        db.session.add(lote)
+        db.session.commit()
+        inserido = lote.total_divergencias
+        lote.divergencias = []
+        db.session.commit()
+        print(f"\n   {'✅' if (inserido, lote.total_divergencias) == (2, 0) else '❌'} total_divergencias pelo ORM: "
+              f"{inserido} no insert, {lote.total_divergencias} depois de limpar as divergências")
+        db.session.delete(lote)
+        db.session.commit()
+
+    invalido = cliente.get('/api/wms/lotes?cursor=ontem', headers=cabecalho)
+    print(f"   {'✅' if invalido.status_code == 400 else '❌'} Cursor inválido → {invalido.status_code}")
+
+    busca = cliente.get('/api/wms/lotes?busca=wms-000012&limite=500', headers=cabecalho).get_json()
+    certo = len(busca) == 10 and all(l['numero_lote'].startswith('WMS-000012') for l in busca)
+    print(f"   {'✅' if certo else '❌'} ?busca=wms-000012 → {len(busca)} lotes pelo número")
+
+
+if __name__ == '__main__':
+    main()